@@ -17,6 +17,8 @@
 """Instance Metadata information."""
 
 import base64
+import collections
+import hashlib
 import os
 import posixpath
 
@@ -35,6 +37,7 @@ from nova.cells import opts as cells_opts
 from nova.cells import rpcapi as cells_rpcapi
 import nova.conf
 from nova import context
+from nova.i18n import _LE
 from nova import network
 from nova.network.security_group import openstack_driver
 from nova import objects
@@ -104,6 +107,10 @@ class InvalidMetadataPath(Exception):
     pass
 
 
+class MetadataRenderError(Exception):
+    pass
+
+
 class InstanceMetadata(object):
     """Instance metadata."""
 
@@ -148,6 +155,7 @@ class InstanceMetadata(object):
         self.password = password.extract_password(instance)
 
         self.uuid = instance.uuid
+        self.project_id = instance.project_id
 
         self.content = {}
         self.files = []
@@ -193,6 +201,7 @@ class InstanceMetadata(object):
                                 extra_md=extra_md, network_info=network_info)
 
         self.route_configuration = None
+        self._keypair = None
 
     def _route_configuration(self):
         if self.route_configuration:
@@ -303,7 +312,7 @@ class InstanceMetadata(object):
             return self._handle_content(path_tokens)
         return self._route_configuration().handle_path(path_tokens)
 
-    def _metadata_as_json(self, version, path):
+    def _metadata_as_json(self, version, path, random_seed=True):
         metadata = {'uuid': self.uuid}
         if self.launch_metadata:
             metadata['meta'] = self.launch_metadata
@@ -318,15 +327,7 @@ class InstanceMetadata(object):
                 self.instance.key_name: self.instance.key_data
             }
 
-            if cells_opts.get_cell_type() == 'compute':
-                cells_api = cells_rpcapi.CellsAPI()
-                keypair = cells_api.get_keypair_at_top(
-                  context.get_admin_context(), self.instance.user_id,
-                  self.instance.key_name)
-            else:
-                keypair = keypair_obj.KeyPair.get_by_name(
-                    context.get_admin_context(), self.instance.user_id,
-                    self.instance.key_name)
+            keypair = self._get_keypair()
             metadata['keys'] = [
                 {'name': keypair.name,
                  'type': keypair.type,
@@ -338,7 +339,7 @@ class InstanceMetadata(object):
         metadata['launch_index'] = self.instance.launch_index
         metadata['availability_zone'] = self.availability_zone
 
-        if self._check_os_version(GRIZZLY, version):
+        if random_seed and self._check_os_version(GRIZZLY, version):
             metadata['random_seed'] = base64.b64encode(os.urandom(512))
 
         if self._check_os_version(LIBERTY, version):
@@ -347,6 +348,19 @@ class InstanceMetadata(object):
         self.set_mimetype(MIME_TYPE_APPLICATION_JSON)
         return jsonutils.dump_as_bytes(metadata)
 
+    def _get_keypair(self):
+        if self._keypair is None:
+            if cells_opts.get_cell_type() == 'compute':
+                cells_api = cells_rpcapi.CellsAPI()
+                self._keypair = cells_api.get_keypair_at_top(
+                  context.get_admin_context(), self.instance.user_id,
+                  self.instance.key_name)
+            else:
+                self._keypair = keypair_obj.KeyPair.get_by_name(
+                    context.get_admin_context(), self.instance.user_id,
+                    self.instance.key_name)
+        return self._keypair
+
     def _handle_content(self, path_tokens):
         if len(path_tokens) == 1:
             raise KeyError("no listing for %s" % "/".join(path_tokens))
@@ -401,40 +415,14 @@ class InstanceMetadata(object):
                            CONF.dhcp_domain)
 
     def lookup(self, path):
-        if path == "" or path[0] != "/":
-            path = posixpath.normpath("/" + path)
-        else:
-            path = posixpath.normpath(path)
+        path, path_tokens = _normalize_path(path)
 
         # Set default mimeType. It will be modified only if there is a change
         self.set_mimetype(MIME_TYPE_TEXT_PLAIN)
 
-        # fix up requests, prepending /ec2 to anything that does not match
-        path_tokens = path.split('/')[1:]
-        if path_tokens[0] not in ("ec2", "openstack"):
-            if path_tokens[0] == "":
-                # request for /
-                path_tokens = ["ec2"]
-            else:
-                path_tokens = ["ec2"] + path_tokens
-            path = "/" + "/".join(path_tokens)
-
-        # all values of 'path' input starts with '/' and have no trailing /
-
         # specifically handle the top level request
         if len(path_tokens) == 1:
-            if path_tokens[0] == "openstack":
-                # NOTE(vish): don't show versions that are in the future
-                today = timeutils.utcnow().strftime("%Y-%m-%d")
-                versions = [v for v in OPENSTACK_VERSIONS if v <= today]
-                if OPENSTACK_VERSIONS != versions:
-                    LOG.debug("future versions %s hidden in version list",
-                              [v for v in OPENSTACK_VERSIONS
-                               if v not in versions])
-                versions += ["latest"]
-            else:
-                versions = VERSIONS + ["latest"]
-            return versions
+            return _get_versions(path_tokens[0])
 
         try:
             if path_tokens[0] == "openstack":
@@ -488,6 +476,117 @@ class InstanceMetadata(object):
             yield ('%s/%s/%s' % ("openstack", CONTENT_DIR, cid), content)
 
 
+class RenderedInstanceMetadata(object):
+    """Metadata documents of an instance, rendered once.
+
+    All the documents served for an InstanceMetadata are rendered when this
+    is created, lookup() only has to find them. Unlike the InstanceMetadata,
+    which holds the instance and the drivers used to build it, this only
+    holds the serialized documents, so that it is cheap to cache and to share
+    between the metadata API workers.
+
+    The stamp is the one of the data the documents were rendered from, see
+    get_metadata_stamp().
+    """
+
+    def __init__(self, instance_md, stamp=None):
+        self.uuid = instance_md.uuid
+        self.project_id = instance_md.project_id
+        self.password = instance_md.password
+        self.stamp = stamp
+        self.set_mimetype(MIME_TYPE_TEXT_PLAIN)
+
+        # Dict of (data, mimetype) tuples keyed by path, without the
+        # "latest" versions which are resolved by lookup()
+        self._documents = {}
+        # Paths of the meta_data.json documents needing a random seed
+        self._seeded = set()
+
+        for version in VERSIONS:
+            self._add_ec2_tree('ec2/%s' % version,
+                               instance_md.get_ec2_metadata(version))
+
+        for version in OPENSTACK_VERSIONS:
+            path = 'openstack/%s' % version
+            self._add(path, instance_md.lookup(path), MIME_TYPE_TEXT_PLAIN)
+            for name in instance_md.lookup(path):
+                self._add_openstack_item(instance_md, version, name)
+
+        for key, content in six.iteritems(instance_md.content):
+            self._add('openstack/%s/%s' % (CONTENT_DIR, key), content,
+                      MIME_TYPE_TEXT_PLAIN)
+
+    def set_mimetype(self, mime_type):
+        self.md_mimetype = mime_type
+
+    def get_mimetype(self):
+        return self.md_mimetype
+
+    def _add(self, path, data, mimetype):
+        if not (callable(data) or
+                isinstance(data, (six.binary_type, six.text_type))):
+            data = ec2_md_print(data)
+        self._documents[path] = (data, mimetype)
+
+    def _add_ec2_tree(self, path, data):
+        self._add(path, data, MIME_TYPE_TEXT_PLAIN)
+        if isinstance(data, dict):
+            for key, value in six.iteritems(data):
+                self._add_ec2_tree('%s/%s' % (path, key), value)
+
+    def _add_openstack_item(self, instance_md, version, name):
+        path = 'openstack/%s/%s' % (version, name)
+        instance_md.set_mimetype(MIME_TYPE_TEXT_PLAIN)
+        try:
+            if name == MD_JSON_NAME:
+                # NOTE: The random seed is added by lookup(), so that each
+                # request still gets a different one.
+                data = instance_md._metadata_as_json(version, name,
+                                                     random_seed=False)
+                if instance_md._check_os_version(GRIZZLY, version):
+                    self._seeded.add(path)
+            else:
+                data = instance_md.lookup(path)
+        except Exception:
+            # NOTE: The other documents can still be served, lookup() fails
+            # for this one like InstanceMetadata.lookup() would have.
+            LOG.exception(_LE('Failed to render the %(path)s metadata of '
+                              'instance %(uuid)s'),
+                          {'path': path, 'uuid': self.uuid})
+            self._documents[path] = (None, None)
+            return
+        self._add(path, data, instance_md.get_mimetype())
+
+    def lookup(self, path):
+        path, path_tokens = _normalize_path(path)
+        self.set_mimetype(MIME_TYPE_TEXT_PLAIN)
+
+        if len(path_tokens) == 1:
+            return _get_versions(path_tokens[0])
+
+        if path_tokens[1] == "latest":
+            if path_tokens[0] == "openstack":
+                path_tokens[1] = OPENSTACK_VERSIONS[-1]
+            else:
+                path_tokens[1] = VERSIONS[-1]
+        key = '/'.join(path_tokens)
+
+        try:
+            data, mimetype = self._documents[key]
+        except KeyError:
+            raise InvalidMetadataPath(path)
+        if data is None:
+            raise MetadataRenderError(path)
+
+        if key in self._seeded:
+            random_seed = base64.b64encode(os.urandom(512))
+            data = (b'{"random_seed": ' +
+                    jsonutils.dump_as_bytes(random_seed) + b', ' + data[1:])
+
+        self.set_mimetype(mimetype)
+        return data
+
+
 class RouteConfiguration(object):
     """Routes metadata paths to request handlers."""
 
@@ -551,12 +650,99 @@ def get_metadata_by_instance_id(instance_id, address, ctxt=None):
     return InstanceMetadata(instance, address)
 
 
+# Stamp of the data the metadata of an instance is built from:
+# - updated_at: updated_at of the instance
+# - info_cache_updated_at: updated_at of its network info cache
+# - metadata_digest: digest of its metadata and system metadata, whose
+#   updates don't change the updated_at of the instance
+MetadataStamp = collections.namedtuple(
+    'MetadataStamp',
+    ['updated_at', 'info_cache_updated_at', 'metadata_digest'])
+
+
+def get_metadata_stamp(instance_uuid, ctxt=None):
+    """Returns the stamp of the data the metadata of an instance is built
+    from, which changes when the instance, its metadata or its network info
+    are updated.
+    """
+    ctxt = ctxt or context.get_admin_context()
+    instance = objects.Instance.get_by_uuid(
+        ctxt, instance_uuid,
+        expected_attrs=['info_cache', 'metadata', 'system_metadata'])
+    return get_instance_metadata_stamp(instance)
+
+
+def _get_metadata_digest(instance):
+    items = [sorted(six.iteritems(getattr(instance, name)))
+             if instance.obj_attr_is_set(name) else None
+             for name in ('metadata', 'system_metadata')]
+    return hashlib.sha256(jsonutils.dump_as_bytes(items)).hexdigest()
+
+
+def get_instance_metadata_stamp(instance):
+    """Returns the stamp of an instance, as loaded with its info cache,
+    metadata and system metadata.
+    """
+    updated_at = None
+    if instance.obj_attr_is_set('updated_at') and instance.updated_at:
+        updated_at = timeutils.normalize_time(instance.updated_at)
+    info_cache_updated_at = None
+    if (instance.obj_attr_is_set('info_cache') and
+            instance.info_cache is not None and
+            instance.info_cache.obj_attr_is_set('updated_at') and
+            instance.info_cache.updated_at):
+        info_cache_updated_at = timeutils.normalize_time(
+            instance.info_cache.updated_at)
+    return MetadataStamp(updated_at, info_cache_updated_at,
+                         _get_metadata_digest(instance))
+
+
 def _format_instance_mapping(ctxt, instance):
     bdms = objects.BlockDeviceMappingList.get_by_instance_uuid(
             ctxt, instance.uuid)
     return block_device.instance_block_mapping(instance, bdms)
 
 
+def _normalize_path(path):
+    """Returns the normalized path and its tokens.
+
+    The tokens always start with either "ec2" or "openstack", "ec2" being
+    prepended to the paths matching none of them.
+    """
+    if path == "" or path[0] != "/":
+        path = posixpath.normpath("/" + path)
+    else:
+        path = posixpath.normpath(path)
+
+    # fix up requests, prepending /ec2 to anything that does not match
+    path_tokens = path.split('/')[1:]
+    if path_tokens[0] not in ("ec2", "openstack"):
+        if path_tokens[0] == "":
+            # request for /
+            path_tokens = ["ec2"]
+        else:
+            path_tokens = ["ec2"] + path_tokens
+        path = "/" + "/".join(path_tokens)
+
+    # all values of 'path' input starts with '/' and have no trailing /
+    return path, path_tokens
+
+
+def _get_versions(root):
+    if root == "openstack":
+        # NOTE(vish): don't show versions that are in the future
+        today = timeutils.utcnow().strftime("%Y-%m-%d")
+        versions = [v for v in OPENSTACK_VERSIONS if v <= today]
+        if OPENSTACK_VERSIONS != versions:
+            LOG.debug("future versions %s hidden in version list",
+                      [v for v in OPENSTACK_VERSIONS
+                       if v not in versions])
+        versions += ["latest"]
+    else:
+        versions = VERSIONS + ["latest"]
+    return versions
+
+
 def ec2_md_print(data):
     if isinstance(data, dict):
         output = ''
@@ -15,13 +15,16 @@
 #    under the License.
 
 """Metadata request handler."""
+import datetime
 import hashlib
 import hmac
 import os
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import secretutils as secutils
+from oslo_utils import timeutils
 import six
 import webob.dec
 import webob.exc
@@ -59,7 +62,18 @@ metadata_opts = [
                     'this should improve response times of the metadata API '
                     'when under heavy load. Higher values may increase memory'
                     'usage and result in longer times for host metadata '
-                    'changes to take effect.')
+                    'changes to take effect. The metadata cached for an '
+                    'instance is dropped once the instance, its metadata or '
+                    'its network info are updated, whatever this time is, '
+                    'see metadata_cache_check_interval.'),
+    cfg.IntOpt('metadata_cache_check_interval',
+               default=5,
+               help='Time in seconds during which the metadata cached for '
+                    'an instance is served without checking whether the '
+                    'instance, its metadata or its network info were '
+                    'updated. Lower values take such updates into account '
+                    'sooner, at the cost of more database lookups; 0 checks '
+                    'the cached metadata on every request.')
 ]
 
 CONF.register_opts(metadata_proxy_opts, 'neutron')
@@ -67,6 +81,10 @@ CONF.register_opts(metadata_opts)
 
 LOG = logging.getLogger(__name__)
 
+# Age in seconds of the most recent update of an instance under which its
+# metadata is not cached
+_STAMP_SETTLE_TIME = 2
+
 
 class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
@@ -74,13 +92,71 @@ class MetadataRequestHandler(wsgi.Application):
     def __init__(self):
         self._cache = cache_utils.get_client(
                 expiration_time=CONF.metadata_cache_expiration)
+        # Dict of the time until which the cached metadata is served
+        # without checking its stamp, keyed by cache key
+        self._stamp_checks = {}
+
+    def _get_cached_metadata(self, cache_key):
+        data = self._cache.get(cache_key)
+        if not data:
+            self._stamp_checks.pop(cache_key, None)
+            return None
+
+        now = time.time()
+        if self._stamp_checks.get(cache_key, 0) > now:
+            return data
+
+        # NOTE: The cached documents are checked against the stamp of the
+        # instance, so that they are rendered again once the instance, its
+        # metadata or its network info are updated.
+        try:
+            stamp = base.get_metadata_stamp(data.uuid)
+        except exception.NotFound:
+            stamp = None
+        if stamp is None or stamp != getattr(data, 'stamp', None):
+            self._cache.delete(cache_key)
+            self._stamp_checks.pop(cache_key, None)
+            return None
+
+        self._checked_stamp(cache_key, now)
+        return data
+
+    def _checked_stamp(self, cache_key, now):
+        interval = CONF.metadata_cache_check_interval
+        if interval <= 0:
+            return
+        # Drop the expired entries so that the instances not requesting
+        # their metadata anymore are not kept
+        for key in [key for key, expires in
+                    six.iteritems(self._stamp_checks) if expires <= now]:
+            del self._stamp_checks[key]
+        self._stamp_checks[cache_key] = now + interval
+
+    def _cache_metadata(self, cache_key, meta_data):
+        if CONF.metadata_cache_expiration <= 0:
+            return meta_data
+
+        stamp = base.get_instance_metadata_stamp(meta_data.instance)
+        # NOTE: The timestamps are stored with a precision of a second, an
+        # update in the same second as the one the stamp was read in can't
+        # be told from it, so such metadata is not cached.
+        settled_at = timeutils.utcnow() - datetime.timedelta(
+            seconds=_STAMP_SETTLE_TIME)
+        if any(value is not None and value > settled_at
+               for value in (stamp.updated_at, stamp.info_cache_updated_at)):
+            return meta_data
+
+        meta_data = base.RenderedInstanceMetadata(meta_data, stamp=stamp)
+        self._cache.set(cache_key, meta_data)
+        self._checked_stamp(cache_key, time.time())
+        return meta_data
 
     def get_metadata_by_remote_address(self, address):
         if not address:
             raise exception.FixedIpNotFoundForAddress(address=address)
 
         cache_key = 'metadata-%s' % address
-        data = self._cache.get(cache_key)
+        data = self._get_cached_metadata(cache_key)
         if data:
             LOG.debug("Using cached metadata for %s", address)
             return data
@@ -90,14 +166,11 @@ class MetadataRequestHandler(wsgi.Application):
         except exception.NotFound:
             return None
 
-        if CONF.metadata_cache_expiration > 0:
-            self._cache.set(cache_key, data)
-
-        return data
+        return self._cache_metadata(cache_key, data)
 
     def get_metadata_by_instance_id(self, instance_id, address):
         cache_key = 'metadata-%s' % instance_id
-        data = self._cache.get(cache_key)
+        data = self._get_cached_metadata(cache_key)
         if data:
             LOG.debug("Using cached metadata for instance %s", instance_id)
             return data
@@ -107,10 +180,7 @@ class MetadataRequestHandler(wsgi.Application):
         except exception.NotFound:
             return None
 
-        if CONF.metadata_cache_expiration > 0:
-            self._cache.set(cache_key, data)
-
-        return data
+        return self._cache_metadata(cache_key, data)
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
@@ -320,7 +390,7 @@ class MetadataRequestHandler(wsgi.Application):
         if meta_data is None:
             LOG.error(_LE('Failed to get metadata for instance id: %s'),
                       instance_id)
-        elif meta_data.instance.project_id != tenant_id:
+        elif meta_data.project_id != tenant_id:
             LOG.warning(_LW("Tenant_id %(tenant_id)s does not match tenant_id "
                             "of instance %(instance_id)s."),
                         {'tenant_id': tenant_id, 'instance_id': instance_id})
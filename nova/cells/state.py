@@ -257,6 +257,9 @@ class CellStateManager(base.Base):
             service_refs = {service.host: service
                             for service in objects.ServiceList.get_by_binary(
                                 ctxt, 'nova-compute')}
+            up_map = self.servicegroup_api.get_up_map(
+                [service for service in service_refs.values()
+                 if not service['disabled']])
 
             compute_nodes = objects.ComputeNodeList.get_all(ctxt)
             for compute in compute_nodes:
@@ -270,7 +273,7 @@ class CellStateManager(base.Base):
                 # computes in a child cell from the api cell. If this is run
                 # in the api cell objects.ComputeNodeList.get_all() above will
                 # return an empty list.
-                alive = self.servicegroup_api.service_is_up(service)
+                alive = up_map[service.id]
                 if not alive:
                     continue
 
@@ -55,8 +55,10 @@
 from __future__ import print_function
 
 import argparse
+import itertools
 import os
 import sys
+import time
 import urllib
 
 import decorator
@@ -65,6 +67,7 @@ from oslo_config import cfg
 from oslo_db import exception as db_exc
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
 from oslo_utils import importutils
 from oslo_utils import uuidutils
 import six
@@ -682,8 +685,12 @@ class VmCommands(object):
                                              _('index'))))
 
         if host is None:
-            instances = objects.InstanceList.get_by_filters(
-                context.get_admin_context(), {}, expected_attrs=['flavor'])
+            # Walk through the instances in chunks rather than loading all of
+            # them at once
+            instances = itertools.chain.from_iterable(
+                objects.InstanceList.iter_by_filters(
+                    context.get_admin_context(), {},
+                    expected_attrs=['flavor']))
         else:
             instances = objects.InstanceList.get_by_host(
                 context.get_admin_context(), host, expected_attrs=['flavor'])
@@ -941,7 +948,22 @@ class DbCommands(object):
             help='Maximum number of deleted rows to archive')
     @args('--verbose', action='store_true', dest='verbose', default=False,
           help='Print how many rows were archived per table.')
-    def archive_deleted_rows(self, max_rows, verbose=False):
+    @args('--until-complete', action='store_true', dest='until_complete',
+          default=False,
+          help='Run continuously until all the deleted rows are archived, '
+               'by batches of max_rows rows (1000 if not specified), and '
+               'print the number of rows archived per second after each '
+               'batch.')
+    @args('--workers', metavar='<number>', default=1,
+          help='Number of tables archived in parallel.')
+    @args('--watermark-file', metavar='<path>', dest='watermark_file',
+          help='File where the last id archived in each table is saved '
+               'after each batch, so that an interrupted archiving resumes '
+               'where it stopped. It is removed once a run archives '
+               'nothing, so that the next one starts a new pass.')
+    def archive_deleted_rows(self, max_rows, verbose=False,
+                             until_complete=False, workers=1,
+                             watermark_file=None):
         """Move up to max_rows deleted rows from production tables to shadow
         tables.
         """
@@ -954,7 +976,46 @@ class DbCommands(object):
                 print(_('max rows must be <= %(max_value)d') %
                       {'max_value': db.MAX_INT})
                 return(1)
-        table_to_rows_archived = db.archive_deleted_rows(max_rows)
+        elif until_complete:
+            max_rows = 1000
+        workers = int(workers)
+        if workers < 1:
+            print(_("Must supply a positive value for workers"))
+            return(1)
+
+        watermarks = {}
+        if watermark_file and os.path.exists(watermark_file):
+            with open(watermark_file) as f:
+                watermarks = jsonutils.load(f)
+
+        table_to_rows_archived = {}
+        while True:
+            previous_watermarks = dict(watermarks)
+            start = time.time()
+            run = db.archive_deleted_rows(max_rows, watermarks=watermarks,
+                                          workers=workers)
+            elapsed = time.time() - start
+            for tablename, rows_archived in run.items():
+                table_to_rows_archived.setdefault(tablename, 0)
+                table_to_rows_archived[tablename] += rows_archived
+            if watermark_file:
+                with open(watermark_file, 'w') as f:
+                    jsonutils.dump(watermarks, f)
+            # The batches only archiving rows of tables which have none
+            # left still move their watermarks.
+            if (not until_complete or
+                    not run and watermarks == previous_watermarks):
+                break
+            rows_archived = sum(run.values())
+            print(_('Archived %(rows)d rows in %(seconds).2f seconds '
+                    '(%(rate)d rows/s)') %
+                  {'rows': rows_archived, 'seconds': elapsed,
+                   'rate': rows_archived / elapsed if elapsed else 0})
+
+        if not run and watermark_file:
+            # Nothing is left after the watermarks, the rows deleted before
+            # them are archived from the first rows on the next run.
+            os.remove(watermark_file)
         if verbose:
             if table_to_rows_archived:
                 utils.print_dict(table_to_rows_archived, _('Table'),
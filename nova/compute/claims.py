@@ -198,8 +198,7 @@ class Claim(NopClaim):
                          if 'numa_topology' in resources else None)
         requested_topology = self.numa_topology
         if host_topology:
-            host_topology = objects.NUMATopology.obj_from_db_obj(
-                    host_topology)
+            host_topology = hardware.numa_topology_from_json(host_topology)
             pci_requests = objects.InstancePCIRequests.get_by_instance_uuid(
                                         self.context, self.instance.uuid)
 
@@ -166,6 +166,19 @@ interval_opts = [
                default=60,
                help="Number of seconds between instance network information "
                     "cache updates"),
+    cfg.IntOpt('heal_instance_info_cache_batch_size',
+               default=1,
+               min=1,
+               help="""
+Number of instances whose network information cache is refreshed on each run
+of the healing periodic task.
+
+With the default value of 1, the caches of the instances on the host are
+refreshed one at a time, which can take hours on hosts with hundreds of
+instances. With a higher value, the network information of the whole batch is
+fetched with a few bulk queries to the network service, and only the caches
+which changed are written to the database.
+"""),
     cfg.IntOpt('reclaim_instance_interval',
                min=0,
                default=0,
@@ -274,6 +287,18 @@ wrap_exception = functools.partial(exception.wrap_exception,
                                    get_notifier=get_notifier)
 
 
+# Power states reported by the hypervisor for which
+# _sync_instance_power_state() has nothing to do for an instance in a given
+# vm_state, once the power state in the database is the same
+SYNCED_POWER_STATES = {
+    vm_states.ACTIVE: (power_state.RUNNING,),
+    vm_states.STOPPED: (power_state.NOSTATE, power_state.SHUTDOWN,
+                        power_state.CRASHED),
+    vm_states.PAUSED: (power_state.PAUSED,),
+    vm_states.SUSPENDED: (power_state.SUSPENDED, power_state.SHUTDOWN),
+}
+
+
 @utils.expects_func_args('migration')
 def errors_out_migration(function):
     """Decorator to error out migration on failure."""
@@ -5725,6 +5750,11 @@ class ComputeManager(manager.Manager):
         if not heal_interval:
             return
 
+        if CONF.heal_instance_info_cache_batch_size > 1:
+            self._heal_instance_info_caches(
+                context, CONF.heal_instance_info_cache_batch_size)
+            return
+
         instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
         instance = None
 
@@ -5732,31 +5762,13 @@ class ComputeManager(manager.Manager):
 
         if not instance_uuids:
             # The list of instances to heal is empty so rebuild it
-            LOG.debug('Rebuilding the list of instances to heal')
-            db_instances = objects.InstanceList.get_by_host(
-                context, self.host, expected_attrs=[], use_slave=True)
-            for inst in db_instances:
-                # We don't want to refresh the cache for instances
-                # which are building or deleting so don't put them
-                # in the list. If they are building they will get
-                # added to the list next time we build it.
-                if (inst.vm_state == vm_states.BUILDING):
-                    LOG.debug('Skipping network cache update for instance '
-                              'because it is Building.', instance=inst)
-                    continue
-                if (inst.task_state == task_states.DELETING):
-                    LOG.debug('Skipping network cache update for instance '
-                              'because it is being deleted.', instance=inst)
-                    continue
-
-                if not instance:
-                    # Save the first one we find so we don't
-                    # have to get it again
-                    instance = inst
-                else:
-                    instance_uuids.append(inst['uuid'])
-
-            self._instance_uuids_to_heal = instance_uuids
+            instances = self._get_instances_to_heal(context)
+            if instances:
+                # Save the first one we find so we don't
+                # have to get it again
+                instance = instances.pop(0)
+            self._instance_uuids_to_heal = [inst['uuid']
+                                            for inst in instances]
         else:
             # Find the next valid instance on the list
             while instance_uuids:
@@ -5807,6 +5819,86 @@ class ComputeManager(manager.Manager):
             LOG.debug("Didn't find any instances for network info cache "
                       "update.")
 
+    def _get_instances_to_heal(self, context):
+        """Returns the instances of the host whose info_cache's network
+        information can be refreshed.
+        """
+        LOG.debug('Rebuilding the list of instances to heal')
+        instances = []
+        db_instances = objects.InstanceList.get_by_host(
+            context, self.host, expected_attrs=[], use_slave=True)
+        for inst in db_instances:
+            # We don't want to refresh the cache for instances
+            # which are building or deleting so don't put them
+            # in the list. If they are building they will get
+            # added to the list next time we build it.
+            if (inst.vm_state == vm_states.BUILDING):
+                LOG.debug('Skipping network cache update for instance '
+                          'because it is Building.', instance=inst)
+                continue
+            if (inst.task_state == task_states.DELETING):
+                LOG.debug('Skipping network cache update for instance '
+                          'because it is being deleted.', instance=inst)
+                continue
+            instances.append(inst)
+        return instances
+
+    def _heal_instance_info_caches(self, context, batch_size):
+        """Refresh the info_cache's network information of the next batch of
+        instances of the list of instances to heal, all at once.
+
+        The network API refreshes the instances of the batch together, with
+        Neutron their ports, networks, subnets and floating IPs are listed
+        with one query each for the whole batch.
+        """
+        instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
+
+        LOG.debug('Starting heal instance info caches')
+
+        if not instance_uuids:
+            # The list of instances to heal is empty so rebuild it
+            instance_uuids = [inst.uuid
+                              for inst in self._get_instances_to_heal(context)]
+            self._instance_uuids_to_heal = instance_uuids
+
+        batch_uuids = instance_uuids[:batch_size]
+        del instance_uuids[:batch_size]
+        instances = []
+        if batch_uuids:
+            db_instances = objects.InstanceList.get_by_filters(
+                context, {'uuid': batch_uuids, 'deleted': False},
+                expected_attrs=['system_metadata', 'info_cache', 'flavor'],
+                use_slave=True)
+            for inst in db_instances:
+                # Check the instance hasn't been migrated
+                if inst.host != self.host:
+                    LOG.debug('Skipping network cache update for instance '
+                              'because it has been migrated to another '
+                              'host.', instance=inst)
+                # Check the instance isn't being deleting
+                elif inst.task_state == task_states.DELETING:
+                    LOG.debug('Skipping network cache update for instance '
+                              'because it is being deleted.', instance=inst)
+                else:
+                    instances.append(inst)
+
+        if not instances:
+            LOG.debug("Didn't find any instances for network info cache "
+                      "update.")
+            return
+
+        try:
+            updated = self.network_api.refresh_instances_nw_info_cache(
+                context, instances)
+        except Exception:
+            LOG.error(_LE('An error occurred while refreshing the network '
+                          'caches of %d instances.'), len(instances),
+                      exc_info=True)
+            return
+        LOG.debug('Updated the network info_cache of %(updated)d of '
+                  '%(total)d instances',
+                  {'updated': len(updated), 'total': len(instances)})
+
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
         if CONF.reboot_timeout > 0:
@@ -6169,7 +6261,12 @@ class ComputeManager(manager.Manager):
                                                         expected_attrs=[],
                                                         use_slave=True)
 
-        num_vm_instances = self.driver.get_num_instances()
+        try:
+            vm_power_states = self.driver.get_power_states()
+            num_vm_instances = len(vm_power_states)
+        except NotImplementedError:
+            vm_power_states = None
+            num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
 
         if num_vm_instances != num_db_instances:
@@ -6198,6 +6295,15 @@ class ComputeManager(manager.Manager):
             self._syncs_in_progress.pop(db_instance.uuid)
 
         for db_instance in db_instances:
+            # NOTE: the power states of all the instances were queried at
+            # once without holding their locks, only sync the instances which
+            # look out of sync, querying their power state again
+            if (vm_power_states is not None and
+                    self._is_power_state_synced(
+                        db_instance,
+                        vm_power_states.get(db_instance.uuid,
+                                            power_state.NOSTATE))):
+                continue
             # process syncs asynchronously - don't want instance locking to
             # block entire periodic task thread
             uuid = db_instance.uuid
@@ -6208,6 +6314,18 @@ class ComputeManager(manager.Manager):
                 self._syncs_in_progress[uuid] = True
                 self._sync_power_pool.spawn_n(_sync, db_instance)
 
+    @staticmethod
+    def _is_power_state_synced(db_instance, vm_power_state):
+        """Returns True if syncing the power state of the instance would do
+        nothing: it has a pending task, or its power state in the database is
+        the one reported by the hypervisor and matches its vm_state.
+        """
+        if db_instance.task_state is not None:
+            return True
+        return (vm_power_state == db_instance.power_state and
+                vm_power_state in SYNCED_POWER_STATES.get(
+                    db_instance.vm_state, ()))
+
     def _query_driver_power_state_and_sync(self, context, db_instance):
         if db_instance.task_state is not None:
             LOG.info(_LI("During sync_power_state the instance has a "
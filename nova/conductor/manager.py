@@ -19,6 +19,7 @@ import copy
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_service import loopingcall
 from oslo_utils import excutils
 import six
 
@@ -28,6 +29,7 @@ from nova.compute import utils as compute_utils
 from nova.compute import vm_states
 from nova.conductor.tasks import live_migrate
 from nova.conductor.tasks import migrate
+from nova import context as nova_context
 from nova.db import base
 from nova import exception
 from nova.i18n import _, _LE, _LI, _LW
@@ -40,6 +42,7 @@ from nova import rpc
 from nova.scheduler import client as scheduler_client
 from nova.scheduler import utils as scheduler_utils
 from nova import servicegroup
+from nova.servicegroup.drivers import db as servicegroup_db
 from nova import utils
 
 LOG = logging.getLogger(__name__)
@@ -59,13 +62,44 @@ class ConductorManager(manager.Manager):
     namespace.  See the ComputeTaskManager class for details.
     """
 
-    target = messaging.Target(version='3.0')
+    target = messaging.Target(version='3.1')
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
                                                *args, **kwargs)
         self.compute_task_mgr = ComputeTaskManager()
         self.additional_endpoints.append(self.compute_task_mgr)
+        self._heartbeats = servicegroup_db.HeartbeatCoalescer()
+        self._heartbeat_timer = None
+
+    def init_host(self):
+        interval = CONF.conductor.heartbeat_flush_interval
+        if interval > 0:
+            self._heartbeat_timer = loopingcall.FixedIntervalLoopingCall(
+                self._flush_heartbeats)
+            self._heartbeat_timer.start(interval=interval,
+                                        initial_delay=interval)
+
+    def cleanup_host(self):
+        if self._heartbeat_timer is not None:
+            self._heartbeat_timer.stop()
+            self._heartbeat_timer = None
+        self._flush_heartbeats()
+
+    def _flush_heartbeats(self):
+        count = self._heartbeats.flush(nova_context.get_admin_context())
+        if count:
+            LOG.debug('Wrote the state reports of %d service(s)', count)
+
+    def report_service_state(self, context, service_id):
+        """Records a state report of a service, written to the database
+        with the other reports at the next flush.
+        """
+        self._heartbeats.add(service_id)
+        if self._heartbeat_timer is None:
+            # The reports are not coalesced by this conductor, e.g. when
+            # [conductor]heartbeat_flush_interval is only set on the computes
+            self._heartbeats.flush(context)
 
     # NOTE(hanlind): This can be removed in version 4.0 of the RPC API
     def provider_fw_rule_get_all(self, context):
@@ -193,6 +193,8 @@ class ConductorAPI(object):
     that they can handle the version_cap being set to 3.0.
 
     * Remove provider_fw_rule_get_all()
+
+    * 3.1 - Added report_service_state()
     """
 
     VERSION_ALIASES = {
@@ -245,6 +247,19 @@ class ConductorAPI(object):
         return cctxt.call(context, 'object_backport_versions', objinst=objinst,
                           object_versions=object_versions)
 
+    def report_service_state(self, context, service_id):
+        """Sends a state report of a service, to be written to the database
+        with the reports of the other services.
+
+        Returns False if nova-conductor can't receive it.
+        """
+        version = '3.1'
+        if not self.client.can_send_version(version):
+            return False
+        cctxt = self.client.prepare(version=version)
+        cctxt.cast(context, 'report_service_state', service_id=service_id)
+        return True
+
 
 class ComputeTaskAPI(object):
     """Client side of the conductor 'compute' namespaced RPC API
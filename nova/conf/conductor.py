@@ -46,11 +46,42 @@ workers = cfg.IntOpt(
     help='Number of workers for OpenStack Conductor service. '
          'The default will be the number of CPUs available.')
 
+heartbeat_flush_interval = cfg.IntOpt(
+    'heartbeat_flush_interval',
+    default=0,
+    min=0,
+    help="""
+Interval, in seconds, at which nova-conductor writes the state reports of the
+services to the database.
+
+When set to a value greater than 0, the services using the db servicegroup
+driver send their periodic state reports to nova-conductor, which writes all
+the reports received since its previous flush with a single UPDATE, instead
+of each service updating its own record on every report_interval. The
+last_seen_up timestamp written is the time of the oldest report flushed, so
+that a service is never seen up later than it actually reported.
+
+This option has to be set on both the services reporting their state and on
+nova-conductor.
+
+Possible values:
+
+* 0: Disabled, each service updates its own record when it reports (default)
+* Any positive integer: Number of seconds between two flushes
+
+Related options:
+
+* service_down_time: the state reports reach the database up to this many
+  seconds late, so this interval should be well below service_down_time
+  minus report_interval
+""")
+
 ALL_OPTS = [
     use_local,
     topic,
     manager,
-    workers]
+    workers,
+    heartbeat_flush_interval]
 
 
 def register_opts(conf):
@@ -216,6 +216,16 @@ linux_net_opts = [
                default='DROP',
                help='The table that iptables to jump to when a packet is '
                     'to be dropped.'),
+    cfg.BoolOpt('iptables_apply_changed_chains',
+                default=False,
+                help='Only send the chains of the nova service whose rules '
+                     'changed since the previous apply to '
+                     'iptables-restore --noflush, instead of saving and '
+                     'restoring the whole tables. The whole tables are '
+                     'still restored on the first apply, and when the rules '
+                     'outside of the chains of the service change. Rules '
+                     'removed from those chains by another tool are only '
+                     'restored when their chain changes.'),
     cfg.IntOpt('ovs_vsctl_timeout',
                default=120,
                help='Amount of time, in seconds, that ovs_vsctl should wait '
@@ -32,6 +32,29 @@ neutron_opts = [
                 default=600,
                 help='Number of seconds before querying neutron for'
                      ' extensions'),
+    cfg.BoolOpt('batch_network_info_queries',
+                default=False,
+                help="""
+Build the network info of instances with a few bulk queries.
+
+When enabled, the subnets, DHCP ports and floating IPs of all the ports of an
+instance (or of a list of instances) are fetched with one list query each,
+instead of one query per port, fixed IP and subnet. This greatly reduces the
+number of requests sent to Neutron for instances with several ports.
+"""),
+    cfg.IntOpt('network_info_cache_ttl',
+               default=0,
+               min=0,
+               help="""
+Number of seconds during which the subnets and DHCP ports fetched to build the
+network info of instances are reused by later builds.
+
+Only used when batch_network_info_queries is enabled. The floating IPs are
+always fetched again. A short value, a few seconds, avoids querying the same
+subnets again when the network info of several instances on the same networks
+is refreshed in a row, while limiting how long a change of a subnet can take
+to show up in the network info. 0 only reuses them within a single build.
+"""),
 ]
 
 
@@ -79,9 +79,24 @@ quota_opts = [
                     'Note that quotas are not updated on a periodic task, '
                     'they will update on a new reservation if max_age has '
                     'passed since the last reservation'),
+    cfg.IntOpt('quota_limit_cache_ttl',
+               default=0,
+               min=0,
+               help='Number of seconds the quota limits of a project, of its '
+                    'users and of the quota classes are cached by the '
+                    'database quota drivers once they are read with a single '
+                    'query. The cache of a process is invalidated when the '
+                    'limits are changed through that process, but the other '
+                    'processes can use the previous limits until their '
+                    'cached copy expires. This defaults to 0(off), the limits '
+                    'being read from the database on each quota check.'),
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
-               help='Default driver to use for quota checks'),
+               help='Default driver to use for quota checks. '
+                    'nova.quota.CounterQuotaDriver stores the quotas in the '
+                    'database like nova.quota.DbQuotaDriver but makes the '
+                    'reservations with conditional updates of the usages '
+                    'instead of locking the usages of the project'),
     ]
 
 
@@ -47,6 +47,32 @@ a different scheduler, this option has no effect.
     None
 """)
 
+batch_placement_opt = cfg.BoolOpt("scheduler_batch_placement",
+        default=False,
+        help="""
+When a request asks for several instances, the FilterScheduler normally runs
+all the filters and weighers over all the hosts once for each instance, which
+gets slow for large multi-instance boot requests on large deployments.
+
+If this is set to True, the hosts are filtered and weighed only once for the
+whole request and kept ordered by weight. After an instance is placed on a
+host, only that host is weighed again, and the filters which have to run for
+each instance of a request are only checked against the hosts being picked.
+The weights of the other hosts are not normalized again, so the placement may
+slightly differ from the one made when this option is False.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+* Services that use this:
+
+    ``nova-scheduler``
+
+* Related options:
+
+    scheduler_host_subset_size
+""")
+
 bm_default_filter_opt = cfg.ListOpt("baremetal_scheduler_default_filters",
         default=[
             "RetryFilter",
@@ -155,6 +181,60 @@ a different scheduler, this option has no effect.
     exception will be raised.
 """)
 
+host_mgr_use_columnar_filt_opt = cfg.BoolOpt("scheduler_use_columnar_filters",
+        default=False,
+        help="""
+If enabled, the filters which only compare the resources of the hosts against
+the request (RamFilter, CoreFilter, DiskFilter, NumInstancesFilter, IoOpsFilter
+and ComputeFilter) are evaluated on all the hosts at once, using arrays of the
+host resources, instead of being called for every host one by one. This greatly
+reduces the time spent filtering when there are thousands of hosts. The other
+filters are then run as usual on the hosts which passed those filters.
+
+This requires the 'numpy' Python library. If it can't be imported, the filters
+are run one host at a time as if this option was disabled.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+* Services that use this:
+
+    ``nova-scheduler``
+
+* Related options:
+
+    scheduler_default_filters
+""")
+
+host_mgr_filter_cache_size_opt = cfg.IntOpt("scheduler_filter_cache_size",
+        default=0,
+        min=0,
+        help="""
+Maximum number of results kept in memory by each filter able to cache them.
+
+Some filters only depend on attributes of the host which rarely change, like
+its aggregates or its capabilities, and on the flavor and image of the
+request: AggregateInstanceExtraSpecsFilter, AggregateTypeAffinityFilter,
+AvailabilityZoneFilter, ComputeCapabilitiesFilter and ImagePropertiesFilter.
+When this is greater than 0, those filters remember their result for each
+host and request properties, and reuse it until the host changes, so that
+repeated requests for the same flavor and image skip most of the filtering.
+The least recently used results are discarded once this number is reached.
+
+Setting this to 0 disables the cache.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+* Services that use this:
+
+    ``nova-scheduler``
+
+* Related options:
+
+    scheduler_default_filters
+""")
+
 host_mgr_sched_wgt_cls_opt = cfg.ListOpt("scheduler_weight_classes",
         default=["nova.scheduler.weights.all_weighers"],
         help="""
@@ -207,6 +287,81 @@ a different scheduler, this option has no effect.
     None
 """)
 
+host_mgr_tracks_cn_chg_opt = cfg.BoolOpt(
+        "scheduler_tracks_compute_node_changes",
+        default=False,
+        help="""
+By default, the scheduler host manager reloads every compute node record from
+the database and refreshes the in-memory state of every host on each
+scheduling request. On large deployments this makes the cost of a request grow
+with the size of the whole fleet.
+
+When this option is enabled, the host manager keeps its in-memory view of the
+hosts between requests and only reloads the compute nodes which were created or
+updated since the previous request. Removed compute nodes and any update that
+would have been missed are reconciled by a full reload that happens at most
+every 'scheduler_host_state_full_refresh_interval' seconds.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+* Services that use this:
+
+    ``nova-scheduler``
+
+* Related options:
+
+    scheduler_host_state_full_refresh_interval
+""")
+
+host_mgr_full_refresh_interval_opt = cfg.IntOpt(
+        "scheduler_host_state_full_refresh_interval",
+        default=300,
+        min=0,
+        help="""
+The maximum number of seconds the scheduler host manager waits between two full
+reloads of the compute nodes when 'scheduler_tracks_compute_node_changes' is
+enabled. Between full reloads, only the compute nodes which were changed are
+reloaded. Setting this to 0 reloads every compute node on each request, which
+is equivalent to disabling 'scheduler_tracks_compute_node_changes'.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+* Services that use this:
+
+    ``nova-scheduler``
+
+* Related options:
+
+    scheduler_tracks_compute_node_changes
+""")
+
+host_mgr_load_pool_size_opt = cfg.IntOpt(
+        "scheduler_host_state_load_pool_size",
+        default=10,
+        min=1,
+        help="""
+Maximum number of concurrent database queries made by the scheduler to load
+the host states.
+
+The services, the compute nodes and the instances of the hosts which do not
+send updates about them to the scheduler are loaded concurrently, with up to
+this number of queries running at the same time. The instances are loaded with
+one query per batch of 100 hosts.
+
+This option is only used by the FilterScheduler and its subclasses; if you use
+a different scheduler, this option has no effect.
+
+* Services that use this:
+
+    ``nova-scheduler``
+
+* Related options:
+
+    scheduler_tracks_instance_changes
+""")
+
 rpc_sched_topic_opt = cfg.StrOpt("scheduler_topic",
         default="scheduler",
         help="""
@@ -891,12 +1046,18 @@ soft_anti_affinity_weight_opt = cfg.FloatOpt(
 
 
 default_opts = [host_subset_size_opt,
+               batch_placement_opt,
                bm_default_filter_opt,
                use_bm_filters_opt,
                host_mgr_avail_filt_opt,
                host_mgr_default_filt_opt,
+               host_mgr_use_columnar_filt_opt,
+               host_mgr_filter_cache_size_opt,
                host_mgr_sched_wgt_cls_opt,
                host_mgr_tracks_inst_chg_opt,
+               host_mgr_tracks_cn_chg_opt,
+               host_mgr_full_refresh_interval_opt,
+               host_mgr_load_pool_size_opt,
                rpc_sched_topic_opt,
                sched_driver_host_mgr_opt,
                driver_opt,
@@ -40,6 +40,31 @@ Interdependencies to other options:
 * None
 """)
 
+numa_cell_fit_policy = cfg.StrOpt(
+    'numa_cell_fit_policy',
+    choices=('pack', 'spread'),
+    help="""Defines in which order the host NUMA cells are tried when fitting
+the NUMA topology of an instance onto a host.
+
+Possible values:
+
+* ``pack``: try the host NUMA cells with the least free vCPUs and memory
+  first, to keep the largest cells free for the instances with the biggest
+  NUMA cells.
+* ``spread``: try the host NUMA cells with the most free vCPUs and memory
+  first, to balance the usage of the NUMA cells of a host.
+* None (default): try the host NUMA cells in the order of their IDs.
+
+Services which consume this:
+
+* ``nova-scheduler``
+* ``nova-compute``
+
+Interdependencies to other options:
+
+* None
+""")
+
 compute_driver = cfg.StrOpt(
     'compute_driver',
     help="""Defines which driver to use for controlling virtualization.
@@ -246,6 +271,38 @@ Interdependencies to other options:
   libvirt firewall driver is enabled.
 """)
 
+firewall_use_ipset = cfg.BoolOpt(
+    'firewall_use_ipset',
+    default=False,
+    help="""Use ipsets to match the members of the security groups.
+
+When set to true, the iptables firewall driver keeps one ipset per security
+group granted access by a rule, holding the fixed IPs of its members, and
+matches it with a single iptables rule per instance instead of one rule per
+member IP. The members of the ipsets are updated incrementally as instances
+join and leave the security groups, without rebuilding the iptables rules.
+
+This option only applies when using the ``nova-network`` service, and is
+ignored by the XenAPI ``Dom0IptablesFirewallDriver``.
+
+Possible values:
+
+* True: Security group rules granting access to a security group match an
+  ipset of its members. The ``ipset`` utility must be installed on the
+  compute hosts
+* False: Security group rules granting access to a security group are
+  expanded into one iptables rule per member IP
+
+Services which consume this:
+
+* ``nova-compute``
+
+Interdependencies to other options:
+
+* ``firewall_driver``: This must be set to an iptables firewall driver, like
+  ``nova.virt.libvirt.firewall.IptablesFirewallDriver``
+""")
+
 force_raw_images = cfg.BoolOpt(
     'force_raw_images',
     default=True,
@@ -325,6 +382,7 @@ remove_unused_original_minimum_age_seconds = cfg.IntOpt(
     'be removed')
 
 ALL_OPTS = [vcpu_pin_set,
+            numa_cell_fit_policy,
             compute_driver,
             default_ephemeral_format,
             preallocate_images,
@@ -333,6 +391,7 @@ ALL_OPTS = [vcpu_pin_set,
             vif_plugging_timeout,
             firewall_driver,
             allow_same_net_traffic,
+            firewall_use_ipset,
             force_raw_images,
             injected_network_template,
             virt_mkfs,
@@ -177,6 +177,16 @@ def service_update(context, service_id, values):
     return IMPL.service_update(context, service_id, values)
 
 
+def service_heartbeat_update(context, service_ids, last_seen_up):
+    """Record a state report of several services at once.
+
+    Sets the last_seen_up of the given services and increments their
+    report_count with a single query, returning the number of services
+    updated.
+    """
+    return IMPL.service_heartbeat_update(context, service_ids, last_seen_up)
+
+
 ###################
 
 
@@ -248,6 +258,19 @@ def compute_node_get_all(context):
     return IMPL.compute_node_get_all(context)
 
 
+def compute_node_get_all_changed_since(context, changes_since):
+    """Get all computeNodes created or updated since a given time.
+
+    :param context: The security context
+    :param changes_since: Timezone-aware datetime; only compute nodes whose
+                          created_at or updated_at is at or after this time
+                          are returned
+
+    :returns: List of dictionaries each containing compute node properties
+    """
+    return IMPL.compute_node_get_all_changed_since(context, changes_since)
+
+
 def compute_node_get_all_by_host(context, host):
     """Get compute nodes by host name
 
@@ -1087,6 +1110,14 @@ def quota_get_all(context, project_id):
     return IMPL.quota_get_all(context, project_id)
 
 
+def quota_get_all_limits_by_project(context, project_id, quota_class=None):
+    """Retrieve the quotas of a project, of all its users, of the default
+    quota class and of the given quota class.
+    """
+    return IMPL.quota_get_all_limits_by_project(context, project_id,
+                                                quota_class=quota_class)
+
+
 def quota_update(context, project_id, resource, limit, user_id=None):
     """Update a quota or raise if it does not exist."""
     return IMPL.quota_update(context, project_id, resource, limit,
@@ -1187,6 +1218,41 @@ def reservation_expire(context):
     return IMPL.reservation_expire(context)
 
 
+def quota_reserve_counters(context, resources, quotas, user_quotas, deltas,
+                           expire, until_refresh, max_age, project_id=None,
+                           user_id=None):
+    """Check quotas and create appropriate reservations, updating the usage
+    counters with conditional updates instead of locking them.
+    """
+    return IMPL.quota_reserve_counters(context, resources, quotas,
+                                       user_quotas, deltas, expire,
+                                       until_refresh, max_age,
+                                       project_id=project_id, user_id=user_id)
+
+
+def reservation_commit_counters(context, reservations, project_id=None,
+                                user_id=None):
+    """Commit quota reservations without locking the usage counters."""
+    return IMPL.reservation_commit_counters(context, reservations,
+                                            project_id=project_id,
+                                            user_id=user_id)
+
+
+def reservation_rollback_counters(context, reservations, project_id=None,
+                                  user_id=None):
+    """Roll back quota reservations without locking the usage counters."""
+    return IMPL.reservation_rollback_counters(context, reservations,
+                                              project_id=project_id,
+                                              user_id=user_id)
+
+
+def reservation_expire_counters(context):
+    """Roll back any expired reservations without locking the usage
+    counters.
+    """
+    return IMPL.reservation_expire_counters(context)
+
+
 ###################
 
 
@@ -1954,10 +2020,15 @@ def task_log_get(context, task_name, period_beginning,
 ####################
 
 
-def archive_deleted_rows(max_rows=None):
+def archive_deleted_rows(max_rows=None, watermarks=None, workers=1):
     """Move up to max_rows rows from production tables to corresponding shadow
     tables.
 
+    :param watermarks: optional dict of the last id archived in each table,
+                       updated as the rows are archived, to resume the
+                       archiving on the next call; it is reset once all the
+                       tables are archived
+    :param workers: number of tables archived in parallel
     :returns: dict that maps table name to number of rows archived from that
               table, for example:
 
@@ -1970,7 +2041,8 @@ def archive_deleted_rows(max_rows=None):
         }
 
     """
-    return IMPL.archive_deleted_rows(max_rows=max_rows)
+    return IMPL.archive_deleted_rows(max_rows=max_rows, watermarks=watermarks,
+                                     workers=workers)
 
 
 def pcidevice_online_data_migration(context, max_count):
@@ -25,6 +25,7 @@ import inspect
 import sys
 import uuid
 
+import eventlet
 from oslo_config import cfg
 from oslo_db import api as oslo_db_api
 from oslo_db import exception as db_exc
@@ -619,6 +620,18 @@ def service_update(context, service_id, values):
     return service_ref
 
 
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@pick_context_manager_writer
+def service_heartbeat_update(context, service_ids, last_seen_up):
+    if not service_ids:
+        return 0
+    return model_query(context, models.Service, read_deleted="no").\
+                filter(models.Service.id.in_(service_ids)).\
+                update({'last_seen_up': last_seen_up,
+                        'report_count': models.Service.report_count + 1},
+                       synchronize_session=False)
+
+
 ###################
 
 
@@ -782,6 +795,10 @@ def _compute_node_select(context, filters=None):
     if "hypervisor_hostname" in filters:
         hyp_hostname = filters["hypervisor_hostname"]
         select = select.where(cn_tbl.c.hypervisor_hostname == hyp_hostname)
+    if "changes-since" in filters:
+        changes_since = timeutils.normalize_time(filters["changes-since"])
+        select = select.where(or_(cn_tbl.c.updated_at >= changes_since,
+                                  cn_tbl.c.created_at >= changes_since))
     return select
 
 
@@ -848,6 +865,11 @@ def compute_node_get_all(context):
     return _compute_node_fetchall(context)
 
 
+@pick_context_manager_reader
+def compute_node_get_all_changed_since(context, changes_since):
+    return _compute_node_fetchall(context, {"changes-since": changes_since})
+
+
 @pick_context_manager_reader
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
@@ -2204,6 +2226,11 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                             sort_dirs=[sort_dir])
 
 
+# Sort keys of the instances which can be paginated with a keyset, see
+# _keyset_paginate_query()
+_INSTANCE_KEYSET_SORT_KEYS = ('created_at', 'id', 'uuid')
+
+
 @require_context
 @pick_context_manager_reader_allow_async
 def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
@@ -2399,6 +2426,20 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     query_prefix = _tag_instance_filter(context, query_prefix, filters)
 
     # paginate query
+    use_keyset = (set(sort_keys).issubset(_INSTANCE_KEYSET_SORT_KEYS) and
+                  len(set(sort_dirs)) == 1)
+    marker_values = None
+    if marker is not None and use_keyset:
+        marker_values = _instance_get_sort_values(context, marker, sort_keys)
+        # NOTE: paginate_query() is left to handle the NULL values
+        use_keyset = None not in marker_values
+    if use_keyset:
+        query_prefix = _keyset_paginate_query(query_prefix, models.Instance,
+                                              limit, sort_keys, sort_dirs[0],
+                                              marker_values)
+        return _instances_fill_metadata(context, query_prefix.all(),
+                                        manual_joins)
+
     if marker is not None:
         try:
             marker = _instance_get_by_uuid(
@@ -2417,6 +2458,62 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
 
 
+def _instance_get_sort_values(context, marker, sort_keys):
+    """Return the values of the sort keys of the marker instance.
+
+    Only those columns are read, instead of loading the whole marker instance
+    with its joined tables.
+    """
+    columns = [getattr(models.Instance, key) for key in sort_keys]
+    result = model_query(context, models.Instance, args=columns,
+                         read_deleted='yes').\
+                         filter_by(uuid=marker).\
+                         first()
+    if not result:
+        raise exception.MarkerNotFound(marker)
+    return list(result)
+
+
+def _keyset_paginate_query(query, model, limit, sort_keys, sort_dir,
+                           marker_values=None):
+    """Return a query paginated with a keyset.
+
+    Like sqlalchemyutils.paginate_query(), the rows following the marker are
+    selected by comparing the sort keys with their values for the marker,
+    which must be given instead of the marker row. Since all the keys are
+    sorted in the same direction, the first sort key is also bounded by the
+    value of the marker so that the database can scan a range of an index
+    starting with those keys, like instances_deleted_created_at_id_idx,
+    instead of evaluating the criteria for all the rows.
+    """
+    if sort_dir == 'desc':
+        sort_dir_func = desc
+    else:
+        sort_dir_func = asc
+    columns = [getattr(model, key) for key in sort_keys]
+    for column in columns:
+        query = query.order_by(sort_dir_func(column))
+
+    if marker_values is not None:
+        criteria_list = []
+        for i, column in enumerate(columns):
+            crit_attrs = [columns[j] == marker_values[j] for j in range(i)]
+            if sort_dir == 'desc':
+                crit_attrs.append(column < marker_values[i])
+            else:
+                crit_attrs.append(column > marker_values[i])
+            criteria_list.append(and_(*crit_attrs))
+        query = query.filter(or_(*criteria_list))
+        if sort_dir == 'desc':
+            query = query.filter(columns[0] <= marker_values[0])
+        else:
+            query = query.filter(columns[0] >= marker_values[0])
+
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
 def _tag_instance_filter(context, query, filters):
     """Applies tag filtering to an Instance query.
 
@@ -3528,6 +3625,54 @@ def quota_get_all(context, project_id):
     return result
 
 
+@require_context
+@main_context_manager.reader
+def quota_get_all_limits_by_project(context, project_id, quota_class=None):
+    """Returns the quotas of a project, of all its users, of the default
+    quota class and of the given quota class, read in a single query.
+    """
+    class_names = [_DEFAULT_QUOTA_NAME]
+    if quota_class:
+        class_names.append(quota_class)
+    project_quotas = sql.select([
+        sql.literal_column("'project'").label('kind'),
+        sql.cast(null(), sa.String(255)).label('name'),
+        models.Quota.resource,
+        models.Quota.hard_limit]).where(and_(
+            models.Quota.project_id == project_id,
+            models.Quota.deleted == 0))
+    user_quotas = sql.select([
+        sql.literal_column("'user'"),
+        models.ProjectUserQuota.user_id,
+        models.ProjectUserQuota.resource,
+        models.ProjectUserQuota.hard_limit]).where(and_(
+            models.ProjectUserQuota.project_id == project_id,
+            models.ProjectUserQuota.deleted == 0))
+    class_quotas = sql.select([
+        sql.literal_column("'class'"),
+        models.QuotaClass.class_name,
+        models.QuotaClass.resource,
+        models.QuotaClass.hard_limit]).where(and_(
+            models.QuotaClass.class_name.in_(class_names),
+            models.QuotaClass.deleted == 0))
+    rows = context.session.execute(
+        sql.union_all(project_quotas, user_quotas, class_quotas)).fetchall()
+
+    result = {'project': {}, 'users': {}, 'defaults': {}, 'class': {}}
+    for kind, name, resource, hard_limit in rows:
+        if kind == 'project':
+            result['project'][resource] = hard_limit
+        elif kind == 'user':
+            result['users'].setdefault(name, {})[resource] = hard_limit
+        else:
+            if name == _DEFAULT_QUOTA_NAME:
+                result['defaults'][resource] = hard_limit
+            if name == quota_class:
+                result['class'][resource] = hard_limit
+
+    return result
+
+
 @main_context_manager.writer
 def quota_create(context, project_id, resource, limit, user_id=None):
     per_user = user_id and resource not in PER_PROJECT_QUOTAS
@@ -4128,6 +4273,308 @@ def reservation_expire(context):
     reservation_query.soft_delete(synchronize_session=False)
 
 
+# NOTE: The functions below make the same reservations as quota_reserve(),
+# reservation_commit(), reservation_rollback() and reservation_expire(), but
+# without locking all the quota_usages rows of the project for the whole
+# operation. The usage counters are changed with atomic conditional UPDATEs,
+# each one in its own short transaction:
+#
+# * the reserved count of the usage of the user is only increased if the
+#   user limit is not exceeded and the usage was not refreshed since it was
+#   read, otherwise the usage is read again and the update retried,
+# * the project limit is checked once the reserved counts are increased, and
+#   those increments are reverted if it is exceeded, so that concurrent
+#   reservations can only be refused when they are close to the limit but
+#   can't go over it together,
+# * a reservation is only applied to its usage by the request which
+#   soft-deletes it.
+#
+# The reservations needing a quota usage to be created or refreshed go
+# through quota_reserve(), which takes the row locks.
+
+_QUOTA_COUNTER_RETRIES = 5
+
+
+@main_context_manager.reader
+def _quota_counter_usages_get(context, project_id, user_id, resources):
+    rows = model_query(context, models.QuotaUsage, read_deleted="no").\
+        filter_by(project_id=project_id).\
+        filter(models.QuotaUsage.resource.in_(resources)).\
+        filter(or_(models.QuotaUsage.user_id == user_id,
+                   models.QuotaUsage.user_id == null())).\
+        all()
+    return {row.resource: row for row in rows}
+
+
+@main_context_manager.reader
+def _quota_counter_project_usages_get(context, project_id, resources):
+    if not resources:
+        return {}
+    rows = model_query(context, models.QuotaUsage,
+                       args=(models.QuotaUsage.resource,
+                             func.sum(models.QuotaUsage.in_use),
+                             func.sum(models.QuotaUsage.reserved)),
+                       read_deleted="no").\
+        filter_by(project_id=project_id).\
+        filter(models.QuotaUsage.resource.in_(resources)).\
+        group_by(models.QuotaUsage.resource).\
+        all()
+    return {resource: dict(in_use=int(in_use or 0),
+                           reserved=int(reserved or 0))
+            for resource, in_use, reserved in rows}
+
+
+def _is_quota_counter_refresh_needed(quota_usage, max_age):
+    """Same as _is_quota_refresh_needed(), without decrementing the
+    until_refresh count of the usage.
+    """
+    if quota_usage.in_use < 0:
+        return True
+    if quota_usage.until_refresh is not None:
+        return quota_usage.until_refresh <= 1
+    return bool(max_age) and (timeutils.utcnow() -
+                              quota_usage.updated_at).seconds >= max_age
+
+
+def _is_quota_counter_over(quota_usage, delta, limit):
+    return (delta > 0 and
+            0 <= limit < quota_usage.in_use + quota_usage.reserved + delta)
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@main_context_manager.writer
+def _quota_counter_usage_reserve(context, quota_usage, delta, limit):
+    """Adds a positive delta to the reserved count of a usage and decrements
+    its until_refresh count, if the limit is not exceeded and the usage was
+    not refreshed since it was read.
+
+    :return: True if the usage was updated, False otherwise.
+    """
+    usage_model = models.QuotaUsage
+    query = model_query(context, usage_model, read_deleted="no").\
+        filter_by(id=quota_usage.id).\
+        filter(usage_model.in_use >= 0)
+    updates = {}
+    if quota_usage.until_refresh is None:
+        query = query.filter(usage_model.until_refresh == null())
+    else:
+        query = query.filter_by(until_refresh=quota_usage.until_refresh)
+        updates['until_refresh'] = usage_model.until_refresh - 1
+    if delta > 0:
+        if limit >= 0:
+            query = query.filter(
+                usage_model.in_use + usage_model.reserved + delta <= limit)
+        updates['reserved'] = usage_model.reserved + delta
+    if not updates:
+        return query.count() > 0
+    return query.update(updates, synchronize_session=False) > 0
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@main_context_manager.writer
+def _quota_counter_usage_unreserve(context, usage_id, delta):
+    model_query(context, models.QuotaUsage, read_deleted="no").\
+        filter_by(id=usage_id).\
+        update({'reserved': models.QuotaUsage.reserved - delta},
+               synchronize_session=False)
+
+
+def _quota_counter_usages_unreserve(context, user_usages, deltas):
+    for res, delta in deltas.items():
+        if delta > 0:
+            _quota_counter_usage_unreserve(context, user_usages[res].id,
+                                           delta)
+
+
+@main_context_manager.writer
+def _quota_counter_reservations_create(context, user_usages, deltas, expire,
+                                       project_id, user_id):
+    reservations = []
+    for res, delta in deltas.items():
+        reservation = _reservation_create(str(uuid.uuid4()),
+                                          user_usages[res], project_id,
+                                          user_id, res, delta, expire,
+                                          context.session)
+        reservations.append(reservation.uuid)
+    return reservations
+
+
+def _quota_counter_reserve(context, project_quotas, user_quotas, deltas,
+                           expire, max_age, project_id, user_id):
+    """Makes the reservations by updating the usage counters.
+
+    :return: the list of reservation UUIDs, or None if the usages have to be
+             created or refreshed first.
+    :raises: OverQuota if the project or user limits would be exceeded.
+    """
+    for attempt in range(_QUOTA_COUNTER_RETRIES):
+        user_usages = _quota_counter_usages_get(context, project_id, user_id,
+                                                list(deltas))
+        if (len(user_usages) != len(deltas) or
+                any(_is_quota_counter_refresh_needed(usage, max_age)
+                    for usage in user_usages.values())):
+            return None
+
+        # Reserve the resources on the usages of the user, in the same order
+        # as the other requests to make lock waits less likely.
+        reserved = {}
+        overs = []
+        retry = False
+        for res, delta in sorted(deltas.items()):
+            if _quota_counter_usage_reserve(context, user_usages[res],
+                                            delta, user_quotas[res]):
+                reserved[res] = delta
+                continue
+            # Find whether the usage went over the limit or was changed
+            # by another request in the meantime.
+            usage = _quota_counter_usages_get(context, project_id, user_id,
+                                              [res]).get(res)
+            if (usage is not None and
+                    usage.until_refresh == user_usages[res].until_refresh and
+                    not _is_quota_counter_refresh_needed(usage, max_age) and
+                    _is_quota_counter_over(usage, delta, user_quotas[res])):
+                LOG.debug('Request is over user quota for resource '
+                          '"%(res)s". User limit: %(limit)s, delta: '
+                          '%(delta)s', {'res': res, 'delta': delta,
+                                        'limit': user_quotas[res]})
+                overs.append(res)
+            else:
+                retry = True
+            break
+
+        # Now that the increments are visible to the other requests, check
+        # the total usage of the project.
+        if not overs and not retry:
+            project_usages = _quota_counter_project_usages_get(
+                context, project_id, [res for res, delta in reserved.items()
+                                      if delta > 0 and
+                                      project_quotas[res] >= 0])
+            for res, usage in project_usages.items():
+                total = usage['in_use'] + usage['reserved']
+                if project_quotas[res] < total:
+                    LOG.debug('Request is over project quota for resource '
+                              '"%(res)s". Project limit: %(limit)s, delta: '
+                              '%(delta)s, current total project usage: '
+                              '%(total)s',
+                              {'res': res, 'limit': project_quotas[res],
+                               'delta': deltas[res],
+                               'total': total - deltas[res]})
+                    overs.append(res)
+
+        if overs or retry:
+            _quota_counter_usages_unreserve(context, user_usages, reserved)
+            if retry:
+                continue
+            if project_quotas == user_quotas:
+                usages = _quota_counter_project_usages_get(
+                    context, project_id, list(deltas))
+            else:
+                usages = {res: dict(in_use=usage.in_use,
+                                    reserved=usage.reserved)
+                          for res, usage in _quota_counter_usages_get(
+                              context, project_id, user_id,
+                              list(deltas)).items()}
+            raise exception.OverQuota(overs=sorted(overs), quotas=user_quotas,
+                                      usages=usages)
+
+        unders = [res for res, delta in deltas.items()
+                  if delta < 0 and delta + user_usages[res].in_use < 0]
+        if unders:
+            LOG.warning(_LW("Change will make usage less than 0 for the "
+                            "following resources: %s"), unders)
+
+        try:
+            return _quota_counter_reservations_create(
+                context, user_usages, deltas, expire, project_id, user_id)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                _quota_counter_usages_unreserve(context, user_usages, deltas)
+
+    LOG.debug('Quota usages of project %(project_id)s and user %(user_id)s '
+              'changed during %(retries)d attempts to reserve %(deltas)s',
+              {'project_id': project_id, 'user_id': user_id,
+               'retries': _QUOTA_COUNTER_RETRIES, 'deltas': deltas})
+    return None
+
+
+@require_context
+def quota_reserve_counters(context, resources, project_quotas, user_quotas,
+                           deltas, expire, until_refresh, max_age,
+                           project_id=None, user_id=None):
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    reservations = _quota_counter_reserve(context, project_quotas,
+                                          user_quotas, deltas, expire,
+                                          max_age, project_id, user_id)
+    if reservations is None:
+        # Let quota_reserve() create or refresh the usages under the row
+        # locks
+        reservations = quota_reserve(context, resources, project_quotas,
+                                     user_quotas, deltas, expire,
+                                     until_refresh, max_age,
+                                     project_id=project_id, user_id=user_id)
+    return reservations
+
+
+@oslo_db_api.wrap_db_retry(max_retries=5, retry_on_deadlock=True)
+@main_context_manager.writer
+def _reservation_counter_settle(context, reservation, commit):
+    """Soft-deletes a reservation and applies it to its usage, unless it was
+    already committed, rolled back or expired by another request.
+    """
+    settled = model_query(context, models.Reservation, read_deleted="no").\
+        filter_by(id=reservation.id).\
+        soft_delete(synchronize_session=False)
+    if not settled:
+        return
+
+    updates = {}
+    if reservation.delta >= 0:
+        updates['reserved'] = models.QuotaUsage.reserved - reservation.delta
+    if commit:
+        updates['in_use'] = models.QuotaUsage.in_use + reservation.delta
+    if updates:
+        model_query(context, models.QuotaUsage, read_deleted="no").\
+            filter_by(id=reservation.usage_id).\
+            update(updates, synchronize_session=False)
+
+
+@main_context_manager.reader
+def _reservation_counter_get_all(context, reservations):
+    return model_query(context, models.Reservation, read_deleted="no").\
+        filter(models.Reservation.uuid.in_(reservations)).\
+        all()
+
+
+@require_context
+def reservation_commit_counters(context, reservations, project_id=None,
+                                user_id=None):
+    for reservation in _reservation_counter_get_all(context, reservations):
+        _reservation_counter_settle(context, reservation, True)
+
+
+@require_context
+def reservation_rollback_counters(context, reservations, project_id=None,
+                                  user_id=None):
+    for reservation in _reservation_counter_get_all(context, reservations):
+        _reservation_counter_settle(context, reservation, False)
+
+
+@main_context_manager.reader
+def _reservation_counter_get_expired(context):
+    return model_query(context, models.Reservation, read_deleted="no").\
+        filter(models.Reservation.expire < timeutils.utcnow()).\
+        all()
+
+
+def reservation_expire_counters(context):
+    for reservation in _reservation_counter_get_expired(context):
+        _reservation_counter_settle(context, reservation, False)
+
+
 ###################
 
 
@@ -6394,16 +6841,22 @@ def task_log_end_task(context, task_name, period_beginning, period_ending,
 ##################
 
 
-def _archive_deleted_rows_for_table(tablename, max_rows):
+# Number of rows moved to a shadow table in each transaction by
+# archive_deleted_rows()
+_ARCHIVE_CHUNK_SIZE = 1000
+
+
+def _archive_deleted_rows_for_table(tablename, max_rows, watermarks=None):
     """Move up to max_rows rows from one tables to the corresponding
     shadow table.
 
+    The rows are moved by chunks of consecutive ids, each chunk in its own
+    transaction. If a watermarks dict is provided, only the rows after the
+    id it holds for the table are moved, and it is updated with the last id
+    moved, or None once all the deleted rows of the table were moved.
+
     :returns: number of rows archived
     """
-    # NOTE(guochbo): There is a circular import, nova.db.sqlalchemy.utils
-    # imports nova.db.sqlalchemy.api.
-    from nova.db.sqlalchemy import utils as db_utils
-
     engine = get_engine()
     conn = engine.connect()
     metadata = MetaData()
@@ -6420,6 +6873,8 @@ def _archive_deleted_rows_for_table(tablename, max_rows):
         shadow_table = Table(shadow_tablename, metadata, autoload=True)
     except NoSuchTableError:
         # No corresponding shadow table; skip it.
+        if watermarks is not None:
+            watermarks[tablename] = None
         return rows_archived
 
     if tablename == "dns_domains":
@@ -6428,43 +6883,115 @@ def _archive_deleted_rows_for_table(tablename, max_rows):
         column = table.c.domain
     else:
         column = table.c.id
-    # NOTE(guochbo): Use DeleteFromSelect to avoid
-    # database's limit of maximum parameter in one SQL statement.
+    if watermarks is None:
+        watermarks = {}
     deleted_column = table.c.deleted
     columns = [c.name for c in table.c]
-    insert = shadow_table.insert(inline=True).\
-        from_select(columns,
-                    sql.select([table],
-                               deleted_column != deleted_column.default.arg).
-                    order_by(column).limit(max_rows))
-    query_delete = sql.select([column],
-                          deleted_column != deleted_column.default.arg).\
-                          order_by(column).limit(max_rows)
-
-    delete_statement = db_utils.DeleteFromSelect(table, query_delete, column)
-    try:
-        # Group the insert and delete in a transaction.
-        with conn.begin():
-            conn.execute(insert)
-            result_delete = conn.execute(delete_statement)
-    except db_exc.DBReferenceError as ex:
-        # A foreign key constraint keeps us from deleting some of
-        # these rows until we clean up a dependent table.  Just
-        # skip this table for now; we'll come back to it later.
-        LOG.warning(_LW("IntegrityError detected when archiving table "
-                     "%(tablename)s: %(error)s"),
-                 {'tablename': tablename, 'error': six.text_type(ex)})
-        return rows_archived
 
-    rows_archived = result_delete.rowcount
+    while max_rows is None or rows_archived < max_rows:
+        chunk_size = _ARCHIVE_CHUNK_SIZE
+        if max_rows is not None:
+            chunk_size = min(chunk_size, max_rows - rows_archived)
+        deleted = deleted_column != deleted_column.default.arg
+        if watermarks.get(tablename) is not None:
+            deleted = and_(deleted, column > watermarks[tablename])
+        # NOTE: The chunks are ranges of ids rather than a list of ids, to
+        # avoid the database's limit of maximum parameter in one SQL
+        # statement. The last chunk has no upper bound.
+        last_id = conn.execute(sql.select([column]).where(deleted).
+                               order_by(column).offset(chunk_size - 1).
+                               limit(1)).scalar()
+        if last_id is not None:
+            deleted = and_(deleted, column <= last_id)
+        insert = shadow_table.insert(inline=True).\
+            from_select(columns, sql.select([table], deleted))
+        delete = table.delete().where(deleted)
+        try:
+            # Group the insert and delete in a transaction.
+            with conn.begin():
+                conn.execute(insert)
+                result_delete = conn.execute(delete)
+        except db_exc.DBReferenceError as ex:
+            # A foreign key constraint keeps us from deleting some of
+            # these rows until we clean up a dependent table.  Just
+            # skip this table for now; we'll come back to it later.
+            LOG.warning(_LW("IntegrityError detected when archiving table "
+                            "%(tablename)s: %(error)s"),
+                        {'tablename': tablename, 'error': six.text_type(ex)})
+            break
+
+        rows_archived += result_delete.rowcount
+        watermarks[tablename] = last_id
+        if last_id is None:
+            break
 
     return rows_archived
 
 
-def archive_deleted_rows(max_rows=None):
+def _get_archive_table_groups(meta):
+    """Groups the tables to archive in the order they have to be archived.
+
+    The tables of a group don't reference each other, and are only
+    referenced by the tables of the previous groups, so that their deleted
+    rows can be archived in parallel once the previous groups are archived.
+    """
+    tables = [table for table in meta.sorted_tables
+              if table.name != 'migrate_version' and
+              not table.name.startswith(_SHADOW_TABLE_PREFIX)]
+    referencing = collections.defaultdict(set)
+    for table in tables:
+        for fk in table.foreign_keys:
+            if fk.column.table is not table:
+                referencing[fk.column.table.name].add(table.name)
+
+    # sorted_tables lists the tables referencing another one after it, so
+    # the groups of the referencing tables are known when going backwards.
+    levels = {}
+    groups = collections.defaultdict(list)
+    for table in reversed(tables):
+        level = max([levels.get(name, 0) + 1
+                     for name in referencing[table.name]] or [0])
+        levels[table.name] = level
+        groups[level].append(table.name)
+    return [groups[level] for level in sorted(groups)]
+
+
+def _archive_deleted_rows_with_budget(tablename, budget, watermarks):
+    """Move the deleted rows of a table to its shadow table by chunks, as
+    long as the number of rows to archive shared with the tables archived in
+    parallel is not reached.
+
+    :param budget: single item list holding the number of rows which can
+                   still be archived
+    :returns: number of rows archived
+    """
+    rows_archived = 0
+    while budget[0] > 0:
+        max_rows = min(_ARCHIVE_CHUNK_SIZE, budget[0])
+        # Take the rows from the budget before archiving them, as the other
+        # tables are archived in the meantime.
+        budget[0] -= max_rows
+        archived = _archive_deleted_rows_for_table(tablename, max_rows,
+                                                   watermarks=watermarks)
+        budget[0] += max_rows - archived
+        rows_archived += archived
+        if archived < max_rows:
+            break
+    return rows_archived
+
+
+def archive_deleted_rows(max_rows=None, watermarks=None, workers=1):
     """Move up to max_rows rows from production tables to the corresponding
     shadow tables.
 
+    :param max_rows: maximum number of rows to archive
+    :param watermarks: optional dict of the last id archived in each table,
+                       updated as the rows are archived; passing it to the
+                       next call resumes the archiving where it stopped, and
+                       skips the tables which have no deleted rows left
+                       until all the tables have none, the next pass then
+                       starting again from the first rows of each table
+    :param workers: number of tables archived in parallel
     :returns: dict that maps table name to number of rows archived from that
               table, for example:
 
@@ -6478,24 +7005,31 @@ def archive_deleted_rows(max_rows=None):
 
     """
     table_to_rows_archived = {}
-    total_rows_archived = 0
+    if watermarks is None:
+        watermarks = {}
+    budget = [max_rows]
+    archive = functools.partial(_archive_deleted_rows_with_budget,
+                                budget=budget, watermarks=watermarks)
+    pool = eventlet.GreenPool(workers)
     meta = MetaData(get_engine(use_slave=True))
     meta.reflect()
-    # Reverse sort the tables so we get the leaf nodes first for processing.
-    for table in reversed(meta.sorted_tables):
-        tablename = table.name
-        # skip the special sqlalchemy-migrate migrate_version table and any
-        # shadow tables
-        if (tablename == 'migrate_version' or
-                tablename.startswith(_SHADOW_TABLE_PREFIX)):
-            continue
-        rows_archived = _archive_deleted_rows_for_table(
-            tablename, max_rows=max_rows - total_rows_archived)
-        total_rows_archived += rows_archived
-        # Only report results for tables that had updates.
-        if rows_archived:
-            table_to_rows_archived[tablename] = rows_archived
-        if total_rows_archived >= max_rows:
+    table_groups = _get_archive_table_groups(meta)
+    if all(watermarks.get(tablename, 0) is None
+           for tablenames in table_groups for tablename in tablenames):
+        # The previous pass is complete, the rows deleted since then are
+        # found before the watermarks.
+        watermarks.clear()
+    # Archive the tables referencing other ones first.
+    for tablenames in table_groups:
+        tablenames = [tablename for tablename in tablenames
+                      if tablename not in watermarks or
+                      watermarks[tablename] is not None]
+        for tablename, rows_archived in zip(tablenames,
+                                            pool.imap(archive, tablenames)):
+            # Only report results for tables that had updates.
+            if rows_archived:
+                table_to_rows_archived[tablename] = rows_archived
+        if budget[0] <= 0:
             break
     return table_to_rows_archived
 
@@ -13,14 +13,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import functools
 import inspect
 
 from oslo_concurrency import lockutils
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import excutils
 
 from nova.db import base
+from nova import exception
 from nova import hooks
 from nova.i18n import _, _LE
 from nova.network import model as network_model
@@ -82,6 +85,25 @@ def refresh_cache(f):
     return wrapper
 
 
+@contextlib.contextmanager
+def refresh_cache_locks(instance_uuids):
+    """Hold the refresh_cache locks of several instances.
+
+    The locks are taken in the order of the instance UUIDs so that two
+    callers locking overlapping sets of instances can't deadlock.
+    """
+    locks = []
+    try:
+        for instance_uuid in sorted(set(instance_uuids)):
+            lock = lockutils.lock('refresh_cache-%s' % instance_uuid)
+            lock.__enter__()
+            locks.append(lock)
+        yield
+    finally:
+        for lock in reversed(locks):
+            lock.__exit__(None, None, None)
+
+
 SENTINEL = object()
 
 
@@ -265,6 +287,63 @@ class NetworkAPI(base.Base):
         """Template method, so a subclass can implement for neutron/network."""
         raise NotImplementedError()
 
+    def refresh_instances_nw_info_cache(self, context, instances):
+        """Refreshes the network info cache of a list of instances.
+
+        Only the caches whose network info changed are saved. The errors are
+        logged and don't stop the refresh of the other instances.
+
+        :returns: The list of the instances whose cache was updated.
+        """
+        updated = []
+        for instance in instances:
+            with lockutils.lock('refresh_cache-%s' % instance.uuid):
+                if self._update_nw_info_cache_if_changed(
+                        context, instance,
+                        functools.partial(self._get_instance_nw_info,
+                                          context, instance)):
+                    updated.append(instance)
+        return updated
+
+    def _update_nw_info_cache_if_changed(self, context, instance,
+                                         get_nw_info):
+        """Saves the network info returned by get_nw_info() in the cache of
+        the instance if it differs from the cached one.
+
+        Must be called with the refresh_cache lock of the instance held.
+
+        :returns: True if the cache was updated.
+        """
+        try:
+            nw_info = get_nw_info()
+            # NOTE: the cache of the instance is read after building the
+            # network info since building it may refresh the cache.
+            cached_nw_info = None
+            if instance.info_cache is not None:
+                cached_nw_info = instance.info_cache.network_info
+            if (cached_nw_info is not None and
+                    jsonutils.loads(nw_info.json()) ==
+                    jsonutils.loads(cached_nw_info.json())):
+                LOG.debug('The network info_cache is up to date',
+                          instance=instance)
+                return False
+            update_instance_cache_with_nw_info(self, context, instance,
+                                               nw_info=nw_info,
+                                               update_cells=False)
+            LOG.debug('Updated the network info_cache for instance',
+                      instance=instance)
+            return True
+        except exception.InstanceNotFound:
+            LOG.debug('Instance no longer exists. Unable to refresh',
+                      instance=instance)
+        except exception.InstanceInfoCacheNotFound:
+            LOG.debug('InstanceInfoCache no longer exists. '
+                      'Unable to refresh', instance=instance)
+        except Exception:
+            LOG.error(_LE('An error occurred while refreshing the network '
+                          'cache.'), instance=instance, exc_info=True)
+        return False
+
     def create_pci_requests_for_sriov_ports(self, context,
                                             pci_requests,
                                             requested_networks):
@@ -18,6 +18,7 @@
 """Implements vlans, bridges, and iptables rules using linux utilities."""
 
 import calendar
+import collections
 import inspect
 import os
 import re
@@ -85,6 +86,9 @@ class IptablesRule(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash((self.chain, self.rule, self.top, self.wrap))
+
     def __repr__(self):
         if self.wrap:
             chain = '%s-%s' % (binary_name, self.chain)
@@ -99,6 +103,8 @@ class IptablesTable(object):
 
     def __init__(self):
         self.rules = []
+        # Set of the rules, to find the duplicates without scanning the list
+        self._rules_set = set()
         self.remove_rules = []
         self.chains = set()
         self.unwrapped_chains = set()
@@ -167,6 +173,7 @@ class IptablesTable(object):
             self.remove_rules += [r for r in self.rules
                                   if jump_snippet in r.rule]
         self.rules = [r for r in self.rules if jump_snippet not in r.rule]
+        self._rules_set = set(self.rules)
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -186,12 +193,13 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         rule_obj = IptablesRule(chain, rule, wrap, top)
-        if rule_obj in self.rules:
+        if rule_obj in self._rules_set:
             LOG.debug("Skipping duplicate iptables rule addition. "
-                      "%(rule)r already in %(rules)r",
-                      {'rule': rule_obj, 'rules': self.rules})
+                      "%(rule)r already in the %(chain)s chain",
+                      {'rule': rule_obj, 'chain': chain})
         else:
-            self.rules.append(IptablesRule(chain, rule, wrap, top))
+            self.rules.append(rule_obj)
+            self._rules_set.add(rule_obj)
             self.dirty = True
 
     def _wrap_target_chain(self, s):
@@ -209,6 +217,7 @@ class IptablesTable(object):
         """
         try:
             self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            self._rules_set.discard(IptablesRule(chain, rule, wrap, top))
             if not wrap:
                 self.remove_rules.append(IptablesRule(chain, rule, wrap, top))
             self.dirty = True
@@ -224,6 +233,7 @@ class IptablesTable(object):
             regex = re.compile(regex)
         num_rules = len(self.rules)
         self.rules = [r for r in self.rules if not regex.match(str(r))]
+        self._rules_set = set(self.rules)
         removed = num_rules - len(self.rules)
         if removed > 0:
             self.dirty = True
@@ -231,12 +241,49 @@ class IptablesTable(object):
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
+        chained_rules = set(rule for rule in self.rules
+                            if rule.chain == chain and rule.wrap == wrap)
         if chained_rules:
             self.dirty = True
-        for rule in chained_rules:
-            self.rules.remove(rule)
+            self.rules = [rule for rule in self.rules
+                          if rule not in chained_rules]
+            self._rules_set -= chained_rules
+
+
+class _IptablesTableState(object):
+    """Snapshot of the rules of an IptablesTable, as passed to
+    iptables-restore.
+
+    The rules of the wrapped chains are indexed by chain, so that the chains
+    changed between two snapshots can be found, while everything outside of
+    them is only compared as a whole.
+    """
+
+    def __init__(self, table):
+        # Lines of each wrapped chain, its top rules first
+        self.chains = dict((chain, []) for chain in table.chains)
+        top_rules = collections.defaultdict(list)
+        unwrapped = []
+        for rule in table.rules:
+            if not rule.wrap:
+                unwrapped.append((rule.chain, rule.rule, rule.top))
+            elif rule.top:
+                top_rules[rule.chain].append(str(rule))
+            else:
+                self.chains.setdefault(rule.chain, []).append(str(rule))
+        for chain, lines in six.iteritems(top_rules):
+            self.chains[chain] = lines + self.chains.get(chain, [])
+        self.unwrapped = (tuple(unwrapped),
+                          frozenset(table.unwrapped_chains))
+
+    def diff(self, other):
+        """Returns the sorted lists of the wrapped chains changed and removed
+        since the other snapshot.
+        """
+        changed = sorted(chain for chain, lines in six.iteritems(self.chains)
+                         if other.chains.get(chain) != lines)
+        removed = sorted(set(other.chains) - set(self.chains))
+        return changed, removed
 
 
 class IptablesManager(object):
@@ -275,6 +322,10 @@ class IptablesManager(object):
 
         self.iptables_apply_deferred = False
 
+        # State of the tables as last restored, keyed by (command, table
+        # name), used to only restore the changed chains
+        self._applied_tables = {}
+
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
         # of FORWARD and OUTPUT.
@@ -358,12 +409,48 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        With the iptables_apply_changed_chains option, only the chains
+        changed since the previous apply are restored, with
+        iptables-restore --noflush, when the rules outside of our wrapped
+        chains didn't change.
+
         """
         s = [('iptables', self.ipv4)]
         if CONF.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
+            self._apply_tables(cmd, tables)
+        LOG.debug("IPTablesManager.apply completed with success")
+
+    def _apply_tables(self, cmd, tables):
+        changed_lines = None
+        if CONF.iptables_apply_changed_chains:
+            states = dict((table_name, _IptablesTableState(table))
+                          for table_name, table in six.iteritems(tables))
+            changed_lines = self._get_changed_chains(cmd, tables, states)
+
+        try:
+            self._restore_tables(cmd, tables, changed_lines)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # Don't trust the state of the tables anymore
+                self._applied_tables.clear()
+
+        if CONF.iptables_apply_changed_chains:
+            for table_name, state in six.iteritems(states):
+                self._applied_tables[(cmd, table_name)] = state
+
+    def _restore_tables(self, cmd, tables, changed_lines):
+        if changed_lines is not None:
+            if changed_lines:
+                self.execute('%s-restore' % (cmd,), '-c', '--noflush',
+                             run_as_root=True,
+                             process_input='\n'.join(changed_lines),
+                             attempts=5)
+            for table in six.itervalues(tables):
+                table.dirty = False
+        else:
             all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
                                                 run_as_root=True,
                                                 attempts=5)
@@ -376,7 +463,33 @@ class IptablesManager(object):
             self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
                          process_input='\n'.join(all_lines),
                          attempts=5)
-        LOG.debug("IPTablesManager.apply completed with success")
+
+    def _get_changed_chains(self, cmd, tables, states):
+        """Returns the iptables-restore --noflush input restoring the wrapped
+        chains changed since the previous apply, or None if the whole tables
+        have to be restored.
+        """
+        lines = []
+        for table_name, table in sorted(six.iteritems(tables)):
+            state = states[table_name]
+            applied = self._applied_tables.get((cmd, table_name))
+            if (applied is None or table.remove_rules or
+                    table.remove_chains or
+                    state.unwrapped != applied.unwrapped):
+                return None
+            changed_chains, removed_chains = state.diff(applied)
+            if not changed_chains and not removed_chains:
+                continue
+            # With --noflush, declaring a user-defined chain flushes it
+            lines.append('*%s' % table_name)
+            lines += [':%s-%s - [0:0]' % (binary_name, chain)
+                      for chain in changed_chains + removed_chains]
+            for chain in changed_chains:
+                lines += state.chains[chain]
+            lines += ['-X %s-%s' % (binary_name, chain)
+                      for chain in removed_chains]
+            lines.append('COMMIT')
+        return lines
 
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
@@ -412,19 +525,18 @@ class IptablesManager(object):
 
         if CONF.iptables_top_regex:
             regex = re.compile(CONF.iptables_top_regex)
-            temp_filter = [line for line in new_filter if regex.search(line)]
-            for rule_str in temp_filter:
-                new_filter = [s for s in new_filter
-                              if s.strip() != rule_str.strip()]
-            top_rules = temp_filter
+            top_rules = [line for line in new_filter if regex.search(line)]
+            top_lines = set(line.strip() for line in top_rules)
+            new_filter = [s for s in new_filter
+                          if s.strip() not in top_lines]
 
         if CONF.iptables_bottom_regex:
             regex = re.compile(CONF.iptables_bottom_regex)
-            temp_filter = [line for line in new_filter if regex.search(line)]
-            for rule_str in temp_filter:
-                new_filter = [s for s in new_filter
-                              if s.strip() != rule_str.strip()]
-            bottom_rules = temp_filter
+            bottom_rules = [line for line in new_filter
+                            if regex.search(line)]
+            bottom_lines = set(line.strip() for line in bottom_rules)
+            new_filter = [s for s in new_filter
+                          if s.strip() not in bottom_lines]
 
         seen_chains = False
         rules_index = 0
@@ -439,8 +551,16 @@ class IptablesManager(object):
         if not seen_chains:
             rules_index = 2
 
+        # Index the current rules by their text without the [packet:byte]
+        # counters, the last occurrence of a rule taking precedence
+        current_rules = {}
+        for line in new_filter:
+            if line.startswith('['):
+                current_rules[_strip_counters(line)] = line
+
         our_rules = top_rules
         bot_rules = []
+        moved_rules = set()
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
@@ -452,31 +572,23 @@ class IptablesManager(object):
                 # [packet:byte] counts and replace it with [0:0], so let's
                 # go look for a duplicate, and over-ride our table rule if
                 # found.
-
-                # ignore [packet:byte] counts at beginning of line
-                if rule_str.startswith('['):
-                    rule_str = rule_str.split(']', 1)[1]
-                dup_filter = [s for s in new_filter
-                              if rule_str.strip() in s.strip()]
-
-                new_filter = [s for s in new_filter
-                              if rule_str.strip() not in s.strip()]
-                # if no duplicates, use original rule
-                if dup_filter:
-                    # grab the last entry, if there is one
-                    dup = list(dup_filter)[-1]
-                    rule_str = str(dup)
-                else:
-                    rule_str = str(rule)
-                rule_str.strip()
+                rule_key = _strip_counters(rule_str)
+                dup = current_rules.pop(rule_key, None)
+                moved_rules.add(rule_key)
+                if dup is not None:
+                    rule_str = dup
 
                 our_rules += [rule_str]
             else:
                 bot_rules += [rule_str]
 
+        if moved_rules:
+            new_filter = [s for s in new_filter
+                          if not s.startswith('[') or
+                          _strip_counters(s) not in moved_rules]
+
         our_rules += bot_rules
 
-        new_filter = list(new_filter)
         new_filter[rules_index:rules_index] = our_rules
 
         new_filter[rules_index:rules_index] = [':%s - [0:0]' % (name,)
@@ -487,64 +599,106 @@ class IptablesManager(object):
 
         commit_index = new_filter.index('COMMIT')
         new_filter[commit_index:commit_index] = bottom_rules
+
+        # Exact text of the rules and chains to remove
+        remove_rules_count = collections.Counter(
+            str(rule).split(' ', 1)[1].strip() for rule in remove_rules)
         seen_lines = set()
+        result = []
 
-        def _weed_out_duplicates(line):
+        # We filter duplicates, letting the *last* occurrence take
+        # precedence.  We also filter out anything in the "remove"
+        # lists.
+        for line in reversed(new_filter):
             # ignore [packet:byte] counts at beginning of lines
-            if line.startswith('['):
-                line = line.split(']', 1)[1]
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
+            stripped = _strip_counters(line)
+            if stripped in seen_lines:
+                continue
+            seen_lines.add(stripped)
 
-        def _weed_out_removes(line):
-            # We need to find exact matches here
             if line.startswith(':'):
                 # it's a chain, for example, ":nova-billing - [0:0]"
                 # strip off everything except the chain name
-                line = line.split(':')[1]
-                line = line.split('- [')[0]
-                line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                chain = line.split(':')[1].split('- [')[0].strip()
+                if chain in remove_chains:
+                    remove_chains.remove(chain)
+                    continue
             elif line.startswith('['):
                 # it's a rule
-                # ignore [packet:byte] counts at beginning of lines
-                line = line.split(']', 1)[1]
-                line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
-
-            # Leave it alone
-            return True
+                if remove_rules_count[stripped] > 0:
+                    remove_rules_count[stripped] -= 1
+                    continue
 
-        # We filter duplicates, letting the *last* occurrence take
-        # precedence.  We also filter out anything in the "remove"
-        # lists.
-        new_filter = list(new_filter)
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter = filter(_weed_out_removes, new_filter)
-        new_filter = list(new_filter)
-        new_filter.reverse()
+            result.append(line)
+        result.reverse()
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
+
+        return result
+
+
+def _strip_counters(line):
+    """Returns an iptables-save line without its [packet:byte] counters."""
+    if line.startswith('['):
+        line = line.split(']', 1)[1]
+    return line.strip()
+
+
+class IpsetManager(object):
+    """Wrapper for ipset.
+
+    Keeps the members of the hash:ip sets created through it in memory, so
+    that only the addresses added to or removed from a set since the previous
+    update are sent to ipset.
+    """
+
+    def __init__(self, execute=None):
+        if not execute:
+            self.execute = _execute
+        else:
+            self.execute = execute
+        # Dict of set of members keyed by set name
+        self.sets = {}
+
+    def set_members(self, name, members, family='inet'):
+        """Sets the members of a set, creating it if needed.
+
+        The first time a set is updated by this service, it is filled under
+        a temporary name and swapped with the set left by a previous run, if
+        any, so that the members staying in the set are always matched.
+
+        Returns True if the members of the set changed.
+        """
+        members = set(members)
+        current = self.sets.get(name)
+        if current is None:
+            tmp_name = '%s-new' % name
+            lines = ['create %s hash:ip family %s' % (name, family),
+                     'create %s hash:ip family %s' % (tmp_name, family),
+                     'flush %s' % tmp_name]
+            lines += ['add %s %s' % (tmp_name, member)
+                      for member in sorted(members)]
+            lines += ['swap %s %s' % (tmp_name, name),
+                      'destroy %s' % tmp_name]
+        else:
+            lines = ['del %s %s' % (name, member)
+                     for member in sorted(current - members)]
+            lines += ['add %s %s' % (name, member)
+                      for member in sorted(members - current)]
+            if not lines:
+                return False
+        self.execute('ipset', 'restore', '-exist', run_as_root=True,
+                     process_input='\n'.join(lines) + '\n')
+        self.sets[name] = members
+        return True
 
-        return new_filter
+    def destroy_set(self, name):
+        """Destroys a set once no iptables rule references it anymore."""
+        if self.sets.pop(name, None) is not None:
+            self.execute('ipset', 'destroy', name, run_as_root=True,
+                         check_exit_code=[0, 1])
 
 
 # NOTE(jkoelker) This is just a nice little stub point since mocking
@@ -1884,6 +2038,7 @@ class NeutronLinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
 
 
 iptables_manager = IptablesManager()
+ipset_manager = IpsetManager()
 
 
 def set_vf_interface_vlan(pci_addr, mac_addr, vlan=0):
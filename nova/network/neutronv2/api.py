@@ -15,7 +15,9 @@
 #    under the License.
 #
 
+import collections
 import copy
+import functools
 import time
 import uuid
 
@@ -69,6 +71,15 @@ soft_external_network_attach_authorize = extensions.soft_core_authorizer(
 _SESSION = None
 _ADMIN_AUTH = None
 
+# Subnets, DHCP ports and floating IPs needed to build the network info of a
+# list of ports, fetched with a few bulk queries:
+# - subnets: dict of subnets keyed by ID, None for those not found
+# - dhcp_ports: dict of lists of DHCP ports keyed by network ID
+# - floating_ips: dict of lists of floating IPs keyed by (port ID, fixed IP)
+# - networks: dict of networks keyed by ID, or None if they were not listed
+_NwInfoLookups = collections.namedtuple(
+    '_NwInfoLookups', ['subnets', 'dhcp_ports', 'floating_ips', 'networks'])
+
 
 def list_opts():
     opts = copy.deepcopy(_neutron_options)
@@ -163,6 +174,9 @@ class API(base_api.NetworkAPI):
         super(API, self).__init__(skip_policy_check=skip_policy_check)
         self.last_neutron_extension_sync = None
         self.extensions = {}
+        # Subnets and DHCP ports reused by the network info builds, as
+        # (expiration time, value) tuples keyed by (kind, project ID, ID)
+        self._nw_info_lookup_cache = {}
 
     def setup_networks_on_host(self, context, instance, host=None,
                                teardown=False):
@@ -936,8 +950,12 @@ class API(base_api.NetworkAPI):
         return network_model.NetworkInfo.hydrate(nw_info)
 
     def _gather_port_ids_and_networks(self, context, instance, networks=None,
-                                      port_ids=None):
-        """Return an instance's complete list of port_ids and networks."""
+                                      port_ids=None, lookups=None):
+        """Return an instance's complete list of port_ids and networks.
+
+        If the networks of the instance were listed in the lookups, they are
+        taken from there rather than listed again.
+        """
 
         if ((networks is None and port_ids is not None) or
             (port_ids is None and networks is not None)):
@@ -953,9 +971,16 @@ class API(base_api.NetworkAPI):
             net_ids = [iface['network']['id'] for iface in ifaces]
 
         if networks is None:
-            networks = self._get_available_networks(context,
-                                                    instance.project_id,
-                                                    net_ids)
+            if lookups is not None and lookups.networks is not None:
+                networks = [lookups.networks[net_id]
+                            for net_id in set(net_ids)
+                            if net_id in lookups.networks]
+                _ensure_requested_network_ordering(
+                    lambda x: x['id'], networks, net_ids)
+            else:
+                networks = self._get_available_networks(context,
+                                                        instance.project_id,
+                                                        net_ids)
         # an interface was added/removed from instance.
         else:
 
@@ -1584,12 +1609,116 @@ class API(base_api.NetworkAPI):
         """Force add a network to the project."""
         raise NotImplementedError()
 
-    def _nw_info_get_ips(self, client, port):
+    def _get_nw_info_lookup(self, context, kind, ids, fetch):
+        """Return a dict of the subnets or DHCP ports keyed by ID.
+
+        The IDs not found in the lookup cache, or whose entry expired, are
+        fetched with a single call to fetch(), which gets the list of those
+        IDs and returns a dict of the items keyed by ID.
+        """
+        ttl = CONF.neutron.network_info_cache_ttl
+        cache = self._nw_info_lookup_cache
+        now = time.time()
+        if ttl:
+            # Drop the expired entries so that the cache doesn't keep the
+            # subnets of the networks not used anymore
+            for key in [key for key, (expires, _value) in six.iteritems(cache)
+                        if expires <= now]:
+                del cache[key]
+        items = {}
+        missing = []
+        for item_id in ids:
+            entry = cache.get((kind, context.project_id, item_id))
+            if entry is None:
+                missing.append(item_id)
+            else:
+                items[item_id] = entry[1]
+        if missing:
+            fetched = fetch(missing)
+            for item_id in missing:
+                items[item_id] = fetched.get(item_id)
+                if ttl:
+                    cache[(kind, context.project_id, item_id)] = (
+                        now + ttl, items[item_id])
+        return items
+
+    def _get_nw_info_lookups(self, context, client, ports, network_ids=None):
+        """Fetch the subnets, DHCP ports and floating IPs of a list of ports.
+
+        The ports may belong to several instances. Instead of querying Neutron
+        for each port, fixed IP and subnet, one list query is done for each
+        kind of resource, and the subnets and DHCP ports are kept in the
+        lookup cache for CONF.neutron.network_info_cache_ttl seconds.
+
+        :param context: Request context, its client is used to fetch the
+                        subnets and DHCP ports like _get_subnets_from_port().
+        :param client: Neutron client used to fetch the floating IPs.
+        :param ports: List of ports.
+        :param network_ids: Optional list of the IDs of the networks to list
+                            with a single query too.
+        :returns: A _NwInfoLookups tuple.
+        """
+        subnet_ids = set()
+        for port in ports:
+            subnet_ids.update(ip['subnet_id'] for ip in port['fixed_ips'])
+        # Since list_subnets(id=[]) returns all the subnets visible for the
+        # current tenant, don't query Neutron if there are no subnets
+        subnets = {}
+        dhcp_ports = {}
+        if subnet_ids:
+            context_client = get_client(context)
+
+            def fetch_subnets(ids):
+                data = context_client.list_subnets(id=ids)
+                return {subnet['id']: subnet
+                        for subnet in data.get('subnets', [])}
+
+            def fetch_dhcp_ports(ids):
+                data = context_client.list_ports(network_id=ids,
+                                                 device_owner='network:dhcp')
+                ports_by_network = {network_id: [] for network_id in ids}
+                for dhcp_port in data.get('ports', []):
+                    ports_by_network.setdefault(
+                        dhcp_port['network_id'], []).append(dhcp_port)
+                return ports_by_network
+
+            subnets = self._get_nw_info_lookup(
+                context, 'subnet', sorted(subnet_ids), fetch_subnets)
+            dhcp_network_ids = set(subnet['network_id']
+                                   for subnet in subnets.values() if subnet)
+            if dhcp_network_ids:
+                dhcp_ports = self._get_nw_info_lookup(
+                    context, 'dhcp_ports', sorted(dhcp_network_ids),
+                    fetch_dhcp_ports)
+
+        floating_ips = collections.defaultdict(list)
+        port_ids = [port['id'] for port in ports if port['fixed_ips']]
+        if port_ids:
+            for fip in self._safe_get_floating_ips(client, port_id=port_ids):
+                floating_ips[(fip['port_id'],
+                              fip['fixed_ip_address'])].append(fip)
+
+        networks = None
+        if network_ids is not None:
+            networks = {}
+            # Like for the subnets, list_networks(id=[]) would return all
+            # the networks
+            if network_ids:
+                data = get_client(context).list_networks(id=network_ids)
+                networks = {network['id']: network
+                            for network in data.get('networks', [])}
+        return _NwInfoLookups(subnets, dhcp_ports, floating_ips, networks)
+
+    def _nw_info_get_ips(self, client, port, lookups=None):
         network_IPs = []
         for fixed_ip in port['fixed_ips']:
             fixed = network_model.FixedIP(address=fixed_ip['ip_address'])
-            floats = self._get_floating_ips_by_fixed_and_port(
-                client, fixed_ip['ip_address'], port['id'])
+            if lookups is None:
+                floats = self._get_floating_ips_by_fixed_and_port(
+                    client, fixed_ip['ip_address'], port['id'])
+            else:
+                floats = lookups.floating_ips.get(
+                    (port['id'], fixed_ip['ip_address']), [])
             for ip in floats:
                 fip = network_model.IP(address=ip['floating_ip_address'],
                                        type='floating')
@@ -1597,8 +1726,12 @@ class API(base_api.NetworkAPI):
             network_IPs.append(fixed)
         return network_IPs
 
-    def _nw_info_get_subnets(self, context, port, network_IPs):
-        subnets = self._get_subnets_from_port(context, port)
+    def _nw_info_get_subnets(self, context, port, network_IPs,
+                             lookups=None):
+        if lookups is None:
+            subnets = self._get_subnets_from_port(context, port)
+        else:
+            subnets = self._get_subnets_from_lookups(port, lookups)
         for subnet in subnets:
             subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
                              if fixed_ip.is_in_subnet(subnet)]
@@ -1683,7 +1816,8 @@ class API(base_api.NetworkAPI):
 
     def _build_network_info_model(self, context, instance, networks=None,
                                   port_ids=None, admin_client=None,
-                                  preexisting_port_ids=None):
+                                  preexisting_port_ids=None,
+                                  neutron_ports=None, lookups=None):
         """Return list of ordered VIFs attached to instance.
 
         :param context: Request context.
@@ -1701,21 +1835,26 @@ class API(base_api.NetworkAPI):
                         an instance is de-allocated. Supplied list will
                         be added to the cached list of preexisting port
                         IDs for this instance.
+        :param neutron_ports: The ports of the instance, already fetched from
+                        Neutron. If value is None they are listed.
+        :param lookups: The _NwInfoLookups of the ports of the instance.
         """
 
-        search_opts = {'tenant_id': instance.project_id,
-                       'device_id': instance.uuid, }
         if admin_client is None:
             client = get_client(context, admin=True)
         else:
             client = admin_client
 
-        data = client.list_ports(**search_opts)
-
-        current_neutron_ports = data.get('ports', [])
+        if neutron_ports is None:
+            search_opts = {'tenant_id': instance.project_id,
+                           'device_id': instance.uuid, }
+            data = client.list_ports(**search_opts)
+            current_neutron_ports = data.get('ports', [])
+        else:
+            current_neutron_ports = neutron_ports
         nw_info_refresh = networks is None and port_ids is None
         networks, port_ids = self._gather_port_ids_and_networks(
-                context, instance, networks, port_ids)
+                context, instance, networks, port_ids, lookups)
         nw_info = network_model.NetworkInfo()
 
         if preexisting_port_ids is None:
@@ -1728,6 +1867,12 @@ class API(base_api.NetworkAPI):
             current_neutron_port_map[current_neutron_port['id']] = (
                 current_neutron_port)
 
+        if lookups is None and CONF.neutron.batch_network_info_queries:
+            lookups = self._get_nw_info_lookups(
+                context, client,
+                [current_neutron_port_map[port_id] for port_id in port_ids
+                 if port_id in current_neutron_port_map])
+
         for port_id in port_ids:
             current_neutron_port = current_neutron_port_map.get(port_id)
             if current_neutron_port:
@@ -1737,10 +1882,11 @@ class API(base_api.NetworkAPI):
                     vif_active = True
 
                 network_IPs = self._nw_info_get_ips(client,
-                                                    current_neutron_port)
+                                                    current_neutron_port,
+                                                    lookups)
                 subnets = self._nw_info_get_subnets(context,
                                                     current_neutron_port,
-                                                    network_IPs)
+                                                    network_IPs, lookups)
 
                 devname = "tap" + current_neutron_port['id']
                 devname = devname[:network_model.NIC_NAME_LEN]
@@ -1773,6 +1919,72 @@ class API(base_api.NetworkAPI):
 
         return nw_info
 
+    def refresh_instances_nw_info_cache(self, context, instances):
+        """Refreshes the network info cache of a list of instances.
+
+        The ports of all the instances are listed with a single query, and
+        their networks, subnets, DHCP ports and floating IPs with one query
+        each. Only the caches whose network info changed are saved.
+
+        :returns: The list of the instances whose cache was updated.
+        """
+        if not instances:
+            return []
+        client = get_client(context, admin=True)
+        instance_uuids = [instance.uuid for instance in instances]
+        updated = []
+        with base_api.refresh_cache_locks(instance_uuids):
+            # Reload the info caches with the locks held, like
+            # _get_instance_nw_info() does, since they list the ports and
+            # networks of the instances
+            db_instances = objects.InstanceList.get_by_filters(
+                context, {'uuid': instance_uuids, 'deleted': False},
+                expected_attrs=['info_cache'])
+            info_caches = {db_instance.uuid: db_instance.info_cache
+                           for db_instance in db_instances}
+
+            data = client.list_ports(device_id=instance_uuids)
+            projects = {instance.uuid: instance.project_id
+                        for instance in instances}
+            instance_ports = collections.defaultdict(list)
+            for port in data.get('ports', []):
+                # Only keep the ports of the project of the instance, like
+                # _build_network_info_model() does
+                if port.get('tenant_id') == projects.get(port['device_id']):
+                    instance_ports[port['device_id']].append(port)
+            network_ids = set()
+            for info_cache in info_caches.values():
+                if info_cache is not None and info_cache.network_info:
+                    network_ids.update(vif['network']['id']
+                                       for vif in info_cache.network_info)
+            lookups = self._get_nw_info_lookups(
+                context, client,
+                [port for instance_uuid in info_caches
+                 for port in instance_ports[instance_uuid]],
+                network_ids=sorted(network_ids))
+
+            for instance in instances:
+                if instance.uuid not in info_caches:
+                    LOG.debug('Instance no longer exists. Unable to refresh',
+                              instance=instance)
+                    continue
+                instance.info_cache = info_caches[instance.uuid]
+                instance.obj_reset_changes(['info_cache'])
+                get_nw_info = functools.partial(
+                    self._get_refreshed_nw_info, context, instance, client,
+                    instance_ports[instance.uuid], lookups)
+                if self._update_nw_info_cache_if_changed(
+                        context, instance, get_nw_info):
+                    updated.append(instance)
+        return updated
+
+    def _get_refreshed_nw_info(self, context, instance, client, ports,
+                               lookups):
+        nw_info = self._build_network_info_model(
+            context, instance, admin_client=client, neutron_ports=ports,
+            lookups=lookups)
+        return network_model.NetworkInfo.hydrate(nw_info)
+
     def _get_subnets_from_port(self, context, port):
         """Return the subnets for a given port."""
 
@@ -1790,38 +2002,55 @@ class API(base_api.NetworkAPI):
         subnets = []
 
         for subnet in ipam_subnets:
-            subnet_dict = {'cidr': subnet['cidr'],
-                           'gateway': network_model.IP(
-                                address=subnet['gateway_ip'],
-                                type='gateway'),
-            }
-
             # attempt to populate DHCP server field
             search_opts = {'network_id': subnet['network_id'],
                            'device_owner': 'network:dhcp'}
             data = get_client(context).list_ports(**search_opts)
             dhcp_ports = data.get('ports', [])
-            for p in dhcp_ports:
-                for ip_pair in p['fixed_ips']:
-                    if ip_pair['subnet_id'] == subnet['id']:
-                        subnet_dict['dhcp_server'] = ip_pair['ip_address']
-                        break
-
-            subnet_object = network_model.Subnet(**subnet_dict)
-            for dns in subnet.get('dns_nameservers', []):
-                subnet_object.add_dns(
-                    network_model.IP(address=dns, type='dns'))
-
-            for route in subnet.get('host_routes', []):
-                subnet_object.add_route(
-                    network_model.Route(cidr=route['destination'],
-                                        gateway=network_model.IP(
-                                            address=route['nexthop'],
-                                            type='gateway')))
-
-            subnets.append(subnet_object)
+            subnets.append(self._build_subnet(subnet, dhcp_ports))
         return subnets
 
+    def _get_subnets_from_lookups(self, port, lookups):
+        """Return the subnets for a given port from the bulk lookups."""
+        subnets = []
+        subnet_ids = set()
+        for ip in port['fixed_ips']:
+            subnet = lookups.subnets.get(ip['subnet_id'])
+            if subnet is None or subnet['id'] in subnet_ids:
+                continue
+            subnet_ids.add(subnet['id'])
+            dhcp_ports = lookups.dhcp_ports.get(subnet['network_id'], [])
+            subnets.append(self._build_subnet(subnet, dhcp_ports))
+        return subnets
+
+    @staticmethod
+    def _build_subnet(subnet, dhcp_ports):
+        """Return the network model of a neutron subnet."""
+        subnet_dict = {'cidr': subnet['cidr'],
+                       'gateway': network_model.IP(
+                            address=subnet['gateway_ip'],
+                            type='gateway'),
+        }
+
+        for p in dhcp_ports:
+            for ip_pair in p['fixed_ips']:
+                if ip_pair['subnet_id'] == subnet['id']:
+                    subnet_dict['dhcp_server'] = ip_pair['ip_address']
+                    break
+
+        subnet_object = network_model.Subnet(**subnet_dict)
+        for dns in subnet.get('dns_nameservers', []):
+            subnet_object.add_dns(
+                network_model.IP(address=dns, type='dns'))
+
+        for route in subnet.get('host_routes', []):
+            subnet_object.add_route(
+                network_model.Route(cidr=route['destination'],
+                                    gateway=network_model.IP(
+                                        address=route['nexthop'],
+                                        type='gateway')))
+        return subnet_object
+
     def get_dns_domains(self, context):
         """Return a list of available dns domains.
 
@@ -57,6 +57,10 @@ INSTANCE_OPTIONAL_ATTRS = (_INSTANCE_OPTIONAL_JOINED_FIELDS +
 INSTANCE_DEFAULT_FIELDS = ['metadata', 'system_metadata',
                            'info_cache', 'security_groups']
 
+# Setters of the fields loaded from the columns of the instances table, as
+# lists of (attribute name, field name, coerce) tuples keyed by class
+_INSTANCE_COLUMN_SETTERS = {}
+
 # Maximum count of tags to one instance
 MAX_TAG_COUNT = 50
 
@@ -287,16 +291,13 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         instance._context = context
         if expected_attrs is None:
             expected_attrs = []
-        # Most of the field names match right now, so be quick
-        for field in instance.fields:
-            if field in INSTANCE_OPTIONAL_ATTRS:
-                continue
-            elif field == 'deleted':
-                instance.deleted = db_inst['deleted'] == db_inst['id']
-            elif field == 'cleaned':
-                instance.cleaned = db_inst['cleaned'] == 1
-            else:
-                instance[field] = db_inst[field]
+        # Most of the field names match right now, so be quick: the values
+        # are coerced and stored directly, the changes being reset below
+        for attrname, field, coerce in _get_column_setters(type(instance)):
+            setattr(instance, attrname,
+                    coerce(instance, field, db_inst[field]))
+        instance.deleted = db_inst['deleted'] == db_inst['id']
+        instance.cleaned = db_inst['cleaned'] == 1
 
         # NOTE(danms): We can be called with a dict instead of a
         # SQLAlchemy object, so we have to be careful here
@@ -1003,6 +1004,24 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             self._normalize_cell_name()
 
 
+def _get_column_setters(inst_cls):
+    """Returns the setters of the fields of an Instance class loaded from the
+    columns of the instances table.
+
+    They are computed once per class, so that converting a list of database
+    entities doesn't have to find again which fields are columns for each
+    entity.
+    """
+    setters = _INSTANCE_COLUMN_SETTERS.get(inst_cls)
+    if setters is None:
+        setters = [(base.get_attrname(name), name, field.coerce)
+                   for name, field in inst_cls.fields.items()
+                   if name not in INSTANCE_OPTIONAL_ATTRS and
+                   name not in ('deleted', 'cleaned')]
+        _INSTANCE_COLUMN_SETTERS[inst_cls] = setters
+    return setters
+
+
 def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
@@ -1067,6 +1086,32 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
             limit=limit, marker=marker, expected_attrs=expected_attrs,
             use_slave=use_slave, sort_keys=sort_keys, sort_dirs=sort_dirs)
 
+    @classmethod
+    def iter_by_filters(cls, context, filters, chunk_size=1000,
+                        expected_attrs=None, use_slave=False):
+        """Yields the instances matching the filters in chunks.
+
+        The instances are sorted by created_at and id, and each chunk is an
+        InstanceList of at most chunk_size instances fetched with its own
+        query, using the last instance of the previous chunk as the marker,
+        so that all the instances can be walked through with a bounded memory
+        use.
+        """
+        marker = None
+        while True:
+            # NOTE: _make_instance_list() modifies the expected attributes
+            chunk = cls.get_by_filters(
+                context, filters, limit=chunk_size, marker=marker,
+                expected_attrs=(list(expected_attrs)
+                                if expected_attrs is not None else None),
+                use_slave=use_slave, sort_keys=['created_at', 'id'],
+                sort_dirs=['asc', 'asc'])
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            marker = chunk[-1].uuid
+
     @staticmethod
     @db.select_db_reader_mode
     def _db_instance_get_all_by_host(context, host, columns_to_join,
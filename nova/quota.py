@@ -42,6 +42,11 @@ class DbQuotaDriver(object):
     """
     UNLIMITED_VALUE = -1
 
+    def __init__(self):
+        # Dict of (expires, limits) tuples keyed by (project_id, quota_class),
+        # used when CONF.quota_limit_cache_ttl is set
+        self._limits_cache = {}
+
     def get_by_project_and_user(self, context, project_id, user_id, resource):
         """Get a specific quota by project and user."""
 
@@ -97,16 +102,24 @@ class DbQuotaDriver(object):
 
         return quotas
 
+    @staticmethod
+    def _get_quota_class(context, project_id, quota_class):
+        """Returns the quota class whose limits apply to a project.
+
+        If the project ID matches the one in the context, we use the
+        quota_class from the context, otherwise, we use the provided
+        quota_class (if any).
+        """
+        if project_id == context.project_id:
+            return context.quota_class
+        return quota_class
+
     def _process_quotas(self, context, resources, project_id, quotas,
                         quota_class=None, defaults=True, usages=None,
                         remains=False):
         modified_quotas = {}
-        # Get the quotas for the appropriate class.  If the project ID
-        # matches the one in the context, we use the quota_class from
-        # the context, otherwise, we use the provided quota_class (if
-        # any)
-        if project_id == context.project_id:
-            quota_class = context.quota_class
+        # Get the quotas for the appropriate class
+        quota_class = self._get_quota_class(context, project_id, quota_class)
         if quota_class:
             class_quotas = db.quota_class_get_all_by_name(context, quota_class)
         else:
@@ -291,6 +304,69 @@ class DbQuotaDriver(object):
                 settable_quotas[key] = {'minimum': minimum, 'maximum': -1}
         return settable_quotas
 
+    def _get_limits(self, context, project_id, quota_class):
+        """Returns the limits of a project, of its users, of the default
+        quota class and of the given quota class, as returned by
+        db.quota_get_all_limits_by_project(), and caches them for
+        CONF.quota_limit_cache_ttl seconds.
+        """
+        key = (project_id, quota_class)
+        now = timeutils.utcnow()
+        cached = self._limits_cache.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        limits = db.quota_get_all_limits_by_project(context, project_id,
+                                                    quota_class=quota_class)
+        for cache_key, (expires, _limits) in list(self._limits_cache.items()):
+            if expires <= now:
+                del self._limits_cache[cache_key]
+        self._limits_cache[key] = (
+            now + datetime.timedelta(seconds=CONF.quota_limit_cache_ttl),
+            limits)
+        return limits
+
+    def invalidate_limits(self, project_id=None, quota_class=None):
+        """Drops the cached limits of a project, or of all the projects if
+        no project is given or if the limits of a quota class changed.
+        """
+        if project_id is None or quota_class is not None:
+            self._limits_cache.clear()
+            return
+        for key in list(self._limits_cache):
+            if key[0] == project_id:
+                del self._limits_cache[key]
+
+    def _get_project_limits(self, context, project_id):
+        """Returns the quotas of a project like db.quota_get_all_by_project(),
+        from the cache if it is enabled.
+        """
+        if not CONF.quota_limit_cache_ttl:
+            return db.quota_get_all_by_project(context, project_id)
+        quota_class = self._get_quota_class(context, project_id,
+                                            context.quota_class)
+        limits = self._get_limits(context, project_id, quota_class)
+        return dict(limits['project'], project_id=project_id)
+
+    def _get_cached_quotas(self, context, resources, project_id,
+                           quota_class, user_id=None):
+        """Returns the same limits as _get_quotas() for the given resources,
+        from the cached limits of the project and of the given quota class.
+        """
+        limits = self._get_limits(context, project_id, quota_class)
+        user_quotas = limits['users'].get(user_id, {}) if user_id else {}
+        quotas = {}
+        for resource in resources.values():
+            name = resource.name
+            if name in user_quotas:
+                quotas[name] = user_quotas[name]
+            elif name in limits['project']:
+                quotas[name] = limits['project'][name]
+            else:
+                quotas[name] = limits['class'].get(
+                    name, limits['defaults'].get(name, resource.default))
+        return quotas
+
     def _get_quotas(self, context, resources, keys, has_sync, project_id=None,
                     user_id=None, project_quotas=None):
         """A helper method which retrieves the quotas for the specific
@@ -327,6 +403,13 @@ class DbQuotaDriver(object):
             unknown = desired - set(sub_resources.keys())
             raise exception.QuotaResourceUnknown(unknown=sorted(unknown))
 
+        # The cached and uncached limits are read for the same quota class
+        quota_class = self._get_quota_class(context, project_id,
+                                            context.quota_class)
+        if CONF.quota_limit_cache_ttl:
+            return self._get_cached_quotas(context, sub_resources, project_id,
+                                           quota_class, user_id=user_id)
+
         if user_id:
             LOG.debug('Getting quotas for user %(user_id)s and project '
                       '%(project_id)s. Resources: %(keys)s',
@@ -335,7 +418,7 @@ class DbQuotaDriver(object):
             # Grab and return the quotas (without usages)
             quotas = self.get_user_quotas(context, sub_resources,
                                           project_id, user_id,
-                                          context.quota_class, usages=False,
+                                          quota_class, usages=False,
                                           project_quotas=project_quotas)
         else:
             LOG.debug('Getting quotas for project %(project_id)s. Resources: '
@@ -343,7 +426,7 @@ class DbQuotaDriver(object):
             # Grab and return the quotas (without usages)
             quotas = self.get_project_quotas(context, sub_resources,
                                              project_id,
-                                             context.quota_class,
+                                             quota_class,
                                              usages=False,
                                              project_quotas=project_quotas)
 
@@ -392,7 +475,7 @@ class DbQuotaDriver(object):
             user_id = context.user_id
 
         # Get the applicable quotas
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = self._get_project_limits(context, project_id)
         quotas = self._get_quotas(context, resources, values.keys(),
                                   has_sync=False, project_id=project_id,
                                   project_quotas=project_quotas)
@@ -486,7 +569,7 @@ class DbQuotaDriver(object):
         # NOTE(Vek): We're not worried about races at this point.
         #            Yes, the admin may be in the process of reducing
         #            quotas, but that's a pretty rare thing.
-        project_quotas = db.quota_get_all_by_project(context, project_id)
+        project_quotas = self._get_project_limits(context, project_id)
         LOG.debug('Quota limits for project %(project_id)s: '
                   '%(project_quotas)s', {'project_id': project_id,
                                          'project_quotas': project_quotas})
@@ -510,10 +593,13 @@ class DbQuotaDriver(object):
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
-        return db.quota_reserve(context, resources, quotas, user_quotas,
-                                deltas, expire,
-                                CONF.until_refresh, CONF.max_age,
-                                project_id=project_id, user_id=user_id)
+        return self._quota_reserve(context, resources, quotas, user_quotas,
+                                   deltas, expire,
+                                   CONF.until_refresh, CONF.max_age,
+                                   project_id=project_id, user_id=user_id)
+
+    def _quota_reserve(self, *args, **kwargs):
+        return db.quota_reserve(*args, **kwargs)
 
     def commit(self, context, reservations, project_id=None, user_id=None):
         """Commit reservations.
@@ -535,8 +621,11 @@ class DbQuotaDriver(object):
         if user_id is None:
             user_id = context.user_id
 
-        db.reservation_commit(context, reservations, project_id=project_id,
-                              user_id=user_id)
+        self._reservation_commit(context, reservations,
+                                 project_id=project_id, user_id=user_id)
+
+    def _reservation_commit(self, *args, **kwargs):
+        db.reservation_commit(*args, **kwargs)
 
     def rollback(self, context, reservations, project_id=None, user_id=None):
         """Roll back reservations.
@@ -558,8 +647,11 @@ class DbQuotaDriver(object):
         if user_id is None:
             user_id = context.user_id
 
-        db.reservation_rollback(context, reservations, project_id=project_id,
-                                user_id=user_id)
+        self._reservation_rollback(context, reservations,
+                                   project_id=project_id, user_id=user_id)
+
+    def _reservation_rollback(self, *args, **kwargs):
+        db.reservation_rollback(*args, **kwargs)
 
     def usage_reset(self, context, resources):
         """Reset the usage records for a particular user on a list of
@@ -600,6 +692,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project_and_user(context, project_id, user_id)
+        self.invalidate_limits(project_id=project_id)
 
     def destroy_all_by_project(self, context, project_id):
         """Destroy all quotas, usages, and reservations associated with a
@@ -610,6 +703,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project(context, project_id)
+        self.invalidate_limits(project_id=project_id)
 
     def expire(self, context):
         """Expire reservations.
@@ -620,9 +714,36 @@ class DbQuotaDriver(object):
         :param context: The request context, for access checks.
         """
 
+        self._reservation_expire(context)
+
+    def _reservation_expire(self, context):
         db.reservation_expire(context)
 
 
+class CounterQuotaDriver(DbQuotaDriver):
+    """Driver storing the quotas in the database like the DbQuotaDriver, but
+    making the reservations without locking the quota usages of the project.
+
+    The usage counters are updated with atomic conditional updates, which
+    are retried if the usage changed in the meantime, so that concurrent
+    reservations in the same project don't wait for each other. A request
+    close to the project limit may however be refused if other requests are
+    reserving the same resource at the same time.
+    """
+
+    def _quota_reserve(self, *args, **kwargs):
+        return db.quota_reserve_counters(*args, **kwargs)
+
+    def _reservation_commit(self, *args, **kwargs):
+        db.reservation_commit_counters(*args, **kwargs)
+
+    def _reservation_rollback(self, *args, **kwargs):
+        db.reservation_rollback_counters(*args, **kwargs)
+
+    def _reservation_expire(self, context):
+        db.reservation_expire_counters(context)
+
+
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
     for all resources are unlimited.  This can be used if you do not
@@ -895,6 +1016,15 @@ class NoopQuotaDriver(object):
         """
         pass
 
+    def invalidate_limits(self, project_id=None, quota_class=None):
+        """Drops the cached limits of a project or quota class.
+
+        :param project_id: The ID of the project whose limits changed.
+        :param quota_class: The name of the quota class whose limits
+                            changed.
+        """
+        pass
+
 
 class BaseResource(object):
     """Describe a single resource for quota checking."""
@@ -1376,6 +1506,17 @@ class QuotaEngine(object):
 
         self._driver.expire(context)
 
+    def invalidate_limits(self, project_id=None, quota_class=None):
+        """Drops the limits cached by the driver once they changed.
+
+        :param project_id: The ID of the project whose limits changed.
+        :param quota_class: The name of the quota class whose limits
+                            changed.
+        """
+
+        self._driver.invalidate_limits(project_id=project_id,
+                                       quota_class=quota_class)
+
     @property
     def resources(self):
         return sorted(self._resources.keys())
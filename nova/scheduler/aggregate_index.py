@@ -0,0 +1,131 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Index of the aggregate metadata used by the scheduler filters.
+"""
+
+import collections
+
+import six
+
+
+def _get_field(aggregate, name):
+    if not aggregate.obj_attr_is_set(name):
+        return None
+    return getattr(aggregate, name)
+
+
+def _split_values(value):
+    """Splits an aggregate metadata value the same way the filters do."""
+    return set(x.strip() for x in value.split(','))
+
+
+class AggregateMetadataIndex(object):
+    """Inverted index of the aggregate metadata, maintained by the HostManager
+    as the aggregates are created, updated and deleted.
+
+    It maps each metadata key, and each metadata key/value pair, to the set of
+    hosts belonging to an aggregate with that metadata, so that the filters
+    can select hosts with set operations instead of merging the metadata of
+    the aggregates of each host. The merged metadata of each host is also
+    kept until the next change of the aggregates.
+
+    Like utils.aggregate_metadata_get_by_host(), the comma-separated metadata
+    values are split into several values.
+    """
+
+    def __init__(self):
+        # Dict of (hosts, metadata) tuples keyed by aggregate ID, as last
+        # indexed
+        self._aggregates = {}
+        # Dict of set of aggregate IDs keyed by host
+        self._host_aggregates = collections.defaultdict(set)
+        # Number of aggregates of each host with a given key or key/value
+        self._hosts_by_key = collections.defaultdict(collections.Counter)
+        self._hosts_by_item = collections.defaultdict(collections.Counter)
+        # Merged metadata keyed by (host, key)
+        self._metadata_cache = {}
+
+    def update(self, aggregate):
+        """Indexes a new or updated aggregate."""
+        self._remove(aggregate.id)
+        hosts = set(_get_field(aggregate, 'hosts') or [])
+        metadata = {key: _split_values(value)
+                    for key, value in six.iteritems(
+                        _get_field(aggregate, 'metadata') or {})}
+        self._aggregates[aggregate.id] = (hosts, metadata)
+        for host in hosts:
+            self._host_aggregates[host].add(aggregate.id)
+            for key, values in six.iteritems(metadata):
+                self._hosts_by_key[key][host] += 1
+                for value in values:
+                    self._hosts_by_item[(key, value)][host] += 1
+        self._metadata_cache.clear()
+
+    def delete(self, aggregate):
+        """Removes a deleted aggregate from the index."""
+        self._remove(aggregate.id)
+        self._metadata_cache.clear()
+
+    @staticmethod
+    def _decrement(counters, counter_key, host):
+        counter = counters[counter_key]
+        counter[host] -= 1
+        if counter[host] <= 0:
+            del counter[host]
+            if not counter:
+                del counters[counter_key]
+
+    def _remove(self, aggregate_id):
+        indexed = self._aggregates.pop(aggregate_id, None)
+        if indexed is None:
+            return
+        hosts, metadata = indexed
+        for host in hosts:
+            self._host_aggregates[host].discard(aggregate_id)
+            if not self._host_aggregates[host]:
+                del self._host_aggregates[host]
+            for key, values in six.iteritems(metadata):
+                self._decrement(self._hosts_by_key, key, host)
+                for value in values:
+                    self._decrement(self._hosts_by_item, (key, value), host)
+
+    def hosts_with_key(self, key):
+        """Returns the set of hosts in an aggregate having the metadata key."""
+        return set(self._hosts_by_key.get(key, ()))
+
+    def hosts_with_value(self, key, value):
+        """Returns the set of hosts in an aggregate whose metadata key has the
+        given value.
+        """
+        return set(self._hosts_by_item.get((key, value), ()))
+
+    def metadata_get_by_host(self, host, key=None):
+        """Returns the same dict of sets as
+        utils.aggregate_metadata_get_by_host() for the HostState of a host.
+        """
+        metadata = self._metadata_cache.get((host, key))
+        if metadata is None:
+            metadata = {}
+            for aggregate_id in self._host_aggregates.get(host, ()):
+                agg_metadata = self._aggregates[aggregate_id][1]
+                if key is None or key in agg_metadata:
+                    for k, values in six.iteritems(agg_metadata):
+                        metadata.setdefault(k, set()).update(values)
+            self._metadata_cache[(host, key)] = metadata
+        # Return a new dict, like utils.aggregate_metadata_get_by_host(), so
+        # that the filters can't add keys to the cached one
+        return collections.defaultdict(set, metadata)
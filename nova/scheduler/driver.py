@@ -74,9 +74,10 @@ class Scheduler(object):
         """Return the list of hosts that have a running service for topic."""
 
         services = objects.ServiceList.get_by_topic(context, topic)
+        up_map = self.servicegroup_api.get_up_map(services)
         return [service.host
                 for service in services
-                if self.servicegroup_api.service_is_up(service)]
+                if up_map[service.id]]
 
     @abc.abstractmethod
     def select_destinations(self, context, spec_obj):
@@ -19,6 +19,8 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
+import itertools
 import random
 
 from oslo_log import log as logging
@@ -107,6 +109,8 @@ class FilterScheduler(driver.Scheduler):
         num_instances = spec_obj.num_instances
         # NOTE(sbauza): Adding one field for any out-of-tree need
         spec_obj.config_options = config_options
+        if CONF.scheduler_batch_placement and num_instances > 1:
+            return self._schedule_batch(hosts, spec_obj)
         for num in range(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -133,13 +137,77 @@ class FilterScheduler(driver.Scheduler):
 
             # Now consume the resources so the filter/weights
             # will change for the next instance.
-            chosen_host.obj.consume_from_request(spec_obj)
-            if spec_obj.instance_group is not None:
-                spec_obj.instance_group.hosts.append(chosen_host.obj.host)
-                # hosts has to be not part of the updates when saving
-                spec_obj.instance_group.obj_reset_changes(['hosts'])
+            self._consume_selected_host(chosen_host, spec_obj)
         return selected_hosts
 
+    def _schedule_batch(self, hosts, spec_obj):
+        """Returns a list of hosts for all the instances of a request.
+
+        Unlike the loop in _schedule(), the hosts are only filtered and
+        weighed once. They are then kept in a heap ordered by weight, and only
+        the host chosen for an instance is weighed again once its resources
+        are consumed. The filters having to run for each instance of the
+        request are only checked against the hosts popped from the heap.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts, spec_obj,
+                                                     index=0)
+        if not hosts:
+            return []
+
+        LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts, spec_obj)
+
+        LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
+
+        # The heap entries are (-weight, sequence, weighed_host) tuples, the
+        # sequence keeping the order between hosts with the same weight and
+        # avoiding the comparison of the WeighedHosts themselves.
+        sequence = itertools.count()
+        heap = [(-weighed_host.weight, next(sequence), weighed_host)
+                for weighed_host in weighed_hosts]
+        heapq.heapify(heap)
+
+        scheduler_host_subset_size = max(1, CONF.scheduler_host_subset_size)
+        selected_hosts = []
+        for num in range(spec_obj.num_instances):
+            # Pop the best hosts until enough of them pass the filters for
+            # this instance. The hosts failing them are dropped like they
+            # would be from the filtered list in _schedule().
+            candidates = []
+            while heap and len(candidates) < scheduler_host_subset_size:
+                entry = heapq.heappop(heap)
+                if num == 0 or self.host_manager.get_filtered_hosts(
+                        [entry[2].obj], spec_obj, index=num):
+                    candidates.append(entry)
+            if not candidates:
+                # Can't get any more locally.
+                break
+
+            chosen_entry = random.choice(candidates)
+            chosen_host = chosen_entry[2]
+
+            LOG.debug("Selected host: %(host)s", {'host': chosen_host})
+            selected_hosts.append(chosen_host)
+
+            self._consume_selected_host(chosen_host, spec_obj)
+            for entry in candidates:
+                if entry is chosen_entry:
+                    self.host_manager.reweigh_host(chosen_host, spec_obj)
+                    entry = (-chosen_host.weight, next(sequence),
+                             chosen_host)
+                heapq.heappush(heap, entry)
+        return selected_hosts
+
+    @staticmethod
+    def _consume_selected_host(chosen_host, spec_obj):
+        """Consumes the resources of the request on the chosen host."""
+        chosen_host.obj.consume_from_request(spec_obj)
+        if spec_obj.instance_group is not None:
+            spec_obj.instance_group.hosts.append(chosen_host.obj.host)
+            # hosts has to be not part of the updates when saving
+            spec_obj.instance_group.obj_reset_changes(['hosts'])
+
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
@@ -16,25 +16,144 @@
 """
 Scheduler host filters
 """
+import collections
+
+from oslo_log import log as logging
+
+import nova.conf
 from nova import filters
+from nova.i18n import _LW
+from nova.scheduler.filters import columns
+from nova.scheduler.filters import utils
+
+CONF = nova.conf.CONF
+LOG = logging.getLogger(__name__)
 
 
 class BaseHostFilter(filters.BaseFilter):
     """Base class for host filters."""
+
+    # Set to True in a subclass implementing host_passes_columns(), so that
+    # the columnar filter engine can run the filter on all hosts at once
+    supports_columns = False
+
+    # Set to True in a subclass whose result only depends on the host
+    # attributes tracked by HostState.generation (aggregates, compute node
+    # and service record) and on the request properties returned by
+    # get_cache_key(), so that the results can be reused between requests
+    cache_results = False
+
+    # Number of results found in or missing from the cache
+    cache_hits = 0
+    cache_misses = 0
+
+    _result_cache = None
+
+    # nova.scheduler.aggregate_index.AggregateMetadataIndex set by the
+    # HostManager loading the filter
+    aggregate_index = None
+
     def _filter_one(self, obj, filter_properties):
         """Return True if the object passes the filter, otherwise False."""
         return self.host_passes(obj, filter_properties)
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        if not self.cache_results or CONF.scheduler_filter_cache_size <= 0:
+            return super(BaseHostFilter, self).filter_all(filter_obj_list,
+                                                          filter_properties)
+        return self._filter_all_cached(filter_obj_list, filter_properties)
+
+    def aggregate_metadata_get_by_host(self, host_state, key=None):
+        """Returns the aggregate metadata of a host, like
+        utils.aggregate_metadata_get_by_host(), using the aggregate index if
+        the filter has one.
+        """
+        if self.aggregate_index is None:
+            return utils.aggregate_metadata_get_by_host(host_state, key=key)
+        return self.aggregate_index.metadata_get_by_host(host_state.host,
+                                                         key=key)
+
+    def get_cache_key(self, filter_properties):
+        """Return the request properties the filter results depend on.
+
+        By default the results are cached per flavor, including its extra
+        specs, and per image properties. Override this in a subclass
+        depending on other properties of the request.
+        """
+        return (utils.flavor_cache_key(filter_properties),
+                utils.image_props_cache_key(filter_properties))
+
+    def _filter_all_cached(self, host_states, filter_properties):
+        request_key = self.get_cache_key(filter_properties)
+        for host_state in host_states:
+            if self._host_passes_cached(host_state, filter_properties,
+                                        request_key):
+                yield host_state
+
+    def _host_passes_cached(self, host_state, filter_properties,
+                            request_key):
+        if self._result_cache is None:
+            self._result_cache = collections.OrderedDict()
+        cache = self._result_cache
+        key = (host_state.host, host_state.nodename, host_state.generation,
+               request_key)
+        try:
+            # Entries are moved to the end when used, so that the least
+            # recently used ones are evicted first
+            result = cache.pop(key)
+            self.cache_hits += 1
+        except KeyError:
+            result = self.host_passes(host_state, filter_properties)
+            self.cache_misses += 1
+            while len(cache) >= CONF.scheduler_filter_cache_size:
+                cache.popitem(last=False)
+        cache[key] = result
+        return result
+
     def host_passes(self, host_state, filter_properties):
         """Return True if the HostState passes the filter, otherwise False.
         Override this in a subclass.
         """
         raise NotImplementedError()
 
+    def host_passes_columns(self, host_columns, filter_properties):
+        """Return a boolean mask of the hosts passing the filter.
+
+        host_columns is a nova.scheduler.filters.columns.HostColumns object.
+        Override this in a subclass setting supports_columns to True.
+        """
+        raise NotImplementedError()
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
-    def __init__(self):
+    def __init__(self, use_columns=False):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
+        if use_columns and not columns.is_available():
+            LOG.warning(_LW("The columnar filter engine requires numpy, "
+                            "falling back to filtering hosts one by one."))
+            use_columns = False
+        self.use_columns = use_columns
+
+    def get_filtered_objects(self, filters, objs, spec_obj, index=0,
+                             column_cache=None):
+        """Filters the host states.
+
+        :param column_cache: optional columns.HostColumnCache from which
+                             the columnar filters take the host columns
+        """
+        if self.use_columns:
+            column_filters = [filter_ for filter_ in filters
+                              if filter_.supports_columns and
+                              filter_.run_filter_for_index(index)]
+            if column_filters:
+                objs = columns.filter_hosts(column_filters, objs, spec_obj,
+                                            cache=column_cache)
+                if not objs:
+                    return []
+                filters = [filter_ for filter_ in filters
+                           if filter_ not in column_filters]
+        return super(HostFilterHandler, self).get_filtered_objects(
+            filters, objs, spec_obj, index)
 
 
 def all_filters():
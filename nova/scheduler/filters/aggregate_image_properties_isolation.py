@@ -18,7 +18,6 @@ import six
 
 import nova.conf
 from nova.scheduler import filters
-from nova.scheduler.filters import utils
 
 CONF = nova.conf.CONF
 
@@ -39,7 +38,7 @@ class AggregateImagePropertiesIsolation(filters.BaseHostFilter):
         cfg_separator = CONF.aggregate_image_properties_isolation_separator
 
         image_props = spec_obj.image.properties if spec_obj.image else {}
-        metadata = utils.aggregate_metadata_get_by_host(host_state)
+        metadata = self.aggregate_metadata_get_by_host(host_state)
 
         for key, options in six.iteritems(metadata):
             if (cfg_namespace and
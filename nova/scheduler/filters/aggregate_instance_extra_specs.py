@@ -19,7 +19,6 @@ import six
 
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
-from nova.scheduler.filters import utils
 
 
 LOG = logging.getLogger(__name__)
@@ -33,6 +32,8 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
     # Aggregate data and instance type does not change within a request
     run_filter_once_per_request = True
 
+    cache_results = True
+
     def host_passes(self, host_state, spec_obj):
         """Return a list of hosts that can create instance_type
 
@@ -46,7 +47,7 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
                 or not instance_type.extra_specs):
             return True
 
-        metadata = utils.aggregate_metadata_get_by_host(host_state)
+        metadata = self.aggregate_metadata_get_by_host(host_state)
 
         for key, req in six.iteritems(instance_type.extra_specs):
             # Either not scope format, or aggregate_instance_extra_specs scope
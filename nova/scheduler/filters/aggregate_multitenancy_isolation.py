@@ -16,11 +16,12 @@
 from oslo_log import log as logging
 
 from nova.scheduler import filters
-from nova.scheduler.filters import utils
 
 
 LOG = logging.getLogger(__name__)
 
+TENANT_KEY = "filter_tenant_id"
+
 
 class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
     """Isolate tenants in specific aggregates."""
@@ -38,11 +39,11 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
         """
         tenant_id = spec_obj.project_id
 
-        metadata = utils.aggregate_metadata_get_by_host(host_state,
-                                                        key="filter_tenant_id")
+        metadata = self.aggregate_metadata_get_by_host(host_state,
+                                                       key=TENANT_KEY)
 
         if metadata != {}:
-            configured_tenant_ids = metadata.get("filter_tenant_id")
+            configured_tenant_ids = metadata.get(TENANT_KEY)
             if configured_tenant_ids:
                 if tenant_id not in configured_tenant_ids:
                     LOG.debug("%s fails tenant id on aggregate", host_state)
@@ -51,3 +52,20 @@ class AggregateMultiTenancyIsolation(filters.BaseHostFilter):
             else:
                 LOG.debug("No tenant id's defined on host. Host passes.")
         return True
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        """Filters all the hosts at once using the aggregate index."""
+        if self.aggregate_index is None:
+            return super(AggregateMultiTenancyIsolation, self).filter_all(
+                filter_obj_list, spec_obj)
+        tenant_id = spec_obj.project_id
+        # Hosts isolated to some tenants, but not to the requesting one
+        isolated_hosts = (self.aggregate_index.hosts_with_key(TENANT_KEY) -
+                          self.aggregate_index.hosts_with_value(TENANT_KEY,
+                                                                tenant_id))
+        if isolated_hosts:
+            LOG.debug("Hosts %(hosts)s fail tenant id %(tenant_id)s on "
+                      "aggregate", {'hosts': sorted(isolated_hosts),
+                                    'tenant_id': tenant_id})
+        return [host_state for host_state in filter_obj_list
+                if host_state.host not in isolated_hosts]
@@ -17,7 +17,6 @@ from oslo_log import log as logging
 
 import nova.conf
 from nova.scheduler import filters
-from nova.scheduler.filters import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -35,13 +34,18 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
     # Availability zones do not change within a request
     run_filter_once_per_request = True
 
+    cache_results = True
+
+    def get_cache_key(self, spec_obj):
+        return spec_obj.availability_zone
+
     def host_passes(self, host_state, spec_obj):
         availability_zone = spec_obj.availability_zone
 
         if not availability_zone:
             return True
 
-        metadata = utils.aggregate_metadata_get_by_host(
+        metadata = self.aggregate_metadata_get_by_host(
                 host_state, key='availability_zone')
 
         if 'availability_zone' in metadata:
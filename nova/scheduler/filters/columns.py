@@ -0,0 +1,238 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar filter engine.
+
+Filters only comparing numbers held by the HostStates against the request
+(free RAM, vCPUs, disk, number of instances, ...) can be evaluated on all the
+hosts at once instead of calling host_passes() for each of them. The values
+needed by those filters are gathered into arrays, one per HostState attribute,
+and each filter computes a boolean mask telling which hosts pass it. Only the
+HostStates left once all the masks are combined are returned.
+
+The arrays can be kept from one request to the next in a HostColumnCache, the
+values of a host being only gathered again when its HostState generation
+changed.
+"""
+
+import operator
+
+from oslo_log import log as logging
+
+from nova.i18n import _LI
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+LOG = logging.getLogger(__name__)
+
+
+def is_available():
+    """Returns True if the columnar filter engine can be used."""
+    return numpy is not None
+
+
+class HostColumnCache(object):
+    """Columns of the HostStates kept across the requests.
+
+    Each host has a row in the columns. The values of a row are gathered
+    again only when the HostState of the host changed since they were, that
+    is when its generation was bumped or it was replaced by another one.
+
+    The rows are never moved nor removed, the HostManager replaces the whole
+    cache when hosts are removed.
+    """
+
+    def __init__(self):
+        # Row of each host keyed by (host, nodename)
+        self._rows = {}
+        self._host_states = []
+        self._generations = []
+        # Stamp of each row, changed each time its HostState changes
+        self._stamps = numpy.zeros(0, dtype=int)
+        self._next_stamp = 1
+        # Dict of (values, stamps) tuples keyed by column name, stamps being
+        # the ones of the rows when their values were gathered
+        self._columns = {}
+
+    def __len__(self):
+        return len(self._host_states)
+
+    def get_rows(self, host_states):
+        """Returns the array of the rows of a list of HostStates."""
+        rows = []
+        changed = []
+        for host_state in host_states:
+            key = (host_state.host, host_state.nodename)
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self._host_states)
+                self._host_states.append(host_state)
+                self._generations.append(host_state.generation)
+                changed.append(row)
+            elif (self._host_states[row] is not host_state or
+                    self._generations[row] != host_state.generation):
+                self._host_states[row] = host_state
+                self._generations[row] = host_state.generation
+                changed.append(row)
+            rows.append(row)
+        if len(self._stamps) < len(self._host_states):
+            self._stamps = _grow(self._stamps, len(self._host_states), 0)
+        if changed:
+            self._stamps[changed] = numpy.arange(
+                self._next_stamp, self._next_stamp + len(changed))
+            self._next_stamp += len(changed)
+        return numpy.array(rows, dtype=int)
+
+    def get(self, name, getter, dtype, rows):
+        """Returns the values of a column for some rows.
+
+        The values of the rows whose HostState changed since they were
+        gathered are gathered again first.
+        """
+        values, stamps = self._columns.get(name, (None, None))
+        if values is None:
+            values = numpy.zeros(0, dtype=dtype)
+            stamps = numpy.zeros(0, dtype=int)
+        if len(values) < len(self._host_states):
+            values = _grow(values, len(self._host_states), 0)
+            stamps = _grow(stamps, len(self._host_states), 0)
+            self._columns[name] = (values, stamps)
+        stale = rows[stamps[rows] != self._stamps[rows]]
+        if len(stale):
+            values[stale] = numpy.array(
+                [getter(self._host_states[row]) for row in stale],
+                dtype=dtype)
+            stamps[stale] = self._stamps[stale]
+        return values[rows]
+
+
+def _grow(array, size, fill_value):
+    """Returns a copy of an array extended to size items."""
+    extension = numpy.empty(size - len(array), dtype=array.dtype)
+    extension.fill(fill_value)
+    return numpy.concatenate([array, extension])
+
+
+class HostColumns(object):
+    """Columnar view of the attributes of a list of HostStates.
+
+    The columns are built lazily, the first time a filter asks for them, so
+    that only the attributes used by the enabled filters are gathered. If a
+    HostColumnCache is provided, they are taken from it.
+    """
+
+    def __init__(self, host_states, cache=None):
+        self.host_states = list(host_states)
+        self._columns = {}
+        self._cache = cache
+        self._rows = None
+        if cache is not None:
+            self._rows = cache.get_rows(self.host_states)
+        # Dict of (values, mask) tuples keyed by the name of the limit to set
+        # on the HostStates passing all the filters
+        self._limits = {}
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def get(self, name, getter=None, dtype=float):
+        """Returns the array of values of an attribute for all the hosts.
+
+        :param name: name of the column, also used as the HostState attribute
+                     name if no getter is provided
+        :param getter: optional callable returning the value for a HostState
+        :param dtype: numpy type of the column, None values are converted to
+                      NaN for floats so that the comparisons involving them
+                      are always False
+        """
+        column = self._columns.get(name)
+        if column is None:
+            getter = getter or operator.attrgetter(name)
+            if self._cache is not None:
+                column = self._cache.get(name, getter, dtype, self._rows)
+            else:
+                column = numpy.array([getter(host_state)
+                                      for host_state in self.host_states],
+                                     dtype=dtype)
+            self._columns[name] = column
+        return column
+
+    def map(self, func, where=None):
+        """Returns a boolean mask of the result of func for each host.
+
+        If a where mask is provided, func is only called for the hosts
+        selected by it and is considered False for the other ones.
+        """
+        mask = numpy.zeros(len(self.host_states), dtype=bool)
+        if where is None:
+            indexes = range(len(self.host_states))
+        else:
+            indexes = numpy.flatnonzero(where)
+        for index in indexes:
+            mask[index] = bool(func(self.host_states[index]))
+        return mask
+
+    def set_limits(self, key, values, where=None):
+        """Sets the oversubscription limit of the hosts passing the filters.
+
+        The limits are only written to the HostStates which pass all the
+        filters, by select().
+        """
+        self._limits[key] = (values, where)
+
+    def select(self, mask):
+        """Returns the list of HostStates selected by the mask.
+
+        The limits set by the filters are written to those HostStates.
+        """
+        indexes = numpy.flatnonzero(mask)
+        selected = [self.host_states[index] for index in indexes]
+        for key, (values, where) in self._limits.items():
+            values = values[indexes].tolist()
+            if where is not None:
+                where = where[indexes].tolist()
+            for pos, host_state in enumerate(selected):
+                if where is None or where[pos]:
+                    host_state.limits[key] = values[pos]
+        return selected
+
+
+def filter_hosts(filters, host_states, spec_obj, cache=None):
+    """Runs the columnar filters on all the host states at once.
+
+    Returns the list of HostStates passing all the filters, the filters being
+    applied in order and the evaluation stopping as soon as no host is left.
+    The columns are taken from the HostColumnCache if one is provided.
+    """
+    columns = HostColumns(host_states, cache=cache)
+    LOG.debug("Starting columnar filtering with %d host(s)", len(columns))
+    mask = numpy.ones(len(columns), dtype=bool)
+    for filter_ in filters:
+        cls_name = filter_.__class__.__name__
+        start_count = int(mask.sum())
+        mask &= filter_.host_passes_columns(columns, spec_obj)
+        end_count = int(mask.sum())
+        LOG.debug("%(cls_name)s: (start: %(start)s, end: %(end)s)",
+                  {'cls_name': cls_name, 'start': start_count,
+                   'end': end_count})
+        if not end_count:
+            LOG.info(_LI("Filter %s returned 0 hosts"), cls_name)
+            break
+    return columns.select(mask)
@@ -31,8 +31,40 @@ class ComputeFilter(filters.BaseHostFilter):
     # Host state does not change within a request
     run_filter_once_per_request = True
 
+    supports_columns = True
+
+    def filter_all(self, filter_obj_list, spec_obj):
+        # NOTE: The host states are all gathered first, so that the state of
+        # their services is checked at once.
+        host_states = list(filter_obj_list)
+        up_map = self._get_up_map(host_states)
+        for host_state in host_states:
+            if self._host_passes(
+                    host_state, lambda service: up_map[service['id']]):
+                yield host_state
+
     def host_passes(self, host_state, spec_obj):
         """Returns True for only active compute nodes."""
+        return self._host_passes(host_state,
+                                 self.servicegroup_api.service_is_up)
+
+    def host_passes_columns(self, host_columns, spec_obj):
+        """Returns True for only active compute nodes."""
+        get_disabled = lambda host_state: host_state.service['disabled']
+        disabled = host_columns.get('service_disabled', get_disabled,
+                                    dtype=bool)
+        up_map = self._get_up_map(host_columns.host_states)
+        return host_columns.map(
+            lambda host_state: self._service_is_up(
+                host_state, up_map[host_state.service['id']]),
+            where=~disabled)
+
+    def _get_up_map(self, host_states):
+        return self.servicegroup_api.get_up_map(
+            [host_state.service for host_state in host_states
+             if not host_state.service['disabled']])
+
+    def _host_passes(self, host_state, is_up):
         service = host_state.service
         if service['disabled']:
             LOG.debug("%(host_state)s is disabled, reason: %(reason)s",
@@ -40,8 +72,11 @@ class ComputeFilter(filters.BaseHostFilter):
                        'reason': service.get('disabled_reason')})
             return False
         else:
-            if not self.servicegroup_api.service_is_up(service):
-                LOG.warning(_LW("%(host_state)s has not been heard from in a "
-                                "while"), {'host_state': host_state})
-                return False
+            return self._service_is_up(host_state, is_up(service))
+
+    def _service_is_up(self, host_state, is_up):
+        if not is_up:
+            LOG.warning(_LW("%(host_state)s has not been heard from in a "
+                            "while"), {'host_state': host_state})
+            return False
         return True
@@ -72,9 +72,35 @@ class BaseCoreFilter(filters.BaseHostFilter):
 class CoreFilter(BaseCoreFilter):
     """CoreFilter filters based on CPU core utilization."""
 
+    supports_columns = True
+
     def _get_cpu_allocation_ratio(self, host_state, spec_obj):
         return host_state.cpu_allocation_ratio
 
+    def host_passes_columns(self, host_columns, spec_obj):
+        """Return True for the hosts having sufficient CPU cores."""
+        instance_vcpus = spec_obj.vcpus
+        host_vcpus_total = host_columns.get('vcpus_total')
+        vcpus_used = host_columns.get('vcpus_used')
+        cpu_allocation_ratio = host_columns.get('cpu_allocation_ratio')
+
+        # Fail safe for the hosts not reporting their VCPUs
+        unset = host_vcpus_total == 0
+        if unset.any():
+            LOG.warning(_LW("VCPUs not set; assuming CPU collection broken"))
+
+        vcpus_total = host_vcpus_total * cpu_allocation_ratio
+        # Only provide a VCPU limit to compute if the virt driver is reporting
+        # an accurate count of installed VCPUs. (XenServer driver does not)
+        has_limit = vcpus_total > 0
+        host_columns.set_limits('vcpu', vcpus_total, where=has_limit)
+
+        # Do not allow an instance to overcommit against itself, only
+        # against other instances.
+        fits = ~has_limit | (instance_vcpus <= host_vcpus_total)
+        free_vcpus = vcpus_total - vcpus_used
+        return unset | (fits & (free_vcpus >= instance_vcpus))
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -28,6 +28,8 @@ CONF = nova.conf.CONF
 class DiskFilter(filters.BaseHostFilter):
     """Disk Filter with over subscription flag."""
 
+    supports_columns = True
+
     def _get_disk_allocation_ratio(self, host_state, spec_obj):
         return host_state.disk_allocation_ratio
 
@@ -59,6 +61,23 @@ class DiskFilter(filters.BaseHostFilter):
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
 
+    def host_passes_columns(self, host_columns, spec_obj):
+        """Filter based on disk usage."""
+        requested_disk = (1024 * (spec_obj.root_gb +
+                                  spec_obj.ephemeral_gb) +
+                          spec_obj.swap)
+
+        free_disk_mb = host_columns.get('free_disk_mb')
+        total_usable_disk_mb = host_columns.get('total_usable_disk_gb') * 1024
+        disk_allocation_ratio = host_columns.get('disk_allocation_ratio')
+
+        disk_mb_limit = total_usable_disk_mb * disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - free_disk_mb
+        usable_disk_mb = disk_mb_limit - used_disk_mb
+
+        host_columns.set_limits('disk_gb', disk_mb_limit / 1024)
+        return usable_disk_mb >= requested_disk
+
 
 class AggregateDiskFilter(DiskFilter):
     """AggregateDiskFilter with per-aggregate disk allocation ratio flag.
@@ -67,6 +86,9 @@ class AggregateDiskFilter(DiskFilter):
     found.
     """
 
+    # The allocation ratio depends on the aggregates of each host
+    supports_columns = False
+
     def _get_disk_allocation_ratio(self, host_state, spec_obj):
         aggregate_vals = utils.aggregate_values_from_key(
             host_state,
@@ -28,6 +28,8 @@ CONF = nova.conf.CONF
 class IoOpsFilter(filters.BaseHostFilter):
     """Filter out hosts with too many concurrent I/O operations."""
 
+    supports_columns = True
+
     def _get_max_io_ops_per_host(self, host_state, spec_obj):
         return CONF.max_io_ops_per_host
 
@@ -46,6 +48,10 @@ class IoOpsFilter(filters.BaseHostFilter):
                          'max_io_ops': max_io_ops})
         return passes
 
+    def host_passes_columns(self, host_columns, spec_obj):
+        num_io_ops = host_columns.get('num_io_ops')
+        return num_io_ops < CONF.max_io_ops_per_host
+
 
 class AggregateIoOpsFilter(IoOpsFilter):
     """AggregateIoOpsFilter with per-aggregate the max io operations.
@@ -53,6 +59,9 @@ class AggregateIoOpsFilter(IoOpsFilter):
     Fall back to global max_io_ops_per_host if no per-aggregate setting found.
     """
 
+    # The maximum depends on the aggregates of each host
+    supports_columns = False
+
     def _get_max_io_ops_per_host(self, host_state, spec_obj):
         aggregate_vals = utils.aggregate_values_from_key(
             host_state,
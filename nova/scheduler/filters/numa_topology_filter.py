@@ -57,7 +57,19 @@ class NUMATopologyFilter(filters.BaseHostFilter):
 
         return True
 
+    def filter_all(self, filter_obj_list, spec_obj):
+        # NOTE: hosts with the same free NUMA topology and allocation ratios
+        # get the same result, so the instance is only fitted once onto each
+        # distinct topology during a request
+        fit_cache = {}
+        for host_state in filter_obj_list:
+            if self._host_passes(host_state, spec_obj, fit_cache):
+                yield host_state
+
     def host_passes(self, host_state, spec_obj):
+        return self._host_passes(host_state, spec_obj)
+
+    def _host_passes(self, host_state, spec_obj, fit_cache=None):
         ram_ratio = host_state.ram_allocation_ratio
         cpu_ratio = host_state.cpu_allocation_ratio
         extra_specs = spec_obj.flavor.extra_specs
@@ -82,7 +94,8 @@ class NUMATopologyFilter(filters.BaseHostFilter):
                         host_topology, requested_topology,
                         limits=limits,
                         pci_requests=pci_requests,
-                        pci_stats=host_state.pci_stats))
+                        pci_stats=host_state.pci_stats,
+                        fit_cache=fit_cache))
             if not instance_topology:
                 LOG.debug("%(host)s, %(node)s fails NUMA topology "
                           "requirements. The instance does not fit on this "
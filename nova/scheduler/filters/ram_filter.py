@@ -67,9 +67,25 @@ class BaseRamFilter(filters.BaseHostFilter):
 class RamFilter(BaseRamFilter):
     """Ram Filter with over subscription flag."""
 
+    supports_columns = True
+
     def _get_ram_allocation_ratio(self, host_state, spec_obj):
         return host_state.ram_allocation_ratio
 
+    def host_passes_columns(self, host_columns, spec_obj):
+        """Only return hosts with sufficient available RAM."""
+        requested_ram = spec_obj.memory_mb
+        free_ram_mb = host_columns.get('free_ram_mb')
+        total_usable_ram_mb = host_columns.get('total_usable_ram_mb')
+        ram_allocation_ratio = host_columns.get('ram_allocation_ratio')
+
+        memory_mb_limit = total_usable_ram_mb * ram_allocation_ratio
+        used_ram_mb = total_usable_ram_mb - free_ram_mb
+        usable_ram = memory_mb_limit - used_ram_mb
+        host_columns.set_limits('memory_mb', memory_mb_limit)
+        return ((total_usable_ram_mb >= requested_ram) &
+                (usable_ram >= requested_ram))
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
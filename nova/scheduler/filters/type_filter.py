@@ -48,6 +48,8 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
     # Aggregate data does not change within a request
     run_filter_once_per_request = True
 
+    cache_results = True
+
     def host_passes(self, host_state, spec_obj):
         instance_type = spec_obj.flavor
 
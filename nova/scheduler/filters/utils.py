@@ -96,3 +96,36 @@ def other_types_on_host(host_state, instance_type_id):
     host_types = set([inst.instance_type_id for inst in host_instances])
     inst_set = set([instance_type_id])
     return bool(host_types - inst_set)
+
+
+def _get_set_attr(obj, name):
+    """Returns the value of an object field, or None if it is not set."""
+    if obj is None or not obj.obj_attr_is_set(name):
+        return None
+    return getattr(obj, name)
+
+
+def flavor_cache_key(spec_obj):
+    """Returns a hashable key identifying the flavor of a RequestSpec.
+
+    The key covers the flavor extra specs, which can be modified without
+    changing the flavor ID.
+    """
+    flavor = _get_set_attr(spec_obj, 'flavor')
+    if flavor is None:
+        return None
+    extra_specs = _get_set_attr(flavor, 'extra_specs') or {}
+    return (_get_set_attr(flavor, 'flavorid'),
+            _get_set_attr(flavor, 'name'),
+            tuple(sorted(extra_specs.items())))
+
+
+def image_props_cache_key(spec_obj):
+    """Returns a hash of the image properties of a RequestSpec."""
+    image = _get_set_attr(spec_obj, 'image')
+    props = _get_set_attr(image, 'properties')
+    if props is None:
+        return None
+    return hash(tuple(sorted((field, six.text_type(getattr(props, field)))
+                             for field in props.obj_fields
+                             if props.obj_attr_is_set(field))))
@@ -19,13 +19,14 @@ Manage hosts in the current zone.
 
 import collections
 import functools
-import time
+import itertools
 try:
     from collections import UserDict as IterableUserDict   # Python 3
 except ImportError:
     from UserDict import IterableUserDict                  # Python 2
 
 
+import eventlet
 import iso8601
 from oslo_log import log as logging
 from oslo_utils import timeutils
@@ -37,7 +38,9 @@ from nova import exception
 from nova.i18n import _LI, _LW
 from nova import objects
 from nova.pci import stats as pci_stats
+from nova.scheduler import aggregate_index
 from nova.scheduler import filters
+from nova.scheduler.filters import columns
 from nova.scheduler import weights
 from nova import utils
 from nova.virt import hardware
@@ -47,6 +50,8 @@ CONF = nova.conf.CONF
 
 LOG = logging.getLogger(__name__)
 HOST_INSTANCE_SEMAPHORE = "host_instance"
+# Maximum number of hosts whose instances are loaded by a single query
+INSTANCE_INFO_BATCH_SIZE = 100
 
 
 class ReadOnlyDict(IterableUserDict):
@@ -100,6 +105,16 @@ def set_update_time_on_success(function):
     return decorated_function
 
 
+# Fields of the service record only changed by the service heartbeats, which
+# are not a change of the host for the filters caching their results
+SERVICE_HEARTBEAT_FIELDS = ('updated_at', 'report_count', 'last_seen_up')
+
+# The generations of all the HostStates are drawn from the same counter, so
+# that a HostState recreated for a host doesn't reuse the generations of the
+# previous one
+_generations = itertools.count(1)
+
+
 class HostState(object):
     """Mutable and immutable information tracked for a host.
     This is an attempt to remove the ad-hoc data structures
@@ -154,6 +169,44 @@ class HostState(object):
 
         self.updated = None
 
+        # Changed each time the compute node, the aggregates or the service
+        # record of the host change, or when resources are consumed on it.
+        # Used by the filters caching their results.
+        self.generation = next(_generations)
+        self._compute_updated_at = None
+
+    def _bump_generation(self):
+        self.generation = next(_generations)
+
+    def _aggregates_changed(self, aggregates):
+        # The HostManager replaces the Aggregate objects when they change
+        return (len(aggregates) != len(self.aggregates) or
+                any(new is not old
+                    for new, old in zip(aggregates, self.aggregates)))
+
+    def _instances_changed(self, inst_dict):
+        # The HostManager shares the dict of the instances of the hosts
+        # sending updates about them, which is updated in place
+        if inst_dict is self.instances:
+            return False
+        if len(inst_dict) != len(self.instances):
+            return True
+        for uuid, instance in six.iteritems(inst_dict):
+            old_instance = self.instances.get(uuid)
+            if (old_instance is None or
+                    old_instance.updated_at != instance.updated_at):
+                return True
+        return False
+
+    def _service_changed(self, service):
+        old_service = getattr(self, 'service', None)
+        if old_service is None:
+            return True
+        fields = ((set(service) | set(old_service)) -
+                  set(SERVICE_HEARTBEAT_FIELDS))
+        return any(service.get(field) != old_service.get(field)
+                   for field in fields)
+
     def update(self, compute=None, service=None, aggregates=None,
             inst_dict=None):
         """Update all information about a host."""
@@ -169,10 +222,15 @@ class HostState(object):
                 self._update_from_compute_node(compute)
             if aggregates is not None:
                 LOG.debug("Update host state with aggregates: %s", aggregates)
+                if self._aggregates_changed(aggregates):
+                    self._bump_generation()
                 self.aggregates = aggregates
             if service is not None:
                 LOG.debug("Update host state with service dict: %s", service)
-                self.service = ReadOnlyDict(service)
+                service = ReadOnlyDict(service)
+                if self._service_changed(service):
+                    self._bump_generation()
+                self.service = service
             if inst_dict is not None:
                 LOG.debug("Update host state with instances: %s", inst_dict)
                 self.instances = inst_dict
@@ -184,6 +242,10 @@ class HostState(object):
         if (self.updated and compute.updated_at
                 and self.updated > compute.updated_at):
             return
+        if (compute.updated_at is None or
+                compute.updated_at != self._compute_updated_at):
+            self._bump_generation()
+            self._compute_updated_at = compute.updated_at
         all_ram_mb = compute.memory_mb
 
         # Assume virtual size is all consumed by instances if use qcow2 disk.
@@ -259,6 +321,7 @@ class HostState(object):
         return _locked(self, spec_obj)
 
     def _locked_consume_from_request(self, spec_obj):
+        self._bump_generation()
         disk_mb = (spec_obj.root_gb +
                    spec_obj.ephemeral_gb) * 1024
         ram_mb = spec_obj.memory_mb
@@ -301,8 +364,10 @@ class HostState(object):
         # temporary orphaned Instance object as a proxy)
         instance = objects.Instance(numa_topology=spec_obj.numa_topology)
 
+        # NOTE: nothing needs the JSON format of the HostState topology, keep
+        # the object so that the filters don't have to decode it again
         self.numa_topology = hardware.get_host_numa_usage_from_instance(
-                self, instance)
+                self, instance, never_serialize_result=True)
 
         # NOTE(sbauza): By considering all cases when the scheduler is called
         # and when consume_from_request() is run, we can safely say that there
@@ -328,7 +393,15 @@ class HostManager(object):
 
     def __init__(self):
         self.host_state_map = {}
-        self.filter_handler = filters.HostFilterHandler()
+        # Inverted index of the aggregate metadata, given to the filters
+        self.aggregate_index = aggregate_index.AggregateMetadataIndex()
+        self.filter_handler = filters.HostFilterHandler(
+            use_columns=CONF.scheduler_use_columnar_filters)
+        # Columns of the host states kept across the requests for the
+        # columnar filters
+        self.host_column_cache = None
+        if self.filter_handler.use_columns:
+            self.host_column_cache = columns.HostColumnCache()
         filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
         self.filter_cls_map = {cls.__name__: cls for cls in filter_classes}
@@ -345,6 +418,13 @@ class HostManager(object):
         self.host_aggregates_map = collections.defaultdict(set)
         self._init_aggregates()
         self.tracks_instance_changes = CONF.scheduler_tracks_instance_changes
+        self.tracks_compute_node_changes = (
+            CONF.scheduler_tracks_compute_node_changes)
+        # Most recent created_at/updated_at value of the compute nodes loaded
+        # so far, and time of the last full reload of the compute nodes. Only
+        # used when tracking compute node changes.
+        self._compute_nodes_changed_since = None
+        self._last_full_refresh = None
         # Dict of instances and status, keyed by host
         self._instance_info = {}
         if self.tracks_instance_changes:
@@ -360,6 +440,7 @@ class HostManager(object):
             self.aggs_by_id[agg.id] = agg
             for host in agg.hosts:
                 self.host_aggregates_map[host].add(agg.id)
+            self.aggregate_index.update(agg)
 
     def update_aggregates(self, aggregates):
         """Updates internal HostManager information about aggregates."""
@@ -379,6 +460,7 @@ class HostManager(object):
             if (aggregate.id in self.host_aggregates_map[host]
                     and host not in aggregate.hosts):
                 self.host_aggregates_map[host].remove(aggregate.id)
+        self.aggregate_index.update(aggregate)
 
     def delete_aggregate(self, aggregate):
         """Deletes internal HostManager information about a specific aggregate.
@@ -388,6 +470,7 @@ class HostManager(object):
         for host in aggregate.hosts:
             if aggregate.id in self.host_aggregates_map[host]:
                 self.host_aggregates_map[host].remove(aggregate.id)
+        self.aggregate_index.delete(aggregate)
 
     def _init_instance_info(self):
         """Creates the initial view of instances for all hosts.
@@ -405,31 +488,14 @@ class HostManager(object):
             compute_nodes = objects.ComputeNodeList.get_all(context).objects
             LOG.debug("Total number of compute nodes: %s", len(compute_nodes))
             # Break the queries into batches of 10 to reduce the total number
-            # of calls to the DB.
-            batch_size = 10
-            start_node = 0
-            end_node = batch_size
-            while start_node <= len(compute_nodes):
-                curr_nodes = compute_nodes[start_node:end_node]
-                start_node += batch_size
-                end_node += batch_size
-                filters = {"host": [curr_node.host
-                                    for curr_node in curr_nodes],
-                           "deleted": False}
-                result = objects.InstanceList.get_by_filters(context,
-                                                             filters)
-                instances = result.objects
-                LOG.debug("Adding %s instances for hosts %s-%s",
-                          len(instances), start_node, end_node)
-                for instance in instances:
-                    host = instance.host
-                    if host not in self._instance_info:
-                        self._instance_info[host] = {"instances": {},
-                                                     "updated": False}
-                    inst_dict = self._instance_info[host]
-                    inst_dict["instances"][instance.uuid] = instance
-                # Call sleep() to cooperatively yield
-                time.sleep(0)
+            # of calls to the DB, the batches being loaded concurrently.
+            instances_by_host = self._get_instances_by_host(
+                context, [compute.host for compute in compute_nodes],
+                batch_size=10)
+            for host, instances in six.iteritems(instances_by_host):
+                if instances:
+                    self._instance_info[host] = {"instances": instances,
+                                                 "updated": False}
             LOG.debug("END:_async_init_instance_info")
 
         # Run this async so that we don't block the scheduler start-up
@@ -452,7 +518,9 @@ class HostManager(object):
                     bad_filters.append(filter_name)
                     continue
                 filter_cls = self.filter_cls_map[filter_name]
-                self.filter_obj_map[filter_name] = filter_cls()
+                filter_obj = filter_cls()
+                filter_obj.aggregate_index = self.aggregate_index
+                self.filter_obj_map[filter_name] = filter_obj
             good_filters.append(self.filter_obj_map[filter_name])
         if bad_filters:
             msg = ", ".join(bad_filters)
@@ -536,24 +604,52 @@ class HostManager(object):
             hosts = six.itervalues(name_to_cls_map)
 
         return self.filter_handler.get_filtered_objects(filters,
-                hosts, spec_obj, index)
+                hosts, spec_obj, index, column_cache=self.host_column_cache)
 
     def get_weighed_hosts(self, hosts, spec_obj):
         """Weigh the hosts."""
         return self.weight_handler.get_weighed_objects(self.weighers,
                 hosts, spec_obj)
 
+    def reweigh_host(self, weighed_host, spec_obj):
+        """Weigh again a host returned by get_weighed_hosts()."""
+        return self.weight_handler.reweigh_object(self.weighers,
+                weighed_host, spec_obj)
+
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
         """
 
+        # The services and the compute nodes are loaded concurrently
+        pool = self._get_load_pool()
+        services = pool.spawn(objects.ServiceList.get_by_binary,
+                              context, 'nova-compute', include_disabled=True)
+        if self._needs_full_refresh():
+            # Get resource usage across the available compute nodes:
+            compute_nodes = pool.spawn(objects.ComputeNodeList.get_all,
+                                       context)
+            self._last_full_refresh = timeutils.utcnow()
+            full_refresh = True
+        else:
+            compute_nodes = pool.spawn(
+                objects.ComputeNodeList.get_all_changed_since,
+                context, self._compute_nodes_changed_since)
+            full_refresh = False
         service_refs = {service.host: service
-                        for service in objects.ServiceList.get_by_binary(
-                            context, 'nova-compute', include_disabled=True)}
-        # Get resource usage across the available compute nodes:
-        compute_nodes = objects.ComputeNodeList.get_all(context)
+                        for service in services.wait()}
+        compute_nodes = list(compute_nodes.wait())
+
+        # Load at once the instances of all the hosts not sending updates
+        # about them, instead of one query per host.
+        host_names = set(compute.host for compute in compute_nodes)
+        if not full_refresh:
+            host_names.update(host for host, node in self.host_state_map)
+        instances_by_host = self._get_instances_by_host(
+            context, [host for host in host_names
+                      if not self._has_instance_info(host)])
+
         seen_nodes = set()
         for compute in compute_nodes:
             service = service_refs.get(compute.host)
@@ -576,20 +672,89 @@ class HostManager(object):
             host_state.update(compute,
                               dict(service),
                               self._get_aggregates_info(host),
-                              self._get_instance_info(context, compute))
+                              self._get_host_instances(context, compute,
+                                                       instances_by_host))
 
             seen_nodes.add(state_key)
+            self._track_compute_node_change(compute)
 
-        # remove compute nodes from host_state_map if they are not active
-        dead_nodes = set(self.host_state_map.keys()) - seen_nodes
+        if full_refresh:
+            # remove compute nodes from host_state_map if they are not active
+            dead_nodes = set(self.host_state_map.keys()) - seen_nodes
+        else:
+            dead_nodes = self._update_unchanged_host_states(
+                context, service_refs, seen_nodes, instances_by_host)
         for state_key in dead_nodes:
             host, node = state_key
             LOG.info(_LI("Removing dead compute node %(host)s:%(node)s "
                          "from scheduler"), {'host': host, 'node': node})
             del self.host_state_map[state_key]
+        if dead_nodes and self.host_column_cache is not None:
+            # The rows of the cache are never removed, start a new one
+            # rather than keeping the rows of the dead nodes
+            self.host_column_cache = columns.HostColumnCache()
 
         return six.itervalues(self.host_state_map)
 
+    def _needs_full_refresh(self):
+        """Returns True if all the compute nodes have to be reloaded."""
+        if not self.tracks_compute_node_changes:
+            return True
+        if (self._last_full_refresh is None or
+                self._compute_nodes_changed_since is None):
+            return True
+        return timeutils.is_older_than(
+            self._last_full_refresh,
+            CONF.scheduler_host_state_full_refresh_interval)
+
+    def _track_compute_node_change(self, compute):
+        """Remembers the most recent change seen on the compute nodes, which
+        is where the next incremental reload starts from.
+        """
+        if not self.tracks_compute_node_changes:
+            return
+        changed_at = compute.updated_at or compute.created_at
+        if changed_at is None:
+            return
+        if (self._compute_nodes_changed_since is None or
+                changed_at > self._compute_nodes_changed_since):
+            self._compute_nodes_changed_since = changed_at
+
+    def _update_unchanged_host_states(self, context, service_refs,
+                                      changed_nodes, instances_by_host=None):
+        """Refreshes the host states whose compute node did not change since
+        the last request.
+
+        The compute node data is kept as is, only the service record, the
+        aggregates and the instances are updated since they are not tracked
+        by the compute node changes, and only the host states where they
+        changed are updated. Returns the set of host state keys whose compute
+        service no longer exists.
+        """
+        dead_nodes = set()
+        for state_key, host_state in six.iteritems(self.host_state_map):
+            if state_key in changed_nodes:
+                continue
+            service = service_refs.get(host_state.host)
+            if not service:
+                dead_nodes.add(state_key)
+                continue
+            service = dict(service)
+            if service == getattr(host_state, 'service', None):
+                service = None
+            aggregates = self._get_aggregates_info(host_state.host)
+            if not host_state._aggregates_changed(aggregates):
+                aggregates = None
+            inst_dict = self._get_host_instances(context, host_state,
+                                                 instances_by_host)
+            if not host_state._instances_changed(inst_dict):
+                inst_dict = None
+            if (service is not None or aggregates is not None or
+                    inst_dict is not None):
+                host_state.update(service=service, aggregates=aggregates,
+                                  inst_dict=inst_dict)
+        return dead_nodes
+
     def _get_aggregates_info(self, host):
         return [self.aggs_by_id[agg_id] for agg_id in
                 self.host_aggregates_map[host]]
@@ -605,9 +770,8 @@ class HostManager(object):
         relying on the version in _instance_info.
         """
         host_name = compute.host
-        host_info = self._instance_info.get(host_name)
-        if host_info and host_info.get("updated"):
-            inst_dict = host_info["instances"]
+        if self._has_instance_info(host_name):
+            inst_dict = self._instance_info[host_name]["instances"]
         else:
             # Host is running old version, or updates aren't flowing.
             inst_list = objects.InstanceList.get_by_host(context, host_name)
@@ -615,6 +779,53 @@ class HostManager(object):
                          for instance in inst_list.objects}
         return inst_dict
 
+    def _has_instance_info(self, host_name):
+        """Returns True if the host sends updates about its instances."""
+        host_info = self._instance_info.get(host_name)
+        return bool(host_info and host_info.get("updated"))
+
+    def _get_host_instances(self, context, compute, instances_by_host):
+        """Returns the instances of a host, taken from instances_by_host if
+        they were loaded by _get_instances_by_host().
+        """
+        if instances_by_host and compute.host in instances_by_host:
+            return instances_by_host[compute.host]
+        return self._get_instance_info(context, compute)
+
+    def _get_load_pool(self):
+        """Returns the green thread pool used to load the host states."""
+        return eventlet.GreenPool(CONF.scheduler_host_state_load_pool_size)
+
+    def _get_instances_by_host(self, context, host_names,
+                               batch_size=INSTANCE_INFO_BATCH_SIZE):
+        """Loads the instances of several hosts.
+
+        The hosts are split into batches of batch_size hosts, each batch being
+        loaded with a single query, and the queries being run concurrently.
+        Returns a dict of instances keyed by their UUID, keyed by host name,
+        with an empty dict for the hosts without any instance.
+        """
+        host_names = list(host_names)
+        instances_by_host = {host_name: {} for host_name in host_names}
+        if not host_names:
+            return instances_by_host
+        batches = [host_names[start:start + batch_size]
+                   for start in range(0, len(host_names), batch_size)]
+
+        def _get_batch(batch):
+            filters = {"host": batch, "deleted": False}
+            return objects.InstanceList.get_by_filters(context, filters)
+
+        pool = self._get_load_pool()
+        for num, instances in enumerate(pool.imap(_get_batch, batches)):
+            LOG.debug("Adding %s instances for hosts %s-%s",
+                      len(instances), num * batch_size,
+                      num * batch_size + len(batches[num]))
+            for instance in instances:
+                instances_by_host.setdefault(
+                    instance.host, {})[instance.uuid] = instance
+        return instances_by_host
+
     def _recreate_instance_info(self, context, host_name):
         """Get the InstanceList for the specified host, and store it in the
         _instance_info dict.
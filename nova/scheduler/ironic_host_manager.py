@@ -95,3 +95,7 @@ class IronicHostManager(host_manager.HostManager):
     def _get_instance_info(self, context, compute):
         """Ironic hosts should not pass instance info."""
         return {}
+
+    def _get_instances_by_host(self, context, host_names, **kwargs):
+        """Ironic hosts should not pass instance info."""
+        return {}
@@ -86,3 +86,20 @@ class API(object):
             return False
 
         return self._driver.is_up(member)
+
+    def get_up_map(self, members):
+        """Check which of the given members are up.
+
+        :param members: list of service refs
+        :returns: dict of booleans keyed by the ID of the members
+        """
+        up_map = {}
+        checked = []
+        for member in members:
+            if member.get('forced_down'):
+                up_map[member['id']] = False
+            else:
+                checked.append(member)
+        if checked:
+            up_map.update(self._driver.get_up_map(checked))
+        return up_map
@@ -27,3 +27,12 @@ class Driver(object):
     def is_up(self, member):
         """Check whether the given member is up."""
         raise NotImplementedError()
+
+    def get_up_map(self, members):
+        """Check whether each of the given members is up.
+
+        :returns: dict of booleans keyed by the ID of the members
+
+        Override this in a subclass able to check them all at once.
+        """
+        return {member['id']: self.is_up(member) for member in members}
@@ -13,13 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+
 from oslo_log import log as logging
 import oslo_messaging as messaging
 from oslo_utils import timeutils
 import six
 
+from nova.conductor import rpcapi as conductor_rpcapi
 import nova.conf
+from nova import context as nova_context
+from nova import db
 from nova.i18n import _, _LI, _LW, _LE
+from nova.objects import base as objects_base
 from nova.servicegroup import api
 from nova.servicegroup.drivers import base
 
@@ -29,10 +35,69 @@ CONF = nova.conf.CONF
 LOG = logging.getLogger(__name__)
 
 
+def _get_last_heartbeat(service_ref):
+    # Keep checking 'updated_at' if 'last_seen_up' isn't set.
+    # Should be able to use only 'last_seen_up' in the M release
+    return (service_ref.get('last_seen_up') or service_ref['updated_at'] or
+            service_ref['created_at'])
+
+
+def _log_down(service_ref, last_heartbeat, elapsed):
+    LOG.debug('Seems service %(binary)s on host %(host)s is down. '
+              'Last heartbeat was %(lhb)s. Elapsed time is %(el)s',
+              {'binary': service_ref.get('binary'),
+               'host': service_ref.get('host'),
+               'lhb': str(last_heartbeat), 'el': str(elapsed)})
+
+
+class HeartbeatCoalescer(object):
+    """Buffers the state reports of services so that they are written to the
+    database with a single UPDATE per flush.
+
+    This is used by nova-conductor when [conductor]heartbeat_flush_interval
+    is set. The last_seen_up timestamp written for all the services flushed
+    together is the time of the oldest of their latest reports, so that no
+    service is seen up later than it actually reported.
+    """
+
+    def __init__(self):
+        # Time of the latest report keyed by service ID
+        self._reports = {}
+
+    def __len__(self):
+        return len(self._reports)
+
+    def add(self, service_id):
+        """Records a state report of a service."""
+        self._reports[service_id] = timeutils.utcnow()
+
+    def flush(self, context):
+        """Writes the reports received since the previous flush.
+
+        Returns the number of services whose state was written.
+        """
+        if not self._reports:
+            return 0
+        reports, self._reports = self._reports, {}
+        try:
+            db.service_heartbeat_update(context, list(reports),
+                                        min(reports.values()))
+        except Exception:
+            LOG.exception(_LE('Unexpected error while writing the state '
+                              'reports of %d service(s)'), len(reports))
+            # Keep the reports for the next flush, unless a newer one was
+            # received in the meantime
+            for service_id, reported_at in six.iteritems(reports):
+                self._reports.setdefault(service_id, reported_at)
+            return 0
+        return len(reports)
+
+
 class DbDriver(base.Driver):
 
     def __init__(self, *args, **kwargs):
         self.service_down_time = CONF.service_down_time
+        self._conductor_api = None
 
     def join(self, member, group, service=None):
         """Add a new member to a service group.
@@ -57,10 +122,7 @@ class DbDriver(base.Driver):
         """Moved from nova.utils
         Check whether a service is up based on last heartbeat.
         """
-        # Keep checking 'updated_at' if 'last_seen_up' isn't set.
-        # Should be able to use only 'last_seen_up' in the M release
-        last_heartbeat = (service_ref.get('last_seen_up') or
-            service_ref['updated_at'] or service_ref['created_at'])
+        last_heartbeat = _get_last_heartbeat(service_ref)
         if isinstance(last_heartbeat, six.string_types):
             # NOTE(russellb) If this service_ref came in over rpc via
             # conductor, then the timestamp will be a string and needs to be
@@ -74,19 +136,70 @@ class DbDriver(base.Driver):
         elapsed = timeutils.delta_seconds(last_heartbeat, timeutils.utcnow())
         is_up = abs(elapsed) <= self.service_down_time
         if not is_up:
-            LOG.debug('Seems service %(binary)s on host %(host)s is down. '
-                      'Last heartbeat was %(lhb)s. Elapsed time is %(el)s',
-                      {'binary': service_ref.get('binary'),
-                       'host': service_ref.get('host'),
-                       'lhb': str(last_heartbeat), 'el': str(elapsed)})
+            _log_down(service_ref, last_heartbeat, elapsed)
         return is_up
 
+    def get_up_map(self, service_refs):
+        """Check whether each of the given services is up based on their
+        last heartbeats.
+
+        The bounds the heartbeats are compared to are computed once for all
+        the services, and the timestamps received as strings are compared
+        to them without being parsed.
+        """
+        now = timeutils.utcnow()
+        down_time = datetime.timedelta(seconds=self.service_down_time)
+        lower, upper = now - down_time, now + down_time
+        # NOTE: The timestamps sent over RPC are formatted with
+        # PERFECT_TIME_FORMAT, whose fields have a fixed width, so that they
+        # compare as strings like the times they represent.
+        str_lower = lower.strftime(timeutils.PERFECT_TIME_FORMAT)
+        str_upper = upper.strftime(timeutils.PERFECT_TIME_FORMAT)
+
+        up_map = {}
+        for service_ref in service_refs:
+            last_heartbeat = _get_last_heartbeat(service_ref)
+            if isinstance(last_heartbeat, six.string_types):
+                if len(last_heartbeat) == len(str_lower):
+                    is_up = str_lower <= last_heartbeat <= str_upper
+                else:
+                    last_heartbeat = timeutils.parse_strtime(last_heartbeat)
+                    is_up = lower <= last_heartbeat <= upper
+            else:
+                last_heartbeat = last_heartbeat.replace(tzinfo=None)
+                is_up = lower <= last_heartbeat <= upper
+            if not is_up:
+                if isinstance(last_heartbeat, six.string_types):
+                    last_heartbeat = timeutils.parse_strtime(last_heartbeat)
+                _log_down(service_ref, last_heartbeat,
+                          timeutils.delta_seconds(last_heartbeat, now))
+            up_map[service_ref['id']] = is_up
+        return up_map
+
+    def _report_state_to_conductor(self, service):
+        """Send the state report to nova-conductor to be written with the
+        reports of the other services, if enabled.
+
+        Returns False if the report has to be written by this service, i.e.
+        if coalescing is disabled, if this service accesses the database
+        directly or if nova-conductor is too old.
+        """
+        if CONF.conductor.heartbeat_flush_interval <= 0:
+            return False
+        if objects_base.NovaObject.indirection_api is None:
+            return False
+        if self._conductor_api is None:
+            self._conductor_api = conductor_rpcapi.ConductorAPI()
+        return self._conductor_api.report_service_state(
+            nova_context.get_admin_context(), service.service_ref.id)
+
     def _report_state(self, service):
         """Update the state of this service in the datastore."""
 
         try:
-            service.service_ref.report_count += 1
-            service.service_ref.save()
+            if not self._report_state_to_conductor(service):
+                service.service_ref.report_count += 1
+                service.service_ref.save()
 
             # TODO(termie): make this pattern be more elegant.
             if getattr(service, 'model_disconnected', False):
@@ -67,6 +67,21 @@ class MemcachedDriver(base.Driver):
 
         return is_up
 
+    def get_up_map(self, service_refs):
+        """Check whether each of the given services is up, with a single
+        request to memcached.
+        """
+        keys = [str("%(topic)s:%(host)s" % service_ref)
+                for service_ref in service_refs]
+        values = self.mc.get_multi(keys) if keys else []
+        up_map = {}
+        for service_ref, key, value in zip(service_refs, keys, values):
+            is_up = value is not None
+            if not is_up:
+                LOG.debug('Seems service %s is down' % key)
+            up_map[service_ref['id']] = is_up
+        return up_map
+
     def _report_state(self, service):
         """Update the state of this service in the datastore."""
         try:
@@ -193,6 +193,8 @@ class HypervisorsTestV21(test.NoDBTestCase):
         self.controller = hypervisors_v21.HypervisorsController()
         self.controller.servicegroup_api.service_is_up = mock.MagicMock(
             return_value=True)
+        self.controller.servicegroup_api.get_up_map = mock.MagicMock(
+            side_effect=lambda services: {s.id: True for s in services})
 
     def setUp(self):
         super(HypervisorsTestV21, self).setUp()
@@ -575,8 +575,9 @@ class ServicesTestV21(test.TestCase):
 
     # This test is just to verify that the servicegroup API gets used when
     # calling the API
-    @mock.patch.object(db_driver.DbDriver, 'is_up', side_effect=KeyError)
-    def test_services_with_exception(self, mock_is_up):
+    @mock.patch.object(db_driver.DbDriver, 'get_up_map',
+                       side_effect=KeyError)
+    def test_services_with_exception(self, mock_get_up_map):
         req = FakeRequestWithHostService()
         self.assertRaises(self.service_is_up_exc, self.controller.index, req)
 
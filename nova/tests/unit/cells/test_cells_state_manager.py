@@ -74,28 +74,30 @@ def _create_fake_node(host, total_mem, total_disk, free_mem, free_disk):
 
 @classmethod
 def _fake_service_get_all_by_binary(cls, context, binary):
-    def _node(host, total_mem, total_disk, free_mem, free_disk):
+    def _node(id, host, total_mem, total_disk, free_mem, free_disk):
         now = timeutils.utcnow()
-        return objects.Service(host=host,
+        return objects.Service(id=id,
+                               host=host,
                                disabled=False,
                                forced_down=False,
                                last_seen_up=now)
 
-    return [_node(*fake) for fake in FAKE_COMPUTES]
+    return [_node(id, *fake) for id, fake in enumerate(FAKE_COMPUTES)]
 
 
 @classmethod
 def _fake_service_get_all_by_binary_nodedown(cls, context, binary):
-    def _service(host, noupdate_sec):
+    def _service(id, host, noupdate_sec):
         now = timeutils.utcnow()
         last_seen = now - datetime.timedelta(seconds=noupdate_sec)
-        return objects.Service(host=host,
+        return objects.Service(id=id,
+                               host=host,
                                disabled=False,
                                forced_down=False,
                                last_seen_up=last_seen,
                                binary=binary)
 
-    return [_service(*fake) for fake in FAKE_SERVICES]
+    return [_service(id, *fake) for id, fake in enumerate(FAKE_SERVICES)]
 
 
 @classmethod
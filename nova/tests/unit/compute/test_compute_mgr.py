@@ -1400,13 +1400,120 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
     def test_sync_power_states(self, mock_get):
         instance = mock.Mock()
         mock_get.return_value = [instance]
-        with mock.patch.object(self.compute._sync_power_pool,
-                               'spawn_n') as mock_spawn:
+        with test.nested(
+            mock.patch.object(self.compute._sync_power_pool, 'spawn_n'),
+            mock.patch.object(self.compute.driver, 'get_power_states',
+                              side_effect=NotImplementedError()),
+            mock.patch.object(self.compute.driver, 'get_num_instances',
+                              return_value=1),
+        ) as (mock_spawn, mock_get_states, mock_num):
             self.compute._sync_power_states(mock.sentinel.context)
             mock_get.assert_called_with(mock.sentinel.context,
                                         self.compute.host, expected_attrs=[],
                                         use_slave=True)
             mock_spawn.assert_called_once_with(mock.ANY, instance)
+            mock_num.assert_called_once_with()
+
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_sync_power_states_bulk(self, mock_get):
+        def _instance(uuid, vm_state, db_power_state, task_state=None):
+            return objects.Instance(uuid=uuid, vm_state=vm_state,
+                                    power_state=db_power_state,
+                                    task_state=task_state)
+
+        synced = _instance(uuids.synced, vm_states.ACTIVE,
+                           power_state.RUNNING)
+        stopped = _instance(uuids.stopped, vm_states.ACTIVE,
+                            power_state.RUNNING)
+        pending = _instance(uuids.pending, vm_states.ACTIVE,
+                            power_state.RUNNING, task_states.REBOOTING)
+        missing = _instance(uuids.missing, vm_states.ACTIVE,
+                            power_state.RUNNING)
+        mock_get.return_value = [synced, stopped, pending, missing]
+        vm_power_states = {uuids.synced: power_state.RUNNING,
+                           uuids.stopped: power_state.SHUTDOWN,
+                           uuids.pending: power_state.SHUTDOWN}
+        with test.nested(
+            mock.patch.object(self.compute._sync_power_pool, 'spawn_n'),
+            mock.patch.object(self.compute.driver, 'get_power_states',
+                              return_value=vm_power_states),
+            mock.patch.object(self.compute.driver, 'get_num_instances'),
+        ) as (mock_spawn, mock_get_states, mock_num):
+            self.compute._sync_power_states(mock.sentinel.context)
+            self.assertEqual([mock.call(mock.ANY, stopped),
+                              mock.call(mock.ANY, missing)],
+                             mock_spawn.call_args_list)
+            mock_get_states.assert_called_once_with()
+            self.assertFalse(mock_num.called)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_heal_instance_info_cache_batch(self, mock_get_by_host,
+                                            mock_get_by_filters):
+        self.flags(heal_instance_info_cache_batch_size=2)
+
+        def _instance(uuid, vm_state=vm_states.ACTIVE, task_state=None,
+                      host=None):
+            return objects.Instance(uuid=uuid, vm_state=vm_state,
+                                    task_state=task_state,
+                                    host=host or self.compute.host)
+
+        building = _instance(uuids.building, vm_state=vm_states.BUILDING)
+        inst1 = _instance(uuids.inst1)
+        inst2 = _instance(uuids.inst2)
+        inst3 = _instance(uuids.inst3)
+        migrated = _instance(uuids.inst3, host='not-me')
+        mock_get_by_host.return_value = [building, inst1, inst2, inst3]
+        mock_get_by_filters.side_effect = [[inst1, inst2], [migrated]]
+
+        with mock.patch.object(self.compute.network_api,
+                               'refresh_instances_nw_info_cache',
+                               return_value=[inst2]) as mock_refresh:
+            self.compute._heal_instance_info_cache(self.context)
+            mock_refresh.assert_called_once_with(self.context,
+                                                 [inst1, inst2])
+            mock_get_by_filters.assert_called_once_with(
+                self.context, {'uuid': [uuids.inst1, uuids.inst2],
+                               'deleted': False},
+                expected_attrs=['system_metadata', 'info_cache', 'flavor'],
+                use_slave=True)
+            self.assertEqual([uuids.inst3],
+                             self.compute._instance_uuids_to_heal)
+
+            # The last instance was migrated, so there's nothing to refresh
+            self.compute._heal_instance_info_cache(self.context)
+            self.assertEqual(1, mock_refresh.call_count)
+            self.assertEqual(2, mock_get_by_filters.call_count)
+            self.assertEqual(1, mock_get_by_host.call_count)
+            self.assertEqual([], self.compute._instance_uuids_to_heal)
+
+    def test_is_power_state_synced(self):
+        def _synced(vm_state, db_power_state, vm_power_state,
+                    task_state=None):
+            instance = objects.Instance(vm_state=vm_state,
+                                        power_state=db_power_state,
+                                        task_state=task_state)
+            return self.compute._is_power_state_synced(instance,
+                                                       vm_power_state)
+
+        self.assertTrue(_synced(vm_states.ACTIVE, power_state.RUNNING,
+                                power_state.RUNNING))
+        self.assertTrue(_synced(vm_states.STOPPED, power_state.SHUTDOWN,
+                                power_state.SHUTDOWN))
+        self.assertTrue(_synced(vm_states.ACTIVE, power_state.RUNNING,
+                                power_state.SHUTDOWN,
+                                task_states.POWERING_OFF))
+        # The database needs an update
+        self.assertFalse(_synced(vm_states.ACTIVE, power_state.RUNNING,
+                                 power_state.SHUTDOWN))
+        # The instance needs to be stopped
+        self.assertFalse(_synced(vm_states.STOPPED, power_state.RUNNING,
+                                 power_state.RUNNING))
+        self.assertFalse(_synced(vm_states.ACTIVE, power_state.SHUTDOWN,
+                                 power_state.SHUTDOWN))
+        # The instances in other vm_states always go through the sync
+        self.assertFalse(_synced(vm_states.RESIZED, power_state.RUNNING,
+                                 power_state.RUNNING))
 
     def _get_sync_instance(self, power_state, vm_state, task_state=None,
                            shutdown_terminate=False):
@@ -21,6 +21,8 @@ import uuid
 import mock
 from mox3 import mox
 import oslo_messaging as messaging
+from oslo_service import loopingcall
+from oslo_utils import fixture as utils_fixture
 from oslo_utils import timeutils
 import six
 
@@ -192,6 +194,66 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         result = self.conductor.provider_fw_rule_get_all(self.context)
         self.assertEqual([], result)
 
+    def _create_services(self, count):
+        return [db.service_create(self.context,
+                                  {'host': 'host%d' % i,
+                                   'binary': 'nova-compute',
+                                   'topic': 'compute',
+                                   'report_count': 0})
+                for i in range(count)]
+
+    def test_report_service_state_not_coalesced(self):
+        service = self._create_services(1)[0]
+        self.conductor.report_service_state(self.context, service['id'])
+        service = db.service_get(self.context, service['id'])
+        self.assertEqual(1, service['report_count'])
+        self.assertIsNotNone(service['last_seen_up'])
+
+    def test_report_service_state_coalesced(self):
+        self.flags(heartbeat_flush_interval=10, group='conductor')
+        services = self._create_services(3)
+        now = timeutils.utcnow().replace(microsecond=0)
+        time_fixture = self.useFixture(utils_fixture.TimeFixture(now))
+        with mock.patch.object(loopingcall,
+                               'FixedIntervalLoopingCall') as mock_timer:
+            self.conductor.init_host()
+        mock_timer.assert_called_once_with(self.conductor._flush_heartbeats)
+        mock_timer.return_value.start.assert_called_once_with(
+            interval=10, initial_delay=10)
+
+        with mock.patch.object(db, 'service_heartbeat_update',
+                               wraps=db.service_heartbeat_update) as mock_upd:
+            for service in services:
+                self.conductor.report_service_state(self.context,
+                                                    service['id'])
+                time_fixture.advance_time_seconds(1)
+            self.assertFalse(mock_upd.called)
+            self.conductor._flush_heartbeats()
+            self.assertEqual(1, mock_upd.call_count)
+            self.conductor._flush_heartbeats()
+            self.assertEqual(1, mock_upd.call_count)
+
+        for service in services:
+            service = db.service_get(self.context, service['id'])
+            self.assertEqual(1, service['report_count'])
+            # The oldest report is written for all the services
+            self.assertEqual(now, service['last_seen_up'])
+
+    def test_cleanup_host_flushes_heartbeats(self):
+        timer = mock.Mock()
+        self.conductor._heartbeat_timer = timer
+        service = self._create_services(1)[0]
+        self.conductor.report_service_state(self.context, service['id'])
+        self.assertEqual(
+            0, db.service_get(self.context, service['id'])['report_count'])
+
+        self.conductor.cleanup_host()
+
+        timer.stop.assert_called_once_with()
+        self.assertIsNone(self.conductor._heartbeat_timer)
+        self.assertEqual(
+            1, db.service_get(self.context, service['id'])['report_count'])
+
 
 class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
     """Conductor RPC API Tests."""
@@ -202,6 +264,25 @@ class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
         self.conductor_manager = self.conductor_service.manager
         self.conductor = conductor_rpcapi.ConductorAPI()
 
+    def test_report_service_state(self):
+        with mock.patch.object(self.conductor.client, 'prepare') as prepare:
+            self.assertTrue(self.conductor.report_service_state(
+                self.context, 42))
+        prepare.assert_called_once_with(version='3.1')
+        prepare.return_value.cast.assert_called_once_with(
+            self.context, 'report_service_state', service_id=42)
+
+    def test_report_service_state_old_conductor(self):
+        with test.nested(
+            mock.patch.object(self.conductor.client, 'can_send_version',
+                              return_value=False),
+            mock.patch.object(self.conductor.client, 'prepare')
+        ) as (can_send_version, prepare):
+            self.assertFalse(self.conductor.report_service_state(
+                self.context, 42))
+        can_send_version.assert_called_once_with('3.1')
+        self.assertFalse(prepare.called)
+
 
 class ConductorAPITestCase(_BaseTestCase, test.TestCase):
     """Conductor API Tests."""
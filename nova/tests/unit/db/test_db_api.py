@@ -20,8 +20,10 @@
 
 import copy
 import datetime
+import time
 import uuid as stdlib_uuid
 
+import eventlet
 import iso8601
 import mock
 import netaddr
@@ -1094,7 +1096,10 @@ class SqlAlchemyDbApiNoDbTestCase(test.NoDBTestCase):
             self, mock_paginate, mock_fill, mock_get):
         ctxt = mock.MagicMock()
         ctxt.elevated.return_value = mock.sentinel.elevated
-        sqlalchemy_api.instance_get_all_by_filters_sort(ctxt, {}, marker='foo')
+        # NOTE: the keyset pagination doesn't load the marker instance, so
+        # sort by a key which isn't handled by it
+        sqlalchemy_api.instance_get_all_by_filters_sort(
+            ctxt, {}, marker='foo', sort_keys=['display_name'])
         mock_get.assert_called_once_with(mock.sentinel.elevated, 'foo')
         ctxt.elevated.assert_called_once_with(read_deleted='yes')
 
@@ -2294,6 +2299,71 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.mox.ReplayAll()
         sqlalchemy_api._instance_system_metadata_get_multi(self.ctxt, [])
 
+    def test_instance_get_all_by_filters_keyset_paginate(self):
+        """Verifies the keyset pagination on (created_at, id) and uuid."""
+        created_at = [datetime.datetime(2016, 1, 1, 0, 0, 0),
+                      datetime.datetime(2016, 1, 2, 0, 0, 0)]
+        # Several instances created at the same time, in a different order
+        # than their IDs
+        insts = [self.create_instance_with_args(created_at=created_at[i])
+                 for i in (1, 0, 1, 0, 1)]
+        # One deleted instance, used as a marker
+        deleted = self.create_instance_with_args(created_at=created_at[0])
+        db.instance_destroy(self.ctxt, deleted['uuid'])
+        filters = {'deleted': False}
+
+        for sort_keys, sort_dirs in ((None, None),
+                                     (['created_at', 'id'], ['asc', 'asc']),
+                                     (['uuid'], ['asc']),
+                                     (['uuid'], ['desc'])):
+            correct_order = db.instance_get_all_by_filters_sort(
+                self.ctxt, filters, sort_keys=sort_keys,
+                sort_dirs=sort_dirs)
+            self.assertEqual(5, len(correct_order))
+            for limit in range(1, 4):
+                marker = None
+                for i in range(0, 6, limit):
+                    with mock.patch.object(sqlalchemy_api,
+                                           '_instance_get_by_uuid') as m_get:
+                        page = db.instance_get_all_by_filters_sort(
+                            self.ctxt, filters, limit=limit, marker=marker,
+                            sort_keys=sort_keys, sort_dirs=sort_dirs)
+                        # The marker instance isn't loaded
+                        self.assertFalse(m_get.called)
+                    self.assertEqual(
+                        [inst['uuid'] for inst in correct_order[i:i + limit]],
+                        [inst['uuid'] for inst in page])
+                    if page:
+                        marker = page[-1]['uuid']
+
+        # A deleted instance can be used as a marker, the instances created
+        # at the same time with a lower ID follow it
+        result = db.instance_get_all_by_filters_sort(
+            self.ctxt, filters, marker=deleted['uuid'],
+            sort_keys=['created_at', 'id'], sort_dirs=['desc', 'desc'])
+        self.assertEqual([insts[3]['uuid'], insts[1]['uuid']],
+                         [inst['uuid'] for inst in result])
+
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters_sort,
+                          self.ctxt, filters,
+                          marker=str(stdlib_uuid.uuid4()))
+
+    def test_instance_get_all_by_filters_keyset_mixed_dirs(self):
+        """Verifies that the keyset pagination isn't used when the sort keys
+        are sorted in different directions.
+        """
+        inst1 = self.create_instance_with_args(
+            created_at=datetime.datetime(2016, 1, 1, 0, 0, 0))
+        inst2 = self.create_instance_with_args(
+            created_at=datetime.datetime(2016, 1, 2, 0, 0, 0))
+        with mock.patch.object(sqlalchemy_api, '_keyset_paginate_query') as m:
+            insts = db.instance_get_all_by_filters_sort(
+                self.ctxt, {}, marker=inst1['uuid'],
+                sort_keys=['created_at', 'id'], sort_dirs=['asc', 'desc'])
+            self.assertFalse(m.called)
+        self.assertEqual([inst2['uuid']], [inst['uuid'] for inst in insts])
+
     def test_instance_get_all_by_filters_regex(self):
         i1 = self.create_instance_with_args(display_name='test1')
         i2 = self.create_instance_with_args(display_name='teeeest2')
@@ -3149,6 +3219,17 @@ class InstanceMetadataTestCase(test.TestCase):
         metadata = db.instance_metadata_get(self.ctxt, instance['uuid'])
         self.assertEqual(metadata, {'new_key': 'new_value'})
 
+    def test_instance_metadata_update_keeps_instance_updated_at(self):
+        instance = db.instance_create(self.ctxt, {'metadata':
+                                                    {'key': 'value'}})
+        db.instance_metadata_update(self.ctxt, instance['uuid'],
+                                    {'key': 'new_value'}, False)
+        db.instance_metadata_delete(self.ctxt, instance['uuid'], 'key')
+        db.instance_system_metadata_update(self.ctxt, instance['uuid'],
+                                           {'key': 'value'}, False)
+        instance = db.instance_get_by_uuid(self.ctxt, instance['uuid'])
+        self.assertIsNone(instance['updated_at'])
+
 
 class InstanceExtraTestCase(test.TestCase):
     def setUp(self):
@@ -3253,6 +3334,28 @@ class ServiceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertRaises(exception.ServiceNotFound,
                           db.service_update, self.ctxt, 100500, {})
 
+    def test_service_heartbeat_update(self):
+        service1 = self._create_service({})
+        service2 = self._create_service({'host': 'fake_host2'})
+        service3 = self._create_service({'host': 'fake_host3'})
+        last_seen_up = datetime.datetime(2016, 4, 1, 12, 0, 0)
+
+        count = db.service_heartbeat_update(
+            self.ctxt, [service1['id'], service2['id']], last_seen_up)
+
+        self.assertEqual(2, count)
+        for service in (service1, service2):
+            updated_service = db.service_get(self.ctxt, service['id'])
+            self.assertEqual(last_seen_up, updated_service['last_seen_up'])
+            self.assertEqual(4, updated_service['report_count'])
+        service3 = db.service_get(self.ctxt, service3['id'])
+        self.assertIsNone(service3['last_seen_up'])
+        self.assertEqual(3, service3['report_count'])
+
+    def test_service_heartbeat_update_no_services(self):
+        self.assertEqual(0, db.service_heartbeat_update(
+            self.ctxt, [], timeutils.utcnow()))
+
     def test_service_update_with_set_forced_down(self):
         service = self._create_service({})
         db.service_update(self.ctxt, service['id'], {'forced_down': True})
@@ -6870,6 +6973,31 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                                         'resource1': 0,
                                                         'resource2': 1})
 
+    def test_quota_get_all_limits_by_project(self):
+        db.quota_create(self.ctxt, 'project1', 'resource0', 10)
+        db.quota_create(self.ctxt, 'project1', 'resource1', 11)
+        db.quota_create(self.ctxt, 'project2', 'resource0', 20)
+        db.quota_create(self.ctxt, 'project1', 'resource0', 1,
+                        user_id='user1')
+        db.quota_create(self.ctxt, 'project1', 'resource1', 2,
+                        user_id='user2')
+        db.quota_class_create(self.ctxt, 'default', 'resource0', 100)
+        db.quota_class_create(self.ctxt, 'class1', 'resource1', 101)
+        db.quota_class_create(self.ctxt, 'class2', 'resource1', 102)
+
+        limits = db.quota_get_all_limits_by_project(self.ctxt, 'project1',
+                                                    quota_class='class1')
+        self.assertEqual({'project': {'resource0': 10, 'resource1': 11},
+                          'users': {'user1': {'resource0': 1},
+                                    'user2': {'resource1': 2}},
+                          'defaults': {'resource0': 100},
+                          'class': {'resource1': 101}}, limits)
+
+        limits = db.quota_get_all_limits_by_project(self.ctxt, 'project3')
+        self.assertEqual({'project': {}, 'users': {},
+                          'defaults': {'resource0': 100}, 'class': {}},
+                         limits)
+
     def test_quota_update(self):
         db.quota_create(self.ctxt, 'project1', 'resource1', 41)
         db.quota_update(self.ctxt, 'project1', 'resource1', 42)
@@ -7034,6 +7162,165 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
                           'project1', 'resource1', 42)
 
 
+class QuotaCountersTestCase(test.TestCase):
+
+    """Tests for the db.api.*_counters quota methods."""
+
+    def setUp(self):
+        super(QuotaCountersTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        self.resources = {'instances': quota.ReservableResource(
+            'instances', '_sync_instances', 'instances')}
+        self.project_quotas = {'instances': 3}
+        self.user_quotas = {'instances': 2}
+        self.expire = timeutils.utcnow() + datetime.timedelta(days=1)
+
+    def _reserve(self, delta=1, user_id='user1', until_refresh=None,
+                 max_age=None):
+        return db.quota_reserve_counters(
+            self.ctxt, self.resources, self.project_quotas, self.user_quotas,
+            {'instances': delta}, self.expire, until_refresh, max_age,
+            project_id='project1', user_id=user_id)
+
+    def _get_usage(self, user_id='user1'):
+        usage = db.quota_usage_get(self.ctxt, 'project1', 'instances',
+                                   user_id)
+        return usage.in_use, usage.reserved
+
+    def test_quota_reserve_counters(self):
+        # The first reservation creates the usage with quota_reserve()
+        reservations = self._reserve()
+        self.assertEqual(1, len(reservations))
+        self.assertEqual((0, 1), self._get_usage())
+
+        with mock.patch.object(sqlalchemy_api, 'quota_reserve') as reserve:
+            reservations = self._reserve()
+        self.assertFalse(reserve.called)
+        self.assertEqual(1, len(reservations))
+        self.assertEqual((0, 2), self._get_usage())
+        reservation = _reservation_get(self.ctxt, reservations[0])
+        self.assertEqual(1, reservation.delta)
+        self.assertEqual('user1', reservation.user_id)
+
+    def test_quota_reserve_counters_negative_delta(self):
+        self._reserve()
+        reservations = self._reserve(delta=-1)
+        self.assertEqual(1, len(reservations))
+        self.assertEqual((0, 1), self._get_usage())
+
+    def test_quota_reserve_counters_over_user_quota(self):
+        self._reserve(delta=2)
+        exc = self.assertRaises(exception.OverQuota, self._reserve)
+        self.assertEqual(['instances'], exc.kwargs['overs'])
+        self.assertEqual({'instances': {'in_use': 0, 'reserved': 2}},
+                         exc.kwargs['usages'])
+        self.assertEqual((0, 2), self._get_usage())
+
+    def test_quota_reserve_counters_over_project_quota(self):
+        self._reserve(delta=2)
+        self._reserve(user_id='user2')
+        self.assertRaises(exception.OverQuota, self._reserve,
+                          user_id='user2')
+        # The increment is reverted once the project limit is found exceeded
+        self.assertEqual((0, 1), self._get_usage('user2'))
+        self.assertEqual((0, 2), self._get_usage('user1'))
+
+    def test_quota_reserve_counters_refresh(self):
+        self._reserve(until_refresh=2)
+        with mock.patch.object(sqlalchemy_api, 'quota_reserve') as reserve:
+            self._reserve(until_refresh=2)
+            self.assertFalse(reserve.called)
+            # until_refresh is down to 1, the usage has to be refreshed
+            self._reserve(until_refresh=2)
+            self.assertTrue(reserve.called)
+
+    def test_quota_reserve_counters_retry(self):
+        self._reserve()
+        # The first conditional update fails without the usage being over
+        # the limit, as if another request changed it in the meantime
+        with mock.patch.object(sqlalchemy_api, '_quota_counter_usage_reserve',
+                               side_effect=[False, True]) as reserve:
+            reservations = self._reserve()
+        self.assertEqual(2, reserve.call_count)
+        self.assertEqual(1, len(reservations))
+
+    def test_quota_reserve_counters_fallback_after_retries(self):
+        self._reserve()
+        with test.nested(
+            mock.patch.object(sqlalchemy_api, '_quota_counter_usage_reserve',
+                              return_value=False),
+            mock.patch.object(sqlalchemy_api, 'quota_reserve',
+                              return_value=['fake-reservation'])
+        ) as (counter_reserve, reserve):
+            self.assertEqual(['fake-reservation'], self._reserve())
+        self.assertEqual(sqlalchemy_api._QUOTA_COUNTER_RETRIES,
+                         counter_reserve.call_count)
+        self.assertTrue(reserve.called)
+
+    def test_reservation_commit_counters(self):
+        self._reserve()
+        reservations = self._reserve()
+        db.reservation_commit_counters(self.ctxt, reservations, 'project1',
+                                       'user1')
+        self.assertEqual((1, 1), self._get_usage())
+        # Committing the same reservations again has no effect
+        db.reservation_commit_counters(self.ctxt, reservations, 'project1',
+                                       'user1')
+        self.assertEqual((1, 1), self._get_usage())
+        self.assertRaises(exception.ReservationNotFound, _reservation_get,
+                          self.ctxt, reservations[0])
+
+    def test_reservation_rollback_counters(self):
+        self._reserve()
+        reservations = self._reserve()
+        db.reservation_rollback_counters(self.ctxt, reservations, 'project1',
+                                         'user1')
+        self.assertEqual((0, 1), self._get_usage())
+        db.reservation_commit_counters(self.ctxt, reservations, 'project1',
+                                       'user1')
+        self.assertEqual((0, 1), self._get_usage())
+
+    def test_reservation_expire_counters(self):
+        self._reserve()
+        self.expire = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        reservations = self._reserve()
+        db.reservation_expire_counters(self.ctxt)
+        self.assertEqual((0, 1), self._get_usage())
+        self.assertRaises(exception.ReservationNotFound, _reservation_get,
+                          self.ctxt, reservations[0])
+
+    def test_performance_check_concurrent_reservations(self):
+        self.project_quotas = {'instances': 50}
+        self.user_quotas = {'instances': -1}
+        users = ['user%d' % i for i in range(10)]
+        for user_id in users:
+            # Create the usages beforehand
+            self._reserve(delta=0, user_id=user_id)
+
+        def reserve_and_commit(user_id):
+            try:
+                reservations = self._reserve(user_id=user_id)
+            except exception.OverQuota:
+                return 0
+            db.reservation_commit_counters(self.ctxt, reservations,
+                                           'project1', user_id)
+            return 1
+
+        pool = eventlet.GreenPool(20)
+        start = time.time()
+        committed = sum(pool.imap(reserve_and_commit, users * 10))
+        elapsed = time.time() - start
+        self.assertLess(elapsed, 30)
+
+        # Concurrent requests may be refused close to the limit, but the
+        # limit is never exceeded
+        self.assertLessEqual(committed, 50)
+        self.assertGreater(committed, 0)
+        usages = db.quota_usage_get_all_by_project(self.ctxt, 'project1')
+        self.assertEqual({'in_use': committed, 'reserved': 0},
+                         usages['instances'])
+
+
 class QuotaReserveNoDbTestCase(test.NoDBTestCase):
     """Tests quota reserve/refresh operations using mock."""
 
@@ -7341,6 +7628,24 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         new_stats = jsonutils.loads(node['stats'])
         self.assertEqual(self.stats, new_stats)
 
+    def test_compute_node_get_all_changed_since(self):
+        created_at = self.item['created_at']
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, created_at)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(self.item['id'], nodes[0]['id'])
+
+        later = created_at + datetime.timedelta(hours=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, later)
+        self.assertEqual(0, len(nodes))
+
+        # Updating the node bumps updated_at, which makes it show up again
+        self.useFixture(utils_fixture.TimeFixture(
+            later + datetime.timedelta(minutes=1)))
+        db.compute_node_update(self.ctxt, self.item['id'], {'vcpus_used': 1})
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, later)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(1, nodes[0]['vcpus_used'])
+
     def test_compute_node_select_schema(self):
         # We here test that compute nodes that have inventory and allocation
         # entries under the new resource-providers schema return non-None
@@ -8613,6 +8918,114 @@ class ArchiveTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assert_shadow_tables_empty_except(
             'shadow_instance_id_mappings')
 
+    def _create_deleted_instance_id_mappings(self):
+        ids = []
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr)
+            ids.append(self.conn.execute(ins_stmt).inserted_primary_key[0])
+        update_statement = self.instance_id_mappings.update().\
+                where(self.instance_id_mappings.c.uuid.in_(self.uuidstrs[:4]))\
+                .values(deleted=1)
+        self.conn.execute(update_statement)
+        return ids
+
+    @mock.patch.object(sqlalchemy_api, '_ARCHIVE_CHUNK_SIZE', 1)
+    def test_archive_deleted_rows_watermarks(self):
+        ids = self._create_deleted_instance_id_mappings()
+        self.conn.execute(self.instance_id_mappings.update().
+                          where(self.instance_id_mappings.c.id == ids[0]).
+                          values(deleted=0))
+        watermarks = {}
+        results = db.archive_deleted_rows(max_rows=3, watermarks=watermarks)
+        self.assertEqual(dict(instance_id_mappings=3), results)
+        self.assertEqual(ids[3], watermarks['instance_id_mappings'])
+
+        # The rows deleted before the watermark are left for the next pass
+        self.conn.execute(self.instance_id_mappings.update().
+                          where(self.instance_id_mappings.c.id.in_(
+                              [ids[0], ids[5]])).
+                          values(deleted=1))
+        results = db.archive_deleted_rows(max_rows=3, watermarks=watermarks)
+        self.assertEqual(dict(instance_id_mappings=1), results)
+        self.assertIsNone(watermarks['instance_id_mappings'])
+        qiim = sql.select([self.instance_id_mappings.c.id])
+        self.assertEqual(sorted([ids[0], ids[4]]), sorted(
+            row[0] for row in self.conn.execute(qiim).fetchall()))
+
+        # The exhausted tables are skipped until the pass is complete
+        watermarks['instances'] = 1
+        with mock.patch.object(sqlalchemy_api,
+                               '_archive_deleted_rows_for_table',
+                               return_value=0) as archive:
+            db.archive_deleted_rows(max_rows=3, watermarks=watermarks)
+        self.assertNotIn('instance_id_mappings',
+                         [call[0][0] for call in archive.call_args_list])
+
+    def test_archive_deleted_rows_watermarks_next_pass(self):
+        ids = self._create_deleted_instance_id_mappings()
+        watermarks = {}
+        results = db.archive_deleted_rows(max_rows=10, watermarks=watermarks)
+        self.assertEqual(dict(instance_id_mappings=4), results)
+        self.assertEqual(set([None]), set(watermarks.values()))
+
+        # All the tables are exhausted, the next pass starts from the first
+        # rows again
+        self.conn.execute(self.instance_id_mappings.update().
+                          where(self.instance_id_mappings.c.id == ids[4]).
+                          values(deleted=1))
+        results = db.archive_deleted_rows(max_rows=10, watermarks=watermarks)
+        self.assertEqual(dict(instance_id_mappings=1), results)
+        self.assertEqual(set([None]), set(watermarks.values()))
+        qiim = sql.select([self.instance_id_mappings.c.id])
+        self.assertEqual([ids[5]], [row[0] for row in
+                                    self.conn.execute(qiim).fetchall()])
+
+    def test_archive_deleted_rows_for_table_watermark(self):
+        ids = self._create_deleted_instance_id_mappings()
+        watermarks = {'instance_id_mappings': ids[1]}
+        num = sqlalchemy_api._archive_deleted_rows_for_table(
+            'instance_id_mappings', max_rows=10, watermarks=watermarks)
+        self.assertEqual(2, num)
+        self.assertIsNone(watermarks['instance_id_mappings'])
+        qsiim = sql.select([self.shadow_instance_id_mappings.c.id])
+        self.assertEqual(sorted(ids[2:4]), sorted(
+            row[0] for row in self.conn.execute(qsiim).fetchall()))
+
+    @mock.patch.object(sqlalchemy_api, '_ARCHIVE_CHUNK_SIZE', 1)
+    def test_archive_deleted_rows_workers(self):
+        self._create_deleted_instance_id_mappings()
+        for i in range(3):
+            ins_stmt = self.dns_domains.insert().values(domain='d%d' % i,
+                                                        deleted=True)
+            self.conn.execute(ins_stmt)
+
+        results = db.archive_deleted_rows(max_rows=5, workers=4)
+        # The tables share the number of rows to archive
+        self.assertEqual(5, sum(results.values()))
+        results = db.archive_deleted_rows(max_rows=5, workers=4)
+        self.assertEqual(2, sum(results.values()))
+        self._assert_shadow_tables_empty_except(
+            'shadow_instance_id_mappings',
+            'shadow_dns_domains'
+        )
+
+    def test_get_archive_table_groups(self):
+        meta = MetaData(bind=self.engine)
+        meta.reflect()
+        groups = sqlalchemy_api._get_archive_table_groups(meta)
+        levels = {}
+        for level, tablenames in enumerate(groups):
+            for tablename in tablenames:
+                self.assertNotIn(tablename, levels)
+                levels[tablename] = level
+        self.assertNotIn('migrate_version', levels)
+        self.assertFalse([name for name in levels
+                          if name.startswith('shadow_')])
+        # The tables are archived before the tables they reference
+        self.assertLess(levels['consoles'], levels['console_pools'])
+        self.assertLess(levels['instance_extra'], levels['instances'])
+        self.assertLess(levels['block_device_mapping'], levels['instances'])
+
     def test_archive_deleted_rows_for_every_uuid_table(self):
         tablenames = []
         for model_class in six.itervalues(models.__dict__):
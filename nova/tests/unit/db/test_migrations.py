@@ -895,6 +895,11 @@ class NovaMigrationsCheckers(test_migrations.ModelsMigrationsSync,
         self.assertColumnExists(engine, 'virtual_interfaces', 'tag')
         self.assertColumnExists(engine, 'block_device_mapping', 'tag')
 
+    def _check_332(self, engine, data):
+        self.assertIndexMembers(engine, 'instances',
+                                'instances_deleted_created_at_id_idx',
+                                ['deleted', 'created_at', 'id'])
+
 
 class TestNovaMigrationsSQLite(NovaMigrationsCheckers,
                                test_base.DbTestCase,
@@ -38,6 +38,7 @@ from nova import test
 from nova.tests.unit import fake_instance
 from nova.tests.unit.objects import test_fixed_ip
 from nova.tests.unit.objects import test_virtual_interface
+from nova.tests import uuidsentinel as uuids
 
 FAKE_UUID = 'a47ae74e-ab08-547f-9eee-ffd23fc46c16'
 
@@ -550,6 +551,37 @@ class ApiTestCase(test.TestCase):
                                             update_cells=False)
         self.assertEqual(fake_result, result)
 
+    @mock.patch.object(api.API, '_get_instance_nw_info')
+    @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
+    def test_refresh_instances_nw_info_cache(self, mock_update, mock_get):
+        vif = network_model.VIF(id='port-id', address='fake-mac')
+        unchanged = fake_instance.fake_instance_obj(
+            self.context, uuid=uuids.unchanged)
+        unchanged.info_cache = objects.InstanceInfoCache(
+            network_info=network_model.NetworkInfo([vif]))
+        changed = fake_instance.fake_instance_obj(
+            self.context, uuid=uuids.changed)
+        changed.info_cache = objects.InstanceInfoCache(
+            network_info=network_model.NetworkInfo())
+        deleted = fake_instance.fake_instance_obj(
+            self.context, uuid=uuids.deleted)
+        nw_info = network_model.NetworkInfo([vif])
+        mock_get.side_effect = [nw_info, nw_info,
+                                exception.InstanceNotFound(
+                                    instance_id=uuids.deleted)]
+
+        updated = self.network_api.refresh_instances_nw_info_cache(
+            self.context, [unchanged, changed, deleted])
+
+        self.assertEqual([changed], updated)
+        self.assertEqual([mock.call(self.context, unchanged),
+                          mock.call(self.context, changed),
+                          mock.call(self.context, deleted)],
+                         mock_get.call_args_list)
+        mock_update.assert_called_once_with(self.network_api, self.context,
+                                            changed, nw_info=nw_info,
+                                            update_cells=False)
+
 
 @mock.patch('nova.network.api.API')
 @mock.patch('nova.db.instance_info_cache_update', return_value=fake_info_cache)
@@ -376,6 +376,49 @@ class LinuxNetworkUtilsTestCase(test.NoDBTestCase):
                     'nova-br100.conf should not have been found')
 
 
+class IpsetManagerTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(IpsetManagerTestCase, self).setUp()
+        self.execute = mock.Mock(return_value=('', ''))
+        self.manager = linux_net.IpsetManager(self.execute)
+
+    def test_set_members(self):
+        self.assertTrue(self.manager.set_members(
+            'nova-sg-1-v6', ['fe80::1', 'fe80::2'], family='inet6'))
+        self.execute.assert_called_once_with(
+            'ipset', 'restore', '-exist', run_as_root=True,
+            process_input='create nova-sg-1-v6 hash:ip family inet6\n'
+                          'create nova-sg-1-v6-new hash:ip family inet6\n'
+                          'flush nova-sg-1-v6-new\n'
+                          'add nova-sg-1-v6-new fe80::1\n'
+                          'add nova-sg-1-v6-new fe80::2\n'
+                          'swap nova-sg-1-v6-new nova-sg-1-v6\n'
+                          'destroy nova-sg-1-v6-new\n')
+
+        self.execute.reset_mock()
+        self.assertTrue(self.manager.set_members(
+            'nova-sg-1-v6', ['fe80::2', 'fe80::3'], family='inet6'))
+        self.execute.assert_called_once_with(
+            'ipset', 'restore', '-exist', run_as_root=True,
+            process_input='del nova-sg-1-v6 fe80::1\n'
+                          'add nova-sg-1-v6 fe80::3\n')
+
+        self.execute.reset_mock()
+        self.assertFalse(self.manager.set_members(
+            'nova-sg-1-v6', ['fe80::3', 'fe80::2'], family='inet6'))
+        self.assertFalse(self.execute.called)
+
+    def test_destroy_set(self):
+        self.manager.set_members('nova-sg-1-v4', ['10.0.0.1'])
+        self.execute.reset_mock()
+        self.manager.destroy_set('nova-sg-1-v4')
+        self.manager.destroy_set('nova-sg-1-v4')
+        self.execute.assert_called_once_with(
+            'ipset', 'destroy', 'nova-sg-1-v4', run_as_root=True,
+            check_exit_code=[0, 1])
+        self.assertEqual({}, self.manager.sets)
+
+
 class LinuxNetworkTestCase(test.NoDBTestCase):
 
     REQUIRES_LOCKING = True
@@ -3019,6 +3019,28 @@ class TestNeutronv2WithMock(test.TestCase):
         self.assertEqual(new_port_ids, instance_port_ids + port_ids)
         self.assertEqual(2, mock_log.warning.call_count)
 
+    @mock.patch.object(neutronapi.API, '_get_available_networks')
+    def test_gather_port_ids_and_networks_from_lookups(self, mock_get_nets):
+        network_info = model.NetworkInfo(
+            [{'id': 'port_%d' % i, 'network': model.Network(id=net_id)}
+             for i, net_id in enumerate(['net_2', 'net_1', 'net_2'])])
+        instance_uuid = uuid.uuid4()
+        instance = objects.Instance(uuid=instance_uuid,
+                                    info_cache=objects.InstanceInfoCache(
+                                        context=self.context,
+                                        instance_uuid=instance_uuid,
+                                        network_info=network_info))
+        networks = {net_id: {'id': net_id}
+                    for net_id in ['net_1', 'net_2', 'net_3']}
+        lookups = neutronapi._NwInfoLookups({}, {}, {}, networks)
+
+        new_networks, new_port_ids = self.api._gather_port_ids_and_networks(
+            self.context, instance, lookups=lookups)
+
+        self.assertEqual([{'id': 'net_2'}, {'id': 'net_1'}], new_networks)
+        self.assertEqual(['port_0', 'port_1', 'port_2'], new_port_ids)
+        self.assertFalse(mock_get_nets.called)
+
     @mock.patch('oslo_concurrency.lockutils.lock')
     @mock.patch.object(neutronapi.API, '_get_instance_nw_info')
     @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
@@ -3808,6 +3830,236 @@ class TestNeutronv2WithMock(test.TestCase):
                           self.api.get_floating_ips_by_project,
                           self.context)
 
+    def _make_nw_info_client(self):
+        """Return a fake neutron client filtering the listed resources."""
+        resources = {
+            'ports': [
+                {'id': 'port1', 'network_id': 'net1', 'tenant_id': 'fake',
+                 'device_id': 'uuid', 'device_owner': 'compute:nova',
+                 'admin_state_up': True, 'status': 'ACTIVE',
+                 'mac_address': 'de:ad:be:ef:00:01',
+                 'binding:vif_type': model.VIF_TYPE_OVS,
+                 'fixed_ips': [
+                     {'ip_address': '10.0.1.2', 'subnet_id': 'subnet1'},
+                     {'ip_address': '10.0.2.2', 'subnet_id': 'subnet2'}]},
+                {'id': 'port2', 'network_id': 'net1', 'tenant_id': 'fake',
+                 'device_id': 'uuid', 'device_owner': 'compute:nova',
+                 'admin_state_up': True, 'status': 'ACTIVE',
+                 'mac_address': 'de:ad:be:ef:00:02',
+                 'binding:vif_type': model.VIF_TYPE_OVS,
+                 'fixed_ips': [
+                     {'ip_address': '10.0.1.3', 'subnet_id': 'subnet1'}]},
+                {'id': 'dhcp1', 'network_id': 'net1', 'tenant_id': 'fake',
+                 'device_id': 'dhcp', 'device_owner': 'network:dhcp',
+                 'fixed_ips': [
+                     {'ip_address': '10.0.1.1', 'subnet_id': 'subnet1'},
+                     {'ip_address': '10.0.2.1', 'subnet_id': 'subnet2'}]}],
+            'subnets': [
+                {'id': 'subnet1', 'network_id': 'net1',
+                 'cidr': '10.0.1.0/24', 'gateway_ip': '10.0.1.254',
+                 'dns_nameservers': ['8.8.8.8'], 'host_routes': []},
+                {'id': 'subnet2', 'network_id': 'net1',
+                 'cidr': '10.0.2.0/24', 'gateway_ip': '10.0.2.254',
+                 'dns_nameservers': [],
+                 'host_routes': [{'destination': '192.168.0.0/24',
+                                  'nexthop': '10.0.2.10'}]}],
+            'floatingips': [
+                {'id': 'fip1', 'port_id': 'port1',
+                 'fixed_ip_address': '10.0.2.2',
+                 'floating_ip_address': '172.24.4.3'}],
+            'networks': [
+                {'id': 'net1', 'name': 'foo', 'tenant_id': 'fake'}],
+        }
+
+        def _list(name):
+            def list_resources(**search_opts):
+                def matches(resource):
+                    for key, value in six.iteritems(search_opts):
+                        if not isinstance(value, list):
+                            value = [value]
+                        if resource.get(key) not in value:
+                            return False
+                    return True
+                return {name: [resource for resource in resources[name]
+                               if matches(resource)]}
+            return list_resources
+
+        client = mock.Mock()
+        client.list_ports.side_effect = _list('ports')
+        client.list_subnets.side_effect = _list('subnets')
+        client.list_floatingips.side_effect = _list('floatingips')
+        client.list_networks.side_effect = _list('networks')
+        return client
+
+    def _build_nw_info_with_client(self, client):
+        instance = objects.Instance(project_id='fake', uuid='uuid')
+        instance.info_cache = objects.InstanceInfoCache(
+            network_info=model.NetworkInfo())
+        networks = [{'id': 'net1', 'name': 'foo', 'tenant_id': 'fake'}]
+        with mock.patch.object(neutronapi, 'get_client',
+                               return_value=client):
+            return self.api._build_network_info_model(
+                self.context, instance, networks, ['port1', 'port2'])
+
+    def test_build_network_info_model_batched(self):
+        nw_info = self._build_nw_info_with_client(
+            self._make_nw_info_client())
+
+        self.flags(batch_network_info_queries=True, group='neutron')
+        client = self._make_nw_info_client()
+        batched_nw_info = self._build_nw_info_with_client(client)
+
+        self.assertEqual(nw_info, batched_nw_info)
+        self.assertEqual(['port1', 'port2'],
+                         [vif['id'] for vif in batched_nw_info])
+        subnets = batched_nw_info[0]['network']['subnets']
+        self.assertEqual(['10.0.1.0/24', '10.0.2.0/24'],
+                         [subnet['cidr'] for subnet in subnets])
+        self.assertEqual(['10.0.1.1', '10.0.2.1'],
+                         [subnet['meta']['dhcp_server']
+                          for subnet in subnets])
+        self.assertEqual('172.24.4.3',
+                         subnets[1]['ips'][0]['floating_ips'][0]['address'])
+        # One query for the ports of the instance, the subnets, the DHCP
+        # ports and the floating IPs, whatever the number of ports
+        client.list_subnets.assert_called_once_with(
+            id=['subnet1', 'subnet2'])
+        client.list_floatingips.assert_called_once_with(
+            port_id=['port1', 'port2'])
+        client.list_ports.assert_has_calls([
+            mock.call(tenant_id='fake', device_id='uuid'),
+            mock.call(network_id=['net1'], device_owner='network:dhcp')])
+        self.assertEqual(2, client.list_ports.call_count)
+        # The networks are only listed once, by _gather_port_ids_and_networks
+        client.list_networks.assert_called_once_with(id=['net1'])
+
+    def test_get_nw_info_lookups_network_ids(self):
+        client = self._make_nw_info_client()
+        ports = client.list_ports(device_id='uuid')['ports']
+        client.list_ports.reset_mock()
+        with mock.patch.object(neutronapi, 'get_client',
+                               return_value=client):
+            lookups = self.api._get_nw_info_lookups(self.context, client,
+                                                    ports)
+            self.assertIsNone(lookups.networks)
+            self.assertFalse(client.list_networks.called)
+
+            # The networks asked for are listed, not the ones of the subnets
+            # which are only used to find the DHCP ports
+            lookups = self.api._get_nw_info_lookups(
+                self.context, client, ports, network_ids=['net2'])
+        client.list_networks.assert_called_once_with(id=['net2'])
+        self.assertEqual({}, lookups.networks)
+        client.list_ports.assert_called_with(network_id=['net1'],
+                                             device_owner='network:dhcp')
+
+    @mock.patch.object(neutronapi.time, 'time')
+    def test_get_nw_info_lookups_cache_ttl(self, mock_time):
+        self.flags(network_info_cache_ttl=10, group='neutron')
+        client = self._make_nw_info_client()
+        ports = client.list_ports(device_id='uuid')['ports']
+        client.list_ports.reset_mock()
+        mock_time.return_value = 100
+
+        with mock.patch.object(neutronapi, 'get_client',
+                               return_value=client):
+            lookups = self.api._get_nw_info_lookups(
+                self.context, client, ports)
+            self.assertEqual(['subnet1', 'subnet2'],
+                             sorted(lookups.subnets))
+            self.assertEqual(['dhcp1'], [port['id'] for port in
+                                         lookups.dhcp_ports['net1']])
+            self.assertEqual(
+                ['fip1'],
+                [fip['id'] for fip in
+                 lookups.floating_ips[('port1', '10.0.2.2')]])
+
+            # The subnets and DHCP ports are reused until they expire, the
+            # floating IPs are always fetched
+            mock_time.return_value = 109
+            self.assertEqual(lookups, self.api._get_nw_info_lookups(
+                self.context, client, ports))
+            self.assertEqual(1, client.list_subnets.call_count)
+            self.assertEqual(1, client.list_ports.call_count)
+            self.assertEqual(2, client.list_floatingips.call_count)
+
+            mock_time.return_value = 110
+            self.assertEqual(lookups, self.api._get_nw_info_lookups(
+                self.context, client, ports))
+            self.assertEqual(2, client.list_subnets.call_count)
+            self.assertEqual(2, client.list_ports.call_count)
+            self.assertEqual(3, client.list_floatingips.call_count)
+
+    def test_get_nw_info_lookups_no_cache(self):
+        client = self._make_nw_info_client()
+        ports = client.list_ports(device_id='uuid')['ports']
+        client.list_ports.reset_mock()
+        with mock.patch.object(neutronapi, 'get_client',
+                               return_value=client):
+            self.api._get_nw_info_lookups(self.context, client, ports)
+            self.api._get_nw_info_lookups(self.context, client, ports)
+        self.assertEqual(2, client.list_subnets.call_count)
+        self.assertEqual(2, client.list_ports.call_count)
+        self.assertEqual({}, self.api._nw_info_lookup_cache)
+
+    @mock.patch('nova.network.base_api.update_instance_cache_with_nw_info')
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_refresh_instances_nw_info_cache(self, mock_get_by_filters,
+                                             mock_update):
+        client = self._make_nw_info_client()
+        nw_info = self._build_nw_info_with_client(client)
+        client.reset_mock()
+
+        def _instance(uuid, network_info):
+            instance = objects.Instance(project_id='fake', uuid=uuid)
+            instance.info_cache = objects.InstanceInfoCache(
+                network_info=model.NetworkInfo.hydrate(network_info))
+            return instance
+
+        # The cached network info of the first instance misses the floating
+        # IP, the one of the second instance without ports is up to date
+        stale_nw_info = model.NetworkInfo.hydrate(nw_info.json())
+        stale_nw_info[0]['network']['subnets'][1]['ips'][0][
+            'floating_ips'] = []
+        stale = _instance('uuid', stale_nw_info)
+        unchanged = _instance('uuid2', [])
+        deleted = _instance('uuid3', [])
+        mock_get_by_filters.return_value = [
+            _instance('uuid', stale_nw_info), _instance('uuid2', [])]
+
+        with mock.patch.object(neutronapi, 'get_client',
+                               return_value=client):
+            updated = self.api.refresh_instances_nw_info_cache(
+                self.context, [stale, unchanged, deleted])
+
+        self.assertEqual([stale], updated)
+        mock_get_by_filters.assert_called_once_with(
+            self.context, {'uuid': ['uuid', 'uuid2', 'uuid3'],
+                           'deleted': False},
+            expected_attrs=['info_cache'])
+        mock_update.assert_called_once_with(self.api, self.context, stale,
+                                            nw_info=nw_info,
+                                            update_cells=False)
+        # The ports of all the instances are listed at once
+        client.list_ports.assert_has_calls([
+            mock.call(device_id=['uuid', 'uuid2', 'uuid3']),
+            mock.call(network_id=['net1'], device_owner='network:dhcp')])
+        self.assertEqual(2, client.list_ports.call_count)
+        self.assertEqual(1, client.list_subnets.call_count)
+        self.assertEqual(1, client.list_floatingips.call_count)
+        # So are their networks, instead of once for each instance
+        client.list_networks.assert_called_once_with(id=['net1'])
+
+    def test_get_nw_info_lookups_no_fixed_ips(self):
+        client = mock.Mock()
+        client.list_floatingips.return_value = {'floatingips': []}
+        lookups = self.api._get_nw_info_lookups(
+            self.context, client, [{'id': 'port1', 'fixed_ips': []}])
+        self.assertEqual(({}, {}, {}, None), lookups)
+        self.assertFalse(client.list_subnets.called)
+        self.assertFalse(client.list_ports.called)
+        self.assertFalse(client.list_floatingips.called)
+
 
 class TestNeutronv2ModuleMethods(test.NoDBTestCase):
 
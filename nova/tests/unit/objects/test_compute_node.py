@@ -413,6 +413,19 @@ class _TestComputeNodeObject(object):
                          subs=self.subs(),
                          comparators=self.comparators())
 
+    @mock.patch('nova.db.compute_node_get_all_changed_since')
+    def test_get_all_changed_since(self, cn_get_all_changed_since):
+        cn_get_all_changed_since.return_value = [fake_compute_node]
+        changes_since = timeutils.parse_isotime('2016-01-01T10:00:00Z')
+        computes = compute_node.ComputeNodeList.get_all_changed_since(
+            self.context, changes_since)
+        self.assertEqual(1, len(computes))
+        cn_get_all_changed_since.assert_called_once_with(self.context,
+                                                         changes_since)
+        self.compare_obj(computes[0], fake_compute_node,
+                         subs=self.subs(),
+                         comparators=self.comparators())
+
     def test_compat_numa_topology(self):
         compute = compute_node.ComputeNode()
         versions = ovo_base.obj_tree_get_versions('ComputeNode')
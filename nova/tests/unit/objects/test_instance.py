@@ -13,6 +13,8 @@
 #    under the License.
 
 import datetime
+import time
+import uuid
 
 import mock
 from mox3 import mox
@@ -23,6 +25,7 @@ from oslo_utils import timeutils
 
 from nova.cells import rpcapi as cells_rpcapi
 from nova.compute import flavors
+from nova import context
 from nova import db
 from nova import exception
 from nova.network import model as network_model
@@ -1680,3 +1683,101 @@ class TestInstanceObjectMisc(test.TestCase):
         self.assertEqual(['metadata', 'extra', 'extra.numa_topology'],
                          instance._expected_cols(['metadata',
                                                   'numa_topology']))
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_iter_by_filters(self, mock_get):
+        ctxt = context.get_admin_context()
+
+        def _chunk(*instance_uuids):
+            return objects.InstanceList(
+                objects=[objects.Instance(uuid=instance_uuid)
+                         for instance_uuid in instance_uuids])
+
+        chunks = [_chunk(uuids.inst1, uuids.inst2),
+                  _chunk(uuids.inst3, uuids.inst4), _chunk()]
+        mock_get.side_effect = chunks
+        expected_attrs = ['fault']
+
+        result = list(objects.InstanceList.iter_by_filters(
+            ctxt, {'host': 'foo'}, chunk_size=2,
+            expected_attrs=expected_attrs))
+
+        self.assertEqual(chunks[:2], result)
+        self.assertEqual(['fault'], expected_attrs)
+        self.assertEqual(
+            [mock.call(ctxt, {'host': 'foo'}, limit=2, marker=marker,
+                       expected_attrs=['fault'], use_slave=False,
+                       sort_keys=['created_at', 'id'],
+                       sort_dirs=['asc', 'asc'])
+             for marker in (None, uuids.inst2, uuids.inst4)],
+            mock_get.call_args_list)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_iter_by_filters_last_chunk(self, mock_get):
+        ctxt = context.get_admin_context()
+        chunk = objects.InstanceList(
+            objects=[objects.Instance(uuid=uuids.inst1)])
+        mock_get.return_value = chunk
+        result = list(objects.InstanceList.iter_by_filters(
+            ctxt, {}, chunk_size=2))
+        self.assertEqual([chunk], result)
+        self.assertEqual(1, mock_get.call_count)
+
+    def test_get_column_setters(self):
+        setters = instance._get_column_setters(objects.Instance)
+        names = [name for _attrname, name, _coerce in setters]
+        self.assertIn('uuid', names)
+        self.assertIn('launched_at', names)
+        for name in instance.INSTANCE_OPTIONAL_ATTRS + ['deleted', 'cleaned']:
+            self.assertNotIn(name, names)
+        self.assertEqual(set(objects.Instance.fields) - set(names),
+                         set(instance.INSTANCE_OPTIONAL_ATTRS +
+                             ['deleted', 'cleaned']))
+        self.assertIs(setters,
+                      instance._get_column_setters(objects.Instance))
+
+    def test_from_db_object_column_values(self):
+        ctxt = context.get_admin_context()
+        db_inst = fake_instance.fake_db_instance(
+            launched_at=datetime.datetime(1955, 11, 12, 22, 4, 0),
+            access_ip_v4='1.2.3.4', deleted=0, cleaned=1)
+        inst = objects.Instance._from_db_object(ctxt, objects.Instance(),
+                                                db_inst)
+
+        # Same values as when setting each field through the object
+        expected = objects.Instance(ctxt)
+        for name in objects.Instance.fields:
+            if name in instance.INSTANCE_OPTIONAL_ATTRS:
+                continue
+            elif name == 'deleted':
+                expected.deleted = False
+            elif name == 'cleaned':
+                expected.cleaned = True
+            else:
+                expected[name] = db_inst[name]
+        expected.obj_reset_changes()
+        self.assertEqual(expected.obj_to_primitive(), inst.obj_to_primitive())
+        self.assertEqual(set(), inst.obj_what_changed())
+        self.assertIsInstance(inst.access_ip_v4, netaddr.IPAddress)
+        self.assertIsNotNone(inst.launched_at.tzinfo)
+
+    def test_performance_check_make_instance_list(self):
+        ctxt = context.get_admin_context()
+        db_insts = []
+        for i in range(10000):
+            db_inst = fake_instance.fake_db_instance(
+                id=i + 1, uuid=str(uuid.UUID(int=i)), deleted=0,
+                launched_at=datetime.datetime(1955, 11, 12, 22, 4, 0))
+            db_inst['metadata'] = [{'key': 'foo', 'value': 'bar'}]
+            db_inst['system_metadata'] = [
+                {'key': 'image_%i' % j, 'value': 'value'} for j in range(10)]
+            db_insts.append(db_inst)
+        start = time.time()
+        inst_list = instance._make_instance_list(
+            ctxt, objects.InstanceList(), db_insts,
+            ['metadata', 'system_metadata'])
+        self.assertTrue(time.time() - start < 30)
+        self.assertEqual(10000, len(inst_list))
+        self.assertEqual({'foo': 'bar'}, inst_list[-1].metadata)
+        self.assertEqual(10, len(inst_list[-1].system_metadata))
+        self.assertEqual(set(), inst_list[-1].obj_what_changed())
@@ -144,19 +144,23 @@ class _TestQuotasObject(object):
         self.mox.ReplayAll()
         quotas.rollback()
 
+    @mock.patch.object(QUOTAS, 'invalidate_limits')
     @mock.patch('nova.db.quota_create')
-    def test_create_limit(self, mock_create):
+    def test_create_limit(self, mock_create, mock_invalidate):
         quotas_obj.Quotas.create_limit(self.context, 'fake-project',
                                        'foo', 10, user_id='user')
         mock_create.assert_called_once_with(self.context, 'fake-project',
                                             'foo', 10, user_id='user')
+        mock_invalidate.assert_called_once_with(project_id='fake-project')
 
+    @mock.patch.object(QUOTAS, 'invalidate_limits')
     @mock.patch('nova.db.quota_update')
-    def test_update_limit(self, mock_update):
+    def test_update_limit(self, mock_update, mock_invalidate):
         quotas_obj.Quotas.update_limit(self.context, 'fake-project',
                                        'foo', 10, user_id='user')
         mock_update.assert_called_once_with(self.context, 'fake-project',
                                             'foo', 10, user_id='user')
+        mock_invalidate.assert_called_once_with(project_id='fake-project')
 
 
 class TestQuotasObject(_TestQuotasObject, test_objects._LocalTest):
@@ -13,6 +13,7 @@
 import mock
 
 from nova import objects
+from nova.scheduler import aggregate_index
 from nova.scheduler.filters import aggregate_multitenancy_isolation as ami
 from nova import test
 from nova.tests.unit.scheduler import fakes
@@ -63,3 +64,22 @@ class TestAggregateMultitenancyIsolationFilter(test.NoDBTestCase):
             context=mock.sentinel.ctx, project_id='my_tenantid')
         host = fakes.FakeHostState('host1', 'compute', {})
         self.assertTrue(self.filt_cls.host_passes(host, spec_obj))
+
+    def test_aggregate_multi_tenancy_isolation_filter_all_index(self,
+            agg_mock):
+        index = aggregate_index.AggregateMetadataIndex()
+        index.update(objects.Aggregate(
+            id=1, hosts=['host1', 'host2'],
+            metadata={'filter_tenant_id': 'my_tenantid, other_tenantid'}))
+        index.update(objects.Aggregate(
+            id=2, hosts=['host2', 'host3'],
+            metadata={'filter_tenant_id': 'other_tenantid'}))
+        self.filt_cls.aggregate_index = index
+        hosts = [fakes.FakeHostState('host%s' % i, 'compute', {})
+                 for i in range(1, 5)]
+        spec_obj = objects.RequestSpec(
+            context=mock.sentinel.ctx, project_id='my_tenantid')
+
+        self.assertEqual([hosts[0], hosts[1], hosts[3]],
+                         self.filt_cls.filter_all(hosts, spec_obj))
+        self.assertFalse(agg_mock.called)
@@ -48,3 +48,16 @@ class TestAvailabilityZoneFilter(test.NoDBTestCase):
         request = self._make_zone_request('bad')
         host = fakes.FakeHostState('host1', 'node1', {})
         self.assertFalse(self.filt_cls.host_passes(host, request))
+
+    def test_availability_zone_filter_cached(self, agg_mock):
+        self.flags(scheduler_filter_cache_size=10)
+        agg_mock.return_value = {'availability_zone': 'nova'}
+        host = fakes.FakeHostState('host1', 'node1', {})
+
+        for zone in ('nova', 'bad', 'nova'):
+            list(self.filt_cls.filter_all([host],
+                                          self._make_zone_request(zone)))
+
+        # The results are cached per requested zone
+        self.assertEqual(2, agg_mock.call_count)
+        self.assertEqual(1, self.filt_cls.cache_hits)
@@ -0,0 +1,176 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from nova import objects
+from nova.scheduler import filters
+from nova.scheduler.filters import columns
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class FakeColumnFilter(filters.BaseHostFilter):
+    supports_columns = True
+
+    def host_passes_columns(self, host_columns, spec_obj):
+        free_ram_mb = host_columns.get('free_ram_mb')
+        host_columns.set_limits('memory_mb', free_ram_mb * 2,
+                                where=free_ram_mb > 1024)
+        return free_ram_mb >= spec_obj.memory_mb
+
+
+class TestHostColumns(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestHostColumns, self).setUp()
+        self.hosts = [
+            fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                {'free_ram_mb': x * 512,
+                                 'ram_allocation_ratio': None})
+            for x in range(4)]
+
+    def test_get(self):
+        host_columns = columns.HostColumns(self.hosts)
+        self.assertEqual(4, len(host_columns))
+        free_ram_mb = host_columns.get('free_ram_mb')
+        self.assertEqual([0, 512, 1024, 1536], free_ram_mb.tolist())
+        # Columns are only built once
+        self.assertIs(free_ram_mb, host_columns.get('free_ram_mb'))
+
+    def test_get_with_getter(self):
+        host_columns = columns.HostColumns(self.hosts)
+        column = host_columns.get('even', lambda h: h.free_ram_mb % 1024 == 0,
+                                  dtype=bool)
+        self.assertEqual([True, False, True, False], column.tolist())
+
+    def test_get_none_value(self):
+        host_columns = columns.HostColumns(self.hosts)
+        column = host_columns.get('ram_allocation_ratio')
+        self.assertFalse((column > 0).any())
+        self.assertFalse((column <= 0).any())
+
+    def test_map(self):
+        host_columns = columns.HostColumns(self.hosts)
+        func = mock.Mock(side_effect=lambda h: h.free_ram_mb > 512)
+        mask = host_columns.map(func)
+        self.assertEqual([False, False, True, True], mask.tolist())
+        self.assertEqual(4, func.call_count)
+
+    def test_map_where(self):
+        host_columns = columns.HostColumns(self.hosts)
+        func = mock.Mock(return_value=True)
+        where = host_columns.get('free_ram_mb') >= 1024
+        mask = host_columns.map(func, where=where)
+        self.assertEqual([False, False, True, True], mask.tolist())
+        func.assert_has_calls([mock.call(self.hosts[2]),
+                               mock.call(self.hosts[3])])
+        self.assertEqual(2, func.call_count)
+
+    def test_select_sets_limits(self):
+        host_columns = columns.HostColumns(self.hosts)
+        free_ram_mb = host_columns.get('free_ram_mb')
+        host_columns.set_limits('memory_mb', free_ram_mb * 2)
+        host_columns.set_limits('disk_gb', free_ram_mb,
+                                where=free_ram_mb > 1024)
+        selected = host_columns.select(free_ram_mb > 0)
+        self.assertEqual(self.hosts[1:], selected)
+        self.assertEqual({}, self.hosts[0].limits)
+        self.assertEqual({'memory_mb': 1024.0}, self.hosts[1].limits)
+        self.assertEqual({'memory_mb': 2048.0}, self.hosts[2].limits)
+        self.assertEqual({'memory_mb': 3072.0, 'disk_gb': 1536.0},
+                         self.hosts[3].limits)
+        # Limits are plain Python values, so they can be sent over RPC
+        self.assertIs(float, type(self.hosts[3].limits['memory_mb']))
+
+
+class TestHostColumnCache(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestHostColumnCache, self).setUp()
+        self.hosts = [
+            fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                {'free_ram_mb': x * 512})
+            for x in range(4)]
+        self.cache = columns.HostColumnCache()
+        self.getter = mock.Mock(
+            side_effect=lambda host_state: host_state.free_ram_mb)
+
+    def _get(self, host_states):
+        host_columns = columns.HostColumns(host_states, cache=self.cache)
+        return host_columns.get('free_ram_mb', self.getter).tolist()
+
+    def test_get_kept_across_requests(self):
+        self.assertEqual([0, 512, 1024, 1536], self._get(self.hosts))
+        self.assertEqual(4, self.getter.call_count)
+        self.assertEqual([512, 1536], self._get(self.hosts[1::2]))
+        self.assertEqual(4, self.getter.call_count)
+
+    def test_get_host_state_changed(self):
+        self._get(self.hosts)
+        self.getter.reset_mock()
+        # The values of a host are gathered again when its generation is
+        # bumped or it is replaced
+        self.hosts[1].free_ram_mb = 128
+        self.hosts[1]._bump_generation()
+        self.hosts[2] = fakes.FakeHostState('host2', 'node2',
+                                            {'free_ram_mb': 256})
+        self.assertEqual([0, 128, 256, 1536], self._get(self.hosts))
+        self.getter.assert_has_calls([mock.call(self.hosts[1]),
+                                      mock.call(self.hosts[2])])
+        self.assertEqual(2, self.getter.call_count)
+
+    def test_get_new_host(self):
+        self._get(self.hosts[:2])
+        self.getter.reset_mock()
+        self.assertEqual([0, 512, 1024, 1536], self._get(self.hosts))
+        self.assertEqual(2, self.getter.call_count)
+        self.assertEqual(4, len(self.cache))
+
+    def test_get_returns_a_copy(self):
+        host_columns = columns.HostColumns(self.hosts, cache=self.cache)
+        host_columns.get('free_ram_mb')[0] = 42
+        self.assertEqual([0, 512, 1024, 1536], self._get(self.hosts))
+
+
+class TestFilterHosts(test.NoDBTestCase):
+
+    def setUp(self):
+        super(TestFilterHosts, self).setUp()
+        self.hosts = [
+            fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                {'free_ram_mb': x * 512})
+            for x in range(4)]
+        self.spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024))
+
+    def test_filter_hosts(self):
+        result = columns.filter_hosts([FakeColumnFilter()], self.hosts,
+                                      self.spec_obj)
+        self.assertEqual(self.hosts[2:], result)
+        self.assertEqual({}, self.hosts[2].limits)
+        self.assertEqual({'memory_mb': 3072.0}, self.hosts[3].limits)
+
+    def test_filter_hosts_with_cache(self):
+        cache = columns.HostColumnCache()
+        result = columns.filter_hosts([FakeColumnFilter()], self.hosts,
+                                      self.spec_obj, cache=cache)
+        self.assertEqual(self.hosts[2:], result)
+        self.assertEqual(4, len(cache))
+
+    def test_filter_hosts_stops_when_no_host_left(self):
+        second_filter = mock.Mock(spec=FakeColumnFilter)
+        self.spec_obj.flavor.memory_mb = 4096
+        result = columns.filter_hosts([FakeColumnFilter(), second_filter],
+                                      self.hosts, self.spec_obj)
+        self.assertEqual([], result)
+        self.assertFalse(second_filter.host_passes_columns.called)
@@ -13,6 +13,7 @@
 import mock
 
 from nova import objects
+from nova.scheduler.filters import columns
 from nova.scheduler.filters import compute_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
@@ -52,3 +53,41 @@ class TestComputeFilter(test.NoDBTestCase):
         service_up_mock.return_value = False
         self.assertFalse(filt_cls.host_passes(host, spec_obj))
         service_up_mock.assert_called_once_with(service)
+
+    @mock.patch('nova.servicegroup.API.get_up_map')
+    def test_compute_filter_filter_all(self, get_up_map_mock,
+                                       service_up_mock):
+        filt_cls = compute_filter.ComputeFilter()
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024))
+        services = [{'id': 1, 'disabled': True},
+                    {'id': 2, 'disabled': False},
+                    {'id': 3, 'disabled': False}]
+        hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                     {'service': service})
+                 for x, service in enumerate(services)]
+        get_up_map_mock.return_value = {2: True, 3: False}
+        self.assertEqual([hosts[1]],
+                         list(filt_cls.filter_all(iter(hosts), spec_obj)))
+        # The services are checked at once, except the disabled ones
+        get_up_map_mock.assert_called_once_with(services[1:])
+        self.assertFalse(service_up_mock.called)
+
+    @mock.patch('nova.servicegroup.API.get_up_map')
+    def test_compute_filter_columns(self, get_up_map_mock, service_up_mock):
+        filt_cls = compute_filter.ComputeFilter()
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024))
+        services = [{'id': 1, 'disabled': True},
+                    {'id': 2, 'disabled': False},
+                    {'id': 3, 'disabled': False}]
+        hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                     {'service': service})
+                 for x, service in enumerate(services)]
+        get_up_map_mock.return_value = {2: True, 3: False}
+        host_columns = columns.HostColumns(hosts)
+        mask = filt_cls.host_passes_columns(host_columns, spec_obj)
+        self.assertEqual([False, True, False], mask.tolist())
+        # The disabled hosts are not checked against the servicegroup API
+        get_up_map_mock.assert_called_once_with(services[1:])
+        self.assertFalse(service_up_mock.called)
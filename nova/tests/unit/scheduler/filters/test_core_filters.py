@@ -13,6 +13,7 @@
 import mock
 
 from nova import objects
+from nova.scheduler.filters import columns
 from nova.scheduler.filters import core_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
@@ -50,6 +51,33 @@ class TestCoreFilter(test.NoDBTestCase):
                  'cpu_allocation_ratio': 2})
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
 
+    def test_core_filter_columns(self):
+        self.filt_cls = core_filter.CoreFilter()
+        spec_obj = objects.RequestSpec(flavor=objects.Flavor(vcpus=2))
+        hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 6,
+                 'cpu_allocation_ratio': 2}),
+            fakes.FakeHostState('host2', 'node2',
+                {'vcpus_total': 0, 'vcpus_used': 0,
+                 'cpu_allocation_ratio': 2}),
+            fakes.FakeHostState('host3', 'node3',
+                {'vcpus_total': 4, 'vcpus_used': 7,
+                 'cpu_allocation_ratio': 2}),
+            fakes.FakeHostState('host4', 'node4',
+                {'vcpus_total': 1, 'vcpus_used': 0,
+                 'cpu_allocation_ratio': 2}),
+        ]
+        host_columns = columns.HostColumns(hosts)
+        mask = self.filt_cls.host_passes_columns(host_columns, spec_obj)
+        self.assertEqual([self.filt_cls.host_passes(host, spec_obj)
+                          for host in hosts], mask.tolist())
+        for host in hosts:
+            host.limits = {}
+        self.assertEqual(hosts[:2], host_columns.select(mask))
+        self.assertEqual(8.0, hosts[0].limits['vcpu'])
+        self.assertNotIn('vcpu', hosts[1].limits)
+
     @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_core_filter_value_error(self, agg_mock):
         self.filt_cls = core_filter.AggregateCoreFilter()
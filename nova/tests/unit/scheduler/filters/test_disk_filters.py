@@ -13,6 +13,7 @@
 import mock
 
 from nova import objects
+from nova.scheduler.filters import columns
 from nova.scheduler.filters import disk_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
@@ -54,6 +55,30 @@ class TestDiskFilter(test.NoDBTestCase):
         self.assertTrue(filt_cls.host_passes(host, spec_obj))
         self.assertEqual(12 * 10.0, host.limits['disk_gb'])
 
+    def test_disk_filter_columns(self):
+        filt_cls = disk_filter.DiskFilter()
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(
+                root_gb=100, ephemeral_gb=18, swap=1024))
+        hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 12,
+                 'disk_allocation_ratio': 10.0}),
+            fakes.FakeHostState('host2', 'node2',
+                {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 12,
+                 'disk_allocation_ratio': 1.0}),
+        ]
+        host_columns = columns.HostColumns(hosts)
+        mask = filt_cls.host_passes_columns(host_columns, spec_obj)
+        self.assertEqual([True, False], mask.tolist())
+        self.assertEqual([hosts[0]], host_columns.select(mask))
+        self.assertEqual(12 * 10.0, hosts[0].limits['disk_gb'])
+        self.assertNotIn('disk_gb', hosts[1].limits)
+
+    def test_aggregate_disk_filter_does_not_support_columns(self):
+        self.assertTrue(disk_filter.DiskFilter.supports_columns)
+        self.assertFalse(disk_filter.AggregateDiskFilter.supports_columns)
+
     def test_disk_filter_oversubscribe_fail(self):
         filt_cls = disk_filter.DiskFilter()
         spec_obj = objects.RequestSpec(
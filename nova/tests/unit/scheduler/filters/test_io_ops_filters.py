@@ -14,6 +14,7 @@
 import mock
 
 from nova import objects
+from nova.scheduler.filters import columns
 from nova.scheduler.filters import io_ops_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
@@ -37,6 +38,17 @@ class TestNumInstancesFilter(test.NoDBTestCase):
         spec_obj = objects.RequestSpec()
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
 
+    def test_filter_num_iops_columns(self):
+        self.flags(max_io_ops_per_host=8)
+        self.filt_cls = io_ops_filter.IoOpsFilter()
+        hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                     {'num_io_ops': x})
+                 for x in range(6, 10)]
+        spec_obj = objects.RequestSpec()
+        host_columns = columns.HostColumns(hosts)
+        mask = self.filt_cls.host_passes_columns(host_columns, spec_obj)
+        self.assertEqual([True, True, False, False], mask.tolist())
+
     @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_aggregate_filter_num_iops_value(self, agg_mock):
         self.flags(max_io_ops_per_host=7)
@@ -13,6 +13,7 @@
 import mock
 
 from nova import objects
+from nova.scheduler.filters import columns
 from nova.scheduler.filters import num_instances_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
@@ -36,6 +37,17 @@ class TestNumInstancesFilter(test.NoDBTestCase):
         spec_obj = objects.RequestSpec()
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
 
+    def test_filter_num_instances_columns(self):
+        self.flags(max_instances_per_host=5)
+        self.filt_cls = num_instances_filter.NumInstancesFilter()
+        hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                     {'num_instances': x})
+                 for x in range(3, 7)]
+        spec_obj = objects.RequestSpec()
+        host_columns = columns.HostColumns(hosts)
+        mask = self.filt_cls.host_passes_columns(host_columns, spec_obj)
+        self.assertEqual([True, True, False, False], mask.tolist())
+
     @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
     def test_filter_aggregate_num_instances_value(self, agg_mock):
         self.flags(max_instances_per_host=4)
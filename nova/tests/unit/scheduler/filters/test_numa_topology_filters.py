@@ -13,11 +13,14 @@
 import itertools
 import uuid
 
+import mock
+
 from nova import objects
 from nova.objects import fields
 from nova.scheduler.filters import numa_topology_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
+from nova.virt import hardware
 
 
 class TestNUMATopologyFilter(test.NoDBTestCase):
@@ -121,6 +124,32 @@ class TestNUMATopologyFilter(test.NoDBTestCase):
         self.assertEqual(limits.cpu_allocation_ratio, 21)
         self.assertEqual(limits.ram_allocation_ratio, 1.3)
 
+    def test_numa_topology_filter_fits_same_topology_once(self):
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]), memory=512),
+                   objects.InstanceNUMACell(id=1, cpuset=set([3]), memory=512)
+               ])
+        spec_obj = self._get_spec_obj(numa_topology=instance_topology)
+        hosts = [fakes.FakeHostState('host%d' % i, 'node',
+                                     {'numa_topology': fakes.NUMA_TOPOLOGY,
+                                      'pci_stats': None,
+                                      'cpu_allocation_ratio': 16.0,
+                                      'ram_allocation_ratio': ratio})
+                 for i, ratio in enumerate([1.5, 1.5, 1.5, 1.0])]
+        with mock.patch.object(hardware, '_numa_fit_instance_cells',
+                               wraps=hardware._numa_fit_instance_cells
+                               ) as mock_fit:
+            passed = list(self.filt_cls.filter_all(hosts, spec_obj))
+            self.assertEqual(hosts, passed)
+            # The limits of the last host differ from the other ones
+            self.assertEqual(2, mock_fit.call_count)
+
+            # Every request searches the host cells again
+            list(self.filt_cls.filter_all(hosts[:1], spec_obj))
+            self.assertEqual(3, mock_fit.call_count)
+        for host in hosts:
+            self.assertIn('numa_topology', host.limits)
+
     def _do_test_numa_topology_filter_cpu_policy(
             self, numa_topology, cpu_policy, cpu_thread_policy, passes):
         instance_topology = objects.InstanceNUMATopology(
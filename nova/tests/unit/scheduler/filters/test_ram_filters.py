@@ -13,6 +13,7 @@
 import mock
 
 from nova import objects
+from nova.scheduler.filters import columns
 from nova.scheduler.filters import ram_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
@@ -57,6 +58,30 @@ class TestRamFilter(test.NoDBTestCase):
                  'ram_allocation_ratio': 2.0})
         self.assertFalse(self.filt_cls.host_passes(host, spec_obj))
 
+    def test_ram_filter_columns(self):
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(memory_mb=1024))
+        hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': 1023, 'total_usable_ram_mb': 1024,
+                 'ram_allocation_ratio': 1.0}),
+            fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': -1024, 'total_usable_ram_mb': 2048,
+                 'ram_allocation_ratio': 2.0}),
+            fakes.FakeHostState('host3', 'node3',
+                {'free_ram_mb': 512, 'total_usable_ram_mb': 512,
+                 'ram_allocation_ratio': 2.0}),
+        ]
+        host_columns = columns.HostColumns(hosts)
+        mask = self.filt_cls.host_passes_columns(host_columns, spec_obj)
+        self.assertEqual([self.filt_cls.host_passes(host, spec_obj)
+                          for host in hosts], mask.tolist())
+        for host in hosts:
+            host.limits = {}
+        self.assertEqual([hosts[1]], host_columns.select(mask))
+        self.assertEqual(2048 * 2.0, hosts[1].limits['memory_mb'])
+        self.assertEqual({}, hosts[0].limits)
+
 
 @mock.patch('nova.scheduler.filters.utils.aggregate_values_from_key')
 class TestAggregateRamFilter(test.NoDBTestCase):
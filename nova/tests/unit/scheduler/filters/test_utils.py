@@ -114,3 +114,35 @@ class TestUtils(test.NoDBTestCase):
         host_state.instances = {inst1.uuid: inst1}
         self.assertFalse(utils.other_types_on_host(host_state, 1))
         self.assertTrue(utils.other_types_on_host(host_state, 2))
+
+    def test_flavor_cache_key(self):
+        spec_obj = objects.RequestSpec(flavor=objects.Flavor(
+            flavorid='42', name='m1.fake', extra_specs={'b': '2', 'a': '1'}))
+        self.assertEqual(('42', 'm1.fake', (('a', '1'), ('b', '2'))),
+                         utils.flavor_cache_key(spec_obj))
+
+        # Changing the extra specs of a flavor changes its key
+        other_spec_obj = objects.RequestSpec(flavor=objects.Flavor(
+            flavorid='42', name='m1.fake', extra_specs={'a': '1'}))
+        self.assertNotEqual(utils.flavor_cache_key(spec_obj),
+                            utils.flavor_cache_key(other_spec_obj))
+
+    def test_flavor_cache_key_no_flavor(self):
+        self.assertIsNone(utils.flavor_cache_key(objects.RequestSpec()))
+
+    def test_image_props_cache_key(self):
+        def _get_spec_obj(**props):
+            return objects.RequestSpec(image=objects.ImageMeta(
+                properties=objects.ImageMetaProps(**props)))
+
+        key = utils.image_props_cache_key(_get_spec_obj(
+            hw_architecture='x86_64', img_hv_type='kvm'))
+        self.assertEqual(key, utils.image_props_cache_key(_get_spec_obj(
+            img_hv_type='kvm', hw_architecture='x86_64')))
+        self.assertNotEqual(key, utils.image_props_cache_key(_get_spec_obj(
+            hw_architecture='x86_64')))
+
+    def test_image_props_cache_key_no_image(self):
+        self.assertIsNone(utils.image_props_cache_key(objects.RequestSpec()))
+        self.assertIsNone(utils.image_props_cache_key(
+            objects.RequestSpec(image=None)))
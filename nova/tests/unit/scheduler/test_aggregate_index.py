@@ -0,0 +1,89 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the aggregate metadata index.
+"""
+
+from nova import objects
+from nova.scheduler import aggregate_index
+from nova.scheduler.filters import utils
+from nova import test
+from nova.tests.unit.scheduler import fakes
+
+
+class AggregateMetadataIndexTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(AggregateMetadataIndexTestCase, self).setUp()
+        self.aggs = [
+            objects.Aggregate(id=1, hosts=['host1', 'host2'],
+                              metadata={'k1': 'v1', 'k2': 'v2, v3'}),
+            objects.Aggregate(id=2, hosts=['host2', 'host3'],
+                              metadata={'k1': 'v1,v4'}),
+            objects.Aggregate(id=3, hosts=['host3'],
+                              metadata={'k3': 'v5'}),
+        ]
+        self.index = aggregate_index.AggregateMetadataIndex()
+        for agg in self.aggs:
+            self.index.update(agg)
+
+    def test_hosts_with_key(self):
+        self.assertEqual({'host1', 'host2', 'host3'},
+                         self.index.hosts_with_key('k1'))
+        self.assertEqual({'host3'}, self.index.hosts_with_key('k3'))
+        self.assertEqual(set(), self.index.hosts_with_key('k4'))
+
+    def test_hosts_with_value(self):
+        self.assertEqual({'host1', 'host2', 'host3'},
+                         self.index.hosts_with_value('k1', 'v1'))
+        self.assertEqual({'host2', 'host3'},
+                         self.index.hosts_with_value('k1', 'v4'))
+        self.assertEqual({'host1', 'host2'},
+                         self.index.hosts_with_value('k2', 'v3'))
+        self.assertEqual(set(), self.index.hosts_with_value('k1', 'v2'))
+
+    def test_update(self):
+        self.index.update(objects.Aggregate(id=2, hosts=['host3'],
+                                            metadata={'k1': 'v4'}))
+
+        # host2 is still in the first aggregate with k1=v1
+        self.assertEqual({'host1', 'host2'},
+                         self.index.hosts_with_value('k1', 'v1'))
+        self.assertEqual({'host3'}, self.index.hosts_with_value('k1', 'v4'))
+        self.assertEqual({'k1': {'v4'}, 'k3': {'v5'}},
+                         self.index.metadata_get_by_host('host3'))
+
+    def test_delete(self):
+        self.index.delete(self.aggs[0])
+
+        self.assertEqual({'host2', 'host3'}, self.index.hosts_with_key('k1'))
+        self.assertEqual(set(), self.index.hosts_with_key('k2'))
+        self.assertEqual({}, self.index.metadata_get_by_host('host1'))
+
+    def test_metadata_get_by_host(self):
+        for host in ('host1', 'host2', 'host3', 'host4'):
+            host_state = fakes.FakeHostState(
+                host, 'node', {'aggregates': [agg for agg in self.aggs
+                                              if host in agg.hosts]})
+            for key in (None, 'k1', 'k3'):
+                self.assertEqual(
+                    utils.aggregate_metadata_get_by_host(host_state, key),
+                    self.index.metadata_get_by_host(host, key))
+
+    def test_metadata_get_by_host_cached(self):
+        metadata = self.index.metadata_get_by_host('host2')
+        metadata['k4'].add('v6')
+
+        self.assertNotIn('k4', self.index.metadata_get_by_host('host2'))
@@ -24,6 +24,7 @@ from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
 from nova.scheduler import utils as scheduler_utils
 from nova.scheduler import weights
+from nova.scheduler.weights import ram
 from nova import test  # noqa
 from nova.tests.unit.scheduler import fakes
 from nova.tests.unit.scheduler import test_scheduler
@@ -40,14 +41,14 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
     @mock.patch('nova.objects.ServiceList.get_by_binary',
                 return_value=fakes.SERVICES)
-    @mock.patch('nova.objects.InstanceList.get_by_host')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     @mock.patch('nova.objects.ComputeNodeList.get_all',
                 return_value=fakes.COMPUTE_NODES)
     @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
                 return_value={'numa_topology': None,
                               'pci_requests': None})
     def test_schedule_happy_day(self, mock_get_extra, mock_get_all,
-                                mock_by_host, mock_get_by_binary):
+                                mock_by_filters, mock_get_by_binary):
         """Make sure there's nothing glaringly wrong with _schedule()
         by doing a happy day pass through.
         """
@@ -113,14 +114,14 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
     @mock.patch('nova.objects.ServiceList.get_by_binary',
                 return_value=fakes.SERVICES)
-    @mock.patch('nova.objects.InstanceList.get_by_host')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     @mock.patch('nova.objects.ComputeNodeList.get_all',
                 return_value=fakes.COMPUTE_NODES)
     @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
                 return_value={'numa_topology': None,
                               'pci_requests': None})
     def test_schedule_host_pool(self, mock_get_extra, mock_get_all,
-                                mock_by_host, mock_get_by_binary):
+                                mock_by_filters, mock_get_by_binary):
         """Make sure the scheduler_host_subset_size property works properly."""
 
         self.flags(scheduler_host_subset_size=2)
@@ -148,14 +149,14 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
     @mock.patch('nova.objects.ServiceList.get_by_binary',
                 return_value=fakes.SERVICES)
-    @mock.patch('nova.objects.InstanceList.get_by_host')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     @mock.patch('nova.objects.ComputeNodeList.get_all',
                 return_value=fakes.COMPUTE_NODES)
     @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
                 return_value={'numa_topology': None,
                               'pci_requests': None})
     def test_schedule_large_host_pool(self, mock_get_extra, mock_get_all,
-                                      mock_by_host, mock_get_by_binary):
+                                      mock_by_filters, mock_get_by_binary):
         """Hosts should still be chosen if pool size
         is larger than number of filtered hosts.
         """
@@ -183,7 +184,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         # one host should be chosen
         self.assertEqual(len(hosts), 1)
 
-    @mock.patch('nova.scheduler.host_manager.HostManager._get_instance_info')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     @mock.patch('nova.objects.ServiceList.get_by_binary',
                 return_value=fakes.SERVICES)
     @mock.patch('nova.objects.ComputeNodeList.get_all',
@@ -193,7 +194,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                               'pci_requests': None})
     def test_schedule_chooses_best_host(self, mock_get_extra, mock_cn_get_all,
                                         mock_get_by_binary,
-                                        mock_get_inst_info):
+                                        mock_by_filters):
         """If scheduler_host_subset_size is 1, the largest host with greatest
         weight should be returned.
         """
@@ -235,14 +236,14 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
     @mock.patch('nova.objects.ServiceList.get_by_binary',
                 return_value=fakes.SERVICES)
-    @mock.patch('nova.objects.InstanceList.get_by_host')
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
     @mock.patch('nova.objects.ComputeNodeList.get_all',
                 return_value=fakes.COMPUTE_NODES)
     @mock.patch('nova.db.instance_extra_get_by_instance_uuid',
                 return_value={'numa_topology': None,
                               'pci_requests': None})
     def test_select_destinations(self, mock_get_extra, mock_get_all,
-                                 mock_by_host, mock_get_by_binary):
+                                 mock_by_filters, mock_get_by_binary):
         """select_destinations is basically a wrapper around _schedule().
 
         Similar to the _schedule tests, this just does a happy path test to
@@ -331,3 +332,99 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                 # Make sure that the consumed hosts have chance to be reverted.
                 for host in consumed_hosts:
                     self.assertIsNone(host.obj.updated)
+
+    def _get_batch_spec_obj(self, num_instances):
+        return objects.RequestSpec(
+            num_instances=num_instances,
+            flavor=objects.Flavor(memory_mb=1024,
+                                  root_gb=0,
+                                  ephemeral_gb=0,
+                                  vcpus=1),
+            project_id=1,
+            os_type='Linux',
+            uuid='fake-uuid',
+            pci_requests=None,
+            numa_topology=None,
+            instance_group=None)
+
+    def _schedule_batch(self, spec_obj, free_ram_mbs, filtered_hosts=None):
+        self.flags(scheduler_batch_placement=True)
+        self.driver.host_manager.weighers = [ram.RAMWeigher()]
+        hosts = [fakes.FakeHostState('host%s' % i, 'node%s' % i,
+                                     {'free_ram_mb': free_ram_mb})
+                 for i, free_ram_mb in enumerate(free_ram_mbs)]
+        filtered_hosts = filtered_hosts or fake_get_filtered_hosts
+
+        with test.nested(
+            mock.patch.object(self.driver, '_get_all_host_states',
+                              return_value=iter(hosts)),
+            mock.patch.object(self.driver.host_manager,
+                              'get_filtered_hosts',
+                              side_effect=filtered_hosts),
+            mock.patch.object(self.driver.host_manager, 'get_weighed_hosts',
+                              wraps=self.driver.host_manager.get_weighed_hosts)
+        ) as (mock_get_all, mock_filtered, mock_weighed):
+            weighed_hosts = self.driver._schedule(self.context, spec_obj)
+
+        # The whole list of hosts is only filtered and weighed once
+        self.assertEqual(1, mock_weighed.call_count)
+        self.assertEqual(0, mock_filtered.call_args_list[0][1]['index'])
+        return weighed_hosts
+
+    def test_schedule_batch(self):
+        spec_obj = self._get_batch_spec_obj(4)
+
+        weighed_hosts = self._schedule_batch(spec_obj, [4096, 3072, 2048])
+
+        self.assertEqual(['host0', 'host1', 'host0', 'host2'],
+                         [weighed_host.obj.host
+                          for weighed_host in weighed_hosts])
+        self.assertEqual([2048, 2048, 1024],
+                         [weighed_host.obj.free_ram_mb
+                          for weighed_host in weighed_hosts[1:]])
+
+    def test_schedule_batch_candidate_filtered_out(self):
+        spec_obj = self._get_batch_spec_obj(3)
+
+        def _filter_host0(hosts, spec_obj, index):
+            return [host for host in hosts
+                    if index == 0 or host.host != 'host0']
+
+        weighed_hosts = self._schedule_batch(spec_obj, [4096, 3072, 2048],
+                                             filtered_hosts=_filter_host0)
+
+        # host0 fails the filters once picked again for the third instance,
+        # so it is dropped and the next best host is used instead
+        self.assertEqual(['host0', 'host1', 'host2'],
+                         [weighed_host.obj.host
+                          for weighed_host in weighed_hosts])
+
+    def test_schedule_batch_not_enough_hosts(self):
+        spec_obj = self._get_batch_spec_obj(3)
+
+        def _filter_all(hosts, spec_obj, index):
+            return list(hosts) if index == 0 else []
+
+        weighed_hosts = self._schedule_batch(spec_obj, [4096, 3072],
+                                             filtered_hosts=_filter_all)
+
+        self.assertEqual(['host0'], [weighed_host.obj.host
+                                     for weighed_host in weighed_hosts])
+
+    @mock.patch.object(filter_scheduler.FilterScheduler, '_schedule_batch')
+    def test_schedule_batch_single_instance(self, mock_schedule_batch):
+        self.flags(scheduler_batch_placement=True)
+        spec_obj = self._get_batch_spec_obj(1)
+        host = fakes.FakeHostState('host1', 'node1', {})
+
+        with test.nested(
+            mock.patch.object(self.driver, '_get_all_host_states',
+                              return_value=[host]),
+            mock.patch.object(self.driver.host_manager, 'get_filtered_hosts',
+                              side_effect=fake_get_filtered_hosts),
+        ):
+            weighed_hosts = self.driver._schedule(self.context, spec_obj)
+
+        self.assertEqual([host], [weighed_host.obj
+                                  for weighed_host in weighed_hosts])
+        self.assertFalse(mock_schedule_batch.called)
@@ -14,13 +14,25 @@
 """
 Tests For Scheduler Host Filters.
 """
+import mock
+
+from nova import objects
 from nova.scheduler import filters
 from nova.scheduler.filters import all_hosts_filter
+from nova.scheduler.filters import columns
 from nova.scheduler.filters import compute_filter
+from nova.scheduler.filters import ram_filter
 from nova import test
 from nova.tests.unit.scheduler import fakes
 
 
+class FakeCachedFilter(filters.BaseHostFilter):
+    cache_results = True
+
+    def host_passes(self, host_state, spec_obj):
+        return host_state.host != 'host2'
+
+
 class HostFiltersTestCase(test.NoDBTestCase):
 
     def test_filter_handler(self):
@@ -35,3 +47,133 @@ class HostFiltersTestCase(test.NoDBTestCase):
         filt_cls = all_hosts_filter.AllHostsFilter()
         host = fakes.FakeHostState('host1', 'node1', {})
         self.assertTrue(filt_cls.host_passes(host, {}))
+
+    def _get_ram_hosts(self):
+        return [fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                    {'free_ram_mb': x * 512,
+                                     'total_usable_ram_mb': 2048,
+                                     'ram_allocation_ratio': 1.0})
+                for x in range(4)]
+
+    def test_filter_handler_columns(self):
+        filter_handler = filters.HostFilterHandler(use_columns=True)
+        self.assertTrue(filter_handler.use_columns)
+        hosts = self._get_ram_hosts()
+        spec_obj = objects.RequestSpec(flavor=objects.Flavor(memory_mb=1024))
+        ram_filt = ram_filter.RamFilter()
+        all_hosts_filt = all_hosts_filter.AllHostsFilter()
+
+        with test.nested(
+            mock.patch.object(ram_filt, 'host_passes'),
+            mock.patch.object(all_hosts_filt, 'host_passes',
+                              return_value=True),
+        ) as (ram_host_passes, all_hosts_passes):
+            result = filter_handler.get_filtered_objects(
+                [all_hosts_filt, ram_filt], hosts, spec_obj)
+
+        self.assertEqual(hosts[2:], result)
+        self.assertEqual(2048.0, hosts[2].limits['memory_mb'])
+        # The RamFilter is evaluated on columns, so the remaining filters
+        # only see the hosts with enough RAM
+        self.assertFalse(ram_host_passes.called)
+        self.assertEqual([mock.call(hosts[2], spec_obj),
+                          mock.call(hosts[3], spec_obj)],
+                         all_hosts_passes.call_args_list)
+
+    def test_filter_handler_columns_no_host_left(self):
+        filter_handler = filters.HostFilterHandler(use_columns=True)
+        hosts = self._get_ram_hosts()
+        spec_obj = objects.RequestSpec(flavor=objects.Flavor(memory_mb=4096))
+        all_hosts_filt = all_hosts_filter.AllHostsFilter()
+
+        with mock.patch.object(all_hosts_filt,
+                               'host_passes') as all_hosts_passes:
+            result = filter_handler.get_filtered_objects(
+                [ram_filter.RamFilter(), all_hosts_filt], hosts, spec_obj)
+
+        self.assertEqual([], result)
+        self.assertFalse(all_hosts_passes.called)
+
+    def test_filter_handler_columns_skipped_for_index(self):
+        filter_handler = filters.HostFilterHandler(use_columns=True)
+        hosts = self._get_ram_hosts()
+        spec_obj = objects.RequestSpec(flavor=objects.Flavor(memory_mb=1024))
+        compute_filt = compute_filter.ComputeFilter()
+
+        with mock.patch.object(compute_filt,
+                               'host_passes_columns') as passes_columns:
+            result = filter_handler.get_filtered_objects(
+                [compute_filt], hosts, spec_obj, index=1)
+
+        self.assertEqual(hosts, result)
+        self.assertFalse(passes_columns.called)
+
+    @mock.patch.object(columns, 'numpy', None)
+    def test_filter_handler_columns_unavailable(self):
+        filter_handler = filters.HostFilterHandler(use_columns=True)
+        self.assertFalse(filter_handler.use_columns)
+
+    def _filter_cached(self, filt, hosts, flavorid='42'):
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(flavorid=flavorid, name='fake',
+                                  extra_specs={}))
+        return list(filt.filter_all(hosts, spec_obj))
+
+    def test_filter_cache(self):
+        self.flags(scheduler_filter_cache_size=10)
+        hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x, {})
+                 for x in range(1, 4)]
+        filt = FakeCachedFilter()
+
+        with mock.patch.object(filt, 'host_passes',
+                               wraps=filt.host_passes) as host_passes:
+            self.assertEqual([hosts[0], hosts[2]],
+                             self._filter_cached(filt, hosts))
+            self.assertEqual([hosts[0], hosts[2]],
+                             self._filter_cached(filt, hosts))
+            self.assertEqual(3, host_passes.call_count)
+            self.assertEqual(3, filt.cache_hits)
+            self.assertEqual(3, filt.cache_misses)
+
+            # A new generation of the host is evaluated again
+            hosts[0]._bump_generation()
+            self.assertEqual([hosts[0], hosts[2]],
+                             self._filter_cached(filt, hosts))
+            self.assertEqual(4, host_passes.call_count)
+
+            # As well as another flavor
+            self.assertEqual([hosts[0], hosts[2]],
+                             self._filter_cached(filt, hosts, flavorid='43'))
+            self.assertEqual(7, host_passes.call_count)
+            self.assertEqual(5, filt.cache_hits)
+            self.assertEqual(7, filt.cache_misses)
+
+    def test_filter_cache_lru(self):
+        self.flags(scheduler_filter_cache_size=2)
+        hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x, {})
+                 for x in range(1, 4)]
+        filt = FakeCachedFilter()
+
+        self._filter_cached(filt, hosts[:2])
+        # host1 is now the most recently used entry, host2 is evicted
+        self._filter_cached(filt, [hosts[0]])
+        self._filter_cached(filt, [hosts[2]])
+        self.assertEqual(2, len(filt._result_cache))
+
+        self._filter_cached(filt, hosts[:1])
+        self.assertEqual(2, filt.cache_hits)
+        self._filter_cached(filt, hosts[1:2])
+        self.assertEqual(2, filt.cache_hits)
+
+    def test_filter_cache_disabled(self):
+        hosts = [fakes.FakeHostState('host1', 'node1', {})]
+        filt = FakeCachedFilter()
+
+        with mock.patch.object(filt, 'host_passes',
+                               return_value=True) as host_passes:
+            self._filter_cached(filt, hosts)
+            self._filter_cached(filt, hosts)
+
+        self.assertEqual(2, host_passes.call_count)
+        self.assertIsNone(filt._result_cache)
+        self.assertEqual(0, filt.cache_misses)
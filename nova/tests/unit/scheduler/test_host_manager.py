@@ -18,9 +18,13 @@ Tests For HostManager
 
 import collections
 import datetime
+import time
 
+import eventlet
 import mock
 from oslo_serialization import jsonutils
+from oslo_utils import fixture as utils_fixture
+from oslo_utils import timeutils
 from oslo_utils import versionutils
 import six
 
@@ -33,6 +37,7 @@ from nova import objects
 from nova.objects import base as obj_base
 from nova.pci import stats as pci_stats
 from nova.scheduler import filters
+from nova.scheduler.filters import columns
 from nova.scheduler import host_manager
 from nova import test
 from nova.tests import fixtures
@@ -112,6 +117,110 @@ class HostManagerTestCase(test.NoDBTestCase):
         exp_filters = {'deleted': False, 'host': [u'host1', u'host2']}
         mock_get_by_filters.assert_called_once_with(mock.ANY, exp_filters)
 
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_filters')
+    def test_get_instances_by_host(self, mock_get_by_filters):
+        inst1 = objects.Instance(host='host1', uuid='uuid1')
+        inst2 = objects.Instance(host='host3', uuid='uuid2')
+        mock_get_by_filters.side_effect = [
+            objects.InstanceList(objects=[inst1]),
+            objects.InstanceList(objects=[inst2])]
+
+        result = self.host_manager._get_instances_by_host(
+            'fake_context', ['host1', 'host2', 'host3'], batch_size=2)
+
+        self.assertEqual({'host1': {'uuid1': inst1}, 'host2': {},
+                          'host3': {'uuid2': inst2}}, result)
+        mock_get_by_filters.assert_has_calls([
+            mock.call('fake_context', {'host': ['host1', 'host2'],
+                                       'deleted': False}),
+            mock.call('fake_context', {'host': ['host3'],
+                                       'deleted': False})])
+
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_filters')
+    def test_get_instances_by_host_no_host(self, mock_get_by_filters):
+        self.assertEqual({}, self.host_manager._get_instances_by_host(
+            'fake_context', []))
+        self.assertFalse(mock_get_by_filters.called)
+
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(host_manager.HostState, '_update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_get_all_host_states_bulk_instances(self, svc_get_by_binary,
+                                                cn_get_all, update_from_cn,
+                                                mock_get_by_filters,
+                                                mock_get_by_host):
+        svc_get_by_binary.return_value = [
+            objects.Service(host='host%s' % x) for x in range(1, 4)]
+        cn_get_all.return_value = [
+            objects.ComputeNode(host='host%s' % x,
+                                hypervisor_hostname='node%s' % x)
+            for x in range(1, 4)]
+        inst1 = objects.Instance(host='host1', uuid='uuid1')
+        inst2 = objects.Instance(host='host2', uuid='uuid2')
+        mock_get_by_filters.return_value = objects.InstanceList(
+            objects=[inst2])
+        self.host_manager._instance_info = {
+            'host1': {'instances': {'uuid1': inst1}, 'updated': True}}
+
+        self.host_manager.get_all_host_states('fake_context')
+
+        # Only the hosts not sending updates are loaded, in a single query
+        self.assertFalse(mock_get_by_host.called)
+        self.assertEqual(1, mock_get_by_filters.call_count)
+        filters = mock_get_by_filters.call_args[0][1]
+        self.assertEqual(['host2', 'host3'], sorted(filters['host']))
+        host_state_map = self.host_manager.host_state_map
+        self.assertEqual({'uuid1': inst1},
+                         host_state_map[('host1', 'node1')].instances)
+        self.assertEqual({'uuid2': inst2},
+                         host_state_map[('host2', 'node2')].instances)
+        self.assertEqual({}, host_state_map[('host3', 'node3')].instances)
+
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_filters')
+    @mock.patch.object(host_manager.HostState, '_update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_performance_check_load_host_states(self, svc_get_by_binary,
+                                                cn_get_all, update_from_cn,
+                                                mock_get_by_filters):
+        """Measures the time taken to load the host states at startup and
+        for the first request, with every query taking query_time seconds.
+        """
+        num_hosts = 500
+        query_time = 0.05
+
+        def _slow_query(result):
+            def _query(*args, **kwargs):
+                eventlet.sleep(query_time)
+                return result
+            return _query
+
+        svc_get_by_binary.side_effect = _slow_query(
+            [objects.Service(host='host%s' % x) for x in range(num_hosts)])
+        cn_get_all.side_effect = _slow_query(objects.ComputeNodeList(
+            objects=[objects.ComputeNode(host='host%s' % x,
+                                         hypervisor_hostname='node%s' % x)
+                     for x in range(num_hosts)]))
+        mock_get_by_filters.side_effect = _slow_query(objects.InstanceList())
+
+        start = time.time()
+        self.host_manager._init_instance_info()
+        startup_time = time.time() - start
+        start = time.time()
+        self.host_manager.get_all_host_states('fake_context')
+        first_request_time = time.time() - start
+
+        self.assertEqual(num_hosts, len(self.host_manager.host_state_map))
+        # Startup: the compute nodes, then 50 batches of 10 hosts. First
+        # request: the services, the compute nodes and 5 batches of 100 hosts.
+        self.assertEqual(55, mock_get_by_filters.call_count)
+        serial_time = query_time * (1 + 50 + 2 + 5)
+        # The queries are run 10 at a time, so this should be about 4 times
+        # faster than running them one after the other.
+        self.assertLess(startup_time + first_request_time, serial_time / 2)
+
     def test_default_filters(self):
         default_filters = self.host_manager.default_filters
         self.assertEqual(1, len(default_filters))
@@ -176,6 +285,28 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual({'fake-host': set([])},
                          self.host_manager.host_aggregates_map)
 
+    def test_aggregate_index(self):
+        fake_agg = objects.Aggregate(id=1, hosts=['fake-host'],
+                                     metadata={'foo': 'bar'})
+        index = self.host_manager.aggregate_index
+
+        self.host_manager.update_aggregates([fake_agg])
+        self.assertEqual({'fake-host'}, index.hosts_with_value('foo', 'bar'))
+
+        fake_agg.metadata = {'foo': 'baz'}
+        self.host_manager.update_aggregates(fake_agg)
+        self.assertEqual(set(), index.hosts_with_value('foo', 'bar'))
+        self.assertEqual({'fake-host'}, index.hosts_with_value('foo', 'baz'))
+
+        self.host_manager.delete_aggregate(fake_agg)
+        self.assertEqual(set(), index.hosts_with_key('foo'))
+
+    def test_choose_host_filters_aggregate_index(self):
+        host_filters = self.host_manager._choose_host_filters(
+                ['FakeFilterClass2'])
+        self.assertIs(self.host_manager.aggregate_index,
+                      host_filters[0].aggregate_index)
+
     def test_choose_host_filters_not_found(self):
         self.assertRaises(exception.SchedulerHostFilterNotFound,
                           self.host_manager._choose_host_filters,
@@ -442,10 +573,10 @@ class HostManagerTestCase(test.NoDBTestCase):
     @mock.patch('nova.scheduler.host_manager.LOG')
     @mock.patch('nova.objects.ServiceList.get_by_binary')
     @mock.patch('nova.objects.ComputeNodeList.get_all')
-    @mock.patch('nova.objects.InstanceList.get_by_host')
-    def test_get_all_host_states(self, mock_get_by_host, mock_get_all,
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
+    def test_get_all_host_states(self, mock_get_by_filters, mock_get_all,
                                  mock_get_by_binary, mock_log):
-        mock_get_by_host.return_value = objects.InstanceList()
+        mock_get_by_filters.return_value = objects.InstanceList()
         mock_get_all.return_value = fakes.COMPUTE_NODES
         mock_get_by_binary.return_value = fakes.SERVICES
         context = 'fake_context'
@@ -502,35 +633,35 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(host_states_map[('host4', 'node4')].free_disk_mb,
                          8388608)
 
-    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_filters')
     @mock.patch.object(host_manager.HostState, '_update_from_compute_node')
     @mock.patch.object(objects.ComputeNodeList, 'get_all')
     @mock.patch.object(objects.ServiceList, 'get_by_binary')
     def test_get_all_host_states_with_no_aggs(self, svc_get_by_binary,
                                               cn_get_all, update_from_cn,
-                                              mock_get_by_host):
+                                              mock_get_by_filters):
         svc_get_by_binary.return_value = [objects.Service(host='fake')]
         cn_get_all.return_value = [
             objects.ComputeNode(host='fake', hypervisor_hostname='fake')]
-        mock_get_by_host.return_value = objects.InstanceList()
+        mock_get_by_filters.return_value = objects.InstanceList()
         self.host_manager.host_aggregates_map = collections.defaultdict(set)
 
         self.host_manager.get_all_host_states('fake-context')
         host_state = self.host_manager.host_state_map[('fake', 'fake')]
         self.assertEqual([], host_state.aggregates)
 
-    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_filters')
     @mock.patch.object(host_manager.HostState, '_update_from_compute_node')
     @mock.patch.object(objects.ComputeNodeList, 'get_all')
     @mock.patch.object(objects.ServiceList, 'get_by_binary')
     def test_get_all_host_states_with_matching_aggs(self, svc_get_by_binary,
                                                     cn_get_all,
                                                     update_from_cn,
-                                                    mock_get_by_host):
+                                                    mock_get_by_filters):
         svc_get_by_binary.return_value = [objects.Service(host='fake')]
         cn_get_all.return_value = [
             objects.ComputeNode(host='fake', hypervisor_hostname='fake')]
-        mock_get_by_host.return_value = objects.InstanceList()
+        mock_get_by_filters.return_value = objects.InstanceList()
         fake_agg = objects.Aggregate(id=1)
         self.host_manager.host_aggregates_map = collections.defaultdict(
             set, {'fake': set([1])})
@@ -540,7 +671,7 @@ class HostManagerTestCase(test.NoDBTestCase):
         host_state = self.host_manager.host_state_map[('fake', 'fake')]
         self.assertEqual([fake_agg], host_state.aggregates)
 
-    @mock.patch.object(nova.objects.InstanceList, 'get_by_host')
+    @mock.patch.object(nova.objects.InstanceList, 'get_by_filters')
     @mock.patch.object(host_manager.HostState, '_update_from_compute_node')
     @mock.patch.object(objects.ComputeNodeList, 'get_all')
     @mock.patch.object(objects.ServiceList, 'get_by_binary')
@@ -548,13 +679,13 @@ class HostManagerTestCase(test.NoDBTestCase):
                                                         svc_get_by_binary,
                                                         cn_get_all,
                                                         update_from_cn,
-                                                        mock_get_by_host):
+                                                        mock_get_by_filters):
         svc_get_by_binary.return_value = [objects.Service(host='fake'),
                                           objects.Service(host='other')]
         cn_get_all.return_value = [
             objects.ComputeNode(host='fake', hypervisor_hostname='fake'),
             objects.ComputeNode(host='other', hypervisor_hostname='other')]
-        mock_get_by_host.return_value = objects.InstanceList()
+        mock_get_by_filters.return_value = objects.InstanceList()
         fake_agg = objects.Aggregate(id=1)
         self.host_manager.host_aggregates_map = collections.defaultdict(
             set, {'other': set([1])})
@@ -774,10 +905,10 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
 
     @mock.patch('nova.objects.ServiceList.get_by_binary')
     @mock.patch('nova.objects.ComputeNodeList.get_all')
-    @mock.patch('nova.objects.InstanceList.get_by_host')
-    def test_get_all_host_states(self, mock_get_by_host, mock_get_all,
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
+    def test_get_all_host_states(self, mock_get_by_filters, mock_get_all,
                                  mock_get_by_binary):
-        mock_get_by_host.return_value = objects.InstanceList()
+        mock_get_by_filters.return_value = objects.InstanceList()
         mock_get_all.return_value = fakes.COMPUTE_NODES
         mock_get_by_binary.return_value = fakes.SERVICES
         context = 'fake_context'
@@ -788,8 +919,8 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
 
     @mock.patch('nova.objects.ServiceList.get_by_binary')
     @mock.patch('nova.objects.ComputeNodeList.get_all')
-    @mock.patch('nova.objects.InstanceList.get_by_host')
-    def test_get_all_host_states_after_delete_one(self, mock_get_by_host,
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
+    def test_get_all_host_states_after_delete_one(self, mock_get_by_filters,
                                                   mock_get_all,
                                                   mock_get_by_binary):
         getter = (lambda n: n.hypervisor_hostname
@@ -797,7 +928,7 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         running_nodes = [n for n in fakes.COMPUTE_NODES
                          if getter(n) != 'node4']
 
-        mock_get_by_host.return_value = objects.InstanceList()
+        mock_get_by_filters.return_value = objects.InstanceList()
         mock_get_all.side_effect = [fakes.COMPUTE_NODES, running_nodes]
         mock_get_by_binary.side_effect = [fakes.SERVICES, fakes.SERVICES]
         context = 'fake_context'
@@ -814,11 +945,11 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
 
     @mock.patch('nova.objects.ServiceList.get_by_binary')
     @mock.patch('nova.objects.ComputeNodeList.get_all')
-    @mock.patch('nova.objects.InstanceList.get_by_host')
-    def test_get_all_host_states_after_delete_all(self, mock_get_by_host,
+    @mock.patch('nova.objects.InstanceList.get_by_filters')
+    def test_get_all_host_states_after_delete_all(self, mock_get_by_filters,
                                                   mock_get_all,
                                                   mock_get_by_binary):
-        mock_get_by_host.return_value = objects.InstanceList()
+        mock_get_by_filters.return_value = objects.InstanceList()
         mock_get_all.side_effect = [fakes.COMPUTE_NODES, []]
         mock_get_by_binary.side_effect = [fakes.SERVICES, fakes.SERVICES]
         context = 'fake_context'
@@ -834,6 +965,282 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerTracksComputeNodeChangesTestCase(test.NoDBTestCase):
+    """Test case for HostManager class tracking the compute node changes."""
+
+    @mock.patch.object(host_manager.HostManager, '_init_instance_info')
+    @mock.patch.object(host_manager.HostManager, '_init_aggregates')
+    def setUp(self, mock_init_agg, mock_init_inst):
+        super(HostManagerTracksComputeNodeChangesTestCase, self).setUp()
+        self.flags(scheduler_tracks_compute_node_changes=True,
+                   scheduler_host_state_full_refresh_interval=300)
+        self.host_manager = host_manager.HostManager()
+        self.now = timeutils.utcnow(with_timezone=True)
+        self.time_fixture = self.useFixture(
+            utils_fixture.TimeFixture(self.now.replace(tzinfo=None)))
+
+    def _get_compute_node(self, index, updated_at, free_ram_mb=512):
+        return objects.ComputeNode(
+            id=index, local_gb=1024, memory_mb=1024, vcpus=1,
+            disk_available_least=None, free_ram_mb=free_ram_mb, vcpus_used=1,
+            free_disk_gb=512, local_gb_used=0, created_at=updated_at,
+            updated_at=updated_at, host='host%s' % index,
+            hypervisor_hostname='node%s' % index, host_ip='127.0.0.1',
+            hypervisor_version=0, numa_topology=None,
+            hypervisor_type='foo', supported_hv_specs=[],
+            pci_device_pools=None, cpu_info=None, stats=None, metrics=None,
+            cpu_allocation_ratio=16.0, ram_allocation_ratio=1.5,
+            disk_allocation_ratio=1.0)
+
+    def _get_fleet(self, num_nodes):
+        compute_nodes = [self._get_compute_node(x, self.now)
+                         for x in range(num_nodes)]
+        services = [objects.Service(host='host%s' % x, disabled=False)
+                    for x in range(num_nodes)]
+        self.host_manager._instance_info = {
+            'host%s' % x: {'instances': {}, 'updated': True}
+            for x in range(num_nodes)}
+        return compute_nodes, services
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_first_call_is_full(self, mock_get_all,
+                                                    mock_get_changed,
+                                                    mock_get_by_binary):
+        compute_nodes, services = self._get_fleet(3)
+        mock_get_all.return_value = compute_nodes
+        mock_get_by_binary.return_value = services
+
+        self.host_manager.get_all_host_states('fake_context')
+
+        mock_get_all.assert_called_once_with('fake_context')
+        self.assertFalse(mock_get_changed.called)
+        self.assertEqual(3, len(self.host_manager.host_state_map))
+        self.assertEqual(self.now,
+                         self.host_manager._compute_nodes_changed_since)
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_only_updates_changed(self, mock_get_all,
+                                                      mock_get_changed,
+                                                      mock_get_by_binary):
+        compute_nodes, services = self._get_fleet(3)
+        mock_get_all.return_value = compute_nodes
+        mock_get_by_binary.return_value = services
+        self.host_manager.get_all_host_states('fake_context')
+
+        later = self.now + datetime.timedelta(seconds=30)
+        mock_get_changed.return_value = [
+            self._get_compute_node(1, later, free_ram_mb=128)]
+        with mock.patch.object(host_manager.HostState,
+                               '_update_from_compute_node',
+                               autospec=True) as mock_update:
+            host_states = list(
+                self.host_manager.get_all_host_states('fake_context'))
+
+        self.assertEqual(1, mock_get_all.call_count)
+        mock_get_changed.assert_called_once_with('fake_context', self.now)
+        self.assertEqual(3, len(host_states))
+        mock_update.assert_called_once_with(
+            self.host_manager.host_state_map[('host1', 'node1')],
+            mock_get_changed.return_value[0])
+        self.assertEqual(later,
+                         self.host_manager._compute_nodes_changed_since)
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_refreshes_unchanged_services(
+            self, mock_get_all, mock_get_changed, mock_get_by_binary):
+        compute_nodes, services = self._get_fleet(2)
+        mock_get_all.return_value = compute_nodes
+        mock_get_by_binary.return_value = services
+        self.host_manager.get_all_host_states('fake_context')
+
+        mock_get_changed.return_value = []
+        mock_get_by_binary.return_value = [
+            objects.Service(host='host0', disabled=True),
+            objects.Service(host='host1', disabled=False)]
+        self.host_manager.get_all_host_states('fake_context')
+
+        host_states_map = self.host_manager.host_state_map
+        self.assertTrue(host_states_map[('host0', 'node0')].service[
+            'disabled'])
+        self.assertFalse(host_states_map[('host1', 'node1')].service[
+            'disabled'])
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_skips_unchanged_host_states(
+            self, mock_get_all, mock_get_changed, mock_get_by_binary):
+        compute_nodes, services = self._get_fleet(3)
+        mock_get_all.return_value = compute_nodes
+        mock_get_by_binary.return_value = services
+        self.host_manager.get_all_host_states('fake_context')
+
+        # host0's service and host1's instances change, host2 is unchanged
+        mock_get_changed.return_value = []
+        mock_get_by_binary.return_value = [
+            objects.Service(host='host0', disabled=True)] + services[1:]
+        self.host_manager._instance_info['host1'] = {
+            'instances': {'fake_uuid': objects.Instance(
+                uuid='fake_uuid', updated_at=self.now)},
+            'updated': True}
+        with mock.patch.object(host_manager.HostState, 'update',
+                               autospec=True) as mock_update:
+            self.host_manager.get_all_host_states('fake_context')
+
+        host_states_map = self.host_manager.host_state_map
+        mock_update.assert_has_calls([
+            mock.call(host_states_map[('host0', 'node0')],
+                      service={'host': 'host0', 'disabled': True},
+                      aggregates=None, inst_dict=None),
+            mock.call(host_states_map[('host1', 'node1')],
+                      service=None, aggregates=None,
+                      inst_dict=self.host_manager._instance_info['host1'][
+                          'instances'])],
+            any_order=True)
+        self.assertEqual(2, mock_update.call_count)
+
+    def test_host_state_instances_changed(self):
+        host_state = host_manager.HostState('host1', 'node1')
+        instance = objects.Instance(uuid='fake_uuid', updated_at=self.now)
+        host_state.instances = {'fake_uuid': instance}
+        self.assertFalse(host_state._instances_changed(
+            host_state.instances))
+        self.assertFalse(host_state._instances_changed(
+            {'fake_uuid': objects.Instance(uuid='fake_uuid',
+                                           updated_at=self.now)}))
+        later = self.now + datetime.timedelta(seconds=1)
+        self.assertTrue(host_state._instances_changed(
+            {'fake_uuid': objects.Instance(uuid='fake_uuid',
+                                           updated_at=later)}))
+        self.assertTrue(host_state._instances_changed(
+            {'other_uuid': objects.Instance(uuid='other_uuid',
+                                            updated_at=self.now)}))
+        self.assertTrue(host_state._instances_changed({}))
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_removes_deleted_services(
+            self, mock_get_all, mock_get_changed, mock_get_by_binary):
+        compute_nodes, services = self._get_fleet(3)
+        mock_get_all.return_value = compute_nodes
+        mock_get_by_binary.return_value = services
+        self.host_manager.get_all_host_states('fake_context')
+
+        mock_get_changed.return_value = []
+        mock_get_by_binary.return_value = services[1:]
+        self.host_manager.get_all_host_states('fake_context')
+
+        self.assertEqual(
+            set([('host1', 'node1'), ('host2', 'node2')]),
+            set(self.host_manager.host_state_map.keys()))
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_removed_nodes_reset_column_cache(
+            self, mock_get_all, mock_get_changed, mock_get_by_binary):
+        column_cache = mock.sentinel.column_cache
+        self.host_manager.host_column_cache = column_cache
+        compute_nodes, services = self._get_fleet(3)
+        mock_get_all.return_value = compute_nodes
+        mock_get_by_binary.return_value = services
+        mock_get_changed.return_value = []
+        self.host_manager.get_all_host_states('fake_context')
+        self.assertIs(column_cache, self.host_manager.host_column_cache)
+
+        mock_get_by_binary.return_value = services[1:]
+        with mock.patch.object(columns, 'HostColumnCache') as mock_cache:
+            self.host_manager.get_all_host_states('fake_context')
+        self.assertEqual(mock_cache.return_value,
+                         self.host_manager.host_column_cache)
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_full_refresh_interval(self, mock_get_all,
+                                                       mock_get_changed,
+                                                       mock_get_by_binary):
+        compute_nodes, services = self._get_fleet(3)
+        mock_get_all.side_effect = [compute_nodes, compute_nodes[1:]]
+        mock_get_by_binary.return_value = services
+        mock_get_changed.return_value = []
+        self.host_manager.get_all_host_states('fake_context')
+
+        self.time_fixture.advance_time_seconds(299)
+        self.host_manager.get_all_host_states('fake_context')
+        self.assertEqual(1, mock_get_all.call_count)
+        self.assertEqual(1, mock_get_changed.call_count)
+        self.assertEqual(3, len(self.host_manager.host_state_map))
+
+        # The full reload prunes the compute nodes which were deleted
+        self.time_fixture.advance_time_seconds(2)
+        self.host_manager.get_all_host_states('fake_context')
+        self.assertEqual(2, mock_get_all.call_count)
+        self.assertEqual(1, mock_get_changed.call_count)
+        self.assertEqual(2, len(self.host_manager.host_state_map))
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_get_all_host_states_not_tracking_changes(self, mock_get_all,
+                                                      mock_get_changed,
+                                                      mock_get_by_binary):
+        self.host_manager.tracks_compute_node_changes = False
+        compute_nodes, services = self._get_fleet(3)
+        mock_get_all.return_value = compute_nodes
+        mock_get_by_binary.return_value = services
+
+        self.host_manager.get_all_host_states('fake_context')
+        self.host_manager.get_all_host_states('fake_context')
+
+        self.assertEqual(2, mock_get_all.call_count)
+        self.assertFalse(mock_get_changed.called)
+        self.assertIsNone(self.host_manager._compute_nodes_changed_since)
+
+    @mock.patch('nova.objects.ServiceList.get_by_binary')
+    @mock.patch('nova.objects.ComputeNodeList.get_all_changed_since')
+    @mock.patch('nova.objects.ComputeNodeList.get_all')
+    def test_performance_check_get_all_host_states(self, mock_get_all,
+                                                   mock_get_changed,
+                                                   mock_get_by_binary):
+        nodes = 10000
+        changed_per_request = 10
+        requests = 10
+
+        compute_nodes, services = self._get_fleet(nodes)
+        mock_get_all.return_value = compute_nodes
+        mock_get_by_binary.return_value = services
+        self.host_manager.get_all_host_states('fake_context')
+
+        def run_test():
+            a = time.time()
+            for x in range(requests):
+                updated_at = self.now + datetime.timedelta(seconds=x + 1)
+                mock_get_changed.return_value = [
+                    self._get_compute_node(index, updated_at)
+                    for index in range(x * changed_per_request,
+                                       (x + 1) * changed_per_request)]
+                list(self.host_manager.get_all_host_states('fake_context'))
+            b = time.time()
+            return (b - a) * 1000.0 / requests
+
+        per_request_ms = run_test()
+
+        self.assertEqual(1, mock_get_all.call_count)
+        self.assertEqual(requests, mock_get_changed.call_count)
+        self.assertEqual(nodes, len(self.host_manager.host_state_map))
+        # This is here so you can do simple performance testing easily, the
+        # bound is only meant to catch a request reloading the whole fleet.
+        self.assertLess(per_request_ms, 10000)
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
@@ -989,7 +1396,8 @@ class HostStateTestCase(test.NoDBTestCase):
                                               fake_numa_topology,
                                               limits=None, pci_requests=None,
                                               pci_stats=None)
-        numa_usage_mock.assert_called_once_with(host, fake_instance)
+        numa_usage_mock.assert_called_once_with(
+            host, fake_instance, never_serialize_result=True)
         sync_mock.assert_called_once_with(("fakehost", "fakenode"))
         self.assertEqual(fake_host_numa_topology, host.numa_topology)
         self.assertIsNotNone(host.updated)
@@ -1010,7 +1418,9 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertEqual(2, host.num_instances)
         self.assertEqual(2, host.num_io_ops)
         self.assertEqual(2, numa_usage_mock.call_count)
-        self.assertEqual(((host, fake_instance),), numa_usage_mock.call_args)
+        self.assertEqual(((host, fake_instance),
+                          {'never_serialize_result': True}),
+                         numa_usage_mock.call_args)
         self.assertEqual(second_host_numa_topology, host.numa_topology)
         self.assertIsNotNone(host.updated)
 
@@ -1118,3 +1528,98 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertEqual({'0': 10, '1': 43},
                          host.metrics[1].numa_membw_values)
         self.assertIsInstance(host.numa_topology, six.string_types)
+
+    def _get_compute_node(self, updated_at):
+        return objects.ComputeNode(
+            memory_mb=1024, free_disk_gb=0, local_gb=0,
+            local_gb_used=0, free_ram_mb=1024, vcpus=0, vcpus_used=0,
+            disk_available_least=None,
+            updated_at=updated_at, host_ip='127.0.0.1',
+            hypervisor_type='htype',
+            hypervisor_hostname='hostname', cpu_info='cpu_info',
+            supported_hv_specs=[],
+            hypervisor_version=1, numa_topology=None,
+            stats=None, pci_device_pools=None, metrics=None,
+            cpu_allocation_ratio=16.0, ram_allocation_ratio=1.5,
+            disk_allocation_ratio=1.0)
+
+    def test_generation_compute_node(self):
+        updated_at = datetime.datetime(2015, 11, 11, 11, 0, 0)
+        host = host_manager.HostState("fakehost", "fakenode")
+        generation = host.generation
+
+        host.update(compute=self._get_compute_node(updated_at))
+        self.assertNotEqual(generation, host.generation)
+        generation = host.generation
+
+        # The same compute node record does not change the host
+        host.update(compute=self._get_compute_node(updated_at))
+        self.assertEqual(generation, host.generation)
+
+        updated_at += datetime.timedelta(seconds=60)
+        host.update(compute=self._get_compute_node(updated_at))
+        self.assertNotEqual(generation, host.generation)
+
+    def test_generation_aggregates(self):
+        agg1 = objects.Aggregate(id=1, metadata={})
+        agg2 = objects.Aggregate(id=2, metadata={})
+        host = host_manager.HostState("fakehost", "fakenode")
+        generation = host.generation
+
+        host.update(aggregates=[])
+        self.assertEqual(generation, host.generation)
+
+        host.update(aggregates=[agg1])
+        self.assertNotEqual(generation, host.generation)
+        generation = host.generation
+
+        host.update(aggregates=[agg1])
+        self.assertEqual(generation, host.generation)
+
+        host.update(aggregates=[agg1, agg2])
+        self.assertNotEqual(generation, host.generation)
+        generation = host.generation
+
+        # Updated aggregates are new objects
+        host.update(aggregates=[agg1, objects.Aggregate(id=2, metadata={})])
+        self.assertNotEqual(generation, host.generation)
+
+    def test_generation_service(self):
+        service = {'id': 1, 'host': 'fakehost', 'disabled': False,
+                   'report_count': 1, 'updated_at': None}
+        host = host_manager.HostState("fakehost", "fakenode")
+        generation = host.generation
+
+        host.update(service=service)
+        self.assertNotEqual(generation, host.generation)
+        generation = host.generation
+
+        # Heartbeats do not change the host
+        service.update(report_count=2, updated_at=timeutils.utcnow())
+        host.update(service=service)
+        self.assertEqual(generation, host.generation)
+
+        service['disabled'] = True
+        host.update(service=service)
+        self.assertNotEqual(generation, host.generation)
+
+    def test_generation_consume_from_request(self):
+        spec_obj = objects.RequestSpec(
+            flavor=objects.Flavor(root_gb=0, ephemeral_gb=0, memory_mb=512,
+                                  vcpus=1),
+            numa_topology=None,
+            pci_requests=None)
+        host = host_manager.HostState("fakehost", "fakenode")
+        generation = host.generation
+
+        host.consume_from_request(spec_obj)
+
+        self.assertNotEqual(generation, host.generation)
+
+    def test_generation_recreated_host_state(self):
+        # A HostState recreated for a host, when the host comes back after
+        # being removed, doesn't reuse the generations of the previous one
+        host = host_manager.HostState("fakehost", "fakenode")
+        host.update(service={'id': 1, 'host': 'fakehost', 'disabled': False})
+        new_host = host_manager.HostState("fakehost", "fakenode")
+        self.assertGreater(new_host.generation, host.generation)
@@ -60,3 +60,24 @@ class ServiceGroupApiTestCase(test.NoDBTestCase):
         result = self.servicegroup_api.service_is_up(member)
         self.assertIs(result, False)
         driver.is_up.assert_not_called()
+
+    def test_get_up_map(self):
+        members = [{'id': 1, 'host': 'fake-host1', 'forced_down': False},
+                   {'id': 2, 'host': 'fake-host2', 'forced_down': True},
+                   {'id': 3, 'host': 'fake-host3'}]
+        driver = self.servicegroup_api._driver
+        driver.get_up_map = mock.MagicMock(return_value={1: True, 3: False})
+
+        result = self.servicegroup_api.get_up_map(members)
+
+        self.assertEqual({1: True, 2: False, 3: False}, result)
+        driver.get_up_map.assert_called_once_with([members[0], members[2]])
+
+    def test_get_up_map_all_forced_down(self):
+        members = [{'id': 1, 'host': 'fake-host1', 'forced_down': True}]
+        driver = self.servicegroup_api._driver
+        driver.get_up_map = mock.MagicMock()
+
+        self.assertEqual({1: False},
+                         self.servicegroup_api.get_up_map(members))
+        self.assertFalse(driver.get_up_map.called)
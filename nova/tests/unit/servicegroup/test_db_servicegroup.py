@@ -12,14 +12,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+import time
+
+import fixtures
 import mock
 from oslo_db import exception as db_exception
 import oslo_messaging as messaging
 from oslo_utils import fixture as utils_fixture
 from oslo_utils import timeutils
 
+from nova import db
 from nova import objects
 from nova import servicegroup
+from nova.servicegroup.drivers import db as db_driver
 from nova import test
 
 
@@ -65,6 +71,63 @@ class DBServiceGroupTestCase(test.NoDBTestCase):
         result = self.servicegroup_api.service_is_up(service)
         self.assertFalse(result)
 
+    def test_get_up_map(self):
+        now = timeutils.utcnow()
+        time_fixture = self.useFixture(utils_fixture.TimeFixture(now))
+        before = now - datetime.timedelta(seconds=self.down_time + 1)
+        services = [
+            objects.Service(id=1, host='up', created_at=now, updated_at=now,
+                            last_seen_up=now, forced_down=False),
+            objects.Service(id=2, host='down', created_at=before,
+                            updated_at=before, last_seen_up=before,
+                            forced_down=False),
+            objects.Service(id=3, host='forced-down', created_at=now,
+                            updated_at=now, last_seen_up=now,
+                            forced_down=True),
+            # Timestamps received over RPC, in the future and in the past
+            {'id': 4, 'host': 'str-up', 'last_seen_up': None,
+             'updated_at': timeutils.strtime(
+                 now + datetime.timedelta(seconds=self.down_time)),
+             'created_at': None},
+            {'id': 5, 'host': 'str-down', 'last_seen_up': None,
+             'updated_at': timeutils.strtime(before),
+             'created_at': None},
+            {'id': 6, 'host': 'str-future', 'last_seen_up': None,
+             'updated_at': None, 'created_at': timeutils.strtime(
+                 now + datetime.timedelta(seconds=self.down_time + 1))},
+        ]
+        expected = {1: True, 2: False, 3: False, 4: True, 5: False,
+                    6: False}
+        self.assertEqual(expected,
+                         self.servicegroup_api.get_up_map(services))
+        for service in services:
+            self.assertEqual(expected[service['id']],
+                             self.servicegroup_api.service_is_up(service))
+
+        time_fixture.advance_time_seconds(self.down_time + 1)
+        self.assertEqual({1: False, 2: False, 3: False, 4: True, 5: False,
+                          6: True},
+                         self.servicegroup_api.get_up_map(services))
+
+    def test_performance_check_get_up_map(self):
+        now = timeutils.utcnow()
+        self.useFixture(utils_fixture.TimeFixture(now))
+        services = [{'id': i, 'last_seen_up': None, 'created_at': None,
+                     'updated_at': timeutils.strtime(now)}
+                    for i in range(10000)]
+
+        start = time.time()
+        for service in services:
+            self.servicegroup_api.service_is_up(service)
+        is_up_time = time.time() - start
+
+        start = time.time()
+        up_map = self.servicegroup_api.get_up_map(services)
+        get_up_map_time = time.time() - start
+
+        self.assertEqual(10000, sum(up_map.values()))
+        self.assertLess(get_up_map_time, is_up_time)
+
     def test_join(self):
         service = mock.MagicMock(report_interval=1)
 
@@ -122,3 +185,140 @@ class DBServiceGroupTestCase(test.NoDBTestCase):
         # unexpected errors must be handled, but disconnected flag not touched
         self.flags(use_local=True, group='conductor')
         self._test_report_state_error(RuntimeError)
+
+    def _make_reporting_service(self, service_id=1):
+        service_ref = objects.Service(id=service_id, host='fake-host',
+                                      topic='compute', report_count=10)
+        return mock.MagicMock(model_disconnected=False,
+                              service_ref=service_ref)
+
+    @mock.patch.object(objects.Service, 'save')
+    def test_report_state_to_conductor(self, upd_mock):
+        self.flags(heartbeat_flush_interval=5, group='conductor')
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.objects.base.NovaObject.indirection_api', mock.Mock()))
+        driver = self.servicegroup_api._driver
+        driver._conductor_api = mock.Mock()
+        driver._conductor_api.report_service_state.return_value = True
+        service = self._make_reporting_service()
+
+        driver._report_state(service)
+
+        driver._conductor_api.report_service_state.assert_called_once_with(
+            mock.ANY, 1)
+        self.assertFalse(upd_mock.called)
+        self.assertFalse(service.model_disconnected)
+
+    @mock.patch.object(objects.Service, 'save')
+    def test_report_state_to_old_conductor(self, upd_mock):
+        self.flags(heartbeat_flush_interval=5, group='conductor')
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.objects.base.NovaObject.indirection_api', mock.Mock()))
+        driver = self.servicegroup_api._driver
+        driver._conductor_api = mock.Mock()
+        driver._conductor_api.report_service_state.return_value = False
+        service = self._make_reporting_service()
+
+        driver._report_state(service)
+
+        upd_mock.assert_called_once_with()
+        self.assertEqual(11, service.service_ref.report_count)
+
+    @mock.patch.object(objects.Service, 'save')
+    def test_report_state_local_not_coalesced(self, upd_mock):
+        # Services accessing the database directly write their own reports
+        self.flags(heartbeat_flush_interval=5, group='conductor')
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.objects.base.NovaObject.indirection_api', None))
+        driver = self.servicegroup_api._driver
+        driver._conductor_api = mock.Mock()
+        service = self._make_reporting_service()
+
+        driver._report_state(service)
+
+        self.assertFalse(driver._conductor_api.report_service_state.called)
+        upd_mock.assert_called_once_with()
+
+    def test_performance_check_heartbeat_writes(self):
+        # Fake fleet of computes reporting every report_interval, with their
+        # reports spread over the interval, during a period of time
+        fleet_size, report_interval, period = 1000, 10, 60
+        flush_interval = 5
+        now = timeutils.utcnow()
+        time_fixture = self.useFixture(utils_fixture.TimeFixture(now))
+        driver = self.servicegroup_api._driver
+        services = [self._make_reporting_service(i)
+                    for i in range(fleet_size)]
+
+        def run_fleet(on_tick=None):
+            for second in range(period):
+                for service in services:
+                    if (service.service_ref.id + second) % report_interval:
+                        continue
+                    driver._report_state(service)
+                time_fixture.advance_time_seconds(1)
+                if on_tick:
+                    on_tick(second + 1)
+
+        # Before: each report is written by its service
+        with mock.patch.object(objects.Service, 'save') as upd_mock:
+            run_fleet()
+        writes_before = upd_mock.call_count
+
+        # After: the reports are coalesced by nova-conductor
+        self.flags(heartbeat_flush_interval=flush_interval,
+                   group='conductor')
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.objects.base.NovaObject.indirection_api', mock.Mock()))
+        coalescer = db_driver.HeartbeatCoalescer()
+
+        def report_service_state(context, service_id):
+            coalescer.add(service_id)
+            return True
+
+        driver._conductor_api = mock.Mock()
+        driver._conductor_api.report_service_state.side_effect = (
+            report_service_state)
+        staleness = []
+
+        def flush(second):
+            if second % flush_interval == 0:
+                coalescer.flush(mock.sentinel.context)
+                if upd_mock.called:
+                    last_seen_up = upd_mock.call_args[0][2]
+                    staleness.append(timeutils.delta_seconds(
+                        last_seen_up, timeutils.utcnow()))
+
+        with mock.patch.object(db, 'service_heartbeat_update') as upd_mock:
+            run_fleet(flush)
+        writes_after = upd_mock.call_count
+
+        self.assertEqual(fleet_size * period // report_interval,
+                         writes_before)
+        self.assertEqual(period // flush_interval, writes_after)
+        reported = sum(len(call[0][1]) for call in upd_mock.call_args_list)
+        self.assertEqual(writes_before, reported)
+        self.assertLessEqual(max(staleness), flush_interval)
+        # Write rate of the fleet, in queries per second
+        self.assertLess(float(writes_after) / period,
+                        float(writes_before) / period / 100)
+
+    @mock.patch.object(db, 'service_heartbeat_update')
+    def test_heartbeat_coalescer_flush_error(self, upd_mock):
+        now = timeutils.utcnow()
+        time_fixture = self.useFixture(utils_fixture.TimeFixture(now))
+        coalescer = db_driver.HeartbeatCoalescer()
+        coalescer.add(1)
+        coalescer.add(2)
+        upd_mock.side_effect = db_exception.DBError()
+
+        self.assertEqual(0, coalescer.flush(mock.sentinel.context))
+        self.assertEqual(2, len(coalescer))
+
+        time_fixture.advance_time_seconds(1)
+        coalescer.add(2)
+        upd_mock.side_effect = None
+        self.assertEqual(2, coalescer.flush(mock.sentinel.context))
+        upd_mock.assert_called_with(mock.sentinel.context, mock.ANY, now)
+        self.assertEqual([1, 2], sorted(upd_mock.call_args[0][1]))
+        self.assertEqual(0, len(coalescer))
@@ -46,6 +46,21 @@ class MemcachedServiceGroupTestCase(test.NoDBTestCase):
         self.assertTrue(self.servicegroup_api.service_is_up(service_ref))
         self.mc_client.get.assert_called_once_with('compute:fake-host')
 
+    def test_get_up_map(self):
+        service_refs = [
+            {'id': 1, 'host': 'fake-host1', 'topic': 'compute'},
+            {'id': 2, 'host': 'fake-host2', 'topic': 'compute'},
+            {'id': 3, 'host': 'fake-host3', 'topic': 'compute',
+             'forced_down': True},
+        ]
+        self.mc_client.get_multi.return_value = [True, None]
+
+        self.assertEqual({1: True, 2: False, 3: False},
+                         self.servicegroup_api.get_up_map(service_refs))
+        self.mc_client.get_multi.assert_called_once_with(
+            ['compute:fake-host1', 'compute:fake-host2'])
+        self.assertFalse(self.mc_client.get.called)
+
     def test_join(self):
         service = mock.MagicMock(report_interval=1)
 
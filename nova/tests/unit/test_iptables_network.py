@@ -15,6 +15,9 @@
 #    under the License.
 """Unit Tests for network code."""
 
+import time
+
+import mock
 import six
 
 from nova.network import linux_net
@@ -275,3 +278,137 @@ class IptablesManagerTestCase(test.NoDBTestCase):
                                                self.manager.ipv4['filter'],
                                                'filter')
         self.assertEqual(current_lines, new_lines)
+
+    def _fake_execute(self, current_lines):
+        restored = []
+
+        def fake_execute(*cmd, **kwargs):
+            if cmd[0] == 'iptables-save':
+                return '\n'.join(current_lines), ''
+            restored.append((cmd, kwargs['process_input'].split('\n')))
+            return '', ''
+
+        self.manager.execute = fake_execute
+        return restored
+
+    def test_apply_changed_chains(self):
+        self.flags(iptables_apply_changed_chains=True)
+        restored = self._fake_execute(self.sample_filter + self.sample_nat)
+        tables = self.manager.ipv4
+        self.manager._apply_tables('iptables', tables)
+        # The first apply restores the whole tables
+        self.assertEqual(1, len(restored))
+        self.assertEqual(('iptables-restore', '-c'), restored[0][0])
+
+        tables['filter'].add_chain('sg-1')
+        tables['filter'].add_rule('sg-1', '-s 10.0.0.1 -j ACCEPT')
+        tables['filter'].add_rule('FORWARD', '-j $sg-1')
+        self.manager._apply_tables('iptables', tables)
+        self.assertEqual(2, len(restored))
+        self.assertEqual(('iptables-restore', '-c', '--noflush'),
+                         restored[1][0])
+        self.assertEqual(
+            ['*filter',
+             ':%s-FORWARD - [0:0]' % self.binary_name,
+             ':%s-sg-1 - [0:0]' % self.binary_name,
+             '[0:0] -A %s-FORWARD -j %s-sg-1' % (self.binary_name,
+                                                 self.binary_name),
+             '[0:0] -A %s-sg-1 -s 10.0.0.1 -j ACCEPT' % self.binary_name,
+             'COMMIT'],
+            restored[1][1])
+        self.assertFalse(tables['filter'].dirty)
+
+        # Nothing changed, nothing to restore
+        self.manager._apply_tables('iptables', tables)
+        self.assertEqual(2, len(restored))
+
+        tables['filter'].remove_chain('sg-1')
+        self.manager._apply_tables('iptables', tables)
+        self.assertEqual(
+            ['*filter',
+             ':%s-FORWARD - [0:0]' % self.binary_name,
+             ':%s-sg-1 - [0:0]' % self.binary_name,
+             '-X %s-sg-1' % self.binary_name,
+             'COMMIT'],
+            restored[2][1])
+
+    def test_apply_changed_chains_unwrapped_change(self):
+        self.flags(iptables_apply_changed_chains=True)
+        restored = self._fake_execute(self.sample_filter + self.sample_nat)
+        tables = self.manager.ipv4
+        self.manager._apply_tables('iptables', tables)
+        tables['filter'].add_rule('FORWARD', '-s 10.0.0.1 -j DROP',
+                                  wrap=False)
+        self.manager._apply_tables('iptables', tables)
+        self.assertEqual(('iptables-restore', '-c'), restored[1][0])
+        self.assertIn('[0:0] -A FORWARD -s 10.0.0.1 -j DROP', restored[1][1])
+
+    def test_apply_changed_chains_error(self):
+        self.flags(iptables_apply_changed_chains=True)
+        self._fake_execute(self.sample_filter + self.sample_nat)
+        tables = self.manager.ipv4
+        self.manager._apply_tables('iptables', tables)
+        self.assertEqual(set([('iptables', 'filter'), ('iptables', 'nat'),
+                              ('iptables', 'mangle')]),
+                         set(self.manager._applied_tables))
+
+        tables['filter'].add_rule('FORWARD', '-s 10.0.0.1 -j DROP')
+        with mock.patch.object(self.manager, 'execute',
+                               side_effect=test.TestingException):
+            self.assertRaises(test.TestingException,
+                              self.manager._apply_tables, 'iptables', tables)
+        # The next apply restores the whole tables
+        self.assertEqual({}, self.manager._applied_tables)
+
+    def test_apply_changed_chains_disabled(self):
+        restored = self._fake_execute(self.sample_filter + self.sample_nat)
+        self.manager._apply_tables('iptables', self.manager.ipv4)
+        self.manager._apply_tables('iptables', self.manager.ipv4)
+        self.assertEqual([('iptables-restore', '-c')] * 2,
+                         [cmd for cmd, lines in restored])
+        self.assertEqual({}, self.manager._applied_tables)
+
+    def _add_rules(self, table, count, chains=500):
+        for i in range(chains):
+            table.add_chain('sg-%d' % i)
+        for i in range(count):
+            table.add_rule('sg-%d' % (i % chains),
+                           '-s 10.%d.%d.%d -j ACCEPT' % (
+                               i // 65536 % 256, i // 256 % 256, i % 256))
+
+    def test_performance_check_add_rule(self):
+        table = self.manager.ipv4['filter']
+        num_rules = len(table.rules)
+        start = time.time()
+        self._add_rules(table, 50000)
+        # Adding the same rules again is a no-op
+        self._add_rules(table, 50000)
+        self.assertEqual(num_rules + 50000, len(table.rules))
+        self.assertTrue(time.time() - start < 10)
+
+    def test_performance_check_modify_rules(self):
+        table = self.manager.ipv4['filter']
+        self._add_rules(table, 50000)
+        new_lines = self.manager._modify_rules(self.sample_filter, table,
+                                               'filter')
+        start = time.time()
+        new_lines = self.manager._modify_rules(new_lines, table, 'filter')
+        self.assertTrue(time.time() - start < 10)
+        self.assertIn('[0:0] -A %s-sg-499 -s 10.0.195.79 -j ACCEPT' % (
+                      self.binary_name), new_lines)
+
+    def test_performance_check_apply_changed_chains(self):
+        self.flags(iptables_apply_changed_chains=True)
+        restored = self._fake_execute(self.sample_filter + self.sample_nat)
+        tables = self.manager.ipv4
+        self._add_rules(tables['filter'], 50000)
+        self.manager._apply_tables('iptables', tables)
+
+        tables['filter'].add_rule('sg-1', '-s 192.168.0.1 -j ACCEPT')
+        start = time.time()
+        self.manager._apply_tables('iptables', tables)
+        self.assertTrue(time.time() - start < 10)
+        # Only the 100 rules of the changed chain are restored
+        self.assertEqual(('iptables-restore', '-c', '--noflush'),
+                         restored[-1][0])
+        self.assertEqual(104, len(restored[-1][1]))
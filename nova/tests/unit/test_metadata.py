@@ -17,6 +17,7 @@
 """Tests for metadata service."""
 
 import base64
+import datetime
 import hashlib
 import hmac
 import re
@@ -29,6 +30,7 @@ except ImportError:
 import mock
 from oslo_config import cfg
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 import six
 import webob
 
@@ -729,6 +731,129 @@ class OpenStackMetadataTestCase(test.TestCase):
             self.assertEqual(nw[k], v)
 
 
+class RenderedMetadataTestCase(test.TestCase):
+    def setUp(self):
+        super(RenderedMetadataTestCase, self).setUp()
+        self.context = context.RequestContext('fake', 'fake')
+        self.instance = fake_inst_obj(self.context)
+        self.flags(use_local=True, group='conductor')
+        fake_network.stub_out_nw_api_get_instance_nw_info(self)
+        fakes.stub_out_key_pair_funcs(self.stubs)
+        self.mdinst = fake_InstanceMetadata(self.stubs, self.instance)
+        self.rendered = base.RenderedInstanceMetadata(self.mdinst,
+                                                      stamp='stamp')
+
+    def _assert_same_lookup(self, path):
+        expected = base.ec2_md_print(self.mdinst.lookup(path))
+        expected_mimetype = self.mdinst.get_mimetype()
+        self.assertEqual(expected,
+                         base.ec2_md_print(self.rendered.lookup(path)),
+                         path)
+        self.assertEqual(expected_mimetype, self.rendered.get_mimetype(),
+                         path)
+        return expected
+
+    def _assert_same_tree(self, path):
+        listing = self._assert_same_lookup(path)
+        for item in listing.split('\n'):
+            if item.endswith('/'):
+                self._assert_same_tree(path + '/' + item[:-1])
+            else:
+                self._assert_same_lookup(path + '/' + item.split('=')[0])
+
+    def test_can_pickle_metadata(self):
+        rendered = pickle.loads(pickle.dumps(self.rendered, protocol=0))
+        self.assertEqual(self.instance.uuid, rendered.uuid)
+        self.assertEqual('stamp', rendered.stamp)
+
+    @mock.patch.object(objects.Instance, 'get_by_uuid')
+    def test_get_metadata_stamp(self, get_by_uuid):
+        updated_at = timeutils.utcnow()
+        self.instance.updated_at = updated_at
+        self.instance.info_cache.updated_at = None
+        get_by_uuid.return_value = self.instance
+        stamp = base.get_metadata_stamp(self.instance.uuid, ctxt=self.context)
+        self.assertEqual(updated_at, stamp.updated_at)
+        self.assertIsNone(stamp.info_cache_updated_at)
+        get_by_uuid.assert_called_once_with(
+            self.context, self.instance.uuid,
+            expected_attrs=['info_cache', 'metadata', 'system_metadata'])
+
+    def test_get_instance_metadata_stamp_metadata_updated(self):
+        # the metadata updates don't change the updated_at of the instance,
+        # the stamp changes with the metadata itself
+        stamp = base.get_instance_metadata_stamp(self.instance)
+        self.assertEqual(stamp, base.get_instance_metadata_stamp(
+            self.instance.obj_clone()))
+
+        self.instance.metadata = {'key': 'value'}
+        md_stamp = base.get_instance_metadata_stamp(self.instance)
+        self.assertNotEqual(stamp, md_stamp)
+        self.assertEqual(stamp.updated_at, md_stamp.updated_at)
+
+        self.instance.system_metadata = {'password_0': 'secret'}
+        self.assertNotEqual(md_stamp,
+                            base.get_instance_metadata_stamp(self.instance))
+
+    def test_ec2_lookup(self):
+        self._assert_same_lookup('/')
+        for version in base.VERSIONS + ['latest']:
+            self._assert_same_tree('/%s' % version)
+        self._assert_same_lookup('/2009-04-04/meta-data/public-keys/0/_name')
+
+    def test_openstack_lookup(self):
+        self._assert_same_lookup('/openstack')
+        for version in base.OPENSTACK_VERSIONS + ['latest']:
+            path = '/openstack/%s' % version
+            for name in self._assert_same_lookup(path).split('\n'):
+                if name not in (base.MD_JSON_NAME, base.PASS_NAME):
+                    self._assert_same_lookup(path + '/' + name)
+
+    def test_metadata_json(self):
+        path = '/openstack/latest/meta_data.json'
+        mddict = jsonutils.loads(self.rendered.lookup(path))
+        self.assertEqual(base.MIME_TYPE_APPLICATION_JSON,
+                         self.rendered.get_mimetype())
+        random_seed = mddict.pop('random_seed')
+        self.assertEqual(512, len(base64.b64decode(random_seed)))
+        expected = jsonutils.loads(self.mdinst.lookup(path))
+        del expected['random_seed']
+        self.assertEqual(expected, mddict)
+
+        # each request gets its own random seed
+        mddict = jsonutils.loads(self.rendered.lookup(path))
+        self.assertNotEqual(random_seed, mddict['random_seed'])
+
+        # older versions do not have it
+        mdjson = self.rendered.lookup('/openstack/2012-08-10/meta_data.json')
+        self.assertNotIn('random_seed', jsonutils.loads(mdjson))
+
+    def test_password(self):
+        self.assertEqual(password.handle_password,
+                         self.rendered.lookup('/openstack/latest/password'))
+        self.assertRaises(base.InvalidMetadataPath, self.rendered.lookup,
+                          '/openstack/2012-08-10/password')
+
+    def test_invalid_path(self):
+        for path in ('/2009-04-04/meta-data/invalid', '/9999-99-99',
+                     '/openstack/9999-99-99/meta_data.json',
+                     '/openstack/content'):
+            self.assertRaises(base.InvalidMetadataPath, self.rendered.lookup,
+                              path)
+
+    @mock.patch.object(objects.KeyPair, 'get_by_name',
+                       side_effect=exception.KeypairNotFound(
+                           user_id='fake_user', name='key'))
+    def test_render_error(self, mock_get_keypair):
+        mdinst = fake_InstanceMetadata(self.stubs, self.instance)
+        rendered = base.RenderedInstanceMetadata(mdinst)
+        self.assertRaises(base.MetadataRenderError, rendered.lookup,
+                          '/openstack/latest/meta_data.json')
+        # the other documents are still served
+        self.assertEqual(USER_DATA_STRING,
+                         rendered.lookup('/openstack/latest/user_data'))
+
+
 class MetadataHandlerTestCase(test.TestCase):
     """Test that metadata is returning proper values."""
 
@@ -1019,9 +1144,12 @@ class MetadataHandlerTestCase(test.TestCase):
         self.assertEqual(base64.b64decode(self.instance['user_data']),
                          response.body)
 
+    @mock.patch.object(base, 'get_metadata_stamp',
+                       return_value=(None, None))
     @mock.patch.object(base, 'get_metadata_by_instance_id')
-    def test_metadata_handler_with_instance_id(self, get_by_uuid):
+    def test_metadata_handler_with_instance_id(self, get_by_uuid, get_stamp):
         # test twice to ensure that the cache works
+        fakes.stub_out_key_pair_funcs(self.stubs)
         get_by_uuid.return_value = self.mdinst
         self.flags(metadata_cache_expiration=15)
         hnd = handler.MetadataRequestHandler()
@@ -1050,15 +1178,101 @@ class MetadataHandlerTestCase(test.TestCase):
         self.assertEqual(base64.b64decode(self.instance.user_data),
                          response.body)
 
+    @mock.patch.object(base, 'get_metadata_stamp',
+                       return_value=(None, None))
     @mock.patch.object(base, 'get_metadata_by_address')
-    def test_metadata_handler_with_remote_address(self, get_by_uuid):
+    def test_metadata_handler_with_remote_address(self, get_by_uuid,
+                                                  get_stamp):
         # test twice to ensure that the cache works
+        fakes.stub_out_key_pair_funcs(self.stubs)
         get_by_uuid.return_value = self.mdinst
         self.flags(metadata_cache_expiration=15)
         hnd = handler.MetadataRequestHandler()
         self._metadata_handler_with_remote_address(hnd)
         self._metadata_handler_with_remote_address(hnd)
         self.assertEqual(1, get_by_uuid.call_count)
+        # the metadata was cached in the last metadata_cache_check_interval
+        self.assertFalse(get_stamp.called)
+
+    @mock.patch.object(handler, 'time')
+    @mock.patch.object(base, 'get_metadata_stamp')
+    @mock.patch.object(base, 'get_metadata_by_address')
+    def test_metadata_handler_cache_check_interval(self, get_by_uuid,
+                                                   get_stamp, mock_time):
+        fakes.stub_out_key_pair_funcs(self.stubs)
+        updated_at = timeutils.utcnow() - datetime.timedelta(minutes=1)
+        self.instance.updated_at = updated_at
+        get_by_uuid.return_value = self.mdinst
+        get_stamp.return_value = base.get_instance_metadata_stamp(
+            self.instance)
+        self.flags(metadata_cache_expiration=15,
+                   metadata_cache_check_interval=5)
+        hnd = handler.MetadataRequestHandler()
+        mock_time.time.return_value = 100
+        self._metadata_handler_with_remote_address(hnd)
+        mock_time.time.return_value = 104
+        self._metadata_handler_with_remote_address(hnd)
+        self.assertFalse(get_stamp.called)
+
+        # the stamp is checked again once the interval elapsed, and then
+        # trusted for another interval
+        mock_time.time.return_value = 105
+        self._metadata_handler_with_remote_address(hnd)
+        mock_time.time.return_value = 109
+        self._metadata_handler_with_remote_address(hnd)
+        get_stamp.assert_called_once_with(self.instance.uuid)
+        self.assertEqual(1, get_by_uuid.call_count)
+
+    @mock.patch.object(base, 'get_metadata_stamp')
+    @mock.patch.object(base, 'get_metadata_by_address')
+    def test_metadata_handler_cache_instance_updated(self, get_by_uuid,
+                                                     get_stamp):
+        fakes.stub_out_key_pair_funcs(self.stubs)
+        updated_at = timeutils.utcnow() - datetime.timedelta(minutes=1)
+        self.instance.updated_at = updated_at
+        get_by_uuid.return_value = self.mdinst
+        stamp = base.get_instance_metadata_stamp(self.instance)
+        get_stamp.return_value = stamp
+        self.flags(metadata_cache_expiration=15,
+                   metadata_cache_check_interval=0)
+        hnd = handler.MetadataRequestHandler()
+        self._metadata_handler_with_remote_address(hnd)
+        self._metadata_handler_with_remote_address(hnd)
+        self.assertEqual(1, get_by_uuid.call_count)
+
+        # the cached metadata is dropped once the instance is updated
+        get_stamp.return_value = stamp._replace(updated_at=timeutils.utcnow())
+        self._metadata_handler_with_remote_address(hnd)
+        self.assertEqual(2, get_by_uuid.call_count)
+
+        # or its metadata
+        get_stamp.return_value = stamp
+        self._metadata_handler_with_remote_address(hnd)
+        self.assertEqual(2, get_by_uuid.call_count)
+        get_stamp.return_value = stamp._replace(metadata_digest='changed')
+        self._metadata_handler_with_remote_address(hnd)
+        self.assertEqual(3, get_by_uuid.call_count)
+
+        # or deleted
+        get_stamp.side_effect = exception.InstanceNotFound(
+            instance_id=self.instance.uuid)
+        self._metadata_handler_with_remote_address(hnd)
+        self.assertEqual(4, get_by_uuid.call_count)
+
+    @mock.patch.object(base, 'get_metadata_stamp')
+    @mock.patch.object(base, 'get_metadata_by_address')
+    def test_metadata_handler_cache_recently_updated(self, get_by_uuid,
+                                                     get_stamp):
+        # the metadata of an instance updated in the last seconds is not
+        # cached, its stamp could miss another update
+        self.instance.updated_at = timeutils.utcnow()
+        get_by_uuid.return_value = self.mdinst
+        self.flags(metadata_cache_expiration=15)
+        hnd = handler.MetadataRequestHandler()
+        self._metadata_handler_with_remote_address(hnd)
+        self._metadata_handler_with_remote_address(hnd)
+        self.assertEqual(2, get_by_uuid.call_count)
+        self.assertFalse(get_stamp.called)
 
     @mock.patch.object(base, 'get_metadata_by_address')
     def test_metadata_handler_with_remote_address_no_cache(self, get_by_uuid):
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
 from six.moves import StringIO
 import sys
 
@@ -393,7 +394,8 @@ class DBCommandsTestCase(test.NoDBTestCase):
     def _test_archive_deleted_rows(self, mock_db_archive, verbose=False):
         self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
         self.commands.archive_deleted_rows(20, verbose=verbose)
-        mock_db_archive.assert_called_once_with(20)
+        mock_db_archive.assert_called_once_with(20, watermarks={},
+                                                workers=1)
         output = sys.stdout.getvalue()
         if verbose:
             expected = '''\
@@ -420,10 +422,86 @@ class DBCommandsTestCase(test.NoDBTestCase):
     def test_archive_deleted_rows_verbose_no_results(self, mock_db_archive):
         self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
         self.commands.archive_deleted_rows(20, verbose=True)
-        mock_db_archive.assert_called_once_with(20)
+        mock_db_archive.assert_called_once_with(20, watermarks={},
+                                                workers=1)
         output = sys.stdout.getvalue()
         self.assertIn('Nothing was archived.', output)
 
+    def test_archive_deleted_rows_negative_workers(self):
+        self.assertEqual(1, self.commands.archive_deleted_rows(20,
+                                                               workers=0))
+
+    @mock.patch.object(db, 'archive_deleted_rows')
+    def test_archive_deleted_rows_until_complete(self, mock_db_archive):
+        def fake_archive(max_rows, watermarks, workers):
+            if mock_db_archive.call_count == 3:
+                # Nothing archived, but a table is found exhausted
+                watermarks['instances'] = None
+                return {}
+            if mock_db_archive.call_count > 3:
+                return {}
+            watermarks['instances'] = mock_db_archive.call_count
+            return dict(instances=10, consoles=5)
+
+        mock_db_archive.side_effect = fake_archive
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout', StringIO()))
+        self.commands.archive_deleted_rows(None, verbose=True,
+                                           until_complete=True, workers=2)
+        self.assertEqual(4, mock_db_archive.call_count)
+        mock_db_archive.assert_called_with(
+            1000, watermarks={'instances': None}, workers=2)
+        output = sys.stdout.getvalue()
+        self.assertEqual(3, output.count('rows/s'))
+        self.assertIn('| instances | 20                      |', output)
+
+    @mock.patch.object(db, 'archive_deleted_rows')
+    def test_archive_deleted_rows_watermark_file(self, mock_db_archive):
+        def fake_archive(max_rows, watermarks, workers):
+            watermarks['instances'] += 10
+            return dict(instances=10)
+
+        mock_db_archive.side_effect = fake_archive
+        watermark_file = self.useFixture(fixtures.TempDir()).join('wm.json')
+        with open(watermark_file, 'w') as f:
+            f.write('{"instances": 42}')
+        self.commands.archive_deleted_rows(20,
+                                           watermark_file=watermark_file)
+        mock_db_archive.assert_called_once_with(
+            20, watermarks={'instances': 52}, workers=1)
+        with open(watermark_file) as f:
+            self.assertEqual('{"instances": 52}', f.read())
+
+    @mock.patch.object(db, 'archive_deleted_rows')
+    def test_archive_deleted_rows_watermark_file_next_pass(self,
+                                                           mock_db_archive):
+        def fake_archive(max_rows, watermarks, workers):
+            if watermarks.get('instances') is None:
+                watermarks['instances'] = 10
+                return dict(instances=10)
+            watermarks['instances'] = None
+            return {}
+
+        mock_db_archive.side_effect = fake_archive
+        watermark_file = self.useFixture(fixtures.TempDir()).join('wm.json')
+        self.commands.archive_deleted_rows(20,
+                                           watermark_file=watermark_file)
+        with open(watermark_file) as f:
+            self.assertEqual('{"instances": 10}', f.read())
+
+        # Nothing is left after the watermark, the pass is complete
+        self.commands.archive_deleted_rows(20,
+                                           watermark_file=watermark_file)
+        self.assertFalse(os.path.exists(watermark_file))
+
+        # The second pass starts from the first rows
+        self.commands.archive_deleted_rows(20,
+                                           watermark_file=watermark_file)
+        self.assertEqual(3, mock_db_archive.call_count)
+        mock_db_archive.assert_called_with(
+            20, watermarks={'instances': 10}, workers=1)
+        with open(watermark_file) as f:
+            self.assertEqual('{"instances": 10}', f.read())
+
     @mock.patch.object(migration, 'db_null_instance_uuid_scan',
                        return_value={'foo': 0})
     def test_null_instance_uuid_scan_no_records_found(self, mock_scan):
@@ -16,6 +16,7 @@
 
 import datetime
 
+import mock
 from oslo_db.sqlalchemy import enginefacade
 from oslo_utils import timeutils
 from six.moves import range
@@ -2174,6 +2175,114 @@ class DbQuotaDriverTestCase(test.TestCase):
                 server_group_members=10,
                 ))
 
+    def _get_cached_limits(self):
+        return {'project': {'instances': 5, 'cores': 8},
+                'users': {'fake_user': {'instances': 2}},
+                'defaults': {'cores': 4, 'ram': 1024},
+                'class': {'ram': 2048}}
+
+    @mock.patch.object(db, 'quota_get_all_limits_by_project')
+    def test_get_quotas_cached(self, get_limits):
+        self.flags(quota_limit_cache_ttl=60)
+        get_limits.return_value = self._get_cached_limits()
+        ctxt = FakeContext('test_project', 'test_class')
+        keys = ['instances', 'cores', 'ram', 'floating_ips']
+        user_quotas = self.driver._get_quotas(ctxt, quota.QUOTAS._resources,
+                                              keys, True,
+                                              project_id='test_project',
+                                              user_id='fake_user')
+        project_quotas = self.driver._get_quotas(ctxt,
+                                                 quota.QUOTAS._resources,
+                                                 keys, True,
+                                                 project_id='test_project')
+
+        get_limits.assert_called_once_with(ctxt, 'test_project',
+                                           quota_class='test_class')
+        self.assertEqual(dict(instances=2, cores=8, ram=2048,
+                              floating_ips=10), user_quotas)
+        self.assertEqual(dict(instances=5, cores=8, ram=2048,
+                              floating_ips=10), project_quotas)
+
+    @mock.patch.object(db, 'quota_get_all_limits_by_project')
+    def test_get_limits_cache_expired(self, get_limits):
+        self.flags(quota_limit_cache_ttl=60)
+        get_limits.return_value = self._get_cached_limits()
+        ctxt = FakeContext('test_project', 'test_class')
+        self.driver._get_limits(ctxt, 'test_project', 'test_class')
+        timeutils.advance_time_seconds(30)
+        self.driver._get_limits(ctxt, 'test_project', 'test_class')
+        self.assertEqual(1, get_limits.call_count)
+
+        timeutils.advance_time_seconds(31)
+        self.driver._get_limits(ctxt, 'other_project', 'test_class')
+        # The expired entries are dropped once another project is loaded
+        self.assertEqual([('other_project', 'test_class')],
+                         list(self.driver._limits_cache))
+        self.driver._get_limits(ctxt, 'test_project', 'test_class')
+        self.assertEqual(3, get_limits.call_count)
+
+    @mock.patch.object(db, 'quota_get_all_limits_by_project')
+    def test_invalidate_limits(self, get_limits):
+        self.flags(quota_limit_cache_ttl=60)
+        get_limits.return_value = self._get_cached_limits()
+        ctxt = FakeContext('test_project', 'test_class')
+        for project_id in ('project1', 'project2'):
+            self.driver._get_limits(ctxt, project_id, 'test_class')
+
+        self.driver.invalidate_limits(project_id='project1')
+        self.assertEqual([('project2', 'test_class')],
+                         list(self.driver._limits_cache))
+        self.driver.invalidate_limits(quota_class='test_class')
+        self.assertEqual({}, self.driver._limits_cache)
+
+    def test_get_quotas_cached_other_project(self):
+        # An admin gets the same limits for another project whether they
+        # are cached or not
+        ctxt = context.RequestContext('admin', 'admin_project', is_admin=True,
+                                      quota_class='admin_class')
+        db.quota_create(ctxt, 'test_project', 'cores', 8)
+        db.quota_class_create(ctxt, 'admin_class', 'ram', 2048)
+        db.quota_class_create(ctxt, 'test_class', 'ram', 4096)
+        keys = ['instances', 'cores', 'ram']
+        uncached = self.driver._get_quotas(ctxt, quota.QUOTAS._resources,
+                                           keys, True,
+                                           project_id='test_project')
+
+        self.flags(quota_limit_cache_ttl=60)
+        cached = self.driver._get_quotas(ctxt, quota.QUOTAS._resources,
+                                         keys, True,
+                                         project_id='test_project')
+        self.assertEqual(uncached, cached)
+        self.assertEqual(8, cached['cores'])
+        self.assertEqual(2048, cached['ram'])
+        self.assertEqual([('test_project', 'admin_class')],
+                         list(self.driver._limits_cache))
+
+    @mock.patch.object(db, 'quota_get_all_by_project')
+    @mock.patch.object(db, 'quota_get_all_limits_by_project')
+    def test_limit_check_cached(self, get_limits, get_all_by_project):
+        self.flags(quota_limit_cache_ttl=60)
+        get_limits.return_value = {
+            'project': {'metadata_items': 64}, 'users': {},
+            'defaults': {}, 'class': {}}
+        ctxt = FakeContext('test_project', 'test_class')
+        for i in range(3):
+            self.driver.limit_check(ctxt, quota.QUOTAS._resources,
+                                    dict(metadata_items=64))
+        self.assertRaises(exception.OverQuota, self.driver.limit_check,
+                          ctxt, quota.QUOTAS._resources,
+                          dict(metadata_items=65))
+        self.assertEqual(1, get_limits.call_count)
+        self.assertFalse(get_all_by_project.called)
+
+    @mock.patch.object(db, 'quota_destroy_all_by_project')
+    def test_destroy_all_by_project_invalidates_limits(self, destroy):
+        self.driver._limits_cache[('test_project', None)] = (
+            timeutils.utcnow(), {})
+        self.driver.destroy_all_by_project(None, 'test_project')
+        destroy.assert_called_once_with(None, 'test_project')
+        self.assertEqual({}, self.driver._limits_cache)
+
     def test_limit_check_under(self):
         self._stub_get_project_quotas()
         self.assertRaises(exception.InvalidQuotaValue,
@@ -2787,6 +2896,52 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.compare_reservation(result, reservations_list)
 
 
+class CounterQuotaDriverTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(CounterQuotaDriverTestCase, self).setUp()
+        self.flags(until_refresh=5, max_age=60)
+        self.driver = quota.CounterQuotaDriver()
+        self.context = FakeContext('test_project', 'test_class')
+
+    @mock.patch.object(db, 'quota_reserve')
+    @mock.patch.object(db, 'quota_reserve_counters',
+                       return_value=['resv-1'])
+    @mock.patch.object(db, 'quota_get_all_by_project', return_value={})
+    def test_reserve(self, get_all, reserve_counters, reserve):
+        expire = timeutils.utcnow()
+        with mock.patch.object(self.driver, '_get_quotas',
+                               return_value={'instances': 10}):
+            result = self.driver.reserve(self.context,
+                                         quota.QUOTAS._resources,
+                                         dict(instances=2), expire=expire)
+        self.assertEqual(['resv-1'], result)
+        reserve_counters.assert_called_once_with(
+            self.context, quota.QUOTAS._resources, {'instances': 10},
+            {'instances': 10}, dict(instances=2), expire, 5, 60,
+            project_id='test_project', user_id='fake_user')
+        self.assertFalse(reserve.called)
+
+    @mock.patch.object(db, 'reservation_commit_counters')
+    def test_commit(self, commit):
+        self.driver.commit(self.context, ['resv-1'])
+        commit.assert_called_once_with(self.context, ['resv-1'],
+                                       project_id='test_project',
+                                       user_id='fake_user')
+
+    @mock.patch.object(db, 'reservation_rollback_counters')
+    def test_rollback(self, rollback):
+        self.driver.rollback(self.context, ['resv-1'],
+                             project_id='other_project', user_id='user')
+        rollback.assert_called_once_with(self.context, ['resv-1'],
+                                         project_id='other_project',
+                                         user_id='user')
+
+    @mock.patch.object(db, 'reservation_expire_counters')
+    def test_expire(self, expire):
+        self.driver.expire(self.context)
+        expire.assert_called_once_with(self.context)
+
+
 class NoopQuotaDriverTestCase(test.TestCase):
     def setUp(self):
         super(NoopQuotaDriverTestCase, self).setUp()
@@ -72,3 +72,24 @@ class TestWeigher(test.NoDBTestCase):
         self.assertEqual(1, len(weighed_host))
         self.assertEqual('host1', weighed_host[0].obj.host)
         self.assertFalse(mock_weigh.called)
+
+    def test_reweigh_object(self):
+        hostinfo = [fakes.FakeHostState('host%s' % i, 'node%s' % i,
+                                        {'free_ram_mb': free_ram_mb})
+                    for i, free_ram_mb in enumerate([4096, 2048, 1024])]
+
+        weight_handler = scheduler_weights.HostWeightHandler()
+        weighers = [ram.RAMWeigher()]
+        weighed_hosts = weight_handler.get_weighed_objects(weighers,
+                                                           hostinfo, {})
+        self.assertEqual([1.0, 0.5, 0.25],
+                         [weighed_host.weight
+                          for weighed_host in weighed_hosts])
+
+        hostinfo[0].free_ram_mb = 3072
+        weighed_host = weight_handler.reweigh_object(weighers,
+                                                     weighed_hosts[0], {})
+
+        # The weight is normalized with the values of the whole list
+        self.assertIs(weighed_hosts[0], weighed_host)
+        self.assertEqual(0.75, weighed_host.weight)
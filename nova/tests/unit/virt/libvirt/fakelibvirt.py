@@ -143,6 +143,14 @@ VIR_DOMAIN_BLOCK_REBASE_RELATIVE = 8
 
 VIR_CONNECT_LIST_DOMAINS_ACTIVE = 1
 VIR_CONNECT_LIST_DOMAINS_INACTIVE = 2
+VIR_CONNECT_LIST_DOMAINS_RUNNING = 16
+VIR_CONNECT_LIST_DOMAINS_PAUSED = 32
+VIR_CONNECT_LIST_DOMAINS_SHUTOFF = 64
+VIR_CONNECT_LIST_DOMAINS_OTHER = 128
+
+VIR_DOMAIN_STATS_BALLOON = 4
+VIR_DOMAIN_STATS_VCPU = 8
+VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE = 1
 
 # secret type
 VIR_SECRET_USAGE_TYPE_NONE = 0
@@ -911,8 +919,31 @@ class Connection(object):
             if flags & VIR_CONNECT_LIST_DOMAINS_INACTIVE:
                 if vm.state == VIR_DOMAIN_SHUTOFF:
                     vms.append(vm)
+            if flags & VIR_CONNECT_LIST_DOMAINS_RUNNING:
+                if vm.state == VIR_DOMAIN_RUNNING:
+                    vms.append(vm)
+            if flags & VIR_CONNECT_LIST_DOMAINS_PAUSED:
+                if vm.state == VIR_DOMAIN_PAUSED:
+                    vms.append(vm)
+            if flags & VIR_CONNECT_LIST_DOMAINS_SHUTOFF:
+                if vm.state == VIR_DOMAIN_SHUTOFF:
+                    vms.append(vm)
+            if flags & VIR_CONNECT_LIST_DOMAINS_OTHER:
+                if vm.state not in (VIR_DOMAIN_RUNNING, VIR_DOMAIN_PAUSED,
+                                    VIR_DOMAIN_SHUTOFF):
+                    vms.append(vm)
         return vms
 
+    def getAllDomainStats(self, stats, flags):
+        # FIXME: Not handling flags at the moment, only running domains with
+        # their vcpu and balloon stats are returned
+        all_stats = []
+        for dom in self._running_vms.values():
+            info = dom.info()
+            all_stats.append((dom, {'vcpu.current': info[3],
+                                    'balloon.current': info[2]}))
+        return all_stats
+
     def _emit_lifecycle(self, dom, event, detail):
         if VIR_DOMAIN_EVENT_ID_LIFECYCLE not in self._event_callbacks:
             return
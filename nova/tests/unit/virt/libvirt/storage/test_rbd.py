@@ -10,6 +10,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
 
 import mock
 
@@ -537,3 +538,122 @@ class RbdTestCase(test.NoDBTestCase):
         proxy.list_snaps.return_value = [{'name': self.snap_name}, ]
         self.driver.rollback_to_snap(self.volume_name, self.snap_name)
         proxy.rollback_to_snap.assert_called_once_with(self.snap_name)
+
+
+@mock.patch.object(rbd_utils, 'rbd')
+@mock.patch.object(rbd_utils, 'rados')
+class RADOSConnectionPoolTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(RADOSConnectionPoolTestCase, self).setUp()
+        self.flags(images_rbd_connection_pool_size=2, group='libvirt')
+        self.pool = rbd_utils.RADOSConnectionPool()
+        patcher = mock.patch.object(rbd_utils, '_connection_pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with mock.patch.object(rbd_utils, 'rbd'):
+            self.driver = rbd_utils.RBDDriver('rbd', None, None)
+
+    def _fake_rados(self, mock_rados):
+        def fake_client(rados_id=None, conffile=None):
+            client = mock.Mock(state='configuring')
+
+            def connect():
+                client.state = 'connected'
+
+            def shutdown():
+                client.state = 'shutdown'
+
+            client.connect.side_effect = connect
+            client.shutdown.side_effect = shutdown
+            client.open_ioctx.side_effect = (
+                lambda pool: mock.Mock(state='open', pool=pool))
+            return client
+
+        mock_rados.Rados.side_effect = fake_client
+        mock_rados.Error = test.TestingException
+
+    def test_reuse(self, mock_rados, mock_rbd):
+        self._fake_rados(mock_rados)
+        with rbd_utils.RADOSClient(self.driver) as client1:
+            pass
+        with rbd_utils.RADOSClient(self.driver) as client2:
+            pass
+        self.assertEqual(1, mock_rados.Rados.call_count)
+        self.assertIs(client1.cluster, client2.cluster)
+        self.assertIs(client1.ioctx, client2.ioctx)
+        self.assertFalse(client1.cluster.shutdown.called)
+        self.assertEqual(1, len(self.pool))
+
+        # The connections are opened per pool
+        with rbd_utils.RBDVolumeProxy(self.driver, 'volume',
+                                      pool='alt_pool') as vol:
+            self.assertEqual('alt_pool', vol.ioctx.pool)
+        self.assertEqual(2, mock_rados.Rados.call_count)
+        self.assertEqual(2, len(self.pool))
+
+    def test_bounded_size(self, mock_rados, mock_rbd):
+        self.flags(images_rbd_connection_pool_size=1, group='libvirt')
+        self._fake_rados(mock_rados)
+        with rbd_utils.RADOSClient(self.driver) as client1:
+            with rbd_utils.RADOSClient(self.driver) as client2:
+                pass
+        # The least recently released connection is shut down
+        self.assertEqual(1, len(self.pool))
+        client2.cluster.shutdown.assert_called_once_with()
+        client2.ioctx.close.assert_called_once_with()
+        self.assertFalse(client1.cluster.shutdown.called)
+
+    def test_not_reused_after_error(self, mock_rados, mock_rbd):
+        self._fake_rados(mock_rados)
+
+        def _fail():
+            with rbd_utils.RADOSClient(self.driver) as client:
+                self.client = client
+                raise test.TestingException()
+
+        self.assertRaises(test.TestingException, _fail)
+        self.client.cluster.shutdown.assert_called_once_with()
+        self.assertEqual(0, len(self.pool))
+
+    def test_unhealthy_connection(self, mock_rados, mock_rbd):
+        self._fake_rados(mock_rados)
+        with rbd_utils.RADOSClient(self.driver) as client1:
+            pass
+        client1.ioctx.state = 'closed'
+        with rbd_utils.RADOSClient(self.driver) as client2:
+            self.assertIsNot(client1.cluster, client2.cluster)
+        client1.cluster.shutdown.assert_called_once_with()
+        self.assertEqual(1, len(self.pool))
+
+    @mock.patch('time.time')
+    def test_idle_timeout(self, mock_time, mock_rados, mock_rbd):
+        self.flags(images_rbd_connection_idle_timeout=60, group='libvirt')
+        self._fake_rados(mock_rados)
+        mock_time.return_value = 1000
+        with rbd_utils.RADOSClient(self.driver) as client1:
+            pass
+        mock_time.return_value = 1061
+        with rbd_utils.RADOSClient(self.driver) as client2:
+            self.assertIsNot(client1.cluster, client2.cluster)
+        client1.cluster.shutdown.assert_called_once_with()
+
+    def test_disabled(self, mock_rados, mock_rbd):
+        self.flags(images_rbd_connection_pool_size=0, group='libvirt')
+        self._fake_rados(mock_rados)
+        for i in range(2):
+            with rbd_utils.RADOSClient(self.driver) as client:
+                pass
+            client.cluster.shutdown.assert_called_once_with()
+        self.assertEqual(2, mock_rados.Rados.call_count)
+        self.assertEqual(0, len(self.pool))
+
+    def test_performance_check_connections(self, mock_rados, mock_rbd):
+        self._fake_rados(mock_rados)
+        start = time.time()
+        for i in range(1000):
+            self.driver.size('volume')
+            self.driver.exists('volume')
+        self.assertTrue(time.time() - start < 10)
+        # A single connection to the monitors for all the operations
+        self.assertEqual(1, mock_rados.Rados.call_count)
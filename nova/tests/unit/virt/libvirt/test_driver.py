@@ -89,6 +89,7 @@ from nova.virt import fake
 from nova.virt import firewall as base_firewall
 from nova.virt import hardware
 from nova.virt.image import model as imgmodel
+from nova.virt import images
 from nova.virt.libvirt import blockinfo
 from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import driver as libvirt_driver
@@ -8647,25 +8648,14 @@ class LibvirtConnTestCase(test.NoDBTestCase):
 
         fake_libvirt_utils.disk_sizes['/test/disk'] = 10 * units.Gi
         fake_libvirt_utils.disk_sizes['/test/disk.local'] = 20 * units.Gi
-        fake_libvirt_utils.disk_backing_files['/test/disk.local'] = 'file'
 
         self.mox.StubOutWithMock(os.path, "getsize")
         os.path.getsize('/test/disk').AndReturn((10737418240))
         os.path.getsize('/test/disk.local').AndReturn((3328599655))
 
-        ret = ("image: /test/disk\n"
-               "file format: raw\n"
-               "virtual size: 20G (21474836480 bytes)\n"
-               "disk size: 3.1G\n"
-               "cluster_size: 2097152\n"
-               "backing file: /test/dummy (actual path: /backing/file)\n")
-
-        self.mox.StubOutWithMock(os.path, "exists")
-        os.path.exists('/test/disk.local').AndReturn(True)
-
-        self.mox.StubOutWithMock(utils, "execute")
-        utils.execute('env', 'LC_ALL=C', 'LANG=C', 'qemu-img', 'info',
-                      '/test/disk.local').AndReturn((ret, ''))
+        self.mox.StubOutWithMock(images, "get_image_header_info")
+        images.get_image_header_info('/test/disk.local', 'qcow2').AndReturn(
+            images.ImageHeaderInfo('qcow2', 21474836480, '/backing/file'))
 
         self.mox.ReplayAll()
         drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
@@ -8755,25 +8745,14 @@ class LibvirtConnTestCase(test.NoDBTestCase):
 
         fake_libvirt_utils.disk_sizes['/test/disk'] = 10 * units.Gi
         fake_libvirt_utils.disk_sizes['/test/disk.local'] = 20 * units.Gi
-        fake_libvirt_utils.disk_backing_files['/test/disk.local'] = 'file'
 
         self.mox.StubOutWithMock(os.path, "getsize")
         os.path.getsize('/test/disk').AndReturn((10737418240))
         os.path.getsize('/test/disk.local').AndReturn((3328599655))
 
-        ret = ("image: /test/disk\n"
-               "file format: raw\n"
-               "virtual size: 20G (21474836480 bytes)\n"
-               "disk size: 3.1G\n"
-               "cluster_size: 2097152\n"
-               "backing file: /test/dummy (actual path: /backing/file)\n")
-
-        self.mox.StubOutWithMock(os.path, "exists")
-        os.path.exists('/test/disk.local').AndReturn(True)
-
-        self.mox.StubOutWithMock(utils, "execute")
-        utils.execute('env', 'LC_ALL=C', 'LANG=C', 'qemu-img', 'info',
-                      '/test/disk.local').AndReturn((ret, ''))
+        self.mox.StubOutWithMock(images, "get_image_header_info")
+        images.get_image_header_info('/test/disk.local', 'qcow2').AndReturn(
+            images.ImageHeaderInfo('qcow2', 21474836480, '/backing/file'))
 
         self.mox.ReplayAll()
         conn_info = {'driver_volume_type': 'fake'}
@@ -10894,6 +10873,49 @@ class LibvirtConnTestCase(test.NoDBTestCase):
         mock_get.assert_called_once_with(mock.ANY, filters, use_slave=True)
         mock_bdms.assert_called_with(mock.ANY, instance_uuids)
 
+    @mock.patch.object(host.Host, "list_instance_domains")
+    @mock.patch.object(objects.BlockDeviceMappingList, "bdms_by_instance_uuid")
+    @mock.patch.object(objects.InstanceList, "get_by_filters")
+    def test_disk_over_committed_size_total_guests_stats(self, mock_get,
+                                                         mock_bdms,
+                                                         mock_list):
+        def fake_guest(id, name):
+            guest = mock.Mock(spec=libvirt_guest.Guest, uuid=str(uuid.uuid4()))
+            guest.id = id
+            guest.name = name
+            guest.get_xml_desc.return_value = '<domain><name>%s</name>' % name
+            return guest
+
+        guests = [fake_guest(0, 'Domain-0'),
+                  fake_guest(1, 'instance0000001'),
+                  fake_guest(2, 'instance0000002')]
+        guests_stats = [host.GuestStats(guest, 1, 512) for guest in guests]
+        mock_get.return_value = []
+        fake_disks = {'instance0000001':
+                      [{'over_committed_disk_size': '10653532160'}],
+                      'instance0000002':
+                      [{'over_committed_disk_size': '1048576'}]}
+
+        def get_info(instance_name, xml, **kwargs):
+            self.assertEqual('<domain><name>%s</name>' % instance_name, xml)
+            return fake_disks.get(instance_name)
+
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with mock.patch.object(drvr, "_get_instance_disk_info",
+                               side_effect=get_info) as mock_info:
+            result = drvr._get_disk_over_committed_size_total(guests_stats)
+
+        self.assertEqual(10654580736, result)
+        self.assertEqual(2, mock_info.call_count)
+        self.assertFalse(mock_list.called)
+        instance_uuids = [guest.uuid for guest in guests[1:]]
+        mock_get.assert_called_once_with(mock.ANY, {'uuid': instance_uuids},
+                                         use_slave=True)
+        # The XML fetched for the snapshot is shared with its other users
+        self.assertEqual(guests[1].get_xml_desc.return_value,
+                         guests_stats[1].get_xml_desc())
+        guests[1].get_xml_desc.assert_called_once_with()
+
     @mock.patch.object(host.Host, "list_instance_domains",
                        return_value=[mock.MagicMock(name='foo')])
     @mock.patch.object(libvirt_driver.LibvirtDriver, "_get_instance_disk_info",
@@ -12050,6 +12072,22 @@ class LibvirtConnTestCase(test.NoDBTestCase):
         self.assertEqual(5, drvr._get_vcpu_used())
         mock_list.assert_called_with(only_guests=True, only_running=True)
 
+    @mock.patch.object(host.Host, "list_instance_domains")
+    def test_vcpu_count_guests_stats(self, mock_list):
+        def fake_guest(id):
+            guest = mock.Mock(spec=libvirt_guest.Guest)
+            guest.id = id
+            return guest
+
+        guests_stats = [host.GuestStats(fake_guest(0), 8, 4096),
+                        host.GuestStats(fake_guest(1), 2, 2048),
+                        host.GuestStats(fake_guest(2), 4, 1024),
+                        host.GuestStats(fake_guest(3))]
+
+        drvr = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.assertEqual(6, drvr._get_vcpu_used(guests_stats))
+        self.assertFalse(mock_list.called)
+
     @mock.patch.object(host.Host, "list_instance_domains")
     def test_failing_vcpu_count_none(self, mock_list):
         """Domain will return zero if the current number of vcpus used
@@ -13712,7 +13750,7 @@ class HostStateTestCase(test.NoDBTestCase):
             def _get_memory_mb_total():
                 return 497
 
-            def _get_memory_mb_used():
+            def _get_memory_mb_used(guests_stats=None):
                 return 88
 
             self._host.get_memory_mb_total = _get_memory_mb_total
@@ -13721,13 +13759,13 @@ class HostStateTestCase(test.NoDBTestCase):
         def _get_vcpu_total(self):
             return 1
 
-        def _get_vcpu_used(self):
+        def _get_vcpu_used(self, guests_stats=None):
             return 0
 
         def _get_cpu_info(self):
             return HostStateTestCase.cpu_info
 
-        def _get_disk_over_committed_size_total(self):
+        def _get_disk_over_committed_size_total(self, guests_stats=None):
             return 0
 
         def _get_local_gb_info(self):
@@ -13782,6 +13820,28 @@ class HostStateTestCase(test.NoDBTestCase):
                         matchers.DictMatches(
                                 HostStateTestCase.numa_topology._to_dict()))
 
+    @mock.patch.object(fakelibvirt, "openAuth")
+    def test_update_status_guests_stats(self, mock_open):
+        mock_open.return_value = fakelibvirt.Connection("qemu:///system")
+
+        drvr = HostStateTestCase.FakeConnection()
+        with test.nested(
+            mock.patch.object(drvr._host, 'get_guests_stats',
+                              return_value=mock.sentinel.guests_stats),
+            mock.patch.object(drvr, '_get_vcpu_used', return_value=0),
+            mock.patch.object(drvr._host, 'get_memory_mb_used',
+                              return_value=88),
+            mock.patch.object(drvr, '_get_disk_over_committed_size_total',
+                              return_value=0)
+        ) as (mock_stats, mock_vcpus, mock_memory, mock_disk):
+            drvr.get_available_resource("compute1")
+
+        # The domains are queried once for all the consumers
+        mock_stats.assert_called_once_with()
+        mock_vcpus.assert_called_once_with(mock.sentinel.guests_stats)
+        mock_memory.assert_called_once_with(mock.sentinel.guests_stats)
+        mock_disk.assert_called_once_with(mock.sentinel.guests_stats)
+
 
 class LibvirtDriverTestCase(test.NoDBTestCase):
     """Test for nova.virt.libvirt.libvirt_driver.LibvirtDriver."""
@@ -14,6 +14,7 @@
 #    under the License.
 
 import re
+import time
 import uuid
 from xml.dom import minidom
 
@@ -424,6 +425,137 @@ class IptablesFirewallTestCase(test.NoDBTestCase):
         # should undefine just the instance filter
         self.assertEqual(original_filter_count - len(fakefilter.filters), 1)
 
+    def _setup_group_members(self, mock_secrule, mock_instlist, count):
+        src_secgroup = objects.SecurityGroup(id=2, name='testsourcegroup')
+        mock_secrule.return_value = objects.SecurityGroupRuleList(objects=[
+            objects.SecurityGroupRule(parent_group_id=1, protocol='tcp',
+                                      from_port=80, to_port=81, cidr=None,
+                                      grantee_group=src_secgroup)])
+        self.members = {}
+        for i in range(count):
+            self.members[i + 100] = ['10.0.%d.%d' % (i // 256, i % 256)]
+        mock_instlist.side_effect = (
+            lambda ctxt, group_id: objects.InstanceList(
+                objects=[self._create_member(member_id)
+                         for member_id in self.members]))
+
+        def fake_get_nw_info(instance):
+            nw_info = mock.Mock()
+            nw_info.fixed_ips.return_value = [
+                {'address': ip, 'version': 4}
+                for ip in self.members[instance.id]]
+            return nw_info
+
+        self.stub_out('nova.compute.utils.get_nw_info_for_instance',
+                      fake_get_nw_info)
+
+    def _create_member(self, instance_id):
+        inst = self._create_instance_ref(uuid=str(uuid.uuid4()))
+        inst.id = instance_id
+        return inst
+
+    @mock.patch.object(objects.InstanceList, "get_by_security_group_id")
+    @mock.patch.object(objects.SecurityGroupRuleList, "get_by_instance")
+    def test_ipset_group_rules(self, mock_secrule, mock_instlist):
+        self.flags(firewall_use_ipset=True)
+        self._setup_group_members(mock_secrule, mock_instlist, 2)
+        execute = mock.Mock(return_value=('', ''))
+        self.fw.ipset = linux_net.IpsetManager(execute)
+        instance_ref = self._create_instance_ref()
+        network_info = _fake_network_info(self, 1)
+
+        ipv4_rules, ipv6_rules = self.fw.instance_rules(instance_ref,
+                                                        network_info)
+        rule = ('-j ACCEPT -p tcp -m multiport --dports 80:81 '
+                '-m set --match-set nova-sg-2-v4 src')
+        self.assertEqual(1, ipv4_rules.count(rule))
+        self.assertFalse([r for r in ipv4_rules if '-s 10.0.0.' in r])
+        execute.assert_called_once_with(
+            'ipset', 'restore', '-exist', run_as_root=True,
+            process_input='create nova-sg-2-v4 hash:ip family inet\n'
+                          'create nova-sg-2-v4-new hash:ip family inet\n'
+                          'flush nova-sg-2-v4-new\n'
+                          'add nova-sg-2-v4-new 10.0.0.0\n'
+                          'add nova-sg-2-v4-new 10.0.0.1\n'
+                          'swap nova-sg-2-v4-new nova-sg-2-v4\n'
+                          'destroy nova-sg-2-v4-new\n')
+        self.assertEqual({instance_ref.id: set(['nova-sg-2-v4'])},
+                         self.fw.instance_ipsets)
+
+        # Only the members which changed are sent to ipset
+        execute.reset_mock()
+        del self.members[100]
+        self.members[200] = ['10.0.1.0']
+        self.assertEqual((ipv4_rules, ipv6_rules),
+                         self.fw.instance_rules(instance_ref, network_info))
+        execute.assert_called_once_with(
+            'ipset', 'restore', '-exist', run_as_root=True,
+            process_input='del nova-sg-2-v4 10.0.0.0\n'
+                          'add nova-sg-2-v4 10.0.1.0\n')
+
+    @mock.patch.object(objects.InstanceList, "get_by_security_group_id")
+    @mock.patch.object(objects.SecurityGroupRuleList, "get_by_instance")
+    def test_ipset_refresh_loads_members_once(self, mock_secrule,
+                                              mock_instlist):
+        self.flags(firewall_use_ipset=True)
+        self._setup_group_members(mock_secrule, mock_instlist, 2)
+        self.fw.ipset = linux_net.IpsetManager(
+            mock.Mock(return_value=('', '')))
+        for instance_id in (1, 2):
+            self.fw.instance_info[instance_id] = (
+                self._create_member(instance_id), _fake_network_info(self, 1))
+        with mock.patch.object(self.fw, '_inner_do_refresh_rules') as inner:
+            self.fw.do_refresh_security_group_rules('secgroup')
+            self.assertEqual(2, inner.call_count)
+        self.assertEqual(1, mock_instlist.call_count)
+        self.assertIsNone(self.fw._security_group_members)
+
+    @mock.patch.object(objects.InstanceList, "get_by_security_group_id")
+    @mock.patch.object(objects.SecurityGroupRuleList, "get_by_instance")
+    def test_ipset_destroyed_when_unused(self, mock_secrule, mock_instlist):
+        self.flags(firewall_use_ipset=True)
+        self._setup_group_members(mock_secrule, mock_instlist, 1)
+        execute = mock.Mock(return_value=('', ''))
+        self.fw.ipset = linux_net.IpsetManager(execute)
+        instance_ref = self._create_instance_ref()
+        network_info = _fake_network_info(self, 1)
+        with mock.patch.object(self.fw.iptables, 'apply'):
+            self.fw.prepare_instance_filter(instance_ref, network_info)
+            execute.reset_mock()
+            self.fw.unfilter_instance(instance_ref, network_info)
+        execute.assert_called_once_with('ipset', 'destroy', 'nova-sg-2-v4',
+                                        run_as_root=True,
+                                        check_exit_code=[0, 1])
+        self.assertEqual({}, self.fw.ipset.sets)
+
+    @mock.patch.object(objects.InstanceList, "get_by_security_group_id")
+    @mock.patch.object(objects.SecurityGroupRuleList, "get_by_instance")
+    def test_performance_check_ipset_group_rules(self, mock_secrule,
+                                                 mock_instlist):
+        self._setup_group_members(mock_secrule, mock_instlist, 2000)
+        self.fw.ipset = linux_net.IpsetManager(
+            mock.Mock(return_value=('', '')))
+        instance_ref = self._create_instance_ref()
+        network_info = _fake_network_info(self, 1)
+
+        ipv4_rules, _ipv6_rules = self.fw.instance_rules(instance_ref,
+                                                         network_info)
+        # One rule per member without ipsets
+        expanded = len(ipv4_rules)
+        self.assertTrue(expanded > 2000)
+
+        self.flags(firewall_use_ipset=True)
+        ipv4_rules, _ipv6_rules = self.fw.instance_rules(instance_ref,
+                                                         network_info)
+        self.assertEqual(expanded - 1999, len(ipv4_rules))
+
+        # A refresh without any change of the members doesn't touch ipset
+        self.fw.ipset.execute.reset_mock()
+        start = time.time()
+        self.fw.instance_rules(instance_ref, network_info)
+        self.assertTrue(time.time() - start < 10)
+        self.assertFalse(self.fw.ipset.execute.called)
+
 
 @mock.patch.object(firewall, 'libvirt', fakelibvirt)
 class NWFilterTestCase(test.NoDBTestCase):
@@ -22,6 +22,7 @@ import mock
 import six
 
 from nova.compute import arch
+from nova.compute import power_state
 from nova import exception
 from nova import objects
 from nova import test
@@ -463,6 +464,105 @@ class HostTestCase(test.NoDBTestCase):
         self.assertEqual(doms[2].name(), vm3.name())
         self.assertEqual(doms[3].name(), vm4.name())
 
+    @mock.patch.object(libvirt_guest.Guest, "get_power_state")
+    @mock.patch.object(fakelibvirt.Connection, "listAllDomains")
+    def test_get_power_states_fast(self, mock_list_all, mock_get_state):
+        dom0 = FakeVirtDomain(id=0, name="Domain-0")
+        vm1 = FakeVirtDomain(id=3, name="instance00000001")
+        vm2 = FakeVirtDomain(id=17, name="instance00000002")
+        vm3 = FakeVirtDomain(name="instance00000003")
+        vm4 = FakeVirtDomain(id=21, name="instance00000004")
+        doms_by_flag = {
+            fakelibvirt.VIR_CONNECT_LIST_DOMAINS_RUNNING: [dom0, vm1],
+            fakelibvirt.VIR_CONNECT_LIST_DOMAINS_PAUSED: [vm2],
+            fakelibvirt.VIR_CONNECT_LIST_DOMAINS_SHUTOFF: [vm3],
+            fakelibvirt.VIR_CONNECT_LIST_DOMAINS_OTHER: [vm4],
+        }
+        mock_list_all.side_effect = doms_by_flag.get
+        mock_get_state.return_value = power_state.CRASHED
+
+        states = self.host.get_power_states()
+
+        self.assertEqual({vm1.UUIDString(): power_state.RUNNING,
+                          vm2.UUIDString(): power_state.PAUSED,
+                          vm3.UUIDString(): power_state.SHUTDOWN,
+                          vm4.UUIDString(): power_state.CRASHED}, states)
+        self.assertEqual(4, mock_list_all.call_count)
+        # Only the domain in another state is queried
+        mock_get_state.assert_called_once_with(self.host)
+
+    @mock.patch.object(host.Host, "list_guests")
+    @mock.patch.object(fakelibvirt.Connection, "listAllDomains")
+    def test_get_power_states_slow(self, mock_list_all, mock_list_guests):
+        mock_list_all.side_effect = AttributeError()
+        guest1 = mock.Mock(spec=libvirt_guest.Guest, uuid='uuid1')
+        guest1.get_power_state.return_value = power_state.RUNNING
+        guest2 = mock.Mock(spec=libvirt_guest.Guest, uuid='uuid2')
+        guest2.get_power_state.return_value = power_state.SHUTDOWN
+        mock_list_guests.return_value = [guest1, guest2]
+
+        states = self.host.get_power_states()
+
+        self.assertEqual({'uuid1': power_state.RUNNING,
+                          'uuid2': power_state.SHUTDOWN}, states)
+        mock_list_guests.assert_called_once_with(only_running=False)
+        guest1.get_power_state.assert_called_once_with(self.host)
+        self.assertTrue(self.host._skip_list_all_domains)
+
+    @mock.patch.object(libvirt_guest.Guest, "_get_domain_info")
+    @mock.patch.object(fakelibvirt.Connection, "getAllDomainStats")
+    def test_get_guests_stats_fast(self, mock_stats, mock_info):
+        dom0 = FakeVirtDomain(id=0, name="Domain-0")
+        vm1 = FakeVirtDomain(id=3, name="instance00000001")
+        vm2 = FakeVirtDomain(id=17, name="instance00000002")
+        mock_stats.return_value = [
+            (dom0, {'vcpu.current': 4, 'balloon.current': 4096}),
+            (vm1, {'vcpu.current': 2, 'balloon.current': 2048}),
+            (vm2, {'vcpu.current': 1})]
+        mock_info.return_value = [1, 1024, 512, 1, 0]
+
+        stats = self.host.get_guests_stats()
+
+        mock_stats.assert_called_once_with(
+            fakelibvirt.VIR_DOMAIN_STATS_VCPU |
+            fakelibvirt.VIR_DOMAIN_STATS_BALLOON,
+            fakelibvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+        self.assertEqual([dom0, vm1, vm2],
+                         [guest_stats.guest._domain for guest_stats in stats])
+        self.assertEqual([(4, 4096), (2, 2048), (1, 512)],
+                         [(guest_stats.vcpus, guest_stats.memory)
+                          for guest_stats in stats])
+        # Only the domain whose memory isn't reported is queried
+        mock_info.assert_called_once_with(self.host)
+
+    @mock.patch.object(host.Host, "list_guests")
+    @mock.patch.object(fakelibvirt.Connection, "getAllDomainStats")
+    def test_get_guests_stats_slow(self, mock_stats, mock_list_guests):
+        mock_stats.side_effect = AttributeError()
+        guest1 = mock.Mock(spec=libvirt_guest.Guest, uuid='uuid1')
+        guest1._get_domain_info.return_value = [1, 2048, 1024, 2, 0]
+        guest2 = mock.Mock(spec=libvirt_guest.Guest, uuid='uuid2')
+        guest2._get_domain_info.side_effect = fakelibvirt.libvirtError(
+            'fake-error')
+        mock_list_guests.return_value = [guest1, guest2]
+
+        stats = self.host.get_guests_stats()
+
+        self.assertEqual([(guest1, 2, 1024), (guest2, None, None)],
+                         [(guest_stats.guest, guest_stats.vcpus,
+                           guest_stats.memory) for guest_stats in stats])
+        mock_list_guests.assert_called_once_with(only_guests=False)
+        self.assertTrue(self.host._skip_all_domain_stats)
+
+    def test_guest_stats_get_xml_desc(self):
+        guest = mock.Mock(spec=libvirt_guest.Guest)
+        guest.get_xml_desc.return_value = '<domain/>'
+        guest_stats = host.GuestStats(guest, 1, 512)
+
+        self.assertEqual('<domain/>', guest_stats.get_xml_desc())
+        self.assertEqual('<domain/>', guest_stats.get_xml_desc())
+        guest.get_xml_desc.assert_called_once_with()
+
     @mock.patch.object(fakelibvirt.Connection, "numOfDomains")
     @mock.patch.object(fakelibvirt.Connection, "listDefinedDomains")
     @mock.patch.object(fakelibvirt.Connection, "listDomainsID")
@@ -864,6 +964,36 @@ Active:          8381604 kB
             self.assertEqual(8657, self.host.get_memory_mb_used())
             mock_list.assert_called_with(only_guests=False)
 
+    def test_get_memory_used_xen_guests_stats(self):
+        self.flags(virt_type='xen', group='libvirt')
+        m = mock.mock_open(read_data="""
+MemTotal:       16194180 kB
+MemFree:          233092 kB
+MemAvailable:    8892356 kB
+Buffers:          567708 kB
+Cached:          8362404 kB
+SwapCached:            0 kB
+Active:          8381604 kB
+""")
+        guests_stats = [
+            host.GuestStats(libvirt_guest.Guest(FakeVirtDomain(id=0)),
+                            4, 15814 * 1024),
+            host.GuestStats(libvirt_guest.Guest(FakeVirtDomain(id=1)),
+                            1, 750 * 1024),
+            host.GuestStats(libvirt_guest.Guest(FakeVirtDomain(id=2)),
+                            1, 1042 * 1024),
+            # The domain disappeared while collecting its stats
+            host.GuestStats(libvirt_guest.Guest(FakeVirtDomain(id=3)))]
+
+        with test.nested(
+                mock.patch.object(six.moves.builtins, "open", m, create=True),
+                mock.patch.object(host.Host, "list_guests"),
+                mock.patch('sys.platform', 'linux2'),
+                ) as (mock_file, mock_list, mock_platform):
+            self.assertEqual(8657,
+                             self.host.get_memory_mb_used(guests_stats))
+            self.assertFalse(mock_list.called)
+
     def test_get_cpu_stats(self):
         stats = self.host.get_cpu_stats()
         self.assertEqual(
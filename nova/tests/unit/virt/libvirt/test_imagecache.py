@@ -1003,3 +1003,120 @@ class VerifyChecksumTestCase(test.NoDBTestCase):
             # Checksum requests for a file with no checksum now have the
             # side effect of creating the checksum
             self.assertTrue(os.path.exists(info_fname))
+
+    def test_hash_file(self):
+        self.stub_out('nova.virt.libvirt.imagecache.HASH_CHUNK_SIZE', 7)
+        with utils.tempdir() as tmpdir:
+            fname, info_fname, testdata = self._make_checksum(tmpdir)
+            self.assertEqual(hashlib.sha1(testdata).hexdigest(),
+                             imagecache._hash_file(fname))
+
+    def test_verify_checksum_skip_unchanged(self):
+        self.flags(checksum_skip_unchanged=True, checksum_interval_seconds=0,
+                   group='libvirt')
+        with utils.tempdir() as tmpdir:
+            image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertTrue(res)
+            self.assertEqual(1, image_cache_manager.hashed_files)
+            self.assertEqual(os.path.getsize(fname),
+                             image_cache_manager.hashed_bytes)
+            self.assertEqual(imagecache._stat_key(fname),
+                             imagecache.read_stored_info(fname,
+                                                         field='sha1-stat'))
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertTrue(res)
+            self.assertEqual(0, image_cache_manager.hashed_files)
+            self.assertEqual(set([fname]),
+                             image_cache_manager.unchanged_base_files)
+
+            # The file is hashed again once it changed
+            with open(fname, 'a') as f:
+                f.write('banana')
+            image_cache_manager = imagecache.ImageCacheManager()
+            res = image_cache_manager._verify_checksum(self.img, fname)
+            self.assertFalse(res)
+            self.assertEqual(1, image_cache_manager.hashed_files)
+
+    def test_verify_checksum_file_missing_skip_unchanged(self):
+        self.flags(checksum_skip_unchanged=True, group='libvirt')
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(image_info_filename_pattern=('$instances_path/'
+                                                    '%(image)s.info'),
+                       group='libvirt')
+            fname, info_fname, testdata = self._make_checksum(tmpdir)
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            res = image_cache_manager._verify_checksum('aaa', fname)
+            self.assertIsNone(res)
+            self.assertEqual(hashlib.sha1(testdata).hexdigest(),
+                             imagecache.read_stored_checksum(
+                                 fname, timestamped=False))
+            self.assertEqual(imagecache._stat_key(fname),
+                             imagecache.read_stored_info(fname,
+                                                         field='sha1-stat'))
+
+    def test_verify_checksums(self):
+        self.flags(checksum_pool_size=2, checksum_interval_seconds=0,
+                   group='libvirt')
+        with utils.tempdir() as tmpdir:
+            image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            fname2 = os.path.join(tmpdir, 'bbb')
+            with open(fname2, 'w') as f:
+                f.write('banana')
+            imagecache.write_stored_info(fname2, field='sha1',
+                                         value='21323454')
+
+            image_cache_manager._verify_checksums(
+                [('42', fname), ('43', fname2), ('44', None),
+                 ('45', os.path.join(tmpdir, 'missing'))])
+
+            self.assertEqual({fname: True, fname2: False},
+                             image_cache_manager.checksum_results)
+            self.assertEqual(2, image_cache_manager.hashed_files)
+            self.assertEqual(os.path.getsize(fname) + len('banana'),
+                             image_cache_manager.hashed_bytes)
+
+            # The results are used when handling the base images
+            with mock.patch.object(image_cache_manager,
+                                   '_verify_checksum') as mock_verify:
+                image_cache_manager._handle_base_image('43', fname2)
+            self.assertFalse(mock_verify.called)
+            self.assertEqual([fname2],
+                             image_cache_manager.corrupt_base_files)
+
+    def test_verify_checksums_disabled(self):
+        self.flags(checksum_base_images=False, group='libvirt')
+        image_cache_manager = imagecache.ImageCacheManager()
+        with mock.patch.object(image_cache_manager,
+                               '_verify_checksum') as mock_verify:
+            image_cache_manager._verify_checksums([('42', '/fake/aaa')])
+        self.assertFalse(mock_verify.called)
+        self.assertEqual({}, image_cache_manager.checksum_results)
+
+    @mock.patch.object(libvirt_utils, 'update_mtime')
+    def test_handle_base_image_unchanged_touched(self, mock_mtime):
+        self.flags(checksum_skip_unchanged=True, checksum_interval_seconds=0,
+                   group='libvirt')
+        with utils.tempdir() as tmpdir:
+            image_cache_manager, fname = self._check_body(tmpdir, "csum valid")
+            image_cache_manager._verify_checksum(self.img, fname)
+
+            def fake_update_mtime(path):
+                os.utime(path, (0, 0))
+
+            mock_mtime.side_effect = fake_update_mtime
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.used_images = {'42': (1, 0, ['banana-42'])}
+            image_cache_manager._handle_base_image('42', fname)
+
+            mock_mtime.assert_called_once_with(fname)
+            # The stored stat follows the new mtime of the file, so that it
+            # is still not hashed again
+            self.assertEqual(imagecache._stat_key(fname),
+                             imagecache.read_stored_info(fname,
+                                                         field='sha1-stat'))
+            self.assertEqual(0, image_cache_manager.hashed_files)
@@ -13,6 +13,7 @@
 # under the License.
 
 import collections
+import time
 import uuid
 
 import mock
@@ -1567,6 +1568,113 @@ class VirtNUMAHostTopologyTestCase(test.NoDBTestCase):
                                                         pci_stats=pci_stats)
             self.assertIsNone(fitted_instance1)
 
+    def _get_host_cells(self, memory_usages, memory=2048):
+        return [objects.NUMACell(id=cell_id, cpuset=set([cell_id]),
+                                 memory=memory, cpu_usage=0,
+                                 memory_usage=memory_usage, mempages=[],
+                                 siblings=[], pinned_cpus=set([]))
+                for cell_id, memory_usage in enumerate(memory_usages)]
+
+    def _test_get_fitting_policy(self, policy, expected_ids):
+        self.flags(numa_cell_fit_policy=policy)
+        host = objects.NUMATopology(
+            cells=self._get_host_cells([0, 1024, 512, 0]))
+        instance = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([0]),
+                                            memory=512),
+                   objects.InstanceNUMACell(id=1, cpuset=set([1]),
+                                            memory=512)])
+        fitted_instance = hw.numa_fit_instance_to_host(host, instance)
+        self.assertEqual(expected_ids,
+                         [cell.id for cell in fitted_instance.cells])
+
+    def test_get_fitting_host_order(self):
+        self._test_get_fitting_policy(None, [0, 1])
+
+    def test_get_fitting_pack(self):
+        self._test_get_fitting_policy(hw.NUMA_FIT_PACK, [1, 2])
+
+    def test_get_fitting_spread(self):
+        self._test_get_fitting_policy(hw.NUMA_FIT_SPREAD, [0, 3])
+
+    def test_get_fitting_does_not_modify_instance(self):
+        fitted_instance = hw.numa_fit_instance_to_host(
+                self.host, self.instance3, self.limits)
+        self.assertEqual(1, fitted_instance.cells[0].id)
+        self.assertEqual(0, self.instance3.cells[0].id)
+
+    @mock.patch.object(hw, '_numa_fit_instance_cell',
+                       wraps=hw._numa_fit_instance_cell)
+    def test_get_fitting_checks_each_pairing_once(self, mock_fit):
+        host = objects.NUMATopology(cells=self._get_host_cells([0] * 8))
+        # The last instance cell does not fit on any host cell, which used to
+        # check all the 40320 permutations of the host cells
+        instance = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=cell_id, cpuset=set([cell_id]),
+                                            memory=memory)
+                   for cell_id, memory in enumerate([1024] * 7 + [4096])])
+        self.assertIsNone(hw.numa_fit_instance_to_host(host, instance))
+        self.assertTrue(mock_fit.call_count <= 8 * 8)
+
+    def test_performance_check_get_fitting_eight_cells(self):
+        host = objects.NUMATopology(
+            cells=self._get_host_cells([0] + [1024] * 7))
+        limits = objects.NUMATopologyLimits(
+            cpu_allocation_ratio=1, ram_allocation_ratio=1)
+        # Only the first host cell can hold the last instance cell, which is
+        # found after 5040 permutations when trying all of them in order
+        instance = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=cell_id, cpuset=set([cell_id]),
+                                            memory=memory)
+                   for cell_id, memory in enumerate([512] * 7 + [2048])])
+        start = time.time()
+        fitted_instance = hw.numa_fit_instance_to_host(host, instance, limits)
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual([1, 2, 3, 4, 5, 6, 7, 0],
+                         [cell.id for cell in fitted_instance.cells])
+
+    @mock.patch.object(hw, '_numa_fit_instance_cells',
+                       wraps=hw._numa_fit_instance_cells)
+    def test_get_fitting_cache(self, mock_fit):
+        fit_cache = {}
+        fitted_instance1 = hw.numa_fit_instance_to_host(
+                self.host, self.instance3, self.limits, fit_cache=fit_cache)
+        same_host = self.host.obj_clone()
+        fitted_instance2 = hw.numa_fit_instance_to_host(
+                same_host, self.instance3, self.limits, fit_cache=fit_cache)
+        self.assertEqual(1, mock_fit.call_count)
+        self.assertEqual(1, fitted_instance2.cells[0].id)
+        self.assertIsNot(fitted_instance1, fitted_instance2)
+
+        # A failure is cached as well
+        self.assertIsNone(hw.numa_fit_instance_to_host(
+                self.host, self.instance2, self.limits, fit_cache=fit_cache))
+        self.assertIsNone(hw.numa_fit_instance_to_host(
+                same_host, self.instance2, self.limits, fit_cache=fit_cache))
+        self.assertEqual(2, mock_fit.call_count)
+
+        # The free topology of the host changed
+        same_host = hw.numa_usage_from_instances(same_host,
+                                                 [fitted_instance2])
+        fitted_instance3 = hw.numa_fit_instance_to_host(
+                same_host, self.instance3, self.limits, fit_cache=fit_cache)
+        self.assertEqual(3, mock_fit.call_count)
+        self.assertEqual(2, fitted_instance3.cells[0].id)
+
+    @mock.patch.object(stats.PciDeviceStats, 'support_requests',
+                       return_value=True)
+    def test_get_fitting_cache_pci(self, mock_support):
+        pci_reqs = [objects.InstancePCIRequest(count=1,
+                                               spec=[{'vendor_id': '8086'}])]
+        fit_cache = {}
+        for i in range(2):
+            self.assertIsNotNone(hw.numa_fit_instance_to_host(
+                self.host, self.instance3, self.limits,
+                pci_requests=pci_reqs, pci_stats=stats.PciDeviceStats(),
+                fit_cache=fit_cache))
+        self.assertEqual(2, mock_support.call_count)
+        self.assertEqual({}, fit_cache)
+
 
 class NumberOfSerialPortsTest(test.NoDBTestCase):
     def test_flavor(self):
@@ -1766,6 +1874,66 @@ class HelperMethodsTestCase(test.NoDBTestCase):
                                  getattr(actual_cell, k))
 
 
+class NUMATopologyCacheTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(NUMATopologyCacheTestCase, self).setUp()
+        hw._NUMA_TOPOLOGY_CACHE.clear()
+        self.addCleanup(hw._NUMA_TOPOLOGY_CACHE.clear)
+        self.hosttopo = objects.NUMATopology(cells=[
+            objects.NUMACell(id=0, cpuset=set([0, 1]), memory=512,
+                             memory_usage=0, cpu_usage=0, mempages=[],
+                             siblings=[], pinned_cpus=set([]))])
+
+    @mock.patch.object(objects.NUMATopology, 'obj_from_db_obj',
+                       wraps=objects.NUMATopology.obj_from_db_obj)
+    def test_numa_topology_from_json(self, mock_decode):
+        json_text = self.hosttopo._to_json()
+        topology = hw.numa_topology_from_json(json_text)
+        self.assertEqual(self.hosttopo.cells, topology.cells)
+        self.assertIs(topology, hw.numa_topology_from_json(json_text))
+        mock_decode.assert_called_once_with(json_text)
+
+    @mock.patch.object(objects.NUMATopology, 'obj_from_db_obj',
+                       wraps=objects.NUMATopology.obj_from_db_obj)
+    def test_numa_topology_to_json(self, mock_decode):
+        json_text = hw.numa_topology_to_json(self.hosttopo)
+        self.assertEqual(self.hosttopo._to_json(), json_text)
+        self.assertIs(self.hosttopo, hw.numa_topology_from_json(json_text))
+        self.assertFalse(mock_decode.called)
+
+    @mock.patch.object(hw, 'NUMA_TOPOLOGY_CACHE_SIZE', 2)
+    def test_numa_topology_cache_lru(self):
+        json_texts = []
+        for cpu_usage in range(3):
+            self.hosttopo.cells[0].cpu_usage = cpu_usage
+            json_texts.append(self.hosttopo._to_json())
+        topology0 = hw.numa_topology_from_json(json_texts[0])
+        hw.numa_topology_from_json(json_texts[1])
+        # Using the first entry makes the second one the least recently used
+        self.assertIs(topology0, hw.numa_topology_from_json(json_texts[0]))
+        hw.numa_topology_from_json(json_texts[2])
+        self.assertEqual([json_texts[0], json_texts[2]],
+                         list(hw._NUMA_TOPOLOGY_CACHE))
+
+    def test_get_host_numa_usage_from_instance_cached(self):
+        instancetopo = objects.InstanceNUMATopology(
+            instance_uuid='fake-uuid',
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([0]),
+                                            memory=256)])
+        host = {'numa_topology': self.hosttopo._to_json()}
+        instance = {'numa_topology': instancetopo}
+        for cpu_usage in (1, 2):
+            host['numa_topology'] = hw.get_host_numa_usage_from_instance(
+                host, instance)
+            topology, was_json = hw.host_topology_and_format_from_host(host)
+            self.assertTrue(was_json)
+            self.assertIs(
+                hw._NUMA_TOPOLOGY_CACHE[host['numa_topology']], topology)
+            self.assertEqual(cpu_usage, topology.cells[0].cpu_usage)
+            self.assertEqual(256 * cpu_usage,
+                             topology.cells[0].memory_usage)
+
+
 class VirtMemoryPagesTestCase(test.NoDBTestCase):
     def test_cell_instance_pagesize(self):
         cell = objects.InstanceNUMACell(
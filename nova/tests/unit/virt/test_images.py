@@ -12,10 +12,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import os
+import struct
+import time
 
+import fixtures
 import mock
 from oslo_concurrency import processutils
+from oslo_utils import units
 
 from nova import exception
 from nova import test
@@ -66,3 +71,122 @@ class QemuTestCase(test.NoDBTestCase):
                                'Image href123 is unacceptable.*',
                                images.fetch_to_raw,
                                None, 'href123', '/no/path', None, None)
+
+
+class ImageHeaderTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ImageHeaderTestCase, self).setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.virt.images._header_cache', collections.OrderedDict()))
+
+    def _write_qcow2(self, name, virtual_size, backing_file=None, version=3,
+                     magic=b'QFI\xfb'):
+        path = os.path.join(self.tmpdir, name)
+        backing_file_offset = backing_file_size = 0
+        if backing_file:
+            backing_file = backing_file.encode('utf-8')
+            backing_file_offset = 104
+            backing_file_size = len(backing_file)
+        header = struct.pack('>4sIQIIQ', magic, version, backing_file_offset,
+                             backing_file_size, 16, virtual_size)
+        with open(path, 'wb') as f:
+            f.write(header.ljust(104, b'\0'))
+            if backing_file:
+                f.write(backing_file)
+        return path
+
+    def test_qcow2(self):
+        path = self._write_qcow2('disk', 20 * units.Gi)
+        info = images.get_image_header_info(path, 'qcow2')
+        self.assertEqual('qcow2', info.file_format)
+        self.assertEqual(20 * units.Gi, info.virtual_size)
+        self.assertIsNone(info.backing_file)
+        self.assertEqual(65536, info.cluster_size)
+
+    def test_qcow2_backing_file(self):
+        path = self._write_qcow2('disk', units.Gi, version=2,
+                                 backing_file='/base/0123abcd')
+        info = images.get_image_header_info(path, 'qcow2')
+        self.assertEqual(units.Gi, info.virtual_size)
+        self.assertEqual('/base/0123abcd', info.backing_file)
+
+    def test_raw(self):
+        path = os.path.join(self.tmpdir, 'disk')
+        with open(path, 'wb') as f:
+            f.truncate(units.Mi)
+        info = images.get_image_header_info(path, 'raw')
+        self.assertEqual('raw', info.file_format)
+        self.assertEqual(units.Mi, info.virtual_size)
+        self.assertIsNone(info.backing_file)
+
+    @mock.patch.object(images, 'qemu_img_info')
+    def test_unknown_header_falls_back_to_qemu_img(self, mock_info):
+        mock_info.return_value = mock.Mock(file_format='qcow2',
+                                           virtual_size='1024',
+                                           backing_file=None,
+                                           cluster_size=65536)
+        path = self._write_qcow2('disk', units.Gi, version=4)
+        info = images.get_image_header_info(path, 'qcow2')
+        mock_info.assert_called_once_with(path, 'qcow2')
+        self.assertEqual(1024, info.virtual_size)
+
+        path = self._write_qcow2('disk.local', units.Gi, magic=b'QFI\0')
+        images.get_image_header_info(path, 'qcow2')
+        mock_info.assert_called_with(path, 'qcow2')
+
+    def test_not_found(self):
+        self.assertRaises(OSError, images.get_image_header_info,
+                          os.path.join(self.tmpdir, 'missing'), 'qcow2')
+
+    def test_cache(self):
+        path = self._write_qcow2('disk', units.Gi)
+        st = os.stat(path)
+        info = images.get_image_header_info(path, 'qcow2')
+        with mock.patch.object(images, '_read_image_header') as mock_read:
+            self.assertIs(info, images.get_image_header_info(path, 'qcow2'))
+            self.assertFalse(mock_read.called)
+
+        # The image is resized
+        self._write_qcow2('disk', 2 * units.Gi)
+        os.utime(path, (st.st_atime, st.st_mtime + 1))
+        self.assertEqual(2 * units.Gi,
+                         images.get_image_header_info(path,
+                                                      'qcow2').virtual_size)
+
+        # The image is replaced by another file
+        self._write_qcow2('disk.new', 3 * units.Gi)
+        os.rename(os.path.join(self.tmpdir, 'disk.new'), path)
+        os.utime(path, (st.st_atime, st.st_mtime + 1))
+        self.assertEqual(3 * units.Gi,
+                         images.get_image_header_info(path,
+                                                      'qcow2').virtual_size)
+
+    def test_cache_size(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.virt.images._HEADER_CACHE_SIZE', 2))
+        paths = [self._write_qcow2('disk%d' % i, units.Gi) for i in range(3)]
+        for path in paths:
+            images.get_image_header_info(path, 'qcow2')
+        self.assertEqual(paths[1:], list(images._header_cache))
+
+    @mock.patch.object(utils, 'execute')
+    def test_performance_check_get_image_header_info(self, mock_execute):
+        # A host running 200 guests with 3 disks each
+        paths = [self._write_qcow2('disk%d' % i, units.Gi,
+                                   backing_file='/base/0123abcd')
+                 for i in range(600)]
+
+        start = time.time()
+        for path in paths:
+            images.get_image_header_info(path, 'qcow2')
+        parse_time = time.time() - start
+
+        start = time.time()
+        for path in paths:
+            images.get_image_header_info(path, 'qcow2')
+        cached_time = time.time() - start
+
+        self.assertFalse(mock_execute.called)
+        self.assertLess(parse_time, 1)
+        self.assertLess(cached_time, 1)
@@ -26,6 +26,7 @@ from oslo_utils import timeutils
 import six
 
 from nova.compute import manager
+from nova.compute import power_state
 from nova.console import type as ctype
 from nova import context
 from nova import exception
@@ -288,6 +289,12 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
         num_instances = self.connection.get_num_instances()
         self.assertEqual(1, num_instances)
 
+    @catch_notimplementederror
+    def test_get_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        states = self.connection.get_power_states()
+        self.assertEqual(power_state.RUNNING, states[instance_ref['uuid']])
+
     @catch_notimplementederror
     def test_snapshot_not_running(self):
         instance_ref = test_utils.get_test_instance()
@@ -180,6 +180,18 @@ class ComputeDriver(object):
         """
         return len(self.list_instances())
 
+    def get_power_states(self):
+        """Return the power states of all the instances on the host.
+
+        Drivers able to get the power states of all their instances at once
+        should implement this, so that the compute manager doesn't call
+        get_info() for each instance when synchronizing the power states.
+
+        :returns: dict of nova.compute.power_state values keyed by instance
+                  UUID
+        """
+        raise NotImplementedError()
+
     def instance_exists(self, instance):
         """Checks existence of an instance on the host.
 
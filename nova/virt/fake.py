@@ -327,6 +327,9 @@ class FakeDriver(driver.ComputeDriver):
                                      num_cpu=2,
                                      cpu_time_ns=0)
 
+    def get_power_states(self):
+        return {uuid: i.state for uuid, i in self.instances.items()}
+
     def get_diagnostics(self, instance):
         return {'cpu0_time': 17300000000,
                 'memory': 524288,
@@ -107,9 +107,19 @@ class FirewallDriver(object):
 class IptablesFirewallDriver(FirewallDriver):
     """Driver which enforces security groups through iptables rules."""
 
+    # Whether the ipsets can be created where the iptables rules are applied
+    ipset_supported = True
+
     def __init__(self, **kwargs):
         self.iptables = linux_net.iptables_manager
+        self.ipset = linux_net.ipset_manager
         self.instance_info = {}
+        # Names of the ipsets matched by the rules of each instance, keyed
+        # by instance ID
+        self.instance_ipsets = {}
+        # Members of the security groups loaded during a refresh of the
+        # rules of all the instances, keyed by security group ID
+        self._security_group_members = None
 
         # Flags for DHCP request rule
         self.dhcp_create = False
@@ -132,11 +142,14 @@ class IptablesFirewallDriver(FirewallDriver):
 
     def filter_defer_apply_off(self):
         self.iptables.defer_apply_off()
+        self._destroy_unused_ipsets()
 
     def unfilter_instance(self, instance, network_info):
         if self.instance_info.pop(instance.id, None):
             self.remove_filters_for_instance(instance)
+            self.instance_ipsets.pop(instance.id, None)
             self.iptables.apply()
+            self._destroy_unused_ipsets()
         else:
             LOG.info(_LI('Attempted to unfilter instance which is not '
                          'filtered'), instance=instance)
@@ -288,6 +301,65 @@ class IptablesFirewallDriver(FirewallDriver):
                     '--dports', '%s:%s' % (rule.from_port,
                                            rule.to_port)]
 
+    def _use_ipset(self):
+        return CONF.firewall_use_ipset and self.ipset_supported
+
+    def _security_group_ipset_name(self, security_group_id, version):
+        return 'nova-sg-%s-v%d' % (security_group_id, version)
+
+    def _get_security_group_members(self, ctxt, security_group):
+        """Returns the network info of the instances of a security group."""
+        if self._security_group_members is not None:
+            members = self._security_group_members.get(security_group.id)
+            if members is not None:
+                return members
+
+        members = []
+        insts = objects.InstanceList.get_by_security_group(ctxt,
+                                                           security_group)
+        for inst in insts:
+            if inst.info_cache.deleted:
+                LOG.debug('ignoring deleted cache')
+                continue
+            members.append(
+                (inst, compute_utils.get_nw_info_for_instance(inst)))
+
+        if self._security_group_members is not None:
+            self._security_group_members[security_group.id] = members
+        return members
+
+    def _get_security_group_ips(self, ctxt, security_group, version):
+        ips = []
+        for inst, nw_info in self._get_security_group_members(
+                ctxt, security_group):
+            inst_ips = [ip['address'] for ip in nw_info.fixed_ips()
+                        if ip['version'] == version]
+            LOG.debug('ips: %r', inst_ips, instance=inst)
+            ips += inst_ips
+        return ips
+
+    def _update_security_group_ipset(self, ctxt, security_group, version):
+        """Updates the ipset of the members of a security group and returns
+        its name.
+        """
+        name = self._security_group_ipset_name(security_group.id, version)
+        ips = self._get_security_group_ips(ctxt, security_group, version)
+        family = 'inet6' if version == 6 else 'inet'
+        self.ipset.set_members(name, ips, family=family)
+        return name
+
+    def _destroy_unused_ipsets(self):
+        """Destroys the ipsets no iptables rule matches anymore."""
+        if self.iptables.iptables_apply_deferred:
+            # The rules matching them may not be removed yet
+            return
+        used = set()
+        for names in self.instance_ipsets.values():
+            used |= names
+        for name in set(self.ipset.sets) - used:
+            if name.startswith('nova-sg-'):
+                self.ipset.destroy_set(name)
+
     def instance_rules(self, instance, network_info):
         ctxt = context.get_admin_context()
         if isinstance(instance, dict):
@@ -317,6 +389,7 @@ class IptablesFirewallDriver(FirewallDriver):
 
         # then, security group chains and rules
         rules = objects.SecurityGroupRuleList.get_by_instance(ctxt, instance)
+        ipsets = set()
 
         for rule in rules:
             if not rule.cidr:
@@ -348,24 +421,23 @@ class IptablesFirewallDriver(FirewallDriver):
             if rule.cidr:
                 args += ['-s', str(rule.cidr)]
                 fw_rules += [' '.join(args)]
-            else:
-                if rule.grantee_group:
-                    insts = objects.InstanceList.get_by_security_group(
-                            ctxt, rule.grantee_group)
-                    for inst in insts:
-                        if inst.info_cache.deleted:
-                            LOG.debug('ignoring deleted cache')
-                            continue
-                        nw_info = compute_utils.get_nw_info_for_instance(
-                                inst)
-
-                        ips = [ip['address'] for ip in nw_info.fixed_ips()
-                               if ip['version'] == version]
-
-                        LOG.debug('ips: %r', ips, instance=inst)
-                        for ip in ips:
-                            subrule = args + ['-s %s' % ip]
-                            fw_rules += [' '.join(subrule)]
+            elif rule.grantee_group and self._use_ipset():
+                ipset_name = self._update_security_group_ipset(
+                    ctxt, rule.grantee_group, version)
+                ipsets.add(ipset_name)
+                args += ['-m set --match-set %s src' % ipset_name]
+                fw_rules += [' '.join(args)]
+            elif rule.grantee_group:
+                ips = self._get_security_group_ips(ctxt, rule.grantee_group,
+                                                   version)
+                for ip in ips:
+                    subrule = args + ['-s %s' % ip]
+                    fw_rules += [' '.join(subrule)]
+
+        if ipsets:
+            self.instance_ipsets[instance.id] = ipsets
+        else:
+            self.instance_ipsets.pop(instance.id, None)
 
         ipv4_rules += ['-j $sg-fallback']
         ipv6_rules += ['-j $sg-fallback']
@@ -380,10 +452,12 @@ class IptablesFirewallDriver(FirewallDriver):
     def refresh_security_group_rules(self, security_group):
         self.do_refresh_security_group_rules(security_group)
         self.iptables.apply()
+        self._destroy_unused_ipsets()
 
     def refresh_instance_security_rules(self, instance):
         self.do_refresh_instance_rules(instance)
         self.iptables.apply()
+        self._destroy_unused_ipsets()
 
     @utils.synchronized('iptables', external=True)
     def _inner_do_refresh_rules(self, instance, network_info, ipv4_rules,
@@ -401,17 +475,24 @@ class IptablesFirewallDriver(FirewallDriver):
 
     def do_refresh_security_group_rules(self, security_group):
         id_list = self.instance_info.keys()
-        for instance_id in id_list:
-            try:
-                instance, network_info = self.instance_info[instance_id]
-            except KeyError:
-                # NOTE(danms): instance cache must have been modified,
-                # ignore this deleted instance and move on
-                continue
-            ipv4_rules, ipv6_rules = self.instance_rules(instance,
-                                                         network_info)
-            self._inner_do_refresh_rules(instance, network_info, ipv4_rules,
-                                         ipv6_rules)
+        if self._use_ipset():
+            # Only load the members of each security group once for all the
+            # instances
+            self._security_group_members = {}
+        try:
+            for instance_id in id_list:
+                try:
+                    instance, network_info = self.instance_info[instance_id]
+                except KeyError:
+                    # NOTE(danms): instance cache must have been modified,
+                    # ignore this deleted instance and move on
+                    continue
+                ipv4_rules, ipv6_rules = self.instance_rules(instance,
+                                                             network_info)
+                self._inner_do_refresh_rules(instance, network_info,
+                                             ipv4_rules, ipv6_rules)
+        finally:
+            self._security_group_members = None
 
     def do_refresh_instance_rules(self, instance):
         _instance, network_info = self.instance_info[instance.id]
@@ -14,6 +14,7 @@
 
 import collections
 import fractions
+import functools
 import itertools
 
 from oslo_log import log as logging
@@ -38,6 +39,17 @@ MEMPAGES_SMALL = -1
 MEMPAGES_LARGE = -2
 MEMPAGES_ANY = -3
 
+NUMA_FIT_PACK = 'pack'
+NUMA_FIT_SPREAD = 'spread'
+
+# Maximum number of decoded host NUMA topologies kept by
+# numa_topology_from_json()
+NUMA_TOPOLOGY_CACHE_SIZE = 1024
+
+# Decoded host NUMA topologies keyed by their JSON text, least recently used
+# first
+_NUMA_TOPOLOGY_CACHE = collections.OrderedDict()
+
 
 def get_vcpu_pin_set():
     """Parsing vcpu_pin_set config.
@@ -1192,9 +1204,110 @@ def numa_get_constraints(flavor, image_meta):
     return _add_cpu_pinning_constraint(flavor, image_meta, numa_topology)
 
 
+def _numa_fit_key_value(value):
+    if hasattr(value, 'obj_attr_is_set'):
+        return _numa_fit_key(value)
+    elif isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    elif isinstance(value, (list, tuple)):
+        return tuple(_numa_fit_key_value(item) for item in value)
+    return value
+
+
+def _numa_fit_key(obj):
+    """Returns a hashable key made of the fields set on a NUMA object."""
+    return tuple((name, _numa_fit_key_value(getattr(obj, name)))
+                 for name in sorted(obj.fields) if obj.obj_attr_is_set(name))
+
+
+def _numa_cell_free_resources(host_cell):
+    memory_usage = (host_cell.memory_usage
+                    if host_cell.obj_attr_is_set('memory_usage') else 0)
+    cpu_usage = (host_cell.cpu_usage
+                 if host_cell.obj_attr_is_set('cpu_usage') else 0)
+    return host_cell.memory - memory_usage, len(host_cell.cpuset) - cpu_usage
+
+
+def _numa_order_host_cells(host_cells, policy):
+    """Returns the host cells in the order they should be tried in.
+
+    The host cells with the least free resources come first when packing,
+    the ones with the most free resources when spreading. Otherwise, and
+    between cells with the same free resources, the host order is kept.
+    """
+    if policy not in (NUMA_FIT_PACK, NUMA_FIT_SPREAD):
+        return list(host_cells)
+    return sorted(host_cells, key=_numa_cell_free_resources,
+                  reverse=(policy == NUMA_FIT_SPREAD))
+
+
+def _numa_fit_instance_cells(host_cells, instance_cells, limits=None,
+                             accept=None):
+    """Search for host cells to fit each of the instance cells onto.
+
+    :param host_cells: list of host cells, in the order to try them in
+    :param instance_cells: list of instance cells to fit
+    :param limits: objects.NUMATopologyLimits that defines limits
+    :param accept: optional callable checking a complete list of fitted
+                   instance cells, like the PCI requests do
+
+    This is a depth-first search of the same host cell permutations as
+    itertools.permutations(), returning the first accepted one, but each
+    host cell/instance cell pairing is only checked once and a permutation
+    is abandoned as soon as one of its pairings fails. Without an accept
+    callable, whether the remaining instance cells fit only depends on the
+    host cells already used, so the sets of used host cells which led to a
+    dead end are remembered as well.
+
+    :returns: list of fitted instance cells or None
+    """
+    fits = {}
+    dead_ends = set()
+
+    def _fit(host_index, instance_index):
+        key = (host_index, instance_index)
+        if key not in fits:
+            # NOTE: _numa_fit_instance_cell() sets the ID of the instance
+            # cell it is given, fit a copy for each of the host cells
+            instance_cell = instance_cells[instance_index].obj_clone()
+            try:
+                fits[key] = _numa_fit_instance_cell(
+                    host_cells[host_index], instance_cell, limits)
+            except exception.MemoryPageSizeNotSupported:
+                # This exception will been raised if instance cell's
+                # custom pagesize is not supported with host cell in
+                # _numa_cell_supports_pagesize_request function.
+                fits[key] = None
+        return fits[key]
+
+    def _search(used, cells):
+        instance_index = len(cells)
+        if instance_index == len(instance_cells):
+            return accept is None or accept(cells)
+        if used in dead_ends:
+            return False
+        for host_index in range(len(host_cells)):
+            if host_index in used:
+                continue
+            got_cell = _fit(host_index, instance_index)
+            if got_cell is None:
+                continue
+            cells.append(got_cell)
+            if _search(used | frozenset([host_index]), cells):
+                return True
+            cells.pop()
+        if accept is None:
+            dead_ends.add(used)
+        return False
+
+    cells = []
+    if _search(frozenset(), cells):
+        return cells
+
+
 def numa_fit_instance_to_host(
         host_topology, instance_topology, limits=None,
-        pci_requests=None, pci_stats=None):
+        pci_requests=None, pci_stats=None, fit_cache=None):
     """Fit the instance topology onto the host topology given the limits
 
     :param host_topology: objects.NUMATopology object to fit an instance on
@@ -1202,12 +1315,17 @@ def numa_fit_instance_to_host(
     :param limits: objects.NUMATopologyLimits that defines limits
     :param pci_requests: instance pci_requests
     :param pci_stats: pci_stats for the host
+    :param fit_cache: optional dict in which the results are cached, so that
+                      fitting an instance onto several hosts with the same
+                      free NUMA topology, like during a scheduling request,
+                      only searches the host cells once
 
     Given a host and instance topology and optionally limits - this method
     will attempt to fit instance cells onto all permutations of host cells
     by calling the _numa_fit_instance_cell method, and return a new
     InstanceNUMATopology with it's cell ids set to host cell id's of
-    the first successful permutation, or None.
+    the first successful permutation, or None. The host cells are tried in
+    the order defined by the numa_cell_fit_policy option.
     """
     if not (host_topology and instance_topology):
         LOG.debug("Require both a host and instance NUMA topology to "
@@ -1220,32 +1338,33 @@ def numa_fit_instance_to_host(
                   {'required': len(instance_topology),
                    'actual': len(host_topology)})
         return
-    else:
-        # TODO(ndipanov): We may want to sort permutations differently
-        # depending on whether we want packing/spreading over NUMA nodes
-        for host_cell_perm in itertools.permutations(
-                host_topology.cells, len(instance_topology)):
-            cells = []
-            for host_cell, instance_cell in zip(
-                    host_cell_perm, instance_topology.cells):
-                try:
-                    got_cell = _numa_fit_instance_cell(
-                        host_cell, instance_cell, limits)
-                except exception.MemoryPageSizeNotSupported:
-                    # This exception will been raised if instance cell's
-                    # custom pagesize is not supported with host cell in
-                    # _numa_cell_supports_pagesize_request function.
-                    break
-                if got_cell is None:
-                    break
-                cells.append(got_cell)
-            if len(cells) == len(host_cell_perm):
-                if not pci_requests:
-                    return objects.InstanceNUMATopology(cells=cells)
-                elif ((pci_stats is not None) and
-                    pci_stats.support_requests(pci_requests,
-                                                     cells)):
-                    return objects.InstanceNUMATopology(cells=cells)
+
+    policy = CONF.numa_cell_fit_policy
+    cache_key = None
+    # NOTE: whether the PCI requests can be satisfied depends on the devices
+    # of each host, which are not part of the key
+    if fit_cache is not None and not pci_requests:
+        cache_key = (_numa_fit_key(host_topology),
+                     _numa_fit_key(instance_topology),
+                     _numa_fit_key(limits) if limits else None,
+                     policy)
+        if cache_key in fit_cache:
+            fitted = fit_cache[cache_key]
+            return fitted.obj_clone() if fitted else None
+
+    accept = None
+    if pci_requests:
+        if pci_stats is None:
+            return
+        accept = functools.partial(pci_stats.support_requests, pci_requests)
+
+    cells = _numa_fit_instance_cells(
+        _numa_order_host_cells(host_topology.cells, policy),
+        instance_topology.cells, limits, accept)
+    fitted = objects.InstanceNUMATopology(cells=cells) if cells else None
+    if cache_key is not None:
+        fit_cache[cache_key] = fitted.obj_clone() if fitted else None
+    return fitted
 
 
 def _numa_pagesize_usage_from_cell(hostcell, instancecell, sign):
@@ -1389,6 +1508,50 @@ def instance_topology_from_instance(instance):
     return instance_numa_topology
 
 
+def _numa_topology_cache_add(json_text, topology):
+    _NUMA_TOPOLOGY_CACHE[json_text] = topology
+    while len(_NUMA_TOPOLOGY_CACHE) > NUMA_TOPOLOGY_CACHE_SIZE:
+        _NUMA_TOPOLOGY_CACHE.popitem(last=False)
+
+
+def numa_topology_from_json(json_text):
+    """Decode the JSON format of a host NUMA topology
+
+    The compute nodes report the same topology over and over, and the
+    scheduler and the resource tracker decode it many times, so the decoded
+    topologies are cached by their JSON text.
+
+    :param json_text: host NUMA topology as stored in the ComputeNode record
+
+    :returns: an objects.NUMATopology which is shared with the other callers
+              and must not be modified, obj_clone() it first if needed
+    """
+    try:
+        # Entries are moved to the end when used, so that the least
+        # recently used ones are evicted first
+        topology = _NUMA_TOPOLOGY_CACHE.pop(json_text)
+    except KeyError:
+        topology = objects.NUMATopology.obj_from_db_obj(json_text)
+    _numa_topology_cache_add(json_text, topology)
+    return topology
+
+
+def numa_topology_to_json(topology):
+    """Encode a host NUMA topology to JSON
+
+    The topology is cached with its JSON text, so that decoding the text with
+    numa_topology_from_json() is free. The topology must not be modified
+    afterwards.
+
+    :param topology: objects.NUMATopology to encode
+
+    :returns: the JSON text of the topology
+    """
+    json_text = topology._to_json()
+    _numa_topology_cache_add(json_text, topology)
+    return json_text
+
+
 # TODO(ndipanov): Remove when all code paths are using objects
 def host_topology_and_format_from_host(host):
     """Convenience method for getting the numa_topology out of hosts
@@ -1410,8 +1573,7 @@ def host_topology_and_format_from_host(host):
             host_numa_topology, six.string_types):
         was_json = True
 
-        host_numa_topology = (objects.NUMATopology.obj_from_db_obj(
-            host_numa_topology))
+        host_numa_topology = numa_topology_from_json(host_numa_topology)
 
     return host_numa_topology, was_json
 
@@ -1451,6 +1613,7 @@ def get_host_numa_usage_from_instance(host, instance, free=False,
 
     if updated_numa_topology is not None:
         if jsonify_result and not never_serialize_result:
-            updated_numa_topology = updated_numa_topology._to_json()
+            updated_numa_topology = numa_topology_to_json(
+                updated_numa_topology)
 
     return updated_numa_topology
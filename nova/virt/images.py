@@ -19,10 +19,14 @@
 Handling of VM disk images.
 """
 
+import collections
 import os
+import stat
+import struct
 
 from oslo_concurrency import processutils
 from oslo_log import log as logging
+from oslo_utils import encodeutils
 from oslo_utils import fileutils
 from oslo_utils import imageutils
 
@@ -37,6 +41,17 @@ LOG = logging.getLogger(__name__)
 CONF = nova.conf.CONF
 IMAGE_API = image.API()
 
+# Start of the qcow2 header: magic, version, backing file offset, backing
+# file size, cluster bits and virtual size, all big-endian
+_QCOW2_HEADER = struct.Struct('>4sIQIIQ')
+_QCOW2_MAGIC = b'QFI\xfb'
+# Longest backing file name accepted by qemu
+_QCOW2_MAX_BACKING_FILE_SIZE = 1023
+
+# Maximum number of images whose header information is cached
+_HEADER_CACHE_SIZE = 4096
+_header_cache = collections.OrderedDict()
+
 
 def qemu_img_info(path, format=None):
     """Return an object containing the parsed output from qemu-img info."""
@@ -67,6 +82,94 @@ def qemu_img_info(path, format=None):
     return imageutils.QemuImgInfo(out)
 
 
+class ImageHeaderInfo(object):
+    """Format, virtual size and backing file of a disk image, as found in
+    its header.
+
+    The attributes have the same names as the ones of the QemuImgInfo
+    objects returned by qemu_img_info().
+    """
+
+    def __init__(self, file_format, virtual_size, backing_file=None,
+                 cluster_size=None):
+        self.file_format = file_format
+        self.virtual_size = virtual_size
+        self.backing_file = backing_file
+        self.cluster_size = cluster_size
+
+
+def _read_qcow2_header(path):
+    """Parse the header of a qcow2 image.
+
+    Returns None if the file doesn't look like a qcow2 image this parser
+    knows about, so that the caller can fall back to qemu-img.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_QCOW2_HEADER.size)
+        if len(header) < _QCOW2_HEADER.size:
+            return None
+        (magic, version, backing_file_offset, backing_file_size,
+         cluster_bits, virtual_size) = _QCOW2_HEADER.unpack(header)
+        if magic != _QCOW2_MAGIC or version not in (2, 3):
+            return None
+        backing_file = None
+        if backing_file_offset:
+            if backing_file_size > _QCOW2_MAX_BACKING_FILE_SIZE:
+                return None
+            f.seek(backing_file_offset)
+            backing_file = f.read(backing_file_size)
+            if len(backing_file) < backing_file_size:
+                return None
+            backing_file = encodeutils.safe_decode(backing_file)
+    return ImageHeaderInfo('qcow2', virtual_size, backing_file,
+                           1 << cluster_bits)
+
+
+def _read_image_header(path, format, st):
+    info = None
+    if format == 'raw' and stat.S_ISREG(st.st_mode):
+        info = ImageHeaderInfo('raw', st.st_size)
+    elif format == 'qcow2':
+        info = _read_qcow2_header(path)
+    if info is None:
+        data = qemu_img_info(path, format)
+        info = ImageHeaderInfo(data.file_format, int(data.virtual_size),
+                               data.backing_file, data.cluster_size)
+    return info
+
+
+def get_image_header_info(path, format):
+    """Return the virtual size and backing file of a disk image.
+
+    This is meant for the periodic tasks, which need this information for
+    every disk of the host. The header of the raw and qcow2 images is read
+    in-process instead of running qemu-img, which is only used for the other
+    formats. The results are cached until the inode or the modification
+    time of the image change, except for the block devices whose
+    modification time doesn't follow their content.
+
+    :param path: Path to the disk image
+    :param format: the on-disk format of path, which must be known since
+                   probing it from untrusted content is unsafe
+    :returns: an ImageHeaderInfo object
+    """
+    st = os.stat(path)
+    if stat.S_ISBLK(st.st_mode):
+        return _read_image_header(path, format, st)
+
+    stamp = (format, st.st_dev, st.st_ino,
+             getattr(st, 'st_mtime_ns', st.st_mtime))
+    cached = _header_cache.pop(path, None)
+    if cached is not None and cached[0] == stamp:
+        info = cached[1]
+    else:
+        info = _read_image_header(path, format, st)
+    _header_cache[path] = (stamp, info)
+    while len(_header_cache) > _HEADER_CACHE_SIZE:
+        _header_cache.popitem(last=False)
+    return info
+
+
 def convert_image(source, dest, in_format, out_format, run_as_root=False):
     """Convert image to other format."""
     if in_format is None:
@@ -4727,6 +4727,9 @@ class LibvirtDriver(driver.ComputeDriver):
         # workaround, see libvirt/compat.py
         return guest.get_info(self._host)
 
+    def get_power_states(self):
+        return self._host.get_power_states()
+
     def _create_domain_setup_lxc(self, instance, image_meta,
                                  block_device_info, disk_info):
         inst_path = libvirt_utils.get_instance_path(instance)
@@ -4989,9 +4992,12 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return info
 
-    def _get_vcpu_used(self):
+    def _get_vcpu_used(self, guests_stats=None):
         """Get vcpu usage number of physical computer.
 
+        :param guests_stats: optional list of host.GuestStats, as returned
+                             by Host.get_guests_stats(), to use instead of
+                             querying the domains
         :returns: The total number of vcpu(s) that are currently being used.
 
         """
@@ -5000,6 +5006,10 @@ class LibvirtDriver(driver.ComputeDriver):
         if CONF.libvirt.virt_type == 'lxc':
             return total + 1
 
+        if guests_stats is not None:
+            return sum(stats.vcpus or 0 for stats in guests_stats
+                       if stats.guest.id != 0)
+
         for guest in self._host.list_guests():
             try:
                 vcpus = guest.get_vcpus_info()
@@ -5340,6 +5350,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
         disk_info_dict = self._get_local_gb_info()
         data = {}
+        # NOTE: Collect the usage of all the domains at once, for the
+        # vCPU, memory and disk usage below
+        guests_stats = self._host.get_guests_stats()
 
         # NOTE(dprince): calling capabilities before getVersion works around
         # an initialization issue with some versions of Libvirt (1.0.5.5).
@@ -5350,8 +5363,8 @@ class LibvirtDriver(driver.ComputeDriver):
         data["vcpus"] = self._get_vcpu_total()
         data["memory_mb"] = self._host.get_memory_mb_total()
         data["local_gb"] = disk_info_dict['total']
-        data["vcpus_used"] = self._get_vcpu_used()
-        data["memory_mb_used"] = self._host.get_memory_mb_used()
+        data["vcpus_used"] = self._get_vcpu_used(guests_stats)
+        data["memory_mb_used"] = self._host.get_memory_mb_used(guests_stats)
         data["local_gb_used"] = disk_info_dict['used']
         data["hypervisor_type"] = self._host.get_driver_type()
         data["hypervisor_version"] = self._host.get_version()
@@ -5368,7 +5381,8 @@ class LibvirtDriver(driver.ComputeDriver):
         data["cpu_info"] = jsonutils.dumps(self._get_cpu_info())
 
         disk_free_gb = disk_info_dict['free']
-        disk_over_committed = self._get_disk_over_committed_size_total()
+        disk_over_committed = self._get_disk_over_committed_size_total(
+            guests_stats)
         available_least = disk_free_gb * units.Gi - disk_over_committed
         data['disk_available_least'] = available_least / units.Gi
 
@@ -6947,8 +6961,14 @@ class LibvirtDriver(driver.ComputeDriver):
 
             disk_type = driver_nodes[cnt].get('type')
             if disk_type == "qcow2":
-                backing_file = libvirt_utils.get_disk_backing_file(path)
-                virt_size = disk.get_disk_size(path)
+                # NOTE: This runs for every disk of the host on each
+                # update_available_resource(), so the image header is read
+                # in-process rather than with qemu-img info
+                header = images.get_image_header_info(path, disk_type)
+                backing_file = header.backing_file
+                if backing_file:
+                    backing_file = os.path.basename(backing_file)
+                virt_size = header.virtual_size
                 over_commit_size = int(virt_size) - dk_size
             else:
                 backing_file = ""
@@ -6983,16 +7003,26 @@ class LibvirtDriver(driver.ComputeDriver):
                 self._get_instance_disk_info(instance.name, xml,
                                              block_device_info))
 
-    def _get_disk_over_committed_size_total(self):
-        """Return total over committed disk size for all instances."""
+    def _get_disk_over_committed_size_total(self, guests_stats=None):
+        """Return total over committed disk size for all instances.
+
+        :param guests_stats: optional list of host.GuestStats, as returned
+                             by Host.get_guests_stats(), to use instead of
+                             listing the domains
+        """
         # Disk size that all instance uses : virtual_size - disk_size
         disk_over_committed_size = 0
-        instance_domains = self._host.list_instance_domains()
-        if not instance_domains:
+        if guests_stats is None:
+            guests_stats = [host.GuestStats(libvirt_guest.Guest(dom))
+                            for dom in self._host.list_instance_domains()]
+        else:
+            guests_stats = [stats for stats in guests_stats
+                            if stats.guest.id != 0]
+        if not guests_stats:
             return disk_over_committed_size
 
         # Get all instance uuids
-        instance_uuids = [dom.UUIDString() for dom in instance_domains]
+        instance_uuids = [stats.guest.uuid for stats in guests_stats]
         ctx = nova_context.get_admin_context()
         # Get instance object list by uuid filter
         filters = {'uuid': instance_uuids}
@@ -7013,10 +7043,10 @@ class LibvirtDriver(driver.ComputeDriver):
         bdms = objects.BlockDeviceMappingList.bdms_by_instance_uuid(
             ctx, instance_uuids)
 
-        for dom in instance_domains:
+        for stats in guests_stats:
+            guest = stats.guest
             try:
-                guest = libvirt_guest.Guest(dom)
-                xml = guest.get_xml_desc()
+                xml = stats.get_xml_desc()
 
                 block_device_info = None
                 if guest.uuid in local_instances:
@@ -76,6 +76,31 @@ HV_DRIVER_QEMU = "QEMU"
 HV_DRIVER_XEN = "Xen"
 
 
+class GuestStats(object):
+    """Resource usage of a running domain
+
+    Instances of this class are returned by Host.get_guests_stats(), which
+    collects them for all the domains at once, so that the consumers of
+    a same snapshot don't query libvirt for each domain again.
+    """
+
+    def __init__(self, guest, vcpus=None, memory=None):
+        self.guest = guest
+        # Number of vCPUs of the domain, None if unknown
+        self.vcpus = vcpus
+        # Current memory of the domain in KiB, None if unknown
+        self.memory = memory
+        self._xml = None
+
+    def get_xml_desc(self):
+        """Returns the XML description of the domain, fetched on the first
+        call only.
+        """
+        if self._xml is None:
+            self._xml = self.guest.get_xml_desc()
+        return self._xml
+
+
 class DomainJobInfo(object):
     """Information about libvirt background jobs
 
@@ -206,6 +231,7 @@ class Host(object):
         self._conn_event_handler = conn_event_handler
         self._lifecycle_event_handler = lifecycle_event_handler
         self._skip_list_all_domains = False
+        self._skip_all_domain_stats = False
         self._caps = None
         self._hostname = None
 
@@ -745,6 +771,99 @@ class Host(object):
 
         return doms
 
+    def get_power_states(self):
+        """Get the power states of the nova instances
+
+        Query libvirt for the domains in each state with one listAllDomains()
+        call per state, instead of looking up every domain and asking for
+        its state. Only the domains in one of the less common states
+        (crashed, suspended, ...) are queried one by one. Without the bulk
+        domain list APIs, the state of each domain is queried.
+
+        :returns: dict of nova.compute.power_state values keyed by UUID
+        """
+        if not self._skip_list_all_domains:
+            try:
+                return self._get_power_states_fast()
+            except (libvirt.libvirtError, AttributeError) as ex:
+                LOG.info(_LI("Unable to use bulk domain list APIs, "
+                             "falling back to slow code path: %(ex)s"),
+                         {'ex': ex})
+                self._skip_list_all_domains = True
+
+        return {guest.uuid: guest.get_power_state(self)
+                for guest in self.list_guests(only_running=False)}
+
+    def _get_power_states_fast(self):
+        conn = self.get_connection()
+        states = {}
+        for flag, state in (
+                (libvirt.VIR_CONNECT_LIST_DOMAINS_RUNNING,
+                 libvirt.VIR_DOMAIN_RUNNING),
+                (libvirt.VIR_CONNECT_LIST_DOMAINS_PAUSED,
+                 libvirt.VIR_DOMAIN_PAUSED),
+                (libvirt.VIR_CONNECT_LIST_DOMAINS_SHUTOFF,
+                 libvirt.VIR_DOMAIN_SHUTOFF)):
+            for dom in conn.listAllDomains(flag):
+                if dom.ID() != 0:
+                    states[dom.UUIDString()] = (
+                        libvirt_guest.LIBVIRT_POWER_STATE[state])
+        for dom in conn.listAllDomains(
+                libvirt.VIR_CONNECT_LIST_DOMAINS_OTHER):
+            if dom.ID() != 0:
+                guest = libvirt_guest.Guest(dom)
+                states[guest.uuid] = guest.get_power_state(self)
+        return states
+
+    def get_guests_stats(self):
+        """Get the resource usage of all the running domains
+
+        The domains and their vCPU and memory usage are retrieved with a
+        single getAllDomainStats() call (libvirt >= 1.2.8). Without this
+        API, the domains are listed and the information of each of them is
+        queried once. Host domains (eg Xen Domain-0) are included.
+
+        :returns: list of GuestStats objects
+        """
+        if not self._skip_all_domain_stats:
+            try:
+                return self._get_guests_stats_fast()
+            except (libvirt.libvirtError, AttributeError) as ex:
+                LOG.info(_LI("Unable to use bulk domain stats APIs, "
+                             "falling back to slow code path: %(ex)s"),
+                         {'ex': ex})
+                self._skip_all_domain_stats = True
+
+        return [self._get_guest_stats(guest)
+                for guest in self.list_guests(only_guests=False)]
+
+    def _get_guests_stats_fast(self):
+        conn = self.get_connection()
+        all_stats = conn.getAllDomainStats(
+            libvirt.VIR_DOMAIN_STATS_VCPU | libvirt.VIR_DOMAIN_STATS_BALLOON,
+            libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+        guests_stats = []
+        for dom, stats in all_stats:
+            guest = libvirt_guest.Guest(dom)
+            vcpus = stats.get('vcpu.current')
+            memory = stats.get('balloon.current')
+            if vcpus is None or memory is None:
+                # Not reported by every hypervisor driver
+                guests_stats.append(self._get_guest_stats(guest))
+            else:
+                guests_stats.append(GuestStats(guest, vcpus, memory))
+        return guests_stats
+
+    def _get_guest_stats(self, guest):
+        try:
+            info = guest._get_domain_info(self)
+        except libvirt.libvirtError as e:
+            LOG.warning(_LW("couldn't obtain the information of domain:"
+                            " %(uuid)s, exception: %(ex)s"),
+                        {"uuid": guest.uuid, "ex": e})
+            return GuestStats(guest)
+        return GuestStats(guest, vcpus=info[3], memory=info[2])
+
     def get_online_cpus(self):
         """Get the set of CPUs that are online on the host
 
@@ -921,9 +1040,24 @@ class Host(object):
         """
         return self._get_hardware_info()[1]
 
-    def get_memory_mb_used(self):
+    def _get_guests_memory(self):
+        for guest in self.list_guests(only_guests=False):
+            try:
+                # TODO(sahid): Use get_info...
+                dom_mem = int(guest._get_domain_info(self)[2])
+            except libvirt.libvirtError as e:
+                LOG.warning(_LW("couldn't obtain the memory from domain:"
+                                " %(uuid)s, exception: %(ex)s"),
+                            {"uuid": guest.uuid, "ex": e})
+                continue
+            yield guest, dom_mem
+
+    def get_memory_mb_used(self, guests_stats=None):
         """Get the used memory size(MB) of physical computer.
 
+        :param guests_stats: optional list of GuestStats, as returned by
+                             get_guests_stats(), to use instead of querying
+                             the domains
         :returns: the total usage of memory(MB).
         """
         if sys.platform.upper() not in ['LINUX2', 'LINUX3']:
@@ -936,15 +1070,15 @@ class Host(object):
         idx3 = m.index('Cached:')
         if CONF.libvirt.virt_type == 'xen':
             used = 0
-            for guest in self.list_guests(only_guests=False):
-                try:
-                    # TODO(sahid): Use get_info...
-                    dom_mem = int(guest._get_domain_info(self)[2])
-                except libvirt.libvirtError as e:
-                    LOG.warning(_LW("couldn't obtain the memory from domain:"
-                                    " %(uuid)s, exception: %(ex)s"),
-                                {"uuid": guest.uuid, "ex": e})
+            if guests_stats is not None:
+                guests_mem = [(stats.guest, stats.memory)
+                              for stats in guests_stats]
+            else:
+                guests_mem = self._get_guests_memory()
+            for guest, dom_mem in guests_mem:
+                if dom_mem is None:
                     continue
+                dom_mem = int(dom_mem)
                 # skip dom0
                 if guest.id != 0:
                     used += dom_mem
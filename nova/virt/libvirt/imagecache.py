@@ -25,12 +25,15 @@ import os
 import re
 import time
 
+import eventlet
+from eventlet import tpool
 from oslo_concurrency import lockutils
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import fileutils
+from oslo_utils import units
 
 import nova.conf
 from nova.i18n import _LE
@@ -66,12 +69,28 @@ imagecache_opts = [
     cfg.IntOpt('checksum_interval_seconds',
                default=3600,
                help='How frequently to checksum base images'),
+    cfg.IntOpt('checksum_pool_size',
+               default=1,
+               min=1,
+               help='Number of base images checksummed at the same time '
+                    'during an image cache manager pass. The files are '
+                    'hashed in native threads.'),
+    cfg.BoolOpt('checksum_skip_unchanged',
+                default=False,
+                help='Do not checksum again the base images whose size, '
+                     'modification time and inode did not change since '
+                     'their checksum was verified. This avoids reading '
+                     'unchanged base images over and over, but a corruption '
+                     'not changing those is no longer detected.'),
     ]
 
 CONF = nova.conf.CONF
 CONF.register_opts(imagecache_opts, 'libvirt')
 CONF.import_opt('instances_path', 'nova.compute.manager')
 
+# Size of the reads when hashing a base image
+HASH_CHUNK_SIZE = 4 * units.Mi
+
 
 def get_cache_fname(images, key):
     """Return a filename based on the SHA1 hash of a given image ID.
@@ -215,12 +234,25 @@ def write_stored_info(target, field=None, value=None):
 def _hash_file(filename):
     """Generate a hash for the contents of a file."""
     checksum = hashlib.sha1()
-    with open(filename) as f:
-        for chunk in iter(lambda: f.read(32768), b''):
-            checksum.update(chunk)
+    # Read the file in large chunks into the same buffer
+    buf = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(filename, 'rb') as f:
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            checksum.update(view[:size])
     return checksum.hexdigest()
 
 
+def _stat_key(filename):
+    """Return what identifies a version of a file without reading it."""
+    st = os.stat(filename)
+    # A list, to compare it with the JSON stored one
+    return [st.st_size, st.st_mtime, st.st_ino]
+
+
 def read_stored_checksum(target, timestamped=True):
     """Read the checksum.
 
@@ -256,6 +288,14 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         self.removable_base_files = []
         self.unexplained_images = []
 
+        # Checksum verification results keyed by base file, the base files
+        # which did not change since their checksum was verified, and the
+        # number of files and bytes hashed during the pass
+        self.checksum_results = {}
+        self.unchanged_base_files = set()
+        self.hashed_files = 0
+        self.hashed_bytes = 0
+
     def _store_image(self, base_dir, ent, original=False):
         """Store a base image for later examination."""
         entpath = os.path.join(base_dir, ent)
@@ -384,6 +424,14 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         def inner_verify_checksum():
             (stored_checksum, stored_timestamp) = read_stored_checksum(
                 base_file, timestamped=True)
+            stat = _stat_key(base_file)
+            if (stored_checksum and CONF.libvirt.checksum_skip_unchanged and
+                    stat == read_stored_info(base_file, field='sha1-stat')):
+                # NOTE: the file did not change since its checksum was
+                # verified, there is no need to read it again
+                self.unchanged_base_files.add(base_file)
+                return True
+
             if stored_checksum:
                 # NOTE(mikal): Checksums are timestamped. If we have recently
                 # checksummed (possibly on another compute node if we are using
@@ -399,7 +447,7 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                     write_stored_info(base_file, field='sha1',
                                       value=stored_checksum)
 
-                current_checksum = _hash_file(base_file)
+                current_checksum = self._hash_base_file(base_file)
 
                 if current_checksum != stored_checksum:
                     LOG.error(_LE('image %(id)s at (%(base_file)s): image '
@@ -409,6 +457,7 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                     return False
 
                 else:
+                    self._store_unchanged_stat(base_file, stat)
                     return True
 
             else:
@@ -425,12 +474,61 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                                  'checksum'),
                              {'id': img_id,
                               'base_file': base_file})
-                    write_stored_checksum(base_file)
+                    write_stored_info(base_file, field='sha1',
+                                      value=self._hash_base_file(base_file))
+                    self._store_unchanged_stat(base_file, stat)
 
                 return None
 
         return inner_verify_checksum()
 
+    def _hash_base_file(self, base_file):
+        """Hash a base image in a native thread, so that several base images
+        can be hashed at the same time.
+        """
+        checksum = tpool.execute(_hash_file, base_file)
+        self.hashed_files += 1
+        self.hashed_bytes += os.path.getsize(base_file)
+        return checksum
+
+    def _store_unchanged_stat(self, base_file, stat):
+        """Store the stat of a base image whose checksum was just verified or
+        written, so that it is not hashed again while it doesn't change.
+        """
+        if CONF.libvirt.checksum_skip_unchanged:
+            write_stored_info(base_file, field='sha1-stat', value=stat)
+            self.unchanged_base_files.add(base_file)
+
+    def _verify_checksums(self, images):
+        """Verify the checksums of a list of (image ID, base file) tuples.
+
+        The checksums are verified by a pool of checksum_pool_size green
+        threads, and the results are kept for _handle_base_image().
+        """
+        if not CONF.libvirt.checksum_base_images:
+            return
+
+        images = [(img_id, base_file) for img_id, base_file in images
+                  if (base_file and os.path.exists(base_file)
+                      and os.path.isfile(base_file))]
+        if not images:
+            return
+
+        start = time.time()
+        pool = eventlet.GreenPool(CONF.libvirt.checksum_pool_size)
+        img_ids = [img_id for img_id, base_file in images]
+        base_files = [base_file for img_id, base_file in images]
+        for base_file, result in zip(base_files, pool.imap(
+                self._verify_checksum, img_ids, base_files)):
+            self.checksum_results[base_file] = result
+        LOG.info(_LI('Verified the checksums of %(files)d base images in '
+                     '%(elapsed).2f seconds, hashing %(hashed_files)d of '
+                     'them (%(hashed_bytes)d bytes)'),
+                 {'files': len(images),
+                  'elapsed': time.time() - start,
+                  'hashed_files': self.hashed_files,
+                  'hashed_bytes': self.hashed_bytes})
+
     @staticmethod
     def _get_age_of_file(base_file):
         if not os.path.exists(base_file):
@@ -526,7 +624,10 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                 and os.path.isfile(base_file)):
             # _verify_checksum returns True if the checksum is ok, and None if
             # there is no checksum file
-            checksum_result = self._verify_checksum(img_id, base_file)
+            if base_file in self.checksum_results:
+                checksum_result = self.checksum_results[base_file]
+            else:
+                checksum_result = self._verify_checksum(img_id, base_file)
             if checksum_result is not None:
                 image_bad = not checksum_result
 
@@ -575,6 +676,11 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                            'base_file': base_file})
                 if os.path.exists(base_file):
                     libvirt_utils.update_mtime(base_file)
+                    if base_file in self.unchanged_base_files:
+                        # NOTE: touching the file changed its mtime, it is
+                        # still unchanged though
+                        write_stored_info(base_file, field='sha1-stat',
+                                          value=_stat_key(base_file))
 
     def _age_and_verify_swap_images(self, context, base_dir):
         LOG.debug('Verify swap images')
@@ -594,17 +700,23 @@ class ImageCacheManager(imagecache.ImageCacheManager):
     def _age_and_verify_cached_images(self, context, all_instances, base_dir):
         LOG.debug('Verify base images')
         # Determine what images are on disk because they're in use
+        base_images = []
         for img in self.used_images:
             fingerprint = hashlib.sha1(img).hexdigest()
             LOG.debug('Image id %(id)s yields fingerprint %(fingerprint)s',
                       {'id': img,
                        'fingerprint': fingerprint})
             for result in self._find_base_file(base_dir, fingerprint):
-                base_file, image_small, image_resized = result
-                self._handle_base_image(img, base_file)
+                base_images.append((img, result))
+
+        self._verify_checksums([(img, result[0])
+                                for img, result in base_images])
+        for img, result in base_images:
+            base_file, image_small, image_resized = result
+            self._handle_base_image(img, base_file)
 
-                if not image_small and not image_resized:
-                    self.originals.append(base_file)
+            if not image_small and not image_resized:
+                self.originals.append(base_file)
 
         # Elements remaining in unexplained_images might be in use
         inuse_backing_images = self._list_backing_images()
@@ -14,6 +14,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
+import time
 import urllib
 
 from eventlet import tpool
@@ -25,6 +27,7 @@ except ImportError:
     rados = None
     rbd = None
 
+from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_service import loopingcall
@@ -39,9 +42,109 @@ from nova.i18n import _LW
 from nova import utils
 from nova.virt.libvirt import utils as libvirt_utils
 
+rbd_opts = [
+    cfg.IntOpt('images_rbd_connection_pool_size',
+               default=0,
+               min=0,
+               help='Maximum number of idle RADOS connections kept open by '
+                    'each nova-compute process to be reused by the rbd '
+                    'image operations, instead of connecting to the Ceph '
+                    'monitors for each of them. Each connection holds a '
+                    'RADOS client and an I/O context on a pool. 0 disables '
+                    'the reuse of the connections.'),
+    cfg.IntOpt('images_rbd_connection_idle_timeout',
+               default=300,
+               min=1,
+               help='Number of seconds after which an idle pooled RADOS '
+                    'connection is shut down instead of being reused.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(rbd_opts, 'libvirt')
+
 LOG = logging.getLogger(__name__)
 
 
+class RADOSConnectionPool(object):
+    """Pool of the idle RADOS connections of a process.
+
+    The connections are (client, ioctx) tuples of a connected rados.Rados
+    client and of an ioctx opened on a pool, keyed by the (rados user,
+    ceph.conf, pool) they were opened with. At most
+    images_rbd_connection_pool_size idle connections are kept, the least
+    recently used ones being shut down first.
+
+    A connection is only handed out again if both its client and its ioctx
+    are still open and it was released less than
+    images_rbd_connection_idle_timeout seconds ago. The connections used by
+    a failed operation are shut down instead of being released to the pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # List of (key, client, ioctx, released_at) tuples, the least
+        # recently released first
+        self._idle = []
+
+    def __len__(self):
+        return len(self._idle)
+
+    @staticmethod
+    def _is_healthy(client, ioctx):
+        return (getattr(client, 'state', None) == 'connected' and
+                getattr(ioctx, 'state', None) == 'open')
+
+    @staticmethod
+    def _shutdown(client, ioctx):
+        # closing an ioctx cannot raise an exception
+        ioctx.close()
+        client.shutdown()
+
+    def get(self, key):
+        """Returns an idle (client, ioctx) connection for the key, or None.
+        """
+        connection = None
+        expires = time.time() - CONF.libvirt.images_rbd_connection_idle_timeout
+        with self._lock:
+            stale = [entry for entry in self._idle if entry[3] < expires]
+            self._idle = [entry for entry in self._idle
+                          if entry[3] >= expires]
+            # Reuse the most recently released connection first
+            for index in range(len(self._idle) - 1, -1, -1):
+                entry = self._idle[index]
+                if entry[0] != key:
+                    continue
+                del self._idle[index]
+                if self._is_healthy(entry[1], entry[2]):
+                    connection = (entry[1], entry[2])
+                    break
+                stale.append(entry)
+
+        for _key, client, ioctx, _released_at in stale:
+            self._shutdown(client, ioctx)
+        return connection
+
+    def put(self, key, client, ioctx):
+        """Releases a connection to the pool, or shuts it down if it can't be
+        reused.
+        """
+        evicted = []
+        pool_size = CONF.libvirt.images_rbd_connection_pool_size
+        with self._lock:
+            if pool_size and self._is_healthy(client, ioctx):
+                self._idle.append((key, client, ioctx, time.time()))
+            else:
+                evicted.append((key, client, ioctx, None))
+            while len(self._idle) > pool_size:
+                evicted.append(self._idle.pop(0))
+
+        for _key, client, ioctx, _released_at in evicted:
+            self._shutdown(client, ioctx)
+
+
+_connection_pool = RADOSConnectionPool()
+
+
 class RBDVolumeProxy(object):
     """Context manager for dealing with an existing rbd volume.
 
@@ -66,7 +169,7 @@ class RBDVolumeProxy(object):
         except rbd.Error:
             with excutils.save_and_reraise_exception():
                 LOG.exception(_LE("error opening rbd image %s"), name)
-                driver._disconnect_from_rados(client, ioctx)
+                driver._disconnect_from_rados(client, ioctx, reusable=False)
 
         self.driver = driver
         self.client = client
@@ -79,7 +182,11 @@ class RBDVolumeProxy(object):
         try:
             self.volume.close()
         finally:
-            self.driver._disconnect_from_rados(self.client, self.ioctx)
+            if type_ is None:
+                self.driver._disconnect_from_rados(self.client, self.ioctx)
+            else:
+                self.driver._disconnect_from_rados(self.client, self.ioctx,
+                                                   reusable=False)
 
     def __getattr__(self, attrib):
         return getattr(self.volume, attrib)
@@ -95,7 +202,11 @@ class RADOSClient(object):
         return self
 
     def __exit__(self, type_, value, traceback):
-        self.driver._disconnect_from_rados(self.cluster, self.ioctx)
+        if type_ is None:
+            self.driver._disconnect_from_rados(self.cluster, self.ioctx)
+        else:
+            self.driver._disconnect_from_rados(self.cluster, self.ioctx,
+                                               reusable=False)
 
     @property
     def features(self):
@@ -115,21 +226,38 @@ class RBDDriver(object):
         self.rbd_user = rbd_user.encode('utf8') if rbd_user else None
         if rbd is None:
             raise RuntimeError(_('rbd python libraries not found'))
+        # Pool keys of the connections taken from the connection pool or
+        # opened while pooling is enabled, keyed by ioctx
+        self._pooled_connections = {}
 
     def _connect_to_rados(self, pool=None):
+        pool_to_open = pool or self.pool
+        pool_size = CONF.libvirt.images_rbd_connection_pool_size
+        key = (self.rbd_user, self.ceph_conf, pool_to_open)
+        if pool_size:
+            connection = _connection_pool.get(key)
+            if connection is not None:
+                self._pooled_connections[connection[1]] = key
+                return connection
+
         client = rados.Rados(rados_id=self.rbd_user,
                                   conffile=self.ceph_conf)
         try:
             client.connect()
-            pool_to_open = pool or self.pool
             ioctx = client.open_ioctx(pool_to_open.encode('utf-8'))
-            return client, ioctx
         except rados.Error:
             # shutdown cannot raise an exception
             client.shutdown()
             raise
-
-    def _disconnect_from_rados(self, client, ioctx):
+        if pool_size:
+            self._pooled_connections[ioctx] = key
+        return client, ioctx
+
+    def _disconnect_from_rados(self, client, ioctx, reusable=True):
+        key = self._pooled_connections.pop(ioctx, None)
+        if key is not None and reusable:
+            _connection_pool.put(key, client, ioctx)
+            return
         # closing an ioctx cannot raise an exception
         ioctx.close()
         client.shutdown()
@@ -17,6 +17,7 @@ import nova.virt.libvirt.driver
 import nova.virt.libvirt.imagebackend
 import nova.virt.libvirt.imagecache
 import nova.virt.libvirt.storage.lvm
+import nova.virt.libvirt.storage.rbd_utils
 import nova.virt.libvirt.utils
 import nova.virt.libvirt.vif
 import nova.virt.libvirt.volume.aoe
@@ -45,6 +46,7 @@ def list_opts():
              nova.virt.libvirt.imagebackend.__imagebackend_opts,
              nova.virt.libvirt.imagecache.imagecache_opts,
              nova.virt.libvirt.storage.lvm.lvm_opts,
+             nova.virt.libvirt.storage.rbd_utils.rbd_opts,
              nova.virt.libvirt.utils.libvirt_opts,
              nova.virt.libvirt.vif.libvirt_vif_opts,
              nova.virt.libvirt.volume.volume.volume_opts,
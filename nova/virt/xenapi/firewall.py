@@ -27,6 +27,10 @@ class Dom0IptablesFirewallDriver(firewall.IptablesFirewallDriver):
     using iptables. This class is meant to be used with the xenapi
     backend and uses xenapi plugin to enforce iptables rules in dom0.
     """
+
+    # The xenhost plugin only runs iptables commands
+    ipset_supported = False
+
     def _plugin_execute(self, *cmd, **kwargs):
         # Prepare arguments for plugin call
         args = {}
@@ -141,3 +141,20 @@ class BaseWeightHandler(loadables.BaseLoader):
                 obj.weight += weigher.weight_multiplier() * weight
 
         return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+
+    def reweigh_object(self, weighers, weighed_obj, weighing_properties):
+        """Compute again the weight of a single WeighedObject.
+
+        The weights are normalized with the minval and maxval recorded by the
+        weighers when the whole list of objects was weighed, so that the new
+        weight can be compared with the ones of the other objects of the list.
+        """
+        weighed_obj.weight = 0.0
+        for weigher in weighers:
+            weights = weigher.weigh_objects([weighed_obj], weighing_properties)
+            weights = normalize(weights,
+                                minval=weigher.minval,
+                                maxval=weigher.maxval)
+            for weight in weights:
+                weighed_obj.weight += weigher.weight_multiplier() * weight
+        return weighed_obj